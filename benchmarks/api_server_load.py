@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+本地API服务负载测试：大量并发客户端通过 /v1/chat/completions 流式请求本地替身上游
+
+替身上游（SSE服务器）与API服务各自运行在独立进程中，客户端进程只负责发起请求与计时，
+统计吞吐量、首字延迟与完整响应延迟的分位数。
+
+用法: python benchmarks/api_server_load.py [--clients 50] [--requests 10] [--chunks 50] [--interval 2]
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+MODEL = "deepseek-ai/DeepSeek-V3"
+
+
+def _serve_api(port_queue, upstream_url: str, db_path: str):
+    """API服务进程：指向替身上游，放宽限流"""
+    from chat_db import ChatDatabase
+    from core.api_server import ChatCompletionServer
+    from models import AIProviderFactory, AsyncSiliconFlowProvider, RateLimiterRegistry
+
+    AsyncSiliconFlowProvider.url = upstream_url
+    # 负载测试不测限流：放宽并发与速率
+    AIProviderFactory.set_rate_limits(RateLimiterRegistry({'': {'rate': 10000.0, 'burst': 10000,
+                                                                'max_concurrency': 10000}}))
+    server = ChatCompletionServer(ChatDatabase(db_path), lambda model: "bench-key", MODEL, port=0)
+
+    async def run():
+        await server.start()
+        port_queue.put(server.port)
+        await server.serve_forever()
+
+    asyncio.run(run())
+
+
+def start_api_server(upstream_url: str, db_path: str):
+    context = multiprocessing.get_context('spawn')
+    port_queue = context.Queue()
+    process = context.Process(target=_serve_api, args=(port_queue, upstream_url, db_path), daemon=True)
+    process.start()
+    return process, f"http://127.0.0.1:{port_queue.get(timeout=30)}"
+
+
+async def one_request(client, index: int):
+    """发起一次流式请求，返回 (首字延迟, 总延迟, 片段数)"""
+    payload = {"model": MODEL, "stream": True, "messages": [{"role": "user", "content": f"请求 {index}"}]}
+    started = time.perf_counter()
+    first = None
+    chunks = 0
+    async with client.stream('POST', '/v1/chat/completions', json=payload) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if not line.startswith('data: ') or line == 'data: [DONE]':
+                continue
+            if json.loads(line[len('data: '):])['choices'][0]['delta'].get('content'):
+                chunks += 1
+                if first is None:
+                    first = time.perf_counter() - started
+    return first, time.perf_counter() - started, chunks
+
+
+async def run_load(base_url: str, clients: int, requests: int):
+    import httpx
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+    results = []
+    async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=limits) as client:
+        async def worker(worker_index):
+            for request_index in range(requests):
+                results.append(await one_request(client, worker_index * requests + request_index))
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(index) for index in range(clients)))
+        elapsed = time.perf_counter() - started
+    return results, elapsed
+
+
+def percentile(ordered, fraction: float) -> float:
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def report(label: str, values):
+    ordered = sorted(values)
+    print(f"{label:>6}: 均值 {statistics.mean(ordered) * 1000:8.1f} ms  p50 {percentile(ordered, 0.5) * 1000:8.1f} ms  "
+          f"p95 {percentile(ordered, 0.95) * 1000:8.1f} ms  p99 {percentile(ordered, 0.99) * 1000:8.1f} ms  "
+          f"最大 {ordered[-1] * 1000:8.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地API服务负载测试")
+    parser.add_argument('--clients', type=int, default=50, help="并发客户端数量")
+    parser.add_argument('--requests', type=int, default=10, help="每个客户端依次发起的请求数")
+    parser.add_argument('--chunks', type=int, default=50, help="上游每个回复的片段数")
+    parser.add_argument('--interval', type=float, default=2.0, help="上游片段间隔（毫秒）")
+    args = parser.parse_args()
+
+    from gui_jitter import start_server
+
+    upstream_process, upstream_url = start_server(args.chunks, args.interval / 1000)
+    with tempfile.TemporaryDirectory() as folder:
+        db_path = os.path.join(folder, 'chat.db')
+        api_process, base_url = start_api_server(upstream_url, db_path)
+        try:
+            # 预热：建立上游连接池，不计入结果
+            asyncio.run(run_load(base_url, 1, 1))
+            results, elapsed = asyncio.run(run_load(base_url, args.clients, args.requests))
+        finally:
+            api_process.kill()
+            upstream_process.kill()
+
+    total = len(results)
+    assert all(chunks == args.chunks for _, _, chunks in results), "存在不完整的回复"
+    ideal = args.chunks * args.interval / 1000
+    print(f"{args.clients} 个并发客户端 × {args.requests} 个请求，每个回复 {args.chunks} 个片段"
+          f"（间隔 {args.interval:g} ms，单个回复理想耗时 {ideal * 1000:.0f} ms）")
+    print(f"  吞吐: {total / elapsed:8.1f} 请求/秒  {total * args.chunks / elapsed:10.0f} 片段/秒  总耗时 {elapsed:.2f} s")
+    report('首字', [first for first, _, _ in results])
+    report('完整', [latency for _, latency, _ in results])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+批量运行吞吐基准：在不同工作线程数下批量运行提示，观察吞吐随并发增长、到达服务商并发上限后持平
+
+本地SSE服务器运行在独立进程中，每个回复耗时约 chunks × interval；限流器的并发上限由 --provider-limit 指定。
+
+用法: python benchmarks/batch_throughput.py [--items 64] [--chunks 20] [--interval 5] [--provider-limit 8]
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+MODEL = "deepseek-ai/DeepSeek-V3"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="批量运行吞吐基准")
+    parser.add_argument('--items', type=int, default=64, help="每轮的条目数")
+    parser.add_argument('--chunks', type=int, default=20, help="每个回复的片段数")
+    parser.add_argument('--interval', type=float, default=5.0, help="片段间隔（毫秒）")
+    parser.add_argument('--provider-limit', type=int, default=8, help="服务商并发上限（限流器 max_concurrency）")
+    parser.add_argument('--concurrency', default="1,2,4,8,16,32", help="要测试的工作线程数，逗号分隔")
+    args = parser.parse_args()
+
+    from core.batch_runner import BatchRunner
+    from gui_jitter import point_to, start_server
+    from models import AIProviderFactory, RateLimiterRegistry
+
+    server_process, url = start_server(args.chunks, args.interval / 1000)
+    point_to(url)
+    AIProviderFactory.set_rate_limits(RateLimiterRegistry({'': {
+        'rate': 10000.0, 'burst': 10000, 'max_concurrency': args.provider_limit, 'background_reserve': 0,
+    }}))
+    ideal = args.chunks * args.interval / 1000
+    print(f"{args.items} 个条目，单个回复约 {ideal * 1000:.0f} ms，服务商并发上限 {args.provider_limit}")
+    try:
+        with tempfile.TemporaryDirectory() as folder:
+            for concurrency in (int(value) for value in args.concurrency.split(',')):
+                items = [{"id": str(i), "index": i, "model": None,
+                          "messages": [{"role": "user", "content": f"并发{concurrency} 第{i}条"}]}
+                         for i in range(args.items)]
+                output = os.path.join(folder, f"results-{concurrency}.jsonl")
+                summary = BatchRunner(MODEL, lambda model: "bench-key", output, concurrency).run(items)
+                assert summary['succeeded'] == args.items, summary
+                expected = min(concurrency, args.provider_limit) / ideal
+                print(f"  工作线程 {concurrency:3d}: {summary['items_per_s']:7.1f} 条/秒"
+                      f"（理论上限 {expected:7.1f}）  p50 {summary['latency_p50_s'] * 1000:6.0f} ms  "
+                      f"p95 {summary['latency_p95_s'] * 1000:6.0f} ms")
+    finally:
+        server_process.kill()
+
+
+if __name__ == '__main__':
+    main()
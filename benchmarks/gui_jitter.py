@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+界面帧抖动基准：比较服务商在进程内（线程）与子进程中运行时，快速流式输出期间界面定时器的抖动
+
+本地SSE服务器以很短的间隔输出大量小片段，界面在16毫秒定时器中把新片段追加到文本框
+（模拟逐帧刷新），统计定时器实际间隔与期望间隔的偏差。
+
+用法: python benchmarks/gui_jitter.py [--streams 4] [--chunks 1000] [--interval 1]
+"""
+import argparse
+import functools
+import json
+import multiprocessing
+import os
+import statistics
+import sys
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+FRAME_MS = 16
+MODEL = "deepseek-ai/DeepSeek-V3"
+
+
+class FastStreamHandler(BaseHTTPRequestHandler):
+    """以固定间隔输出大量小片段的SSE流（分块传输）"""
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        for index in range(self.server.chunks):
+            line = f"data: {json.dumps({'choices': [{'delta': {'content': f'片段{index} '}}]})}\n\n"
+            data = line.encode('utf-8')
+            self.wfile.write(f"{len(data):x}\r\n".encode('ascii') + data + b"\r\n")
+            self.wfile.flush()
+            if self.server.interval:
+                time.sleep(self.server.interval)
+        done = b"data: [DONE]\n\n"
+        self.wfile.write(f"{len(done):x}\r\n".encode('ascii') + done + b"\r\n0\r\n\r\n")
+        self.wfile.flush()
+
+
+def _serve(port_queue, chunks: int, interval: float):
+    class Server(ThreadingHTTPServer):
+        request_queue_size = 64
+        daemon_threads = True
+    httpd = Server(('127.0.0.1', 0), FastStreamHandler)
+    httpd.chunks = chunks
+    httpd.interval = interval
+    port_queue.put(httpd.server_address[1])
+    httpd.serve_forever()
+
+
+def start_server(chunks: int, interval: float):
+    """在独立进程中启动本地SSE服务器（避免与界面进程争用GIL影响测量），返回 (进程, URL)"""
+    context = multiprocessing.get_context('spawn')
+    port_queue = context.Queue()
+    process = context.Process(target=_serve, args=(port_queue, chunks, interval), daemon=True)
+    process.start()
+    return process, f"http://127.0.0.1:{port_queue.get(timeout=30)}/v1/chat/completions"
+
+
+def point_to(url):
+    """把硅基流动请求指向本地服务器（子进程中同样调用）"""
+    from models import SiliconFlowProvider
+    SiliconFlowProvider.url = url
+
+
+def run_mode(app, mode: str, streams: int, url: str, provider_process=None):
+    """运行一轮并返回 (帧间隔偏差列表（毫秒）, 总耗时, 收到的字符数)"""
+    from PyQt6.QtCore import QTimer
+    from PyQt6.QtWidgets import QPlainTextEdit
+    from core.ai_client import AIStreamThread, ProcessStreamTask
+    from models import MessageRecord
+
+    editor = QPlainTextEdit()
+    history = (MessageRecord(1, 'user', "你好"),)
+    deviations = []
+    received = [0]
+    last_tick = [time.perf_counter()]
+
+    pending = []
+
+    def tick():
+        now = time.perf_counter()
+        deviations.append(abs((now - last_tick[0]) * 1000 - FRAME_MS))
+        last_tick[0] = now
+        # 每帧把新片段追加到文本框一次
+        if pending:
+            editor.appendPlainText(''.join(pending))
+            pending.clear()
+
+    def on_chunk(text):
+        received[0] += len(text)
+        pending.append(text)
+
+    remaining = [streams]
+
+    def on_finished(*_):
+        remaining[0] -= 1
+        if remaining[0] == 0:
+            app.quit()
+
+    tasks = []
+    for _ in range(streams):
+        if mode == 'process':
+            task = ProcessStreamTask(provider_process, "你好", "bench-key", history, MODEL)
+        else:
+            task = AIStreamThread("你好", "bench-key", history, MODEL)
+        task.chunk_received.connect(on_chunk)
+        task.stream_finished.connect(on_finished)
+        task.error_occurred.connect(lambda message: (print(message), on_finished()))
+        tasks.append(task)
+
+    timer = QTimer()
+    timer.setInterval(FRAME_MS)
+    timer.timeout.connect(tick)
+    started = time.perf_counter()
+    timer.start()
+    for task in tasks:
+        task.start()
+    app.exec()
+    timer.stop()
+    elapsed = time.perf_counter() - started
+    for task in tasks:
+        task.wait()
+    return deviations, elapsed, received[0]
+
+
+def report(mode: str, deviations, elapsed: float, received: int):
+    ordered = sorted(deviations) or [0.0]
+    p99 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))]
+    print(f"{mode:>8}: 帧数 {len(deviations):4d}  抖动均值 {statistics.mean(ordered):6.2f} ms  "
+          f"p50 {statistics.median(ordered):6.2f} ms  p99 {p99:6.2f} ms  最大 {ordered[-1]:6.2f} ms  "
+          f"耗时 {elapsed:5.2f} s  字符 {received}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="界面帧抖动基准（进程内 vs 子进程）")
+    parser.add_argument('--streams', type=int, default=4, help="并发流数量")
+    parser.add_argument('--chunks', type=int, default=1000, help="每个流的片段数")
+    parser.add_argument('--interval', type=float, default=1.0, help="片段间隔（毫秒）")
+    args = parser.parse_args()
+
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    from PyQt6.QtWidgets import QApplication
+    from core.provider_process import ProviderProcess
+    from models import AIProviderFactory, RateLimiterRegistry
+
+    server_process, url = start_server(args.chunks, args.interval / 1000)
+    point_to(url)
+    # 基准不测限流：放宽并发与速率
+    rate_limits = {'': {'rate': 1000.0, 'burst': 1000, 'max_concurrency': 1000}}
+    AIProviderFactory.set_rate_limits(RateLimiterRegistry(rate_limits))
+    app = QApplication(sys.argv)
+
+    provider_process = ProviderProcess({
+        'rate_limits': rate_limits,
+        'initializer': functools.partial(point_to, url),
+    })
+    try:
+        # 预热：启动子进程并建立连接，不计入结果
+        run_mode(app, 'process', 1, url, provider_process)
+        run_mode(app, 'thread', 1, url)
+        print(f"{args.streams} 个并发流，每个 {args.chunks} 个片段（间隔 {args.interval:g} ms），"
+              f"期望帧间隔 {FRAME_MS} ms")
+        report('进程内', *run_mode(app, 'thread', args.streams, url))
+        report('子进程', *run_mode(app, 'process', args.streams, url, provider_process))
+    finally:
+        provider_process.shutdown()
+        server_process.kill()
+
+
+if __name__ == '__main__':
+    main()
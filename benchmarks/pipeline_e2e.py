@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+端到端基准（离线）：发送 → 流式接收 → 渲染 → 保存 的完整链路
+
+在无界面平台上运行真实的 ChatWindow（配置与数据库放在临时目录，不影响本机数据），依次发送消息，统计：
+    首字：点击发送到第一个片段显示在界面上
+    完整：点击发送到回复保存完毕
+    收尾：流结束后的处理（写入数据库与切换富文本渲染）
+    帧抖动：16毫秒定时器的实际间隔偏差（界面是否卡顿）
+
+--transport provider 使用进程内的模拟服务商（mock 模型），
+--transport http 使用独立进程中的模拟SSE服务与真实的硅基流动客户端。
+
+--trace 同时启用延迟追踪，打印各阶段耗时并导出Chrome trace。
+--lag-monitor 同时监测界面卡顿，打印事件循环延迟、聊天区重绘耗时与卡顿最多的处理函数。
+
+用法: python benchmarks/pipeline_e2e.py [--transport provider|http] [--messages 10] [--tps 200] [--tokens 300]
+                                       [--ttft 0.2] [--async-streams] [--trace trace.json]
+                                       [--lag-monitor]
+"""
+import argparse
+import multiprocessing
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+FRAME_MS = 16
+
+
+def _serve_mock(port_queue, scenario_args):
+    from models import MockScenario
+    from utils.mock_server import MockStreamServer
+    server = MockStreamServer(MockScenario(**scenario_args))
+    port_queue.put(server.siliconflow_url)
+    server.httpd.serve_forever()
+
+
+def start_mock_server(scenario_args):
+    """在独立进程中启动模拟SSE服务（避免与界面进程争用GIL），返回 (进程, 硅基流动地址)"""
+    context = multiprocessing.get_context('spawn')
+    port_queue = context.Queue()
+    process = context.Process(target=_serve_mock, args=(port_queue, scenario_args), daemon=True)
+    process.start()
+    return process, port_queue.get(timeout=30)
+
+
+def percentile(values, fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="离线端到端基准：发送 → 流式 → 渲染 → 保存")
+    parser.add_argument('--transport', choices=('provider', 'http'), default='provider')
+    parser.add_argument('--messages', type=int, default=10, help="依次发送的消息数")
+    parser.add_argument('--ttft', type=float, default=0.2, help="模拟首字延迟（秒）")
+    parser.add_argument('--tps', type=float, default=200.0, help="模拟输出速率（片段/秒）")
+    parser.add_argument('--tokens', type=int, default=300, help="每个回复的片段数")
+    parser.add_argument('--reasoning', type=int, default=0, help="思考过程片段数")
+    parser.add_argument('--async-streams', action='store_true', help="使用共享事件循环的异步流")
+    parser.add_argument('--trace', metavar='PATH', help="启用延迟追踪并把Chrome trace导出到该文件")
+    parser.add_argument('--lag-monitor', action='store_true', help="监测界面卡顿并打印卡顿最多的处理函数")
+    args = parser.parse_args()
+
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    from PyQt6.QtCore import QEventLoop, QTimer
+    from PyQt6.QtWidgets import QApplication
+    import ui.main_window as main_window
+    from chat_db import ChatDatabase
+    from core.config_manager import ConfigManager
+    from models import SiliconFlowProvider
+    from utils.lag_monitor import lag_monitor
+    from utils.tracing import tracer
+
+    if args.trace:
+        tracer.enable()
+    if args.lag_monitor:
+        lag_monitor.enable()
+
+    scenario_args = dict(ttft=args.ttft, tokens_per_second=args.tps, reply_tokens=args.tokens,
+                         reasoning_tokens=args.reasoning)
+    server_process = None
+    folder = tempfile.mkdtemp(prefix="nefelibata-bench-")
+    ini_folder = os.path.join(folder, 'ini')
+    os.makedirs(ini_folder)
+    paths = {
+        'ini_folder': ini_folder,
+        'config_file': os.path.join(ini_folder, 'config.ini'),
+        'model_config_file': os.path.join(ini_folder, 'modelconfig.ini'),
+        'key_file': os.path.join(ini_folder, 'config.key'),
+        'model_key_file': os.path.join(ini_folder, 'modelconfig.key'),
+    }
+    config_manager = ConfigManager(paths)
+    config_manager.save_chat_option('async_streams', 'true' if args.async_streams else 'false')
+    if args.transport == 'http':
+        server_process, url = start_mock_server(scenario_args)
+        SiliconFlowProvider.url = url
+        config_manager.save_api_key('deepseek', 'sk-bench')
+        model = "deepseek-ai/DeepSeek-V3"
+    else:
+        query = '&'.join(f"{key}={value:g}" for key, value in (
+            ('ttft', args.ttft), ('tps', args.tps), ('tokens', args.tokens), ('reasoning', args.reasoning)))
+        model = f"mock?{query}"
+    config_manager.save_current_model(model)
+    # 界面使用临时目录中的配置与数据库
+    main_window.get_config_paths = lambda: paths
+    ChatDatabase.get_default_db_path = staticmethod(lambda: os.path.join(folder, 'chat_history.db'))
+
+    app = QApplication(sys.argv)
+    window = main_window.ChatWindow()
+    window.resize(900, 700)
+    window.show()
+    while not window._initialized:
+        app.processEvents(QEventLoop.ProcessEventsFlag.AllEvents, 50)
+
+    deviations = []
+    last_tick = [time.perf_counter()]
+
+    def tick():
+        now = time.perf_counter()
+        deviations.append(abs((now - last_tick[0]) * 1000 - FRAME_MS))
+        last_tick[0] = now
+
+    frame_timer = QTimer()
+    frame_timer.timeout.connect(tick)
+
+    # 记录首个片段显示与回复保存完毕的时间
+    state = {}
+    handle_chunk = window.handle_ai_chunk
+    handle_finished = window.handle_ai_stream_finished
+
+    def on_chunk(chunk):
+        handle_chunk(chunk)
+        state['chunks'] += 1
+        if 'first' not in state:
+            state['first'] = time.perf_counter()
+
+    def on_finished(full_text):
+        started = time.perf_counter()
+        handle_finished(full_text)
+        state['finish_handler'] = time.perf_counter() - started
+        state['done'] = time.perf_counter()
+        state['loop'].quit()
+
+    def on_error(message):
+        state['error'] = message
+        state['loop'].quit()
+
+    window.handle_ai_chunk = on_chunk
+    window.handle_ai_stream_finished = on_finished
+    window.handle_error = on_error
+
+    results = []
+    try:
+        frame_timer.start(FRAME_MS)
+        for index in range(args.messages + 1):
+            state.clear()
+            state['chunks'] = 0
+            state['loop'] = QEventLoop()
+            window.input_box.setPlainText(f"第 {index} 条基准消息：请给出一段包含列表和代码的回答")
+            sent_at = time.perf_counter()
+            last_tick[0] = sent_at
+            deviations_before = len(deviations)
+            window.send_message()
+            QTimer.singleShot(120_000, state['loop'].quit)
+            state['loop'].exec()
+            if 'error' in state:
+                raise RuntimeError(f"请求失败: {state['error']}")
+            if 'done' not in state:
+                raise RuntimeError("等待回复超时")
+            if index == 0:
+                del deviations[deviations_before:]
+                continue  # 预热：首次请求建立连接与加载渲染器，不计入结果
+            results.append((state['first'] - sent_at, state['done'] - sent_at, state['finish_handler'],
+                            state['chunks']))
+    finally:
+        frame_timer.stop()
+        window.close()
+        if server_process is not None:
+            server_process.kill()
+
+    saved = len(ChatDatabase(os.path.join(folder, 'chat_history.db')).get_conversation_history(
+        window.conversation_id, limit=1000))
+    ttfts = [r[0] for r in results]
+    totals = [r[1] for r in results]
+    finishes = [r[2] for r in results]
+    chunks = sum(r[3] for r in results)
+    mode = "异步流" if args.async_streams else "线程"
+    print(f"{args.transport} / {mode}: {len(results)} 条消息，每条 {args.tokens} 个片段，"
+          f"模拟首字 {args.ttft * 1000:.0f} ms，{args.tps:g} 片段/秒")
+    print(f"  首字: p50 {percentile(ttfts, 0.5) * 1000:7.1f} ms  p95 {percentile(ttfts, 0.95) * 1000:7.1f} ms")
+    print(f"  完整: p50 {percentile(totals, 0.5) * 1000:7.1f} ms  p95 {percentile(totals, 0.95) * 1000:7.1f} ms  "
+          f"界面处理 {chunks / sum(totals):7.1f} 片段/秒")
+    print(f"  收尾: 均值 {statistics.mean(finishes) * 1000:7.2f} ms  最大 {max(finishes) * 1000:7.2f} ms")
+    print(f"  帧抖动: p50 {percentile(deviations, 0.5):6.2f} ms  p99 {percentile(deviations, 0.99):6.2f} ms  "
+          f"最大 {max(deviations):6.2f} ms")
+    print(f"  已保存消息: {saved} 条（期望 {2 * (args.messages + 1)}）")
+    if args.trace:
+        tracer.export_chrome_trace(args.trace)
+        print(tracer.report())
+        print(f"Chrome trace: {args.trace}")
+    if args.lag_monitor:
+        print(lag_monitor.report())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+流式解析CPU基准：比较智谱SDK、智谱直连与硅基流动路径每个片段的CPU开销
+
+本地SSE服务器运行在独立进程中，只统计客户端进程的CPU时间。
+
+用法: python benchmarks/stream_parse_cpu.py [--chunks 5000] [--rounds 3]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+MESSAGES = [{"role": "user", "content": "你好"}]
+
+
+def measure(provider, model: str, chunks: int) -> float:
+    """返回每个片段的CPU时间（微秒）"""
+    started = time.process_time()
+    received = sum(1 for _ in provider.stream_chat(MESSAGES, model))
+    elapsed = time.process_time() - started
+    assert received == chunks, f"收到 {received} 个片段，期望 {chunks}"
+    return elapsed / received * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="流式解析CPU基准")
+    parser.add_argument('--chunks', type=int, default=5000, help="每轮的片段数")
+    parser.add_argument('--rounds', type=int, default=3, help="轮数（取最小值）")
+    args = parser.parse_args()
+
+    import zhipuai
+    from gui_jitter import start_server
+    from models import SiliconFlowProvider, ZhipuAIProvider
+
+    server_process, url = start_server(args.chunks, 0)
+    try:
+        sdk = ZhipuAIProvider("bench.secret", raw_http=False)
+        sdk._client = zhipuai.ZhipuAI(api_key="bench.secret", base_url=url.rsplit('/chat/completions', 1)[0])
+        raw = ZhipuAIProvider("bench.secret")
+        raw.url = url
+        siliconflow = SiliconFlowProvider("bench-key")
+        siliconflow.url = url
+        paths = [
+            ("智谱SDK", sdk, "glm-4-plus"),
+            ("智谱直连", raw, "glm-4-plus"),
+            ("硅基流动", siliconflow, "deepseek-ai/DeepSeek-V3"),
+        ]
+        for _, provider, model in paths:
+            measure(provider, model, args.chunks)  # 预热
+        print(f"每轮 {args.chunks} 个片段，取 {args.rounds} 轮中的最小值")
+        for label, provider, model in paths:
+            best = min(measure(provider, model, args.chunks) for _ in range(args.rounds))
+            print(f"{label:>6}: {best:7.1f} µs/片段")
+    finally:
+        server_process.kill()
+
+
+if __name__ == '__main__':
+    main()
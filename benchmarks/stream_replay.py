@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+流回放基准：用录制的真实流（或现场从模拟服务录制的流）对流式链路的各个环节做可复现的测量
+
+    解析：ReplayProvider 不限速回放，每个片段的CPU时间（SSE切行与JSON解析）
+    线程：AIStreamThread 按 --speed 回放，片段经信号到达界面线程的延迟与实际耗时/录制时长
+    渲染：按录制的片段形态逐个调用 MessageWidget.update_content（思考标签解析与纯文本更新）的耗时
+
+录制方法：在config.ini的[CHAT]中设置 record_streams = streams.nfsr（相对路径位于数据目录中），
+正常使用一段时间后把该文件传给本基准。
+
+用法: python benchmarks/stream_replay.py [录制文件] [--speed 0] [--rounds 3]
+      python benchmarks/stream_replay.py --synthesize 8   # 没有录制文件时从本地模拟服务录制
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+MESSAGES = [{"role": "user", "content": "请给出一段包含列表和代码的回答"}]
+
+
+def synthesize(path: str, streams: int):
+    """从本地模拟服务（硅基流动与智谱格式交替，部分带思考过程）录制若干段流"""
+    from models import AIProviderFactory, MockScenario, SiliconFlowProvider, StreamRecorder, ZhipuAIProvider
+    from utils.mock_server import MockStreamServer
+
+    AIProviderFactory.enable_stream_recording(StreamRecorder(path))
+    try:
+        with MockStreamServer(MockScenario(ttft=0.05, tokens_per_second=400, reply_tokens=400)) as server:
+            server.point_providers()
+            for index in range(streams):
+                if index % 2:
+                    model = f"mock/reasoning?ttft=0.05&tps=400&tokens=400&reasoning={40 + index * 10}"
+                    provider = ZhipuAIProvider("bench-key")
+                else:
+                    model = f"mock?ttft=0.05&tps=400&tokens={200 + index * 50}"
+                    provider = SiliconFlowProvider("bench-key")
+                for _ in provider.stream_chat(MESSAGES, model):
+                    pass
+    finally:
+        AIProviderFactory.enable_stream_recording(None)
+
+
+def percentile(values, fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def bench_parse(recordings, rounds: int):
+    from models import ReplayProvider, StreamReplayer
+    replayer = StreamReplayer(recordings, speed=0)
+    best = None
+    for _ in range(rounds):
+        started = time.process_time()
+        chunks = 0
+        for recording in recordings:
+            chunks += sum(1 for _ in ReplayProvider(replayer).stream_chat(MESSAGES, recording.model))
+        elapsed = time.process_time() - started
+        best = elapsed if best is None else min(best, elapsed)
+    print(f"解析: {chunks} 个片段，{best / chunks * 1e6:6.2f} µs/片段（{rounds} 轮中的最小值）")
+
+
+def bench_thread(app, recordings, speed: float):
+    from collections import deque
+    from PyQt6.QtCore import QEventLoop
+    from core.ai_client import AIStreamThread
+    from models import AIProviderFactory, MessageRecord, RateLimiterRegistry, ReplayProvider, StreamReplayer
+
+    # 记录工作线程中每个片段产生的时间，界面线程按顺序取出计算信号延迟
+    produced = deque()
+    original_stream_chat = ReplayProvider.stream_chat
+
+    def stream_chat(self, messages, model):
+        for text in original_stream_chat(self, messages, model):
+            produced.append(time.perf_counter())
+            yield text
+
+    ReplayProvider.stream_chat = stream_chat
+    AIProviderFactory.enable_replay(StreamReplayer(recordings, speed))
+    AIProviderFactory.set_rate_limits(RateLimiterRegistry({'': {
+        'rate': 10000.0, 'burst': 10000, 'max_concurrency': 64, 'background_reserve': 0}}))
+    AIProviderFactory.enable_single_flight(False)
+    latencies = []
+    overheads = []
+    try:
+        for index, recording in enumerate(recordings):
+            loop = QEventLoop()
+            history = (MessageRecord(1, 'user', f"第{index}段"),)
+            thread = AIStreamThread("", "bench-key", history, recording.model)
+            thread.chunk_received.connect(lambda _: latencies.append(time.perf_counter() - produced.popleft()))
+            thread.stream_finished.connect(lambda *_: loop.quit())
+            thread.error_occurred.connect(lambda message: (print(message), loop.quit()))
+            started = time.perf_counter()
+            thread.start()
+            loop.exec()
+            thread.wait()
+            expected = recording.duration / speed if speed > 0 else 0
+            overheads.append(time.perf_counter() - started - expected)
+    finally:
+        ReplayProvider.stream_chat = original_stream_chat
+        AIProviderFactory.enable_replay(None)
+    label = f"{speed:g}倍速" if speed > 0 else "不限速"
+    print(f"线程（{label}）: {len(latencies)} 个片段  信号延迟 p50 {percentile(latencies, 0.5) * 1000:6.3f} ms  "
+          f"p99 {percentile(latencies, 0.99) * 1000:6.3f} ms  额外耗时 均值 {statistics.mean(overheads) * 1000:6.1f} ms/段")
+
+
+def bench_render(app, recordings):
+    from models import ReplayProvider, StreamReplayer
+    from ui.widgets import MessageWidget
+
+    replayer = StreamReplayer(recordings, speed=0)
+    costs = []
+    finishes = []
+    for recording in recordings:
+        widget = MessageWidget("", align_right=False)
+        widget.resize(700, 400)
+        widget.show()
+        full = ""
+        for chunk in ReplayProvider(replayer).stream_chat(MESSAGES, recording.model):
+            full += chunk
+            started = time.perf_counter()
+            widget.update_content(full)
+            app.processEvents()
+            costs.append(time.perf_counter() - started)
+        started = time.perf_counter()
+        widget.finish_streaming(full)
+        app.processEvents()
+        finishes.append(time.perf_counter() - started)
+        widget.close()
+        widget.deleteLater()
+    print(f"渲染: {len(costs)} 次更新  p50 {percentile(costs, 0.5) * 1000:6.3f} ms  "
+          f"p99 {percentile(costs, 0.99) * 1000:6.3f} ms  最大 {max(costs) * 1000:6.2f} ms  "
+          f"结束流式 均值 {statistics.mean(finishes) * 1000:6.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="流回放基准")
+    parser.add_argument('recording', nargs='?', help="录制文件（record_streams 生成）")
+    parser.add_argument('--synthesize', type=int, default=0, help="没有录制文件时从模拟服务录制的段数")
+    parser.add_argument('--speed', type=float, default=0.0, help="线程环节的回放速度，0为不限速")
+    parser.add_argument('--rounds', type=int, default=3, help="解析环节的轮数")
+    args = parser.parse_args()
+    if not args.recording and not args.synthesize:
+        parser.error("需要录制文件或 --synthesize")
+
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    from PyQt6.QtWidgets import QApplication
+    from models import load_recordings
+
+    with tempfile.TemporaryDirectory() as folder:
+        path = args.recording
+        if not path:
+            path = os.path.join(folder, 'streams.nfsr')
+            synthesize(path, args.synthesize)
+        recordings = load_recordings(path)
+        if not recordings:
+            parser.error("录制文件中没有录制")
+        total = sum(len(r.chunks) for r in recordings)
+        print(f"{len(recordings)} 段录制，{total} 个字节块，录制时长 {sum(r.duration for r in recordings):.2f} s，"
+              f"文件 {os.path.getsize(path) / 1024:.1f} KiB（原始 {sum(r.size for r in recordings) / 1024:.1f} KiB）")
+
+        app = QApplication(sys.argv)
+        bench_parse(recordings, args.rounds)
+        bench_thread(app, recordings, args.speed)
+        bench_render(app, recordings)
+
+
+if __name__ == '__main__':
+    main()
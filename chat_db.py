@@ -3,17 +3,34 @@ import os
 from datetime import datetime
 
 class ChatDatabase:
-    def __init__(self):
-        # 获取当前脚本所在目录
-        current_dir = os.path.dirname(os.path.abspath(__file__))
+    # 会话摘要以特殊发送者类型保存，不计入消息数量限制，也不出现在历史记录中
+    SUMMARY_SENDER = 'summary'
+    # 本地API服务（python main.py --serve）创建的会话ID前缀，图形界面启动时不会打开这些会话
+    API_CONVERSATION_PREFIX = 'api-'
+    # 等待其他连接释放写锁的最长时间（秒）
+    BUSY_TIMEOUT = 10.0
+
+    def __init__(self, db_path=None):
         # 数据库文件路径
-        self.db_path = os.path.join(current_dir, 'chat_history.db')
+        self.db_path = db_path or self.get_default_db_path()
         self.init_database()
 
+    @staticmethod
+    def get_default_db_path():
+        """获取数据库文件路径（当前脚本所在目录），无需打开数据库"""
+        current_dir = os.path.dirname(os.path.abspath(__file__))
+        return os.path.join(current_dir, 'chat_history.db')
+
+    def _connect(self):
+        """打开数据库连接（图形界面与API服务可能同时写入，遇到锁时等待而不是立即失败）"""
+        return sqlite3.connect(self.db_path, timeout=self.BUSY_TIMEOUT)
+
     def init_database(self):
         """初始化数据库，创建消息表"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
+        # WAL模式下读写互不阻塞，多个进程可以同时读取
+        cursor.execute('PRAGMA journal_mode=WAL')
         
         # 创建消息表
         cursor.execute('''
@@ -26,16 +43,35 @@ class ChatDatabase:
             )
         ''')
         
+        # 旧数据库迁移：摘要消息记录其覆盖到的最后一条消息ID
+        columns = [row[1] for row in cursor.execute('PRAGMA table_info(messages)')]
+        if 'covers_until' not in columns:
+            cursor.execute('ALTER TABLE messages ADD COLUMN covers_until INTEGER')
+        # 多模型对比：回复记录生成它的模型，以及所回复的用户消息ID
+        if 'model' not in columns:
+            cursor.execute('ALTER TABLE messages ADD COLUMN model TEXT')
+        if 'reply_to' not in columns:
+            cursor.execute('ALTER TABLE messages ADD COLUMN reply_to INTEGER')
+        # 多模型对比：各模型回复的首字延迟与总耗时（秒）
+        if 'ttft' not in columns:
+            cursor.execute('ALTER TABLE messages ADD COLUMN ttft REAL')
+        if 'total_seconds' not in columns:
+            cursor.execute('ALTER TABLE messages ADD COLUMN total_seconds REAL')
+        
         conn.commit()
         conn.close()
 
-    def save_message(self, content, sender, conversation_id):
+    def save_message(self, content, sender, conversation_id, model=None, reply_to=None, ttft=None,
+                     total_seconds=None):
         """保存新消息到数据库，并维持最多50条消息的限制"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
+        # 先取得写锁，计数、删除与插入作为一个整体，避免并发写入时超出数量限制
+        cursor.execute('BEGIN IMMEDIATE')
         
         # 检查当前消息总数
-        cursor.execute('SELECT COUNT(*) FROM messages WHERE conversation_id = ?', (conversation_id,))
+        cursor.execute('SELECT COUNT(*) FROM messages WHERE conversation_id = ? AND sender != ?',
+                       (conversation_id, self.SUMMARY_SENDER))
         count = cursor.fetchone()[0]
         
         # 如果消息数量达到50条，删除最早的消息
@@ -44,17 +80,17 @@ class ChatDatabase:
                 DELETE FROM messages 
                 WHERE id IN (
                     SELECT id FROM messages 
-                    WHERE conversation_id = ? 
+                    WHERE conversation_id = ? AND sender != ?
                     ORDER BY timestamp ASC 
                     LIMIT 1
                 )
-            ''', (conversation_id,))
+            ''', (conversation_id, self.SUMMARY_SENDER))
         
         # 插入新消息
         cursor.execute('''
-            INSERT INTO messages (content, sender, conversation_id)
-            VALUES (?, ?, ?)
-        ''', (content, sender, conversation_id))
+            INSERT INTO messages (content, sender, conversation_id, model, reply_to, ttft, total_seconds)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (content, sender, conversation_id, model, reply_to, ttft, total_seconds))
         
         # 获取新插入消息的ID
         message_id = cursor.lastrowid
@@ -66,37 +102,72 @@ class ChatDatabase:
 
     def get_conversation_history(self, conversation_id, limit=50):
         """获取指定会话的历史记录"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         
         cursor.execute('''
-            SELECT id, content, sender, timestamp
+            SELECT id, content, sender, timestamp, model, reply_to, ttft, total_seconds
             FROM messages
-            WHERE conversation_id = ?
-            ORDER BY timestamp DESC
+            WHERE conversation_id = ? AND sender != ?
+            ORDER BY timestamp DESC, id DESC
             LIMIT ?
-        ''', (conversation_id, limit))
+        ''', (conversation_id, self.SUMMARY_SENDER, limit))
         
         messages = cursor.fetchall()
         conn.close()
         
         # 将消息记录转换
         formatted_messages = []
-        for message_id, content, sender, _ in reversed(messages):
+        for message_id, content, sender, _, model, reply_to, ttft, total_seconds in reversed(messages):
             formatted_messages.append({
                 "id": message_id,
                 "role": "assistant" if sender == "ai" else "user",
-                "content": content
+                "content": content,
+                "model": model,
+                "reply_to": reply_to,
+                "ttft": ttft,
+                "total_seconds": total_seconds
             })
         
         return formatted_messages
 
     def delete_message(self, message_id):
         """从数据库中删除指定消息"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         
         cursor.execute('DELETE FROM messages WHERE id = ?', (message_id,))
         
         conn.commit()
-        conn.close()
\ No newline at end of file
+        conn.close()
+
+    def save_summary(self, content, conversation_id, covers_until):
+        """保存会话摘要（每个会话只保留最新的一条）"""
+        conn = self._connect()
+        cursor = conn.cursor()
+        
+        cursor.execute('DELETE FROM messages WHERE conversation_id = ? AND sender = ?',
+                       (conversation_id, self.SUMMARY_SENDER))
+        cursor.execute('''
+            INSERT INTO messages (content, sender, conversation_id, covers_until)
+            VALUES (?, ?, ?, ?)
+        ''', (content, self.SUMMARY_SENDER, conversation_id, covers_until))
+        
+        conn.commit()
+        conn.close()
+
+    def get_summary(self, conversation_id):
+        """获取会话摘要，返回 (摘要内容, 覆盖到的消息ID)，没有摘要时返回None"""
+        conn = self._connect()
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+            SELECT content, covers_until FROM messages
+            WHERE conversation_id = ? AND sender = ?
+            ORDER BY id DESC
+            LIMIT 1
+        ''', (conversation_id, self.SUMMARY_SENDER))
+        
+        row = cursor.fetchone()
+        conn.close()
+        return row
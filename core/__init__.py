@@ -3,12 +3,24 @@ Core package - 核心功能模块
 包含AI客户端、配置管理、加密工具等核心功能
 """
 
-from .crypto_utils import CryptoManager
-from .config_manager import ConfigManager
-from .ai_client import AIChatThread
+import importlib
 
 __all__ = [
     'CryptoManager',
     'ConfigManager', 
     'AIChatThread'
 ]
+
+# 子模块按需导入（cryptography等依赖较重，避免拖慢启动）
+_LAZY_ATTRS = {
+    'CryptoManager': '.crypto_utils',
+    'ConfigManager': '.config_manager',
+    'AIChatThread': '.ai_client',
+}
+
+
+def __getattr__(name):
+    if name in _LAZY_ATTRS:
+        module = importlib.import_module(_LAZY_ATTRS[name], __name__)
+        return getattr(module, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
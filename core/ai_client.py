@@ -2,20 +2,27 @@
 AI客户端封装
 提供线程化的AI聊天功能
 """
-import requests
 import json
-from PyQt6.QtCore import QThread, pyqtSignal
-from typing import List, Dict, Any, Optional
+import threading
+import time
+from PyQt6.QtCore import QObject, QThread, pyqtSignal
+from typing import List, Dict, Any, Optional, Sequence
 
-from models import AIProviderFactory
+from models import AIProviderFactory, Priority
+from models.transport import StreamAbort, abort_scope
+from utils.tracing import tracer
+from .context_assembler import context_assembler
 
 
 class AIChatThread(QThread):
-    """AI聊天线程（非流式）"""
+    """AI聊天线程（非流式）
+
+    history_messages 为会话快照（MessageRecord元组或消息字典序列），已包含当前用户消息
+    """
     response_received = pyqtSignal(str)
     error_occurred = pyqtSignal(str)
 
-    def __init__(self, prompt: str, api_key: str, history_messages: Optional[List[Dict]] = None, model: str = "glm-4-flash"):
+    def __init__(self, prompt: str, api_key: str, history_messages: Optional[Sequence] = None, model: str = "glm-4-flash"):
         super().__init__()
         self.prompt = prompt
         self.api_key = api_key
@@ -23,13 +30,12 @@ class AIChatThread(QThread):
         self.model = model
 
     def run(self):
+        import requests
         try:
-            # 构建完整的消息列表，确保不重复
-            if not self.history_messages:
-                messages = [{"role": "user", "content": self.prompt}]
-            else:
-                # 移除最后一个重复的消息
-                messages = self.history_messages[:-1] + [{"role": "user", "content": self.prompt}]
+            # 会话快照已包含当前用户消息，按模型的上下文预算组装
+            history = self.history_messages or [{"role": "user", "content": self.prompt}]
+            context = context_assembler.assemble(history, self.model)
+            messages = context.messages
             
             # 使用工厂创建AI服务提供商
             provider = AIProviderFactory.create_provider(self.model, self.api_key)
@@ -45,64 +51,303 @@ class AIChatThread(QThread):
 
 
 class AIStreamThread(QThread):
-    """AI流式聊天线程"""
+    """AI流式聊天线程
+
+    history_messages 为会话快照（MessageRecord元组或消息字典序列），已包含当前用户消息；
+    summary 为会话摘要（可选），被摘要覆盖的消息不再发送。
+
+    中断使用 cancel() 而不是 QThread.terminate()：强制结束线程会跳过限流与请求合并的收尾，
+    永久占用并发名额；取消后线程在下一个片段到达时关闭流并正常退出，不再发出信号。
+    """
     chunk_received = pyqtSignal(str)  # 接收到文本片段
+    context_assembled = pyqtSignal(int, int)  # 发送的上下文token数, 被裁剪的token数
+    first_token = pyqtSignal(float)  # 收到首个片段时发出首字延迟（秒），不必等到回复结束
+    timing_ready = pyqtSignal(float, float, bool)  # 首字延迟, 总耗时（秒）, 是否为回复缓存的回放
+    model_served = pyqtSignal(str)  # 实际提供回复的模型（自动路由时与请求的模型不同）
     stream_finished = pyqtSignal(str)  # 流式输出完成，发送完整文本
     error_occurred = pyqtSignal(str)
+    # 延迟追踪的附加标签（如会话ID），见 utils.tracing
+    trace_tags: Dict[str, Any] = {}
 
-    def __init__(self, prompt: str, api_key: str, history_messages: Optional[List[Dict]] = None, model: str = "glm-4-flash"):
+    def __init__(self, prompt: str, api_key: str, history_messages: Optional[Sequence] = None, model: str = "glm-4-flash",
+                 summary=None):
         super().__init__()
         self.prompt = prompt
         self.api_key = api_key
         self.history_messages = history_messages or []
         self.model = model
+        self.summary = summary
+        self._cancelled = threading.Event()
+        self._abort = StreamAbort()
+
+    def cancel(self):
+        """取消（可在任意线程调用）：立即关闭正在读取的响应，不必等到下一个片段"""
+        self._cancelled.set()
+        self._abort.abort()
 
     def run(self):
+        import requests
+        tracer.set_tags(model=self.model, **self.trace_tags)
+        request_span = tracer.begin('stream.request')
         try:
-            # 构建完整的消息列表
-            if not self.history_messages:
-                messages = [{"role": "user", "content": self.prompt}]
-            else:
-                messages = self.history_messages[:-1] + [{"role": "user", "content": self.prompt}]
+            started_at = time.perf_counter()
+            first_chunk_at = None
+            # 会话快照已包含当前用户消息，按模型的上下文预算组装
+            history = self.history_messages or [{"role": "user", "content": self.prompt}]
+            with tracer.span('stream.assemble_context'):
+                context = context_assembler.assemble(history, self.model, self.summary)
+            messages = context.messages
+            
+            self.context_assembled.emit(context.total_tokens, context.trimmed_tokens)
             
             # 使用工厂创建AI服务提供商
             provider = AIProviderFactory.create_provider(self.model, self.api_key)
-            response = provider.chat(messages=messages, model=self.model, stream=True)
-            
             full_content = ""
-            
-            if self.model.startswith("glm-"):
-                # 处理智谱AI的流式响应
-                for chunk in response:
-                    if hasattr(chunk.choices[0].delta, 'content') and chunk.choices[0].delta.content:
-                        chunk_text = chunk.choices[0].delta.content
+            chunk_count = 0
+            # 各服务商的流式响应统一为文本片段（缓存命中时为回放的片段）；
+            # 在中止范围内读取，cancel() 关闭阻塞在读取中的响应
+            with abort_scope(self._abort):
+                stream = provider.stream_chat(messages=messages, model=self.model)
+                try:
+                    for chunk_text in stream:
+                        if self._cancelled.is_set():
+                            break
+                        if first_chunk_at is None:
+                            first_chunk_at = time.perf_counter()
+                            tracer.instant('stream.first_token')
+                            self.first_token.emit(first_chunk_at - started_at)
                         full_content += chunk_text
+                        chunk_count += 1
                         self.chunk_received.emit(chunk_text)
-            else:
-                # 处理SiliconFlow的流式响应
-                for line in response.iter_lines():
-                    if line:
-                        line = line.decode('utf-8')
-                        if line.startswith('data: '):
-                            data_str = line[6:]  # 去掉 'data: ' 前缀
-                            if data_str.strip() == '[DONE]':
-                                break
-                            try:
-                                data = json.loads(data_str)
-                                if 'choices' in data and data['choices']:
-                                    delta = data['choices'][0].get('delta', {})
-                                    if 'content' in delta and delta['content']:
-                                        chunk_text = delta['content']
-                                        full_content += chunk_text
-                                        self.chunk_received.emit(chunk_text)
-                            except json.JSONDecodeError:
-                                continue
+                except Exception:
+                    # 取消时关闭响应导致的读取错误不是请求失败
+                    if not self._cancelled.is_set():
+                        raise
+                finally:
+                    # 关闭生成器：依次执行各层包装的收尾（释放并发名额、退出请求合并、关闭连接）
+                    stream.close()
+            if self._cancelled.is_set():
+                tracer.end(request_span, error='cancelled')
+                return
             
+            finished_at = time.perf_counter()
+            ttft = (first_chunk_at or finished_at) - started_at
+            served_model = getattr(provider, 'served_model', None) or self.model
+            cached = getattr(provider, 'cache_hit', False)
+            self.timing_ready.emit(ttft, finished_at - started_at, cached)
+            if served_model == self.model and not cached and AIProviderFactory.router is not None:
+                # 直接指定模型的请求同样计入路由统计（自动路由的请求由路由器自己记录；缓存回放不计入）
+                AIProviderFactory.router.record_success(self.model, ttft, finished_at - started_at, chunk_count)
+            tracer.end(request_span, chunks=chunk_count, served_model=served_model)
+            self.model_served.emit(served_model)
             self.stream_finished.emit(full_content)
             
         except requests.exceptions.RequestException as e:
+            tracer.end(request_span, error=type(e).__name__)
+            self._record_failure()
             error_message = f"网络请求错误: {e}"
             self.error_occurred.emit(error_message)
         except Exception as e:
+            tracer.end(request_span, error=type(e).__name__)
+            self._record_failure()
             error_message = f"发生意外错误: {str(e)}"
             self.error_occurred.emit(error_message)
+
+    def _record_failure(self):
+        """直接指定模型的请求失败同样计入路由统计"""
+        if AIProviderFactory.router is not None and self.model != AIProviderFactory.AUTO_MODEL:
+            AIProviderFactory.router.record_failure(self.model)
+
+
+class AsyncStreamTask(QObject):
+    """异步流式聊天任务
+
+    与 AIStreamThread 信号和接口一致（start/isRunning/cancel/wait），但运行在共享的事件循环线程上：
+    多个流式请求不再各占一个线程，中断即取消任务。不支持自动路由（"auto"）与对冲请求。
+    """
+    chunk_received = pyqtSignal(str)
+    context_assembled = pyqtSignal(int, int)
+    first_token = pyqtSignal(float)
+    timing_ready = pyqtSignal(float, float, bool)
+    model_served = pyqtSignal(str)
+    stream_finished = pyqtSignal(str)
+    error_occurred = pyqtSignal(str)
+    trace_tags: Dict[str, Any] = {}
+
+    def __init__(self, prompt: str, api_key: str, history_messages: Optional[Sequence] = None, model: str = "glm-4-flash",
+                 summary=None):
+        super().__init__()
+        self.prompt = prompt
+        self.api_key = api_key
+        self.history_messages = history_messages or []
+        self.model = model
+        self.summary = summary
+        self._future = None
+
+    def start(self):
+        from .event_loop import get_loop_thread
+        self._future = get_loop_thread().submit(self._run())
+
+    def isRunning(self) -> bool:
+        return self._future is not None and not self._future.done()
+
+    def cancel(self):
+        """取消任务（网络连接随之关闭）"""
+        if self._future is not None:
+            self._future.cancel()
+
+    def wait(self, msecs: Optional[int] = None) -> bool:
+        """等待任务结束（取消后只等待收尾，最多 msecs 毫秒）"""
+        if self._future is None:
+            return True
+        import concurrent.futures
+        try:
+            self._future.result(None if msecs is None else msecs / 1000)
+        except concurrent.futures.TimeoutError:
+            return False
+        except (concurrent.futures.CancelledError, Exception):
+            pass
+        return True
+
+    async def _run(self):
+        import asyncio
+        # 标签只作用于本任务
+        tracer.set_tags(model=self.model, **self.trace_tags)
+        request_span = tracer.begin('stream.request')
+        try:
+            started_at = time.perf_counter()
+            first_chunk_at = None
+            history = self.history_messages or [{"role": "user", "content": self.prompt}]
+            # 计算token较耗时，放到线程池中避免阻塞其他流
+            assemble_started = time.perf_counter_ns()
+            context = await asyncio.get_running_loop().run_in_executor(
+                None, context_assembler.assemble, history, self.model, self.summary
+            )
+            tracer.complete('stream.assemble_context', assemble_started)
+            self.context_assembled.emit(context.total_tokens, context.trimmed_tokens)
+
+            provider = AIProviderFactory.create_async_provider(self.model, self.api_key)
+            full_content = ""
+            chunk_count = 0
+            async for chunk_text in provider.chat_stream(context.messages, self.model):
+                if first_chunk_at is None:
+                    first_chunk_at = time.perf_counter()
+                    tracer.instant('stream.first_token')
+                    self.first_token.emit(first_chunk_at - started_at)
+                full_content += chunk_text
+                chunk_count += 1
+                self.chunk_received.emit(chunk_text)
+
+            finished_at = time.perf_counter()
+            ttft = (first_chunk_at or finished_at) - started_at
+            cached = getattr(provider, 'cache_hit', False)
+            self.timing_ready.emit(ttft, finished_at - started_at, cached)
+            if not cached and AIProviderFactory.router is not None:
+                AIProviderFactory.router.record_success(self.model, ttft, finished_at - started_at, chunk_count)
+            tracer.end(request_span, chunks=chunk_count)
+            self.model_served.emit(self.model)
+            self.stream_finished.emit(full_content)
+        except asyncio.CancelledError:
+            tracer.end(request_span, error='cancelled')
+            raise
+        except Exception as e:
+            tracer.end(request_span, error=type(e).__name__)
+            if AIProviderFactory.router is not None:
+                AIProviderFactory.router.record_failure(self.model)
+            self.error_occurred.emit(f"发生意外错误: {str(e)}")
+
+
+class ProcessStreamTask(QObject):
+    """在服务商子进程中运行的流式聊天任务
+
+    与 AIStreamThread 信号和接口一致；帧由子进程的读取线程收到后通过信号排队送回界面线程。
+    不支持自动路由（"auto"）与对冲请求。
+    """
+    chunk_received = pyqtSignal(str)
+    context_assembled = pyqtSignal(int, int)
+    first_token = pyqtSignal(float)
+    timing_ready = pyqtSignal(float, float, bool)
+    model_served = pyqtSignal(str)
+    stream_finished = pyqtSignal(str)
+    error_occurred = pyqtSignal(str)
+
+    def __init__(self, provider_process, prompt: str, api_key: str, history_messages: Optional[Sequence] = None,
+                 model: str = "glm-4-flash", summary=None):
+        super().__init__()
+        self.provider_process = provider_process
+        self.prompt = prompt
+        self.api_key = api_key
+        self.history_messages = history_messages or []
+        self.model = model
+        self.summary = summary
+        self._request_id = None
+        self._parts = []
+        self._finished = threading.Event()
+        self._started_at = 0.0
+
+    def start(self):
+        self._started_at = time.perf_counter()
+        self._request_id = self.provider_process.submit(
+            self, self.model, self.api_key, self.history_messages, self.summary, self.prompt
+        )
+
+    def isRunning(self) -> bool:
+        return self._request_id is not None and not self._finished.is_set()
+
+    def cancel(self):
+        """取消请求"""
+        if self._request_id is not None:
+            self.provider_process.cancel(self._request_id)
+            self._finished.set()
+
+    def wait(self, msecs: Optional[int] = None) -> bool:
+        return self._finished.wait(None if msecs is None else msecs / 1000)
+
+    # 以下方法在读取线程中调用（StreamHandler接口）
+    def on_context(self, total_tokens: int, trimmed_tokens: int):
+        self.context_assembled.emit(total_tokens, trimmed_tokens)
+
+    def on_delta(self, text: str):
+        if not self._parts:
+            # 在界面进程中计时（含进程间传输），回复结束后以子进程测得的首字延迟为准
+            self.first_token.emit(time.perf_counter() - self._started_at)
+        self._parts.append(text)
+        self.chunk_received.emit(text)
+
+    def on_done(self, ttft: float, total: float, served_model: str, cached: bool):
+        self.timing_ready.emit(ttft, total, cached)
+        if not cached and AIProviderFactory.router is not None:
+            AIProviderFactory.router.record_success(self.model, ttft, total, len(self._parts))
+        self._finished.set()
+        self.model_served.emit(served_model)
+        self.stream_finished.emit(''.join(self._parts))
+
+    def on_error(self, message: str):
+        if AIProviderFactory.router is not None:
+            AIProviderFactory.router.record_failure(self.model)
+        self._finished.set()
+        self.error_occurred.emit(message)
+
+
+class ConversationSummaryThread(QThread):
+    """后台会话摘要线程"""
+    summary_ready = pyqtSignal(str, int)  # 摘要内容, 覆盖到的消息ID
+    error_occurred = pyqtSignal(str)
+
+    def __init__(self, summarizer, api_key: str, records, summary=None):
+        super().__init__()
+        self.summarizer = summarizer
+        self.api_key = api_key
+        self.records = records
+        self.summary = summary
+
+    def run(self):
+        try:
+            # 摘要是后台任务，限流排队时让位于用户正在等待的对话
+            provider = AIProviderFactory.create_provider(self.summarizer.summary_model, self.api_key,
+                                                         priority=Priority.BACKGROUND)
+            new_summary = self.summarizer.summarize(provider, self.records, self.summary)
+            if new_summary is not None:
+                self.summary_ready.emit(new_summary.content, new_summary.covers_until)
+        except Exception as e:
+            self.error_occurred.emit(f"会话摘要失败: {str(e)}")
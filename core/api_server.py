@@ -0,0 +1,409 @@
+"""
+本地API服务
+无界面运行（python main.py --serve），提供OpenAI兼容的 /v1/chat/completions（支持SSE流式输出），
+与图形界面共用配置、API密钥、服务商路由与聊天记录数据库。
+
+基于asyncio的HTTP/1.1服务：所有连接在同一个事件循环上处理，上游请求使用共享的异步连接池；
+自动路由与对冲请求走同步服务商，在线程池中运行。聊天记录由单个写入线程依次保存。
+"""
+import asyncio
+import concurrent.futures
+import json
+import threading
+import time
+import uuid
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from models import AIProviderFactory
+from models.transport import StreamAbort, abort_scope
+
+# 请求体大小上限（字节）
+MAX_BODY_BYTES = 8 * 1024 * 1024
+# 请求头数量上限
+MAX_HEADERS = 100
+
+HTTP_REASONS = {
+    200: "OK", 400: "Bad Request", 401: "Unauthorized", 404: "Not Found", 405: "Method Not Allowed",
+    411: "Length Required", 413: "Payload Too Large", 500: "Internal Server Error", 502: "Bad Gateway",
+}
+
+
+class HTTPError(Exception):
+    """返回给客户端的错误（OpenAI错误格式）"""
+
+    def __init__(self, status: int, message: str, error_type: str = "invalid_request_error"):
+        super().__init__(message)
+        self.status = status
+        self.error_type = error_type
+
+
+class ChatCompletionServer:
+    """OpenAI兼容的本地API服务
+
+    db: ChatDatabase，为None时不保存聊天记录
+    api_key_lookup: 根据模型获取API密钥（通常为 ConfigManager.get_api_key_for_model）
+    default_model: 请求未指定模型时使用的模型
+    token: 非空时客户端需携带 Authorization: Bearer <token>
+    """
+
+    def __init__(self, db, api_key_lookup: Callable[[str], str], default_model: Optional[str] = None,
+                 host: str = '127.0.0.1', port: int = 8765, token: Optional[str] = None):
+        self.db = db
+        self.api_key_lookup = api_key_lookup
+        self.default_model = default_model
+        self.host = host
+        self.port = port
+        self.token = token
+        self._server = None
+        self._connections = set()
+        # 同步服务商（自动路由、对冲请求）的流式读取线程
+        self._stream_executor = concurrent.futures.ThreadPoolExecutor(max_workers=64, thread_name_prefix="api-stream")
+        # 聊天记录按顺序由单个线程写入
+        self._db_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="api-db")
+        # 统计
+        self.requests = 0
+        self.active_streams = 0
+
+    async def start(self):
+        """开始监听（端口为0时由系统分配，实际端口写回 self.port）"""
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def serve_forever(self):
+        if self._server is None:
+            await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            # 关闭空闲的keep-alive连接与进行中的流
+            for task in list(self._connections):
+                task.cancel()
+            await asyncio.gather(*self._connections, return_exceptions=True)
+            await self._server.wait_closed()
+        self._stream_executor.shutdown(wait=False, cancel_futures=True)
+        self._db_executor.shutdown(wait=True)
+
+    # ---- HTTP ----
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """处理一个连接（支持keep-alive，流式响应结束后关闭连接）"""
+        task = asyncio.current_task()
+        self._connections.add(task)
+        try:
+            while True:
+                try:
+                    request = await self._read_request(reader)
+                except HTTPError as e:
+                    await self._send_error(writer, e, keep_alive=False)
+                    break
+                if request is None:
+                    break
+                method, path, headers, body = request
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                self.requests += 1
+                try:
+                    keep_alive = await self._dispatch(writer, method, path, headers, body, keep_alive)
+                except HTTPError as e:
+                    await self._send_error(writer, e, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass
+        finally:
+            self._connections.discard(task)
+            writer.close()
+
+    async def _read_request(self, reader: asyncio.StreamReader):
+        """读取一个请求，连接关闭时返回None"""
+        request_line = await reader.readline()
+        if not request_line:
+            return None
+        try:
+            method, target, _ = request_line.decode('latin-1').rstrip('\r\n').split(' ', 2)
+        except ValueError:
+            raise HTTPError(400, "无效的请求行")
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            if len(headers) >= MAX_HEADERS:
+                raise HTTPError(400, "请求头过多")
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            raise HTTPError(411, "请求体需要提供Content-Length")
+        try:
+            length = int(headers.get('content-length', '0'))
+        except ValueError:
+            raise HTTPError(400, "无效的Content-Length")
+        if length > MAX_BODY_BYTES:
+            raise HTTPError(413, "请求体过大")
+        body = await reader.readexactly(length) if length else b''
+        return method.upper(), target.split('?', 1)[0], headers, body
+
+    def _check_auth(self, headers: Dict[str, str]):
+        if self.token and headers.get('authorization', '') != f"Bearer {self.token}":
+            raise HTTPError(401, "无效的访问令牌", "authentication_error")
+
+    async def _dispatch(self, writer, method: str, path: str, headers: Dict[str, str], body: bytes,
+                        keep_alive: bool) -> bool:
+        """处理请求，返回连接是否可以继续使用"""
+        if path == '/v1/models':
+            if method != 'GET':
+                raise HTTPError(405, "只支持GET")
+            self._check_auth(headers)
+            models = [AIProviderFactory.AUTO_MODEL] + [
+                model for group in AIProviderFactory.get_supported_models().values() for model in group
+            ]
+            await self._send_json(writer, 200, {
+                "object": "list",
+                "data": [{"id": model, "object": "model", "owned_by": "nefelibata"} for model in models],
+            }, keep_alive)
+            return keep_alive
+        if path == '/v1/chat/completions':
+            if method != 'POST':
+                raise HTTPError(405, "只支持POST")
+            self._check_auth(headers)
+            return await self._chat_completions(writer, headers, body, keep_alive)
+        raise HTTPError(404, f"未知的路径: {path}")
+
+    async def _send_response(self, writer, status: int, headers: List[Tuple[str, str]], body: bytes = b'',
+                             keep_alive: bool = True):
+        lines = [f"HTTP/1.1 {status} {HTTP_REASONS.get(status, '')}"]
+        lines += [f"{name}: {value}" for name, value in headers]
+        lines.append(f"Connection: {'keep-alive' if keep_alive else 'close'}")
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body)
+        await writer.drain()
+
+    async def _send_json(self, writer, status: int, data, keep_alive: bool = True,
+                         extra_headers: Optional[List[Tuple[str, str]]] = None):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        headers = [("Content-Type", "application/json; charset=utf-8"), ("Content-Length", str(len(body)))]
+        await self._send_response(writer, status, headers + (extra_headers or []), body, keep_alive)
+
+    async def _send_error(self, writer, error: HTTPError, keep_alive: bool):
+        await self._send_json(writer, error.status, {
+            "error": {"message": str(error), "type": error.error_type, "code": error.status}
+        }, keep_alive)
+
+    # ---- 聊天 ----
+
+    def _parse_chat_request(self, body: bytes):
+        try:
+            data = json.loads(body or b'{}')
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            raise HTTPError(400, "请求体不是有效的JSON")
+        if not isinstance(data, dict):
+            raise HTTPError(400, "请求体必须是JSON对象")
+        model = data.get('model') or self.default_model
+        if not model:
+            raise HTTPError(400, "缺少model")
+        messages = data.get('messages')
+        if not isinstance(messages, list) or not messages:
+            raise HTTPError(400, "messages 必须是非空数组")
+        normalized = []
+        for message in messages:
+            if not isinstance(message, dict) or message.get('role') not in ('system', 'user', 'assistant'):
+                raise HTTPError(400, "消息的role必须是 system、user 或 assistant")
+            content = message.get('content')
+            if isinstance(content, list):
+                # 只取多段内容中的文本
+                content = ''.join(part.get('text', '') for part in content if isinstance(part, dict))
+            if not isinstance(content, str):
+                raise HTTPError(400, "消息的content必须是字符串")
+            normalized.append({"role": message['role'], "content": content})
+        return model, normalized, bool(data.get('stream'))
+
+    async def _chat_completions(self, writer, headers: Dict[str, str], body: bytes, keep_alive: bool) -> bool:
+        from chat_db import ChatDatabase
+        model, messages, stream = self._parse_chat_request(body)
+        api_key = self.api_key_lookup(model)
+        if not api_key:
+            raise HTTPError(400, f"模型 {model} 未设置API密钥")
+        conversation_id = headers.get('x-conversation-id') or f"{ChatDatabase.API_CONVERSATION_PREFIX}{uuid.uuid4()}"
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        created = int(time.time())
+        reply = _Reply(model)
+
+        if not stream:
+            try:
+                content = ''.join([chunk async for chunk in self._stream_reply(reply, api_key, messages)])
+            except HTTPError:
+                raise
+            except Exception as e:
+                raise HTTPError(502, f"上游请求失败: {e}", "upstream_error")
+            self._persist(conversation_id, messages, content, reply.served_model)
+            await self._send_json(writer, 200, {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": reply.served_model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                             "finish_reason": "stop"}],
+            }, keep_alive, [("X-Conversation-Id", conversation_id)])
+            return keep_alive
+
+        # 流式响应：发送完毕后关闭连接（不使用分块编码）
+        await self._send_response(writer, 200, [
+            ("Content-Type", "text/event-stream; charset=utf-8"),
+            ("Cache-Control", "no-cache"),
+            ("X-Conversation-Id", conversation_id),
+        ], keep_alive=False)
+
+        def event(delta, finish_reason=None):
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": reply.served_model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }
+            return f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode('utf-8')
+
+        parts = []
+        self.active_streams += 1
+        try:
+            writer.write(event({"role": "assistant"}))
+            stream_iter = self._stream_reply(reply, api_key, messages)
+            try:
+                async for chunk in stream_iter:
+                    parts.append(chunk)
+                    writer.write(event({"content": chunk}))
+                    # 客户端读取慢时在此等待；客户端断开时抛出连接错误，上游请求随之关闭
+                    await writer.drain()
+            finally:
+                await stream_iter.aclose()
+            writer.write(event({}, "stop") + b"data: [DONE]\n\n")
+            await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            raise
+        except Exception as e:
+            error = {"error": {"message": f"上游请求失败: {e}", "type": "upstream_error"}}
+            writer.write(f"data: {json.dumps(error, ensure_ascii=False)}\n\n".encode('utf-8'))
+            await writer.drain()
+            return False
+        finally:
+            self.active_streams -= 1
+        self._persist(conversation_id, messages, ''.join(parts), reply.served_model)
+        return False
+
+    async def _stream_reply(self, reply: "_Reply", api_key: str, messages: List[Dict[str, str]]) -> AsyncIterator[str]:
+        """请求上游服务商，逐段返回回复文本
+
+        自动路由与对冲请求依赖同步服务商，在线程池中运行；其余模型使用异步服务商
+        """
+        model = reply.model
+        if model == AIProviderFactory.AUTO_MODEL or AIProviderFactory.hedging is not None:
+            provider = AIProviderFactory.create_provider(model, api_key)
+            async for chunk in self._iter_sync_stream(provider, messages, model):
+                yield chunk
+            reply.served_model = getattr(provider, 'served_model', None) or model
+            return
+        provider = AIProviderFactory.create_async_provider(model, api_key)
+        async for chunk in provider.chat_stream(messages, model):
+            yield chunk
+
+    async def _iter_sync_stream(self, provider, messages: List[Dict[str, str]], model: str) -> AsyncIterator[str]:
+        """在线程池中读取同步服务商的流式输出（客户端断开时立即关闭上游响应，不等下一个片段）"""
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        stop = threading.Event()
+        abort = StreamAbort()
+
+        def put(item):
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, item)
+            except RuntimeError:
+                pass  # 事件循环已关闭
+
+        def produce():
+            with abort_scope(abort):
+                stream = provider.stream_chat(messages=messages, model=model)
+                try:
+                    for chunk in stream:
+                        if stop.is_set():
+                            break
+                        put(('chunk', chunk))
+                    put(('end', None))
+                except Exception as e:
+                    put(('error', e))
+                finally:
+                    stream.close()
+
+        loop.run_in_executor(self._stream_executor, produce)
+        try:
+            while True:
+                kind, value = await queue.get()
+                if kind == 'chunk':
+                    yield value
+                elif kind == 'error':
+                    raise value
+                else:
+                    return
+        finally:
+            stop.set()
+            abort.abort()
+
+    def _persist(self, conversation_id: str, messages: List[Dict[str, str]], content: str, model: str):
+        """保存最后一条用户消息与回复（在写入线程中执行，不阻塞事件循环）"""
+        if self.db is None or not content:
+            return
+        user_content = next((m['content'] for m in reversed(messages) if m['role'] == 'user'), None)
+
+        def write():
+            try:
+                if user_content is not None:
+                    self.db.save_message(user_content, 'user', conversation_id)
+                self.db.save_message(content, 'ai', conversation_id, model)
+            except Exception as e:
+                print(f"保存聊天记录失败: {e}")
+
+        self._db_executor.submit(write)
+
+
+class _Reply:
+    """一次回复的模型信息（自动路由时 served_model 为实际提供回复的模型）"""
+    __slots__ = ('model', 'served_model')
+
+    def __init__(self, model: str):
+        self.model = model
+        self.served_model = model
+
+
+def main(argv: Optional[List[str]] = None):
+    """命令行入口：python main.py --serve [--host HOST] [--port PORT]"""
+    import argparse
+    import os
+    from chat_db import ChatDatabase
+    from core.config_manager import ConfigManager
+    from core.provider_setup import configure_providers
+    from utils.resources import get_config_paths
+
+    config_manager = ConfigManager(get_config_paths())
+    settings = config_manager.get_server_settings()
+    parser = argparse.ArgumentParser(prog="main.py --serve", description="OpenAI兼容的本地API服务")
+    parser.add_argument('--host', default=settings['host'])
+    parser.add_argument('--port', type=int, default=settings['port'])
+    args = parser.parse_args(argv)
+
+    db = ChatDatabase()
+    configure_providers(config_manager, os.path.dirname(db.db_path))
+    server = ChatCompletionServer(db, config_manager.get_api_key_for_model, config_manager.get_current_model(),
+                                  args.host, args.port, settings['token'])
+
+    async def run():
+        await server.start()
+        print(f"本地API服务已启动: http://{server.host}:{server.port}/v1/chat/completions", flush=True)
+        try:
+            await server.serve_forever()
+        finally:
+            await server.close()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        print("本地API服务已停止")
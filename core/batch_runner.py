@@ -0,0 +1,298 @@
+"""
+批量提示运行器
+从JSONL/CSV文件读取提示，经 AIProviderFactory 创建的服务提供商（限流、容错、请求合并与回复缓存）
+在有限的工作线程中并发运行，结果逐条追加写入JSONL（含每条的延迟与token统计）。
+
+输出文件同时作为检查点：中断后以相同参数重新运行，已成功的条目会被跳过。
+
+用法: python main.py --batch prompts.jsonl --output results.jsonl [--model MODEL] [--concurrency 8]
+
+输入格式（JSONL每行一个对象，CSV第一行为列名）：
+    id        条目ID（可选，默认为行号）
+    prompt    用户提示（与 messages 二选一）
+    messages  完整消息列表（仅JSONL）
+    system    系统提示（可选）
+    model     覆盖 --model（可选）
+"""
+import concurrent.futures
+import csv
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set
+
+from models import AIProviderFactory
+from models.transport import StreamAbort, abort_scope
+from core.context_assembler import estimate_tokens
+
+
+class BatchInputError(Exception):
+    """输入文件格式错误"""
+    pass
+
+
+def _item_from_record(record: Dict[str, Any], line_number: int) -> Dict[str, Any]:
+    """把输入记录转换为条目：{'id', 'index', 'messages', 'model'}"""
+    messages = record.get('messages')
+    if messages is None:
+        prompt = record.get('prompt')
+        if not prompt:
+            raise BatchInputError(f"第 {line_number} 行缺少 prompt 或 messages")
+        messages = [{"role": "user", "content": prompt}]
+        if record.get('system'):
+            messages.insert(0, {"role": "system", "content": record['system']})
+    elif not isinstance(messages, list) or not messages:
+        raise BatchInputError(f"第 {line_number} 行的 messages 必须是非空数组")
+    item_id = record.get('id')
+    return {
+        "id": str(item_id) if item_id not in (None, '') else str(line_number),
+        "index": line_number,
+        "messages": messages,
+        "model": record.get('model') or None,
+    }
+
+
+def load_prompts(path: str) -> List[Dict[str, Any]]:
+    """读取JSONL或CSV（按扩展名判断）输入文件"""
+    items = []
+    with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+        if path.lower().endswith('.csv'):
+            for line_number, record in enumerate(csv.DictReader(f), start=1):
+                items.append(_item_from_record(record, line_number))
+        else:
+            for line_number, line in enumerate(f, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError as e:
+                    raise BatchInputError(f"第 {line_number} 行不是有效的JSON: {e}")
+                if not isinstance(record, dict):
+                    raise BatchInputError(f"第 {line_number} 行必须是JSON对象")
+                items.append(_item_from_record(record, line_number))
+    seen = set()
+    for item in items:
+        if item['id'] in seen:
+            raise BatchInputError(f"条目ID重复: {item['id']}")
+        seen.add(item['id'])
+    return items
+
+
+def load_checkpoint(output_path: str) -> Set[str]:
+    """读取输出文件中已成功的条目ID（中断时写了一半的最后一行会被忽略）"""
+    completed = set()
+    if not os.path.exists(output_path):
+        return completed
+    with open(output_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if isinstance(result, dict) and result.get('status') == 'ok':
+                completed.add(str(result.get('id')))
+    return completed
+
+
+class BatchRunner:
+    """批量运行器
+
+    api_key_lookup: 根据模型获取API密钥（通常为 ConfigManager.get_api_key_for_model）
+    concurrency: 工作线程数；实际并发还受每个服务商的限流器约束（见 [RATE_LIMIT]）
+    """
+
+    def __init__(self, model: str, api_key_lookup: Callable[[str], str], output_path: str,
+                 concurrency: int = 4, progress: Optional[Callable[[Dict[str, Any]], None]] = None):
+        self.model = model
+        self.api_key_lookup = api_key_lookup
+        self.output_path = output_path
+        self.concurrency = max(1, concurrency)
+        self.progress = progress
+        self._write_lock = threading.Lock()
+        self._stop = threading.Event()
+        # 进行中条目的中止句柄：中断时立即关闭它们正在读取的响应
+        self._aborts: Set[StreamAbort] = set()
+        self._aborts_lock = threading.Lock()
+        # 统计
+        self.succeeded = 0
+        self.failed = 0
+        self.skipped = 0
+
+    def run(self, items: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+        """运行所有未完成的条目，返回汇总统计；KeyboardInterrupt时写入已完成的结果后重新抛出"""
+        completed = load_checkpoint(self.output_path)
+        items = list(items)
+        pending = [item for item in items if item['id'] not in completed]
+        # 只计入本次输入中已完成的条目（输出文件里可能还有其他输入的结果）
+        self.skipped = len(items) - len(pending)
+        started = time.perf_counter()
+        latencies = []
+        completion_tokens = 0
+
+        directory = os.path.dirname(os.path.abspath(self.output_path))
+        os.makedirs(directory, exist_ok=True)
+        with open(self.output_path, 'a', encoding='utf-8') as output, \
+                concurrent.futures.ThreadPoolExecutor(self.concurrency, thread_name_prefix="batch") as executor:
+            if output.tell() and not self._ends_with_newline():
+                # 上次中断时写了一半的行：另起一行，避免与新结果连在一起
+                output.write('\n')
+            futures = [executor.submit(self._run_item, item) for item in pending]
+            handled = set()
+            try:
+                for future in concurrent.futures.as_completed(futures):
+                    handled.add(future)
+                    result = future.result()
+                    if result is None:
+                        continue
+                    self._write(output, result)
+                    if result['status'] == 'ok':
+                        self.succeeded += 1
+                        latencies.append(result['latency_s'])
+                        completion_tokens += result['completion_tokens']
+                    else:
+                        self.failed += 1
+                    if self.progress is not None:
+                        self.progress(result)
+            except KeyboardInterrupt:
+                # 未开始的条目不再运行，进行中的条目立即中止（不等停滞的上游；重新运行时再执行），
+                # 已完成但尚未写入的结果仍然写入
+                self._stop.set()
+                with self._aborts_lock:
+                    aborts = list(self._aborts)
+                for abort in aborts:
+                    abort.abort()
+                for future in futures:
+                    future.cancel()
+                for future in futures:
+                    if future not in handled and not future.cancelled():
+                        result = future.result()
+                        if result is not None:
+                            self._write(output, result)
+                raise
+
+        elapsed = time.perf_counter() - started
+        latencies.sort()
+        return {
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "skipped": self.skipped,
+            "elapsed_s": round(elapsed, 3),
+            "items_per_s": round(len(latencies) / elapsed, 3) if elapsed > 0 else 0.0,
+            "completion_tokens_per_s": round(completion_tokens / elapsed, 1) if elapsed > 0 else 0.0,
+            "latency_p50_s": latencies[len(latencies) // 2] if latencies else None,
+            "latency_p95_s": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] if latencies else None,
+        }
+
+    def _ends_with_newline(self) -> bool:
+        with open(self.output_path, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b'\n'
+
+    def _write(self, output, result: Dict[str, Any]):
+        with self._write_lock:
+            output.write(json.dumps(result, ensure_ascii=False) + '\n')
+            output.flush()
+
+    def _run_item(self, item: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """运行一个条目（工作线程中），返回输出记录；批量已停止时返回None"""
+        abort = StreamAbort()
+        with self._aborts_lock:
+            self._aborts.add(abort)
+        try:
+            # 先登记再检查：中断时要么看到停止标记，要么已被中止
+            if self._stop.is_set():
+                return None
+            with abort_scope(abort):
+                return self._stream_item(item)
+        finally:
+            with self._aborts_lock:
+                self._aborts.discard(abort)
+
+    def _stream_item(self, item: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """读取一个条目的流式回复"""
+        model = item['model'] or self.model
+        result = {
+            "id": item['id'],
+            "index": item['index'],
+            "model": model,
+            "prompt_tokens": sum(estimate_tokens(message.get('content') or '') for message in item['messages']),
+        }
+        started = time.perf_counter()
+        first_chunk_at = None
+        parts = []
+        stream = None
+        try:
+            provider = AIProviderFactory.create_provider(model, self.api_key_lookup(model))
+            stream = provider.stream_chat(messages=item['messages'], model=model)
+            for chunk in stream:
+                if self._stop.is_set():
+                    return None
+                if first_chunk_at is None:
+                    first_chunk_at = time.perf_counter()
+                parts.append(chunk)
+        except Exception as e:
+            if self._stop.is_set():
+                return None  # 中断时关闭响应导致的读取错误，不记为失败
+            result.update(status="error", error=str(e), latency_s=round(time.perf_counter() - started, 3))
+            return result
+        finally:
+            if stream is not None:
+                stream.close()
+        response = ''.join(parts)
+        result.update(
+            status="ok",
+            served_model=getattr(provider, 'served_model', None) or model,
+            response=response,
+            latency_s=round(time.perf_counter() - started, 3),
+            ttft_s=round(first_chunk_at - started, 3) if first_chunk_at is not None else None,
+            completion_tokens=estimate_tokens(response),
+            chunks=len(parts),
+        )
+        return result
+
+
+def main(argv: Optional[List[str]] = None):
+    """命令行入口：python main.py --batch INPUT --output OUTPUT [--model MODEL] [--concurrency N]"""
+    import argparse
+    import sys
+    from chat_db import ChatDatabase
+    from core.config_manager import ConfigManager
+    from core.provider_setup import configure_providers
+    from utils.resources import get_config_paths
+
+    parser = argparse.ArgumentParser(prog="main.py --batch", description="批量运行提示，结果写入JSONL")
+    parser.add_argument('input', help="输入文件（.jsonl 或 .csv）")
+    parser.add_argument('--output', required=True, help="输出JSONL文件（同时作为检查点）")
+    parser.add_argument('--model', help="使用的模型（默认为界面中选择的模型）")
+    parser.add_argument('--concurrency', type=int, default=4, help="工作线程数")
+    args = parser.parse_args(argv)
+
+    config_manager = ConfigManager(get_config_paths())
+    configure_providers(config_manager, os.path.dirname(ChatDatabase.get_default_db_path()))
+    model = args.model or config_manager.get_current_model()
+    if not model:
+        parser.error("未选择模型，请使用 --model 指定")
+    try:
+        items = load_prompts(args.input)
+    except (OSError, BatchInputError) as e:
+        print(f"读取输入失败: {e}", file=sys.stderr)
+        sys.exit(2)
+
+    total = len(items)
+    done = [0]
+
+    def progress(result):
+        done[0] += 1
+        status = "完成" if result['status'] == 'ok' else f"失败: {result['error'][:80]}"
+        print(f"[{done[0]}/{total - runner.skipped}] {result['id']} {result['latency_s']:.2f}s {status}", flush=True)
+
+    runner = BatchRunner(model, config_manager.get_api_key_for_model, args.output, args.concurrency, progress)
+    try:
+        summary = runner.run(items)
+    except KeyboardInterrupt:
+        print(f"\n已中断：成功 {runner.succeeded} 条，失败 {runner.failed} 条；重新运行相同命令即可从断点继续")
+        sys.exit(130)
+    print(json.dumps(summary, ensure_ascii=False))
+    if summary['failed']:
+        sys.exit(1)
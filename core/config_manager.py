@@ -3,7 +3,7 @@
 """
 import configparser
 import re
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 from .crypto_utils import CryptoManager
 
 
@@ -75,13 +75,212 @@ class ConfigManager:
         self._save_model_config()
 
     def get_api_key_for_model(self, model: str) -> str:
-        """根据模型获取对应的API密钥"""
+        """根据模型获取对应的API密钥（自动路由时返回模型组中第一个可用的密钥）"""
+        if model == "auto":
+            group = self.get_auto_group()
+            return self.get_api_key_for_model(group[0]) if group else ""
+        from models.mock_provider import is_mock_model
+        if is_mock_model(model):
+            # 本地模拟服务商不需要API密钥
+            return "mock"
         if model.startswith("deepseek-ai") or model.startswith("Qwen/"):
             # SiliconFlow 提供商支持的模型
             return self.get_api_key("deepseek")
         else:
             # 智谱AI 提供商支持的模型
             return self.get_api_key("glm")
+
+    def get_chat_option(self, name: str, default: str = "") -> str:
+        """获取聊天选项（[CHAT]节，明文保存）"""
+        if self.config.has_section('CHAT'):
+            return self.config['CHAT'].get(name, default)
+        return default
+
+    def save_chat_option(self, name: str, value: str):
+        """保存聊天选项"""
+        if not self.config.has_section('CHAT'):
+            self.config.add_section('CHAT')
+        self.config['CHAT'][name] = value
+        self._save_config()
+
+    def get_auto_group(self, available_only: bool = True) -> List[str]:
+        """获取自动路由的等价模型组，available_only 为真时只包含已设置API Key的模型
+
+        在config.ini中配置，默认为所有支持的模型：
+            [CHAT]
+            auto_group = glm-4-plus,deepseek-ai/DeepSeek-V3,Qwen/Qwen3-235B-A22B
+        """
+        configured = self.get_chat_option('auto_group')
+        if configured:
+            models = [model.strip() for model in configured.split(',') if model.strip()]
+        else:
+            from models import AIProviderFactory
+            models = [model for group in AIProviderFactory.get_supported_models().values() for model in group]
+        from models.mock_provider import is_mock_model
+        models = [model for model in models if model != "auto" and (configured or not is_mock_model(model))]
+        if not available_only:
+            return models
+        return [model for model in models if self.get_api_key_for_model(model)]
+
+    def get_hedging_settings(self) -> Optional[Dict[str, Any]]:
+        """获取对冲请求设置，未启用时返回None
+
+        在config.ini中配置：
+            [CHAT]
+            hedging = true
+            hedging_percentile = 0.9
+            hedging_budget = 0.1
+            hedging_alternate = same  ; same: 同一模型，group: 自动路由模型组中的等价模型
+        """
+        if self.get_chat_option('hedging', 'false').lower() not in ('true', '1', 'yes', 'on'):
+            return None
+        try:
+            return {
+                'percentile': float(self.get_chat_option('hedging_percentile', '0.9')),
+                'budget_ratio': float(self.get_chat_option('hedging_budget', '0.1')),
+                'alternate_mode': self.get_chat_option('hedging_alternate', 'same').strip().lower(),
+            }
+        except ValueError as e:
+            print(f"对冲请求配置无效: {e}")
+            return None
+
+    def get_resilience_settings(self):
+        """获取容错策略（超时、空闲看门狗与重试），可按模型单独配置
+
+        在config.ini中配置（单位：秒），未配置的项使用默认值：
+            [RESILIENCE]
+            connect_timeout = 10
+            read_timeout = 120
+            idle_timeout = 60
+            max_retries = 2
+
+            [RESILIENCE deepseek-ai/DeepSeek-R1]
+            idle_timeout = 180
+        """
+        from models import ResiliencePolicy, ResilienceSettings
+
+        def parse(section, base):
+            values = {}
+            for name in ('connect_timeout', 'read_timeout', 'idle_timeout', 'backoff_base', 'backoff_max'):
+                if name in section:
+                    values[name] = float(section[name])
+            if 'max_retries' in section:
+                values['max_retries'] = int(section['max_retries'])
+            return base.copy(**values)
+
+        default = ResiliencePolicy()
+        overrides = {}
+        try:
+            if self.config.has_section('RESILIENCE'):
+                default = parse(self.config['RESILIENCE'], default)
+            for section_name in self.config.sections():
+                if section_name.startswith('RESILIENCE '):
+                    model = section_name[len('RESILIENCE '):].strip()
+                    overrides[model] = parse(self.config[section_name], default)
+        except ValueError as e:
+            print(f"容错策略配置无效，使用默认值: {e}")
+            return ResilienceSettings()
+        return ResilienceSettings(default, overrides)
+
+    def get_rate_limit_settings(self) -> Dict[str, Dict[str, Any]]:
+        """获取限流设置：服务商名称 -> RateLimiter参数（'' 为所有服务商的默认值）
+
+        在config.ini中配置，限额对同一服务商的同一API密钥共享：
+            [RATE_LIMIT]
+            rate = 2              ; 每秒请求数
+            burst = 4             ; 允许的突发请求数
+            max_concurrency = 4   ; 同时进行的请求上限
+            background_reserve = 1 ; 为交互请求保留的并发名额
+
+            [RATE_LIMIT siliconflow]
+            rate = 1
+        """
+        settings = {}
+        try:
+            for section_name in self.config.sections():
+                if section_name == 'RATE_LIMIT':
+                    provider_name = ''
+                elif section_name.startswith('RATE_LIMIT '):
+                    provider_name = section_name[len('RATE_LIMIT '):].strip()
+                else:
+                    continue
+                section = self.config[section_name]
+                values = {}
+                for name in ('rate', 'min_rate', 'recovery'):
+                    if name in section:
+                        values[name] = float(section[name])
+                for name in ('burst', 'max_concurrency', 'background_reserve'):
+                    if name in section:
+                        values[name] = int(section[name])
+                settings[provider_name] = values
+        except ValueError as e:
+            print(f"限流配置无效，使用默认值: {e}")
+            return {}
+        return settings
+
+    def get_server_settings(self) -> Dict[str, Any]:
+        """获取本地API服务设置（python main.py --serve）
+
+        在config.ini中配置：
+            [SERVER]
+            host = 127.0.0.1
+            port = 8765
+            token =          ; 非空时客户端需携带 Authorization: Bearer <token>
+        """
+        section = self.config['SERVER'] if self.config.has_section('SERVER') else {}
+        try:
+            port = int(section.get('port', '8765'))
+        except ValueError:
+            print("API服务端口配置无效，使用默认值 8765")
+            port = 8765
+        return {
+            'host': section.get('host', '127.0.0.1'),
+            'port': port,
+            'token': section.get('token', '') or None,
+        }
+
+    def get_compaction_settings(self) -> Optional[Dict[str, Any]]:
+        """获取会话摘要压缩设置，未启用时返回None
+
+        在config.ini中配置：
+            [CHAT]
+            compaction = true
+            compaction_threshold = 6000
+            compaction_keep_recent = 2000
+            summary_model = glm-z1-flash
+        """
+        if self.get_chat_option('compaction', 'false').lower() not in ('true', '1', 'yes', 'on'):
+            return None
+        try:
+            return {
+                'threshold_tokens': int(self.get_chat_option('compaction_threshold', '6000')),
+                'keep_recent_tokens': int(self.get_chat_option('compaction_keep_recent', '2000')),
+                'summary_model': self.get_chat_option('summary_model', 'glm-z1-flash'),
+            }
+        except ValueError as e:
+            print(f"会话摘要配置无效: {e}")
+            return None
+
+    def get_response_cache_settings(self) -> Optional[Dict[str, Any]]:
+        """获取回复缓存设置，未启用时返回None
+
+        在config.ini中配置：
+            [CHAT]
+            response_cache = true
+            response_cache_ttl = 604800
+            response_cache_max_entries = 2000
+        """
+        if self.get_chat_option('response_cache', 'false').lower() not in ('true', '1', 'yes', 'on'):
+            return None
+        try:
+            return {
+                'ttl_seconds': int(self.get_chat_option('response_cache_ttl', str(7 * 24 * 3600))),
+                'max_disk_entries': int(self.get_chat_option('response_cache_max_entries', '2000')),
+            }
+        except ValueError as e:
+            print(f"回复缓存配置无效: {e}")
+            return None
+
     def validate_api_key(self, api_key: str, model_type: str) -> bool:
         """验证API密钥格式"""
         if not api_key:  # 允许清空API密钥
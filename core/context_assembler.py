@@ -0,0 +1,140 @@
+"""
+上下文组装器
+估算每条消息的token数（按消息ID与内容缓存），去除历史回复中的思考过程，
+并按模型的上下文预算从最新消息开始裁剪历史
+"""
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from models import AIProviderFactory, ConversationSummary, MessageRecord, select_replies
+
+THINK_PATTERN = re.compile(r'<think>.*?</think>', re.DOTALL)
+# 每条消息的格式开销（角色标记等）
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算token数：中日韩字符约1个token，其他字符约4个一个token"""
+    wide = sum(1 for char in text if char >= '⺀')
+    return wide + (len(text) - wide + 3) // 4 + MESSAGE_OVERHEAD_TOKENS
+
+
+class AssembledContext(NamedTuple):
+    """组装结果"""
+    messages: List[Dict[str, str]]  # 发送给服务商的消息列表
+    total_tokens: int  # 发送的估算token数
+    trimmed_tokens: int  # 被裁剪掉的估算token数（含去除的思考过程）
+    dropped_messages: int  # 被丢弃的历史消息条数
+
+
+class ContextAssembler:
+    """上下文组装器"""
+
+    def __init__(self, max_cache_entries: int = 4096):
+        self.max_cache_entries = max_cache_entries
+        # 消息ID -> (内容, API消息, 原始token数, 去除思考过程后的token数)
+        # 命中时还要比较内容：清空历史后数据库重建，消息ID从1重新开始，不能命中旧会话的消息
+        self._cache: "OrderedDict[int, Tuple[str, Dict[str, str], int, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def clear(self):
+        """清空缓存（清空历史时调用）"""
+        with self._lock:
+            self._cache.clear()
+
+    def _prepare(self, message, is_latest: bool) -> Tuple[Dict[str, str], int, int]:
+        """准备单条消息：历史回复去除<think>内容并估算token数"""
+        if isinstance(message, MessageRecord):
+            message_id, role, content = message.id, message.role, message.content
+        else:
+            message_id, role, content = message.get('id'), message['role'], message['content']
+
+        if message_id is not None and not is_latest:
+            with self._lock:
+                cached = self._cache.get(message_id)
+                if cached is not None and cached[0] == content:
+                    self._cache.move_to_end(message_id)
+                    return cached[1:]
+
+        original_tokens = estimate_tokens(content)
+        if role == 'assistant' and '<think>' in content and not is_latest:
+            stripped = THINK_PATTERN.sub('', content).strip()
+            api_message = {"role": role, "content": stripped}
+            tokens = estimate_tokens(stripped)
+        else:
+            api_message = message.to_api() if isinstance(message, MessageRecord) else {"role": role, "content": content}
+            tokens = original_tokens
+
+        prepared = (api_message, original_tokens, tokens)
+        if message_id is not None and not is_latest:
+            with self._lock:
+                # 内容不同（ID被重新使用）时替换旧条目
+                self._cache[message_id] = (content,) + prepared
+                self._cache.move_to_end(message_id)
+                while len(self._cache) > self.max_cache_entries:
+                    self._cache.popitem(last=False)
+        return prepared
+
+    def assemble(self, messages: Sequence, model: str,
+                 summary: Optional[ConversationSummary] = None) -> AssembledContext:
+        """按模型预算组装上下文，最后一条（当前用户消息）总是保留
+
+        有会话摘要时，已被摘要覆盖的消息由摘要代替，摘要放在上下文开头；
+        多模型对比产生的多条回复只保留一条
+        """
+        messages = select_replies(messages, model)
+        budget = AIProviderFactory.get_context_budget(model)
+        summary_tokens = 0
+        if summary is not None:
+            summary_tokens = estimate_tokens(summary.content)
+            budget -= summary_tokens
+            messages = [
+                message for message in messages[:-1]
+                if (self._message_id(message) or 0) > summary.covers_until
+            ] + list(messages[-1:])
+        selected = []
+        total_tokens = 0
+        trimmed_tokens = 0
+        dropped_messages = 0
+
+        for index in range(len(messages) - 1, -1, -1):
+            is_latest = index == len(messages) - 1
+            api_message, original_tokens, tokens = self._prepare(messages[index], is_latest)
+            if dropped_messages or (not is_latest and total_tokens + tokens > budget):
+                # 超出预算后，更早的消息全部丢弃，保持上下文连续
+                dropped_messages += 1
+                trimmed_tokens += original_tokens
+                continue
+            selected.append((api_message, original_tokens, tokens))
+            total_tokens += tokens
+            trimmed_tokens += original_tokens - tokens
+
+        selected.reverse()
+        # 上下文以用户消息开头
+        while len(selected) > 1 and selected[0][0]["role"] == "assistant":
+            api_message, original_tokens, tokens = selected.pop(0)
+            total_tokens -= tokens
+            trimmed_tokens += tokens
+            dropped_messages += 1
+
+        api_messages = [item[0] for item in selected]
+        if summary is not None:
+            api_messages.insert(0, summary.to_api())
+            total_tokens += summary_tokens
+        return AssembledContext(api_messages, total_tokens, trimmed_tokens, dropped_messages)
+
+    @staticmethod
+    def _message_id(message) -> Optional[int]:
+        """获取消息ID"""
+        return message.id if isinstance(message, MessageRecord) else message.get('id')
+
+    def forget(self, message_id: int):
+        """删除消息时清除其缓存"""
+        with self._lock:
+            self._cache.pop(message_id, None)
+
+
+# 全局组装器
+context_assembler = ContextAssembler()
@@ -0,0 +1,75 @@
+"""
+异步事件循环线程
+所有异步流式请求运行在同一个专用线程的asyncio事件循环上，
+结果通过Qt信号（跨线程自动排队）送回界面线程
+"""
+import asyncio
+import concurrent.futures
+import threading
+from typing import Coroutine, Optional
+
+
+class AsyncLoopThread:
+    """运行asyncio事件循环的守护线程"""
+
+    def __init__(self, name: str = "asyncio-loop"):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._started = threading.Event()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.call_soon(self._started.set)
+        self.loop.run_forever()
+        # 循环停止后等待被取消的任务收尾，再关闭共享的HTTP客户端与剩余的异步生成器
+        from models.transport import close_async_client
+        pending = asyncio.all_tasks(self.loop)
+        if pending:
+            self.loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+        self.loop.run_until_complete(close_async_client())
+        self.loop.run_until_complete(self.loop.shutdown_asyncgens())
+        self.loop.close()
+
+    def start(self):
+        self._thread.start()
+        self._started.wait()
+
+    def submit(self, coro: Coroutine) -> concurrent.futures.Future:
+        """在事件循环中运行协程（线程安全），返回的Future取消时会取消对应的任务"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def stop(self, timeout: Optional[float] = 5.0):
+        """取消所有任务并停止事件循环"""
+        if not self._thread.is_alive():
+            return
+
+        def cancel_all():
+            for task in asyncio.all_tasks(self.loop):
+                task.cancel()
+            self.loop.call_soon(self.loop.stop)
+
+        self.loop.call_soon_threadsafe(cancel_all)
+        self._thread.join(timeout)
+
+
+_lock = threading.Lock()
+_loop_thread: Optional[AsyncLoopThread] = None
+
+
+def get_loop_thread() -> AsyncLoopThread:
+    """获取共享的事件循环线程（首次使用时启动）"""
+    global _loop_thread
+    with _lock:
+        if _loop_thread is None:
+            _loop_thread = AsyncLoopThread()
+            _loop_thread.start()
+        return _loop_thread
+
+
+def shutdown_loop_thread():
+    """停止共享的事件循环线程（退出时调用）"""
+    global _loop_thread
+    with _lock:
+        loop_thread, _loop_thread = _loop_thread, None
+    if loop_thread is not None:
+        loop_thread.stop()
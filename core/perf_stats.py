@@ -0,0 +1,334 @@
+"""
+性能统计
+按模型与日期增量汇总首字延迟、总耗时、生成速度（tokens/秒）、错误率与界面掉帧次数，用于按实测数据选择模型。
+
+延迟分布使用HDR风格的对数-线性分桶直方图（每个2的幂区间32个线性桶，相对误差约3%），只保存非空桶。
+记录先累积在内存中，定期（以及退出时）合并到SQLite（perf_stats.db）：每个 (模型, 日期, 指标) 只有一行，
+打开统计面板时只需合并少量行，即使使用数月也能立即显示。
+
+命令行报告: python main.py --stats [--days 7] [--model MODEL]
+"""
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+# 直方图指标与计数器
+METRICS = ('ttft_ms', 'total_ms', 'tokens_per_s')
+COUNTERS = ('requests', 'errors', 'frame_drops')
+PERCENTILES = (0.5, 0.95, 0.99)
+
+
+class Histogram:
+    """对数-线性分桶直方图：小于 SUB_BUCKETS 的值按整数分桶，更大的值在每个2的幂区间内均分为 SUB_BUCKETS 个桶"""
+    SUB_BUCKETS = 32
+    __slots__ = ('buckets', 'count', 'total', 'minimum', 'maximum')
+
+    def __init__(self, buckets: Optional[Dict[int, int]] = None, count: int = 0, total: float = 0.0,
+                 minimum: Optional[float] = None, maximum: Optional[float] = None):
+        self.buckets: Dict[int, int] = buckets or {}
+        self.count = count
+        self.total = total
+        self.minimum = minimum
+        self.maximum = maximum
+
+    @staticmethod
+    def bucket_index(value: float) -> int:
+        sub = Histogram.SUB_BUCKETS
+        if value < sub:
+            return max(0, int(value))
+        mantissa, exponent = math.frexp(value)  # value = mantissa * 2**exponent，mantissa ∈ [0.5, 1)
+        # 区间 [2**(exponent-1), 2**exponent) 内的线性桶
+        return sub + (exponent - 6) * sub + int((mantissa * 2 - 1) * sub)
+
+    @staticmethod
+    def bucket_range(index: int) -> Tuple[float, float]:
+        sub = Histogram.SUB_BUCKETS
+        if index < sub:
+            return float(index), float(index + 1)
+        octave, offset = divmod(index - sub, sub)
+        width = 2.0 ** octave
+        lower = (sub + offset) * width
+        return lower, lower + width
+
+    def record(self, value: float, count: int = 1):
+        value = max(0.0, value)
+        index = self.bucket_index(value)
+        self.buckets[index] = self.buckets.get(index, 0) + count
+        self.count += count
+        self.total += value * count
+        self.minimum = value if self.minimum is None else min(self.minimum, value)
+        self.maximum = value if self.maximum is None else max(self.maximum, value)
+
+    def merge(self, other: "Histogram"):
+        for index, count in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + count
+        self.count += other.count
+        self.total += other.total
+        if other.minimum is not None:
+            self.minimum = other.minimum if self.minimum is None else min(self.minimum, other.minimum)
+        if other.maximum is not None:
+            self.maximum = other.maximum if self.maximum is None else max(self.maximum, other.maximum)
+
+    def percentile(self, fraction: float) -> Optional[float]:
+        """分位数（所在桶的中点，限制在实际最小值与最大值之间）"""
+        if not self.count:
+            return None
+        target = max(1, math.ceil(self.count * fraction))
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= target:
+                lower, upper = self.bucket_range(index)
+                return min(max((lower + upper) / 2, self.minimum), self.maximum)
+        return self.maximum
+
+    @property
+    def mean(self) -> Optional[float]:
+        return self.total / self.count if self.count else None
+
+    def buckets_json(self) -> str:
+        return json.dumps({str(index): count for index, count in sorted(self.buckets.items())},
+                          separators=(',', ':'))
+
+    @staticmethod
+    def from_row(buckets: str, count: int, total: float, minimum: Optional[float],
+                 maximum: Optional[float]) -> "Histogram":
+        return Histogram({int(index): value for index, value in json.loads(buckets).items()}, count, total,
+                         minimum, maximum)
+
+
+class PerfStats:
+    """按模型与日期的性能统计（线程安全）
+
+    flush_interval: 距上次写入超过该秒数时，下一次记录会把内存中的增量合并到数据库
+    clock: 墙上时钟（决定记录属于哪一天，测试时可替换）
+    """
+
+    def __init__(self, db_path: str, flush_interval: float = 30.0, clock: Callable[[], float] = time.time):
+        self.db_path = db_path
+        self.flush_interval = flush_interval
+        self.clock = clock
+        self._histograms: Dict[Tuple[str, str, str], Histogram] = {}
+        self._counters: Dict[Tuple[str, str, str], int] = {}
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        self._init_db()
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=10.0)
+
+    def _init_db(self):
+        conn = self._connect()
+        try:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS perf_histograms (
+                    model TEXT NOT NULL,
+                    day TEXT NOT NULL,
+                    metric TEXT NOT NULL,
+                    count INTEGER NOT NULL,
+                    total REAL NOT NULL,
+                    minimum REAL,
+                    maximum REAL,
+                    buckets TEXT NOT NULL,
+                    PRIMARY KEY (model, day, metric)
+                )
+            ''')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS perf_counters (
+                    model TEXT NOT NULL,
+                    day TEXT NOT NULL,
+                    name TEXT NOT NULL,
+                    value INTEGER NOT NULL,
+                    PRIMARY KEY (model, day, name)
+                )
+            ''')
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _day(self) -> str:
+        return time.strftime('%Y-%m-%d', time.localtime(self.clock()))
+
+    def _add(self, model: str, metric: str, value: float):
+        key = (model, self._day(), metric)
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            histogram = self._histograms[key] = Histogram()
+        histogram.record(value)
+
+    def _count(self, model: str, name: str, value: int = 1):
+        key = (model, self._day(), name)
+        self._counters[key] = self._counters.get(key, 0) + value
+
+    def record_request(self, model: str, ttft: float, total: float, tokens: int = 0):
+        """记录一次成功的请求：首字延迟与总耗时（秒），回复的token数（用于计算生成速度）"""
+        with self._lock:
+            self._count(model, 'requests')
+            self._add(model, 'ttft_ms', ttft * 1000)
+            self._add(model, 'total_ms', total * 1000)
+            generation = total - ttft
+            if tokens > 0 and generation > 0:
+                self._add(model, 'tokens_per_s', tokens / generation)
+        self._maybe_flush()
+
+    def record_error(self, model: str):
+        with self._lock:
+            self._count(model, 'requests')
+            self._count(model, 'errors')
+        self._maybe_flush()
+
+    def record_frame_drops(self, model: str, dropped: int):
+        """记录一次流式输出期间界面丢掉的帧数"""
+        if dropped <= 0:
+            return
+        with self._lock:
+            self._count(model, 'frame_drops', dropped)
+        self._maybe_flush()
+
+    def _maybe_flush(self):
+        if time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """把内存中的增量合并到数据库（一个事务）"""
+        with self._lock:
+            histograms, self._histograms = self._histograms, {}
+            counters, self._counters = self._counters, {}
+            self._last_flush = time.monotonic()
+        if not histograms and not counters:
+            return
+        with self._db_lock:
+            conn = self._connect()
+            try:
+                conn.execute('BEGIN IMMEDIATE')
+                for (model, day, metric), histogram in histograms.items():
+                    row = conn.execute(
+                        'SELECT buckets, count, total, minimum, maximum FROM perf_histograms '
+                        'WHERE model = ? AND day = ? AND metric = ?', (model, day, metric)
+                    ).fetchone()
+                    if row is not None:
+                        merged = Histogram.from_row(*row)
+                        merged.merge(histogram)
+                        histogram = merged
+                    conn.execute(
+                        'INSERT OR REPLACE INTO perf_histograms (model, day, metric, count, total, minimum, maximum, '
+                        'buckets) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                        (model, day, metric, histogram.count, histogram.total, histogram.minimum, histogram.maximum,
+                         histogram.buckets_json())
+                    )
+                conn.executemany(
+                    'INSERT INTO perf_counters (model, day, name, value) VALUES (?, ?, ?, ?) '
+                    'ON CONFLICT (model, day, name) DO UPDATE SET value = value + excluded.value',
+                    [(model, day, name, value) for (model, day, name), value in counters.items()]
+                )
+                conn.commit()
+            finally:
+                conn.close()
+
+    def _since(self, days: Optional[int]) -> str:
+        if not days:
+            return ''
+        return time.strftime('%Y-%m-%d', time.localtime(self.clock() - (days - 1) * 86400))
+
+    def _load(self, days: Optional[int], model: Optional[str] = None):
+        """读取 (模型, 日期, 指标, 直方图) 与 (模型, 日期, 计数器, 值)"""
+        self.flush()
+        since = self._since(days)
+        model_filter = ' AND model = ?' if model else ''
+        params = (since, model) if model else (since,)
+        conn = self._connect()
+        try:
+            histograms = [(row[0], row[1], row[2], Histogram.from_row(*row[3:])) for row in conn.execute(
+                'SELECT model, day, metric, buckets, count, total, minimum, maximum FROM perf_histograms '
+                f'WHERE day >= ?{model_filter}', params)]
+            counters = conn.execute(f'SELECT model, day, name, value FROM perf_counters WHERE day >= ?{model_filter}',
+                                    params).fetchall()
+        finally:
+            conn.close()
+        return histograms, counters
+
+    @staticmethod
+    def _describe(histograms: Dict[str, Histogram], counters: Dict[str, int]) -> Dict:
+        result = {name: counters.get(name, 0) for name in COUNTERS}
+        result['error_rate'] = result['errors'] / result['requests'] if result['requests'] else 0.0
+        for metric in METRICS:
+            histogram = histograms.get(metric) or Histogram()
+            result[metric] = {"count": histogram.count, "mean": histogram.mean,
+                              **{f"p{round(q * 100)}": histogram.percentile(q) for q in PERCENTILES}}
+        return result
+
+    def summary(self, days: Optional[int] = None) -> Dict[str, Dict]:
+        """按模型汇总最近 days 天（None为全部）：计数器、错误率与各指标的 count/mean/p50/p95/p99"""
+        histogram_rows, counter_rows = self._load(days)
+        histograms: Dict[str, Dict[str, Histogram]] = {}
+        counters: Dict[str, Dict[str, int]] = {}
+        for model, _, metric, histogram in histogram_rows:
+            histograms.setdefault(model, {}).setdefault(metric, Histogram()).merge(histogram)
+        for model, _, name, value in counter_rows:
+            counters.setdefault(model, {})[name] = counters.get(model, {}).get(name, 0) + value
+        return {model: self._describe(histograms.get(model, {}), counters.get(model, {}))
+                for model in sorted(set(histograms) | set(counters))}
+
+    def daily(self, model: str, days: Optional[int] = 30) -> List[Tuple[str, Dict]]:
+        """某个模型按日期的统计（日期升序）"""
+        histogram_rows, counter_rows = self._load(days, model)
+        histograms: Dict[str, Dict[str, Histogram]] = {}
+        counters: Dict[str, Dict[str, int]] = {}
+        for _, day, metric, histogram in histogram_rows:
+            histograms.setdefault(day, {})[metric] = histogram
+        for _, day, name, value in counter_rows:
+            counters.setdefault(day, {})[name] = value
+        return [(day, self._describe(histograms.get(day, {}), counters.get(day, {})))
+                for day in sorted(set(histograms) | set(counters))]
+
+    def report(self, days: Optional[int] = None, model: Optional[str] = None) -> str:
+        """文本报告（命令行）"""
+        period = f"最近 {days} 天" if days else "全部"
+        lines = [f"==== 性能统计（{period}）====",
+                 f"{'模型':<28}{'请求':>6}{'错误率':>8}{'首字p50/p95/p99 (ms)':>26}{'总耗时p50/p95/p99 (s)':>26}"
+                 f"{'tokens/s p50':>14}{'掉帧':>8}"]
+        summary = self.summary(days)
+        if model:
+            summary = {model: summary[model]} if model in summary else {}
+        if not summary:
+            lines.append("（暂无数据）")
+        for name, stats in summary.items():
+            ttft = '/'.join(_format(stats['ttft_ms'][f"p{p}"], 1) for p in (50, 95, 99))
+            total = '/'.join(_format(stats['total_ms'][f"p{p}"], 0.001, 2) for p in (50, 95, 99))
+            lines.append(f"{name:<28}{stats['requests']:>6}{stats['error_rate'] * 100:>7.1f}%{ttft:>26}{total:>26}"
+                         f"{_format(stats['tokens_per_s']['p50'], 1, 1):>14}{stats['frame_drops']:>8}")
+        if model and summary:
+            lines.append(f"[{model} 按日期]")
+            for day, stats in self.daily(model, days):
+                lines.append(f"  {day}  请求 {stats['requests']:>5}  错误率 {stats['error_rate'] * 100:5.1f}%  "
+                             f"首字p50 {_format(stats['ttft_ms']['p50'], 1):>7} ms  "
+                             f"tokens/s p50 {_format(stats['tokens_per_s']['p50'], 1, 1):>6}")
+        return '\n'.join(lines)
+
+
+def _format(value: Optional[float], scale: float = 1.0, digits: int = 0) -> str:
+    return '-' if value is None else f"{value * scale:.{digits}f}"
+
+
+def main(argv=None):
+    import argparse
+    from chat_db import ChatDatabase
+    parser = argparse.ArgumentParser(description="按模型的性能统计报告")
+    parser.add_argument('--days', type=int, help="只统计最近N天（默认全部）")
+    parser.add_argument('--model', help="只显示该模型，并列出按日期的统计")
+    parser.add_argument('--db', help="统计数据库路径（默认位于聊天数据库所在目录）")
+    args = parser.parse_args(argv)
+    path = args.db or os.path.join(os.path.dirname(ChatDatabase.get_default_db_path()), 'perf_stats.db')
+    if not os.path.exists(path):
+        print(f"尚无统计数据: {path}")
+        return
+    print(PerfStats(path).report(args.days, args.model))
+
+
+if __name__ == '__main__':
+    main()
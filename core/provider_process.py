@@ -0,0 +1,296 @@
+"""
+服务商子进程
+在独立进程中运行网络请求、JSON解析与SDK对象创建，不与界面线程争用GIL；
+子进程通过本地管道发送紧凑的二进制帧（每帧：类型1字节 + 请求ID 4字节 + 负载），
+SDK崩溃只会结束子进程，正在进行的请求收到错误，下次请求时自动重启
+本模块会在子进程中导入，不能依赖PyQt
+"""
+import multiprocessing
+import struct
+import threading
+import traceback
+from typing import Callable, Dict, Optional, Sequence
+
+# 子进程 -> 界面进程的帧类型
+FRAME_CONTEXT = 1  # 负载: 发送的token数, 被裁剪的token数（!II）
+FRAME_DELTA = 2  # 负载: UTF-8文本片段
+FRAME_DONE = 3  # 负载: 首字延迟, 总耗时, 是否来自回复缓存（!dd?） + 实际提供回复的模型（UTF-8）
+FRAME_ERROR = 4  # 负载: UTF-8错误信息
+
+_HEADER = struct.Struct('!BI')
+_CONTEXT = struct.Struct('!II')
+_TIMING = struct.Struct('!dd?')
+
+
+def encode_frame(kind: int, request_id: int, payload: bytes = b'') -> bytes:
+    return _HEADER.pack(kind, request_id) + payload
+
+
+def decode_frame(frame: bytes):
+    """返回 (帧类型, 请求ID, 负载)"""
+    kind, request_id = _HEADER.unpack_from(frame)
+    return kind, request_id, frame[_HEADER.size:]
+
+
+class StreamHandler:
+    """接收某个请求的帧（在界面进程的读取线程中调用）"""
+
+    def on_context(self, total_tokens: int, trimmed_tokens: int):
+        pass
+
+    def on_delta(self, text: str):
+        pass
+
+    def on_done(self, ttft: float, total: float, served_model: str, cached: bool):
+        pass
+
+    def on_error(self, message: str):
+        pass
+
+
+class ProviderProcess:
+    """服务商子进程（界面进程一侧）
+
+    settings 传给子进程用于配置 AIProviderFactory（须可pickle）：
+        resilience: ResilienceSettings
+        rate_limits: 限流设置（见 ConfigManager.get_rate_limit_settings）
+        zhipu_raw_http: 智谱流式请求是否直连
+        single_flight: 是否合并相同的并发请求
+        response_cache: ResponseCache的参数（可选）
+        record_streams: 流式响应录制文件路径（可选）
+        replay: 回放设置 {'path': 录制文件路径, 'speed': 回放速度}（可选）
+        initializer: 子进程启动时调用的模块级函数（可选，测试与基准中用于指向本地服务器）
+    """
+
+    def __init__(self, settings: Optional[Dict] = None):
+        self.settings = settings or {}
+        self.restarts = 0  # 子进程异常退出后的重启次数
+        self._context = multiprocessing.get_context('spawn')
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock()
+        self._process = None
+        self._conn = None
+        self._handlers: Dict[int, tuple] = {}  # 请求ID -> (处理器, 所在的管道)
+        self._next_id = 1
+        self._stopping = False
+
+    def _ensure_started(self):
+        """启动子进程（调用方持有 _lock）"""
+        if self._process is not None and self._conn is not None and self._process.is_alive():
+            return
+        if self._process is not None:
+            # 管道已断开时子进程可能尚未被回收，确保旧进程结束
+            self._process.kill()
+            self._process.join(1.0)
+            self.restarts += 1
+            print(f"服务商子进程已退出（退出码 {self._process.exitcode}），正在重启")
+        parent_conn, child_conn = self._context.Pipe()
+        self._process = self._context.Process(
+            target=_child_main, args=(child_conn, self.settings), name="provider-process", daemon=True
+        )
+        self._process.start()
+        child_conn.close()
+        self._conn = parent_conn
+        threading.Thread(target=self._read_frames, args=(parent_conn,), name="provider-reader", daemon=True).start()
+
+    def _read_frames(self, conn):
+        """读取子进程的帧并分发给对应的请求
+
+        已经到达的连续文本帧合并后一次分发，输出很快时界面线程收到的信号数随之减少
+        """
+        pending = None  # 尚未读取处理的下一帧
+        while True:
+            try:
+                frame = pending if pending is not None else conn.recv_bytes()
+                pending = None
+                kind, request_id, payload = decode_frame(frame)
+                if kind == FRAME_DELTA:
+                    parts = [payload]
+                    while conn.poll(0):
+                        pending = conn.recv_bytes()
+                        next_kind, next_id, next_payload = decode_frame(pending)
+                        if next_kind != FRAME_DELTA or next_id != request_id:
+                            break
+                        parts.append(next_payload)
+                        pending = None
+                    payload = b''.join(parts)
+            except (EOFError, OSError):
+                break
+            with self._lock:
+                handler, _ = self._handlers.get(request_id, (None, None))
+                if kind in (FRAME_DONE, FRAME_ERROR):
+                    self._handlers.pop(request_id, None)
+            if handler is None:
+                continue
+            try:
+                if kind == FRAME_DELTA:
+                    handler.on_delta(payload.decode('utf-8'))
+                elif kind == FRAME_CONTEXT:
+                    handler.on_context(*_CONTEXT.unpack(payload))
+                elif kind == FRAME_DONE:
+                    ttft, total, cached = _TIMING.unpack_from(payload)
+                    handler.on_done(ttft, total, payload[_TIMING.size:].decode('utf-8'), cached)
+                elif kind == FRAME_ERROR:
+                    handler.on_error(payload.decode('utf-8'))
+            except Exception:
+                traceback.print_exc()
+
+        # 子进程退出：经由该管道的未完成请求全部失败（下次请求时重启子进程）
+        with self._lock:
+            handlers = [handler for handler, handler_conn in self._handlers.values() if handler_conn is conn]
+            self._handlers = {request_id: entry for request_id, entry in self._handlers.items()
+                              if entry[1] is not conn}
+            if self._conn is conn:
+                self._conn = None
+            stopping = self._stopping
+        conn.close()
+        if not stopping:
+            for handler in handlers:
+                handler.on_error("服务商子进程异常退出，请重试")
+
+    def _send(self, conn, message) -> bool:
+        try:
+            with self._send_lock:
+                conn.send(message)
+            return True
+        except (OSError, ValueError):
+            return False
+
+    def submit(self, handler: StreamHandler, model: str, api_key: str, history: Sequence, summary=None,
+               prompt: str = "", priority: int = 0) -> int:
+        """在子进程中发起流式请求，返回请求ID"""
+        with self._lock:
+            self._ensure_started()
+            request_id = self._next_id
+            self._next_id += 1
+            conn = self._conn
+            self._handlers[request_id] = (handler, conn)
+        if not self._send(conn, ('start', request_id, model, api_key, tuple(history), summary, prompt, priority)):
+            with self._lock:
+                self._handlers.pop(request_id, None)
+            handler.on_error("无法连接服务商子进程")
+        return request_id
+
+    def cancel(self, request_id: int):
+        """取消请求（子进程在下一个片段到达时停止读取并关闭连接）"""
+        with self._lock:
+            self._handlers.pop(request_id, None)
+            conn = self._conn
+        if conn is not None:
+            self._send(conn, ('cancel', request_id))
+
+    def is_alive(self) -> bool:
+        return self._process is not None and self._process.is_alive()
+
+    def kill(self):
+        """强制结束子进程（用于测试崩溃恢复）"""
+        if self._process is not None:
+            self._process.kill()
+
+    def shutdown(self, timeout: float = 2.0):
+        """停止子进程"""
+        with self._lock:
+            self._stopping = True
+            process, conn = self._process, self._conn
+        if conn is not None:
+            self._send(conn, ('stop',))
+        if process is not None:
+            process.join(timeout)
+            if process.is_alive():
+                process.kill()
+
+
+class _PipeClosed(Exception):
+    """子进程向界面进程写入帧失败（管道已关闭）"""
+
+
+def _child_main(conn, settings: Dict):
+    """子进程入口：每个请求一个线程，帧写入共享同一把锁"""
+    from models import AIProviderFactory, ResponseCache, StreamRecorder, StreamReplayer
+    from models.rate_limiter import RateLimiterRegistry
+    from models.transport import StreamAbort, abort_scope
+
+    initializer: Optional[Callable[[], None]] = settings.get('initializer')
+    if initializer is not None:
+        initializer()
+    if 'zhipu_raw_http' in settings:
+        AIProviderFactory.zhipu_raw_http = settings['zhipu_raw_http']
+    if settings.get('resilience') is not None:
+        AIProviderFactory.set_resilience(settings['resilience'])
+    AIProviderFactory.set_rate_limits(RateLimiterRegistry(settings.get('rate_limits')))
+    AIProviderFactory.enable_single_flight(settings.get('single_flight', False))
+    if settings.get('response_cache'):
+        AIProviderFactory.enable_response_cache(ResponseCache(**settings['response_cache']))
+    if settings.get('record_streams'):
+        AIProviderFactory.enable_stream_recording(StreamRecorder(settings['record_streams']))
+    if settings.get('replay'):
+        AIProviderFactory.enable_replay(StreamReplayer.load(**settings['replay']))
+
+    send_lock = threading.Lock()
+    # 请求ID -> 中止句柄：取消时立即关闭正在读取的响应（仍在等待首字时同样打断）
+    cancelled: Dict[int, "StreamAbort"] = {}
+
+    def send(kind: int, request_id: int, payload: bytes = b''):
+        try:
+            with send_lock:
+                conn.send_bytes(encode_frame(kind, request_id, payload))
+        except (OSError, ValueError) as e:
+            # 只有管道写入失败才表示界面进程已关闭；服务商抛出的 OSError/ValueError（网络错误、JSON解析错误等）照常报告
+            raise _PipeClosed() from e
+
+    def run(request_id, model, api_key, history, summary, prompt, priority):
+        import time
+        from core.context_assembler import context_assembler
+        abort = cancelled[request_id]
+        try:
+            started_at = time.perf_counter()
+            first_chunk_at = None
+            history = history or [{"role": "user", "content": prompt}]
+            context = context_assembler.assemble(history, model, summary)
+            send(FRAME_CONTEXT, request_id, _CONTEXT.pack(context.total_tokens, context.trimmed_tokens))
+            provider = AIProviderFactory.create_provider(model, api_key, priority)
+            with abort_scope(abort):
+                stream = provider.stream_chat(messages=context.messages, model=model)
+                try:
+                    for chunk_text in stream:
+                        if abort.aborted:
+                            return
+                        if first_chunk_at is None:
+                            first_chunk_at = time.perf_counter()
+                        send(FRAME_DELTA, request_id, chunk_text.encode('utf-8'))
+                finally:
+                    stream.close()
+            finished_at = time.perf_counter()
+            served_model = getattr(provider, 'served_model', None) or model
+            send(FRAME_DONE, request_id,
+                 _TIMING.pack((first_chunk_at or finished_at) - started_at, finished_at - started_at,
+                              getattr(provider, 'cache_hit', False))
+                 + served_model.encode('utf-8'))
+        except _PipeClosed:
+            pass  # 界面进程已关闭管道
+        except Exception as e:
+            if abort.aborted:
+                return  # 取消时关闭响应导致的读取错误
+            try:
+                send(FRAME_ERROR, request_id, f"发生意外错误: {str(e)}".encode('utf-8'))
+            except _PipeClosed:
+                pass
+        finally:
+            cancelled.pop(request_id, None)
+
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, OSError):
+            break
+        if message[0] == 'start':
+            request_id = message[1]
+            cancelled[request_id] = StreamAbort()
+            threading.Thread(target=run, args=message[1:], daemon=True).start()
+        elif message[0] == 'cancel':
+            abort = cancelled.get(message[1])
+            if abort is not None:
+                abort.abort()
+        elif message[0] == 'stop':
+            break
+    conn.close()
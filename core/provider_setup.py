@@ -0,0 +1,71 @@
+"""
+服务提供商配置
+按config.ini配置 AIProviderFactory（容错、请求合并、限流、自动路由、对冲请求与回复缓存），
+图形界面与无界面API服务共用
+"""
+import os
+from typing import Any, Dict, Optional
+
+from models import (AIProviderFactory, HedgingPolicy, ModelRouter, RateLimiterRegistry, ResponseCache,
+                    StreamRecorder, StreamReplayer)
+
+
+def configure_providers(config_manager, data_dir: str) -> Optional[Dict[str, Any]]:
+    """配置 AIProviderFactory，返回回复缓存的参数（未启用时为None，供服务商子进程使用）
+
+    data_dir: 数据库所在目录，回复缓存保存在其中
+    """
+    # 超时、空闲看门狗与重试策略
+    AIProviderFactory.set_resilience(config_manager.get_resilience_settings())
+    # 智谱流式请求直连接口或使用SDK
+    AIProviderFactory.zhipu_raw_http = config_manager.get_chat_option('zhipu_transport', 'http').lower() != 'sdk'
+    # 在模型列表中列出本地模拟模型（离线测试用）
+    AIProviderFactory.mock_models_listed = config_manager.get_chat_option('mock_models', 'false').lower() in (
+        '1', 'true', 'yes', 'on')
+    # 同时进行的相同请求只向上游发出一次
+    AIProviderFactory.enable_single_flight(
+        config_manager.get_chat_option('single_flight', 'true').lower() in ('1', 'true', 'yes', 'on')
+    )
+    # 流式响应录制与回放（性能分析用，相对路径位于数据目录中）
+    record_path = config_manager.get_chat_option('record_streams', '')
+    AIProviderFactory.enable_stream_recording(
+        StreamRecorder(os.path.join(data_dir, record_path)) if record_path else None
+    )
+    AIProviderFactory.enable_replay(_load_replayer(config_manager, data_dir))
+    # 按服务商与API密钥的限速与并发上限
+    AIProviderFactory.set_rate_limits(RateLimiterRegistry(config_manager.get_rate_limit_settings()))
+    # 自动路由：在等价模型组中选择最快的健康模型
+    router = ModelRouter(config_manager.get_auto_group(available_only=False), config_manager.get_api_key_for_model)
+    AIProviderFactory.enable_router(router)
+    hedging = config_manager.get_hedging_settings()
+    if hedging:
+        alternate = None
+        if hedging.pop('alternate_mode') == 'group':
+            # 对冲到模型组中当前排名最靠前的其他模型
+            def alternate(model):
+                if model not in router.group:
+                    return None
+                return next((other for other in router.rank() if other != model), None)
+        AIProviderFactory.enable_hedging(
+            HedgingPolicy(alternate=alternate, **hedging), config_manager.get_api_key_for_model
+        )
+    # 可选的回复缓存：相同的请求直接回放缓存的回复
+    cache_settings = config_manager.get_response_cache_settings()
+    if cache_settings:
+        cache_settings['disk_path'] = os.path.join(data_dir, 'response_cache.db')
+        AIProviderFactory.enable_response_cache(ResponseCache(**cache_settings))
+    return cache_settings
+
+
+def _load_replayer(config_manager, data_dir: str) -> Optional[StreamReplayer]:
+    """读取回放设置，录制文件无法读取（不存在、损坏或为空）或回放速度无效时不启用回放"""
+    replay_path = config_manager.get_chat_option('replay_streams', '')
+    if not replay_path:
+        return None
+    try:
+        speed = float(config_manager.get_chat_option('replay_speed', '1'))
+        replayer = StreamReplayer.load(os.path.join(data_dir, replay_path), speed)
+    except (OSError, ValueError) as e:
+        print(f"流式响应回放配置无效，不启用回放: {e}")
+        return None
+    return replayer
@@ -0,0 +1,99 @@
+"""
+会话滚动摘要
+历史消息超过token阈值时，用低成本模型把较早的对话增量压缩为摘要，
+之后的请求只发送 摘要 + 最近的对话
+"""
+from typing import List, Optional, Sequence, Tuple
+
+from models import ConversationSummary, MessageRecord
+from .context_assembler import THINK_PATTERN, estimate_tokens
+
+SUMMARY_SYSTEM_PROMPT = (
+    "你是对话摘要助手。请把给出的对话压缩成简洁的中文摘要，保留用户的目标、偏好、"
+    "已确认的事实与结论、未解决的问题以及重要的代码或数据细节，不要编造内容，不要添加评论。"
+)
+
+
+class ConversationSummarizer:
+    """会话摘要器
+
+    threshold_tokens: 未被摘要覆盖的历史超过该值时触发摘要
+    keep_recent_tokens: 最近的这部分对话保持原文，不参与摘要
+    """
+
+    def __init__(self, threshold_tokens: int = 6000, keep_recent_tokens: int = 2000,
+                 summary_model: str = "glm-z1-flash"):
+        self.threshold_tokens = threshold_tokens
+        self.keep_recent_tokens = keep_recent_tokens
+        self.summary_model = summary_model
+
+    @staticmethod
+    def _unsummarized(records: Sequence[MessageRecord],
+                      summary: Optional[ConversationSummary]) -> List[MessageRecord]:
+        """尚未被摘要覆盖的消息"""
+        if summary is None:
+            return list(records)
+        return [record for record in records if record.id is not None and record.id > summary.covers_until]
+
+    @staticmethod
+    def _record_tokens(record: MessageRecord) -> int:
+        """估算消息token数（不含思考过程）"""
+        content = THINK_PATTERN.sub('', record.content) if record.role == 'assistant' else record.content
+        return estimate_tokens(content)
+
+    def needs_summary(self, records: Sequence[MessageRecord], summary: Optional[ConversationSummary]) -> bool:
+        """未被摘要覆盖的历史是否超过阈值"""
+        total = sum(self._record_tokens(record) for record in self._unsummarized(records, summary))
+        return total > self.threshold_tokens
+
+    def plan(self, records: Sequence[MessageRecord],
+             summary: Optional[ConversationSummary]) -> Tuple[List[MessageRecord], Optional[int]]:
+        """确定本次需要摘要的消息：保留最近 keep_recent_tokens 的对话，其余较早的部分参与摘要
+
+        返回 (需要摘要的消息, 摘要覆盖到的消息ID)；无需摘要时返回 ([], None)
+        """
+        pending = self._unsummarized(records, summary)
+        recent_tokens = 0
+        split = len(pending)
+        while split > 0 and recent_tokens + self._record_tokens(pending[split - 1]) <= self.keep_recent_tokens:
+            split -= 1
+            recent_tokens += self._record_tokens(pending[split])
+        # 保留的部分从用户消息开始，避免把一问一答拆开
+        while split > 0 and pending[split - 1].role == 'user':
+            split -= 1
+
+        to_summarize = pending[:split]
+        if not to_summarize:
+            return [], None
+        return to_summarize, to_summarize[-1].id
+
+    @staticmethod
+    def build_prompt(previous: Optional[ConversationSummary], records: Sequence[MessageRecord]) -> List[dict]:
+        """构建摘要请求：已有摘要 + 新增对话"""
+        lines = []
+        if previous is not None:
+            lines.append(f"已有摘要：\n{previous.content}\n")
+        lines.append("新增对话：")
+        for record in records:
+            speaker = "用户" if record.role == 'user' else "助手"
+            content = THINK_PATTERN.sub('', record.content).strip() if record.role == 'assistant' else record.content
+            lines.append(f"{speaker}：{content}")
+        lines.append("\n请输出合并后的完整摘要。")
+        return [
+            {"role": "system", "content": SUMMARY_SYSTEM_PROMPT},
+            {"role": "user", "content": '\n'.join(lines)},
+        ]
+
+    def summarize(self, provider, records: Sequence[MessageRecord],
+                  summary: Optional[ConversationSummary]) -> Optional[ConversationSummary]:
+        """增量生成摘要；没有需要摘要的内容时返回None"""
+        to_summarize, covers_until = self.plan(records, summary)
+        if not to_summarize:
+            return None
+
+        response = provider.chat(messages=self.build_prompt(summary, to_summarize), model=self.summary_model)
+        # 推理模型的回复中可能带有思考过程
+        content = THINK_PATTERN.sub('', response).strip()
+        if not content:
+            return None
+        return ConversationSummary(content, covers_until)
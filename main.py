@@ -1,8 +1,55 @@
 """
 Nefelibata - AI聊天应用
 程序入口点
+
+用法:
+    python main.py                    启动图形界面
+    python main.py --profile-startup  启动并打印导入与初始化耗时
+    python main.py --trace            记录端到端延迟追踪，退出时导出Chrome trace与SQLite指标表（可与其他参数同用）
+    python main.py --lag-monitor      监测界面卡顿（事件循环延迟、帧重绘耗时与卡顿时的调用栈），退出时打印报告（可与其他参数同用）
+    python main.py --serve [--host HOST] [--port PORT]
+                                      无界面运行OpenAI兼容的本地API服务
+    python main.py --batch INPUT --output OUTPUT [--model MODEL] [--concurrency N]
+                                      批量运行JSONL/CSV中的提示，结果写入JSONL
+    python main.py --stats [--days N] [--model MODEL]
+                                      打印按模型的性能统计（首字延迟、总耗时、生成速度的分位数与错误率）
 """
+import sys
 
 if __name__ == "__main__":
+    if "--trace" in sys.argv:
+        sys.argv.remove("--trace")
+        import atexit
+        import os
+        from utils.tracing import tracer
+        tracer.enable()
+        # 与聊天数据库位于同一目录
+        atexit.register(tracer.save, os.path.dirname(os.path.abspath(__file__)))
+    if "--lag-monitor" in sys.argv:
+        sys.argv.remove("--lag-monitor")
+        import atexit
+        import os
+        from utils.lag_monitor import lag_monitor
+        lag_monitor.enable()
+        atexit.register(lag_monitor.save, os.path.dirname(os.path.abspath(__file__)))
+    if "--serve" in sys.argv:
+        sys.argv.remove("--serve")
+        from core.api_server import main as serve
+        serve(sys.argv[1:])
+        sys.exit(0)
+    if "--batch" in sys.argv:
+        sys.argv.remove("--batch")
+        from core.batch_runner import main as run_batch
+        run_batch(sys.argv[1:])
+        sys.exit(0)
+    if "--stats" in sys.argv:
+        sys.argv.remove("--stats")
+        from core.perf_stats import main as print_stats
+        print_stats(sys.argv[1:])
+        sys.exit(0)
+    if "--profile-startup" in sys.argv:
+        sys.argv.remove("--profile-startup")
+        from utils.startup_profiler import profiler
+        profiler.enable()
     from ui.main_window import main
     main()
@@ -8,15 +8,63 @@ from .ai_providers import (
     ZhipuAIProvider, 
     SiliconFlowProvider, 
     AIProviderFactory,
+    CachedProvider,
     ZhipuAI,  # 兼容性别名
     SiliconFlowAI  # 兼容性别名
 )
+from .conversation import MessageRecord, ConversationSummary, ConversationStore, select_replies, to_api_messages
+from .response_cache import ResponseCache, make_cache_key
+from .router import ModelRouter, ModelStats, RoutedProvider
+from .hedging import HedgedProvider, HedgingPolicy
+from .errors import ProviderError, StreamAbortedError, StreamStalledError, StreamTruncatedError
+from .resilience import ResiliencePolicy, ResilienceSettings, ResilientProvider
+from .rate_limiter import LimitedProvider, Priority, RateLimiter, RateLimiterRegistry
+from .single_flight import SingleFlight, SingleFlightProvider
+from .async_providers import AsyncAIProvider, AsyncSiliconFlowProvider, AsyncZhipuAIProvider
+from .mock_provider import MockProvider, MockScenario
+from .stream_recorder import ReplayProvider, StreamRecorder, StreamRecording, StreamReplayer, load_recordings
 
 __all__ = [
     'AIProvider',
     'ZhipuAIProvider',
     'SiliconFlowProvider', 
     'AIProviderFactory',
+    'CachedProvider',
     'ZhipuAI',
-    'SiliconFlowAI'
+    'SiliconFlowAI',
+    'MessageRecord',
+    'ConversationSummary',
+    'ConversationStore',
+    'select_replies',
+    'to_api_messages',
+    'ResponseCache',
+    'make_cache_key',
+    'ModelRouter',
+    'ModelStats',
+    'RoutedProvider',
+    'HedgedProvider',
+    'HedgingPolicy',
+    'ProviderError',
+    'StreamAbortedError',
+    'StreamStalledError',
+    'StreamTruncatedError',
+    'ResiliencePolicy',
+    'ResilienceSettings',
+    'ResilientProvider',
+    'LimitedProvider',
+    'Priority',
+    'RateLimiter',
+    'RateLimiterRegistry',
+    'SingleFlight',
+    'SingleFlightProvider',
+    'AsyncAIProvider',
+    'AsyncSiliconFlowProvider',
+    'AsyncZhipuAIProvider',
+    'MockProvider',
+    'MockScenario',
+    'ReplayProvider',
+    'StreamRecorder',
+    'StreamRecording',
+    'StreamReplayer',
+    'load_recordings'
 ]
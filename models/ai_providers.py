@@ -1,40 +1,147 @@
 """
 AI服务提供商客户端
 整合了不同AI服务提供商的API接口
+SDK与网络库在首次使用时才导入，以缩短应用启动时间
 """
-import zhipuai
-import requests
 import json
-from typing import List, Dict, Any, Optional
+import time
+from typing import List, Dict, Any, Iterable, Iterator, Optional
 from abc import ABC, abstractmethod
 
+from .conversation import to_api_messages
+from .response_cache import ResponseCache, make_cache_key
+from .errors import ProviderError, StreamStalledError, StreamTruncatedError, is_retryable, parse_retry_after
+from .transport import close_response, get_session, get_zhipu_client, on_abort, watch_stream
+from utils.tracing import tracer
+
+# 缓存回复回放时每个片段的字符数
+REPLAY_CHUNK_CHARS = 64
+
+
+# parse_sse_line 遇到流结束标记时的返回值
+SSE_DONE = object()
+
+
+def parse_sse_line(line) -> Any:
+    """解析OpenAI兼容SSE流中的一行：返回文本片段，流结束时返回 SSE_DONE，其他行返回None"""
+    if not line:
+        return None
+    if isinstance(line, bytes):
+        line = line.decode('utf-8')
+    if not line.startswith('data: '):
+        return None
+    data_str = line[6:]  # 去掉 'data: ' 前缀
+    if data_str.strip() == '[DONE]':
+        return SSE_DONE
+    try:
+        data = json.loads(data_str)
+    except json.JSONDecodeError:
+        return None
+    if 'choices' in data and data['choices']:
+        delta = data['choices'][0].get('delta', {})
+        if delta.get('content'):
+            return delta['content']
+    return None
+
+
+def iter_sse_deltas(lines: Iterable) -> Iterator[str]:
+    """解析OpenAI兼容的SSE流，逐段返回回复文本；没有收到 [DONE] 就结束时抛出 StreamTruncatedError"""
+    for line in lines:
+        text = parse_sse_line(line)
+        if text is SSE_DONE:
+            return
+        if text:
+            yield text
+    raise StreamTruncatedError()
+
+
+def _response_lines(response, provider: str, model: str, started_at: float) -> Iterable:
+    """流式响应的SSE行；启用了流录制时同时录制原始字节块"""
+    recorder = AIProviderFactory.stream_recorder
+    if recorder is None:
+        lines = response.iter_lines()
+    else:
+        lines = recorder.iter_lines(response, provider, model, started_at)
+    if tracer.enabled:
+        return _trace_first_line(lines, provider, model)
+    return lines
+
+
+def _trace_first_line(lines: Iterable, provider: str, model: str) -> Iterator:
+    iterator = iter(lines)
+    for line in iterator:
+        tracer.instant('provider.first_byte', provider=provider, model=model)
+        yield line
+        break
+    yield from iterator
+
 
 class AIProvider(ABC):
     """AI服务提供商抽象基类"""
     
     def __init__(self, api_key: str):
         self.api_key = api_key
+        # 超时设置（秒），None表示使用网络库默认值，见 configure_timeouts
+        self.connect_timeout: Optional[float] = None
+        self.read_timeout: Optional[float] = None
+        self.idle_timeout: Optional[float] = None
     
+    def configure_timeouts(self, connect_timeout: Optional[float], read_timeout: Optional[float],
+                           idle_timeout: Optional[float]):
+        """设置连接超时、非流式读取超时与流式空闲超时"""
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.idle_timeout = idle_timeout
+
     @abstractmethod
     def chat(self, messages: List[Dict[str, str]], model: str, stream: bool = False) -> str:
         """发送聊天请求"""
         pass
 
+    def stream_chat(self, messages: List[Dict[str, str]], model: str) -> Iterator[str]:
+        """发送流式聊天请求，逐段返回回复文本（默认一次性返回完整回复）"""
+        yield self.chat(messages=messages, model=model)
+
 
 class ZhipuAIProvider(AIProvider):
-    """智谱AI服务提供商"""
+    """智谱AI服务提供商
+
+    流式请求默认直接请求OpenAI兼容接口并用 iter_sse_deltas 解析，省去SDK为每个片段构建对象的开销；
+    直连被拒绝（认证方式或接口不兼容）时回退到SDK，并在本进程内对该API密钥不再尝试直连
+    """
+    name = "zhipu"
+    url = "https://open.bigmodel.cn/api/paas/v4/chat/completions"
+    # 直连失败、已回退到SDK的API密钥
+    _sdk_only_keys = set()
+    # 直连被拒绝时回退到SDK的状态码
+    FALLBACK_STATUS_CODES = {401, 404, 405}
     
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: str, raw_http: bool = True):
         super().__init__(api_key)
-        self.client = zhipuai.ZhipuAI(api_key=api_key)    
+        self.raw_http = raw_http
+        self._client = None
+
+    @property
+    def client(self):
+        """SDK客户端（只在使用SDK时才导入与创建）"""
+        if self._client is None:
+            self._client = get_zhipu_client(self.api_key)
+        return self._client
         
     def chat(self, messages: List[Dict[str, str]], model: str = "glm-z1-flash", stream: bool = False) -> str:
         """发送GLM聊天请求"""
         try:
+            options = {}
+            if self.connect_timeout or self.read_timeout or self.idle_timeout:
+                import httpx
+                # 流式请求的读取超时即相邻数据的最大间隔
+                read_timeout = self.idle_timeout if stream else self.read_timeout
+                options["timeout"] = httpx.Timeout(read_timeout, connect=self.connect_timeout)
             response = self.client.chat.completions.create(
                 model=model,
-                messages=messages,
-                stream=stream
+                messages=to_api_messages(messages),
+                stream=stream,
+                **options
             )
             
             if stream:
@@ -46,55 +153,143 @@ class ZhipuAIProvider(AIProvider):
                 
         except Exception as e:
             error_msg = f"GLM API请求错误: {str(e)}"
+            status_code = None
+            retry_after = None
             if hasattr(e, 'response') and e.response is not None:
+                status_code = e.response.status_code
+                retry_after = parse_retry_after(e.response.headers.get('retry-after'))
                 error_msg += f"\n响应状态码: {e.response.status_code}"
                 try:
                     error_detail = e.response.json()
                     error_msg += f"\n错误详情: {error_detail}"
                 except:
                     error_msg += f"\n响应内容: {e.response.text}"
-            raise Exception(error_msg)
+            retryable = None if status_code is not None else is_retryable(e)
+            raise ProviderError(error_msg, status_code, retryable, retry_after)
+
+    def stream_chat(self, messages: List[Dict[str, str]], model: str = "glm-z1-flash") -> Iterator[str]:
+        """发送GLM流式聊天请求（优先直连，必要时回退到SDK）"""
+        if self.raw_http and self.api_key not in ZhipuAIProvider._sdk_only_keys:
+            started_at = time.perf_counter()
+            with tracer.span('provider.connect', provider=self.name, model=model):
+                response = self._post_stream(messages, model)
+            if response is not None:
+                yield from self._iter_raw_stream(response, model, started_at)
+                return
+        yield from self._iter_sdk_stream(messages, model)
+
+    def _post_stream(self, messages: List[Dict[str, str]], model: str):
+        """直连OpenAI兼容接口发起流式请求；接口拒绝直连时返回None（改用SDK）"""
+        import requests
+        payload = {"model": model, "stream": True, "messages": to_api_messages(messages)}
+        headers = {"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"}
+        timeout = (self.connect_timeout, self.idle_timeout) if self.connect_timeout or self.idle_timeout else None
+        try:
+            response = get_session().post(self.url, json=payload, headers=headers, stream=True, timeout=timeout)
+        except requests.exceptions.RequestException as e:
+            raise ProviderError(f"GLM API请求错误: {str(e)}", retryable=is_retryable(e))
+        if response.status_code < 400:
+            return response
+
+        status_code = response.status_code
+        retry_after = parse_retry_after(response.headers.get('Retry-After'))
+        body = response.text
+        response.close()
+        if status_code in ZhipuAIProvider.FALLBACK_STATUS_CODES:
+            print(f"GLM直连请求被拒绝（{status_code}），改用SDK")
+            ZhipuAIProvider._sdk_only_keys.add(self.api_key)
+            return None
+        raise ProviderError(f"GLM API请求错误\n响应状态码: {status_code}\n响应内容: {body[:500]}",
+                            status_code, retry_after=retry_after)
+
+    def _iter_raw_stream(self, response, model: str, started_at: float) -> Iterator[str]:
+        import requests
+        stop = lambda: close_response(response)
+        on_abort(stop)
+        try:
+            lines = _response_lines(response, self.name, model, started_at)
+            yield from iter_sse_deltas(watch_stream(lines, self.idle_timeout, stop))
+        except requests.exceptions.RequestException as e:
+            if isinstance(e, requests.exceptions.ConnectionError) and 'timed out' in str(e).lower():
+                raise StreamStalledError(self.idle_timeout or 0) from e
+            raise ProviderError(f"GLM流式响应中断: {str(e)}", retryable=is_retryable(e))
+        finally:
+            response.close()
+
+    def _iter_sdk_stream(self, messages: List[Dict[str, str]], model: str) -> Iterator[str]:
+        with tracer.span('provider.connect', provider=self.name, model=model, transport='sdk'):
+            response = self.chat(messages=messages, model=model, stream=True)
+        http_response = getattr(response, 'response', None)
+        on_stall = http_response.close if http_response is not None else None
+        if on_stall is not None:
+            on_abort(on_stall)
+        finished = False
+        try:
+            for chunk in watch_stream(response, self.idle_timeout, on_stall):
+                if not chunk.choices:
+                    continue
+                if getattr(chunk.choices[0].delta, 'content', None):
+                    yield chunk.choices[0].delta.content
+                if getattr(chunk.choices[0], 'finish_reason', None):
+                    finished = True
+            if not finished:
+                raise StreamTruncatedError()
+        except ProviderError:
+            raise
+        except Exception as e:
+            raise ProviderError(f"GLM流式响应中断: {str(e)}", retryable=is_retryable(e))
+        finally:
+            if http_response is not None:
+                http_response.close()
 
 
 class SiliconFlowProvider(AIProvider):
     """硅基流动AI服务提供商（支持DeepSeek、Qwen等模型）"""
+    name = "siliconflow"
+    url = "https://api.siliconflow.cn/v1/chat/completions"
     
     def __init__(self, api_key: str):
         super().__init__(api_key)
-        self.url = "https://api.siliconflow.cn/v1/chat/completions"
         self.headers = {
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json"
         }      
         
+    @staticmethod
+    def build_messages(messages: List[Dict[str, str]], model: str) -> List[Dict[str, str]]:
+        """转换为API消息，并根据模型添加适当的系统消息"""
+        if model.startswith("deepseek-ai"):
+            system_message = {"role": "system", "content": "你是由中国的深度求索公司开发的智能助手DeepSeek。"}
+        elif model.startswith("Qwen/"):
+            system_message = {"role": "system", "content": "你是阿里云开发的通义千问大模型，一个有用、无害、诚实的AI助手。"}
+        else:
+            # 对于其他模型，不添加特定的身份声明
+            system_message = {"role": "system", "content": "你是一个有用、无害、诚实的AI助手。"}
+        return [system_message, *to_api_messages(messages)]
+
     def chat(self, messages: List[Dict[str, str]], model: str = "deepseek-ai/DeepSeek-V3", stream: bool = False) -> str:
         """发送SiliconFlow聊天请求"""
+        import requests
         try:
-            # 根据模型添加适当的系统消息
-            if model.startswith("deepseek-ai"):
-                system_message = {"role": "system", "content": "你是由中国的深度求索公司开发的智能助手DeepSeek。"}
-            elif model.startswith("Qwen/"):
-                system_message = {"role": "system", "content": "你是阿里云开发的通义千问大模型，一个有用、无害、诚实的AI助手。"}
-            else:
-                # 对于其他模型，不添加特定的身份声明
-                system_message = {"role": "system", "content": "你是一个有用、无害、诚实的AI助手。"}
-            
-            full_messages = [system_message] + messages
-            
             payload = {
                 "model": model,
                 "stream": stream,
-                "messages": full_messages
+                "messages": SiliconFlowProvider.build_messages(messages, model)
             }
             
-            response = requests.post(self.url, json=payload, headers=self.headers, stream=stream)
+            # 流式请求的读取超时即相邻数据的最大间隔
+            read_timeout = self.idle_timeout if stream else self.read_timeout
+            timeout = (self.connect_timeout, read_timeout) if self.connect_timeout or read_timeout else None
+            response = get_session().post(self.url, json=payload, headers=self.headers, stream=stream,
+                                          timeout=timeout)
             
             if response.status_code == 403:
+                response.close()
                 error_msg = "API认证失败(403 Forbidden)。可能的原因：\n"
                 error_msg += "1. API密钥无效或已过期\n"
                 error_msg += "2. API密钥没有访问该模型的权限\n"
                 error_msg += "3. 账户余额不足或已被禁用"
-                raise Exception(error_msg)
+                raise ProviderError(error_msg, 403)
             
             response.raise_for_status()
             
@@ -116,35 +311,299 @@ class SiliconFlowProvider(AIProvider):
             else:
                 error_msg = f"SiliconFlow API请求错误: {str(e)}\n"
                 
+            status_code = None
+            retry_after = None
             if hasattr(e, 'response') and e.response is not None:
+                status_code = e.response.status_code
+                retry_after = parse_retry_after(e.response.headers.get('Retry-After'))
                 error_msg += f"响应状态码: {e.response.status_code}\n"
                 try:
                     error_detail = e.response.json()
                     error_msg += f"错误详情: {error_detail}"
                 except:
                     error_msg += f"响应内容: {e.response.text}"
-            raise Exception(error_msg)
+                e.response.close()
+            retryable = None if status_code is not None else is_retryable(e)
+            raise ProviderError(error_msg, status_code, retryable, retry_after)
             
+        except ProviderError:
+            raise
         except (KeyError, IndexError) as e:
-            raise Exception(f"API响应格式错误: {str(e)}")
+            raise ProviderError(f"API响应格式错误: {str(e)}", retryable=False)
         except Exception as e:
-            raise Exception(f"SiliconFlow错误: {str(e)}")
+            raise ProviderError(f"SiliconFlow错误: {str(e)}", retryable=is_retryable(e))
+
+    def stream_chat(self, messages: List[Dict[str, str]], model: str = "deepseek-ai/DeepSeek-V3") -> Iterator[str]:
+        """发送SiliconFlow流式聊天请求"""
+        import requests
+        started_at = time.perf_counter()
+        with tracer.span('provider.connect', provider=self.name, model=model):
+            response = self.chat(messages=messages, model=model, stream=True)
+        stop = lambda: close_response(response)
+        on_abort(stop)
+        try:
+            lines = _response_lines(response, self.name, model, started_at)
+            yield from iter_sse_deltas(watch_stream(lines, self.idle_timeout, stop))
+        except requests.exceptions.RequestException as e:
+            # 读取超时同样说明流已停滞
+            if isinstance(e, requests.exceptions.ConnectionError) and 'timed out' in str(e).lower():
+                raise StreamStalledError(self.idle_timeout or 0) from e
+            raise ProviderError(f"SiliconFlow流式响应中断: {str(e)}", retryable=is_retryable(e))
+        finally:
+            # 提前结束（中断或对冲失败方被取消）时立即归还连接池中的连接
+            response.close()
+
+
+class CachedProvider(AIProvider):
+    """带回复缓存的服务提供商包装
+
+    相同的 (模型, 消息, 参数) 直接返回缓存的回复；流式请求命中时按片段回放，
+    与真实流式输出走同一条路径。只有完整结束的回复才会写入缓存。
+    """
+
+    def __init__(self, provider: AIProvider, cache: ResponseCache):
+        super().__init__(provider.api_key)
+        self.provider = provider
+        self.cache = cache
+        # 最近一次回复是否来自缓存（回放耗时接近0，不计入路由与性能统计）
+        self.cache_hit = False
+
+    @property
+    def served_model(self) -> Optional[str]:
+        """实际提供回复的模型（缓存命中时为None）"""
+        return getattr(self.provider, 'served_model', None)
+
+    def chat(self, messages: List[Dict[str, str]], model: str, stream: bool = False) -> str:
+        """发送聊天请求（原始流式响应对象无法缓存，直接透传）"""
+        if stream:
+            return self.provider.chat(messages=messages, model=model, stream=True)
+        key = make_cache_key(model, messages)
+        content = self.cache.get(key)
+        self.cache_hit = content is not None
+        if content is None:
+            content = self.provider.chat(messages=messages, model=model)
+            self.cache.put(key, content)
+        return content
+
+    def stream_chat(self, messages: List[Dict[str, str]], model: str) -> Iterator[str]:
+        """发送流式聊天请求，命中缓存时按片段回放"""
+        key = make_cache_key(model, messages)
+        content = self.cache.get(key)
+        self.cache_hit = content is not None
+        if content is not None:
+            for start in range(0, len(content), REPLAY_CHUNK_CHARS):
+                yield content[start:start + REPLAY_CHUNK_CHARS]
+            return
+
+        parts = []
+        for chunk in self.provider.stream_chat(messages=messages, model=model):
+            parts.append(chunk)
+            yield chunk
+        # 被中断或在结束标记之前断开的流（StreamTruncatedError）不会执行到这里，不完整的回复不会被缓存
+        if parts:
+            self.cache.put(key, ''.join(parts))
 
 
 class AIProviderFactory:
-    """AI服务提供商工厂"""      
+    """AI服务提供商工厂"""
+    # 回复缓存（可选），启用后创建的服务提供商都会经过缓存
+    response_cache: Optional[ResponseCache] = None
+    # 自动路由：选择 AUTO_MODEL 时由路由器在等价模型组中选择模型
+    AUTO_MODEL = "auto"
+    router = None
+    # 对冲请求策略（可选），首字迟迟未到时再发出一个相同的请求
+    hedging = None
+    _hedge_api_key_lookup = None
+    # 容错策略（超时、空闲看门狗与重试），按模型区分
+    resilience = None
+    # 按服务商与API密钥共享的限流器（RateLimiterRegistry）
+    rate_limits = None
+    # 智谱流式请求是否直连OpenAI兼容接口（False时始终使用SDK）
+    zhipu_raw_http = True
+    # 相同并发请求合并（SingleFlight / AsyncSingleFlight），None时不合并
+    single_flight = None
+    async_single_flight = None
+    # 是否在模型列表中列出本地模拟模型（mock 开头的模型始终可用，见 mock_provider）
+    mock_models_listed = False
+    # 流式响应录制器（StreamRecorder）与回放来源（StreamReplayer），见 stream_recorder
+    stream_recorder = None
+    replayer = None
+
     @staticmethod
-    def create_provider(model: str, api_key: str) -> AIProvider:
-        """根据模型名称创建相应的服务提供商"""
+    def set_resilience(settings):
+        """设置容错策略（ResilienceSettings）"""
+        AIProviderFactory.resilience = settings
+
+    @staticmethod
+    def set_rate_limits(registry):
+        """设置限流器（RateLimiterRegistry）"""
+        AIProviderFactory.rate_limits = registry
+
+    @staticmethod
+    def create_provider(model: str, api_key: str, priority: int = 0) -> AIProvider:
+        """根据模型名称创建相应的服务提供商
+
+        priority: 请求优先级（见 rate_limiter.Priority），后台任务在限流排队时让位于交互请求
+        """
+        if model == AIProviderFactory.AUTO_MODEL:
+            if AIProviderFactory.router is None:
+                raise Exception("自动路由未启用")
+            from .router import RoutedProvider
+            return RoutedProvider(AIProviderFactory.router)
+        return AIProviderFactory.create_model_provider(model, api_key, priority)
+
+    @staticmethod
+    def create_model_provider(model: str, api_key: str, priority: int = 0) -> AIProvider:
+        """创建具体模型的服务提供商（不经过自动路由）"""
+        provider = AIProviderFactory._create_base_provider(model, api_key)
+        provider = AIProviderFactory._with_resilience(AIProviderFactory._with_rate_limit(provider, priority), model)
+        if AIProviderFactory.hedging is not None:
+            from .hedging import HedgedProvider
+            provider = HedgedProvider(provider, AIProviderFactory.hedging,
+                                      lambda hedge_model: AIProviderFactory._create_hedge_provider(hedge_model, priority))
+        if AIProviderFactory.single_flight is not None:
+            from .single_flight import SingleFlightProvider
+            provider = SingleFlightProvider(provider, AIProviderFactory.single_flight)
+        if AIProviderFactory.response_cache is not None:
+            return CachedProvider(provider, AIProviderFactory.response_cache)
+        return provider
+
+    @staticmethod
+    def create_async_provider(model: str, api_key: str, priority: int = 0):
+        """创建具体模型的异步服务提供商（限流、容错、请求合并与回复缓存与同步版本一致，不支持自动路由与对冲）"""
+        from .async_providers import (AsyncCachedProvider, AsyncLimitedProvider, AsyncResilientProvider,
+                                      AsyncSiliconFlowProvider, AsyncSingleFlightProvider, AsyncZhipuAIProvider)
+        from .rate_limiter import RateLimiterRegistry
+        from .resilience import ResilienceSettings
+        from .mock_provider import AsyncMockProvider, is_mock_model
+        if AIProviderFactory.replayer is not None:
+            from .stream_recorder import AsyncReplayProvider
+            provider = AsyncReplayProvider(AIProviderFactory.replayer, api_key)
+        elif is_mock_model(model):
+            provider = AsyncMockProvider(api_key)
+        elif model.startswith("deepseek-ai") or model.startswith("Qwen/"):
+            provider = AsyncSiliconFlowProvider(api_key)
+        else:
+            provider = AsyncZhipuAIProvider(api_key)
+        if AIProviderFactory.rate_limits is None:
+            AIProviderFactory.rate_limits = RateLimiterRegistry()
+        if AIProviderFactory.resilience is None:
+            AIProviderFactory.resilience = ResilienceSettings()
+        provider = AsyncLimitedProvider(provider, AIProviderFactory.rate_limits.get(provider.name, api_key), priority)
+        provider = AsyncResilientProvider(provider, AIProviderFactory.resilience.policy_for(model))
+        if AIProviderFactory.async_single_flight is not None:
+            provider = AsyncSingleFlightProvider(provider, AIProviderFactory.async_single_flight)
+        if AIProviderFactory.response_cache is not None:
+            provider = AsyncCachedProvider(provider, AIProviderFactory.response_cache)
+        return provider
+
+    @staticmethod
+    def _create_base_provider(model: str, api_key: str) -> AIProvider:
+        """按模型名称选择服务商"""
+        from .mock_provider import MockProvider, is_mock_model
+        if AIProviderFactory.replayer is not None:
+            from .stream_recorder import ReplayProvider
+            return ReplayProvider(AIProviderFactory.replayer, api_key)
+        if is_mock_model(model):
+            return MockProvider(api_key)
         if model.startswith("deepseek-ai") or model.startswith("Qwen/"):
             return SiliconFlowProvider(api_key)
+        return ZhipuAIProvider(api_key, raw_http=AIProviderFactory.zhipu_raw_http)
+
+    @staticmethod
+    def _create_hedge_provider(model: str, priority: int = 0) -> AIProvider:
+        """创建对冲到等价模型时使用的服务提供商"""
+        provider = AIProviderFactory._create_base_provider(model, AIProviderFactory._hedge_api_key_lookup(model))
+        return AIProviderFactory._with_resilience(AIProviderFactory._with_rate_limit(provider, priority), model)
+
+    @staticmethod
+    def _with_rate_limit(provider: AIProvider, priority: int) -> AIProvider:
+        """经过该服务商与API密钥共享的限流器（位于重试之内，每次重试同样需要获得许可）"""
+        from .rate_limiter import LimitedProvider, RateLimiterRegistry
+        if AIProviderFactory.rate_limits is None:
+            AIProviderFactory.rate_limits = RateLimiterRegistry()
+        limiter = AIProviderFactory.rate_limits.get(provider.name, provider.api_key)
+        return LimitedProvider(provider, limiter, priority)
+
+    @staticmethod
+    def _with_resilience(provider: AIProvider, model: str) -> AIProvider:
+        """按模型的容错策略包装服务提供商（未设置时使用默认策略）"""
+        from .resilience import ResilienceSettings, ResilientProvider
+        if AIProviderFactory.resilience is None:
+            AIProviderFactory.resilience = ResilienceSettings()
+        return ResilientProvider(provider, AIProviderFactory.resilience.policy_for(model))
+
+    @staticmethod
+    def enable_hedging(policy, api_key_lookup=None):
+        """启用对冲请求，传入None时关闭；api_key_lookup 用于对冲到其他模型时获取API密钥"""
+        AIProviderFactory.hedging = policy
+        AIProviderFactory._hedge_api_key_lookup = api_key_lookup
+
+    @staticmethod
+    def enable_response_cache(cache: Optional[ResponseCache]):
+        """启用回复缓存，传入None时关闭"""
+        AIProviderFactory.response_cache = cache
+
+    @staticmethod
+    def enable_single_flight(enabled: bool = True):
+        """启用相同并发请求合并：重复请求订阅同一个上游流，只发出一次上游请求"""
+        if enabled:
+            from .single_flight import AsyncSingleFlight, SingleFlight
+            AIProviderFactory.single_flight = SingleFlight()
+            AIProviderFactory.async_single_flight = AsyncSingleFlight()
         else:
-            return ZhipuAIProvider(api_key)
+            AIProviderFactory.single_flight = None
+            AIProviderFactory.async_single_flight = None
+
+    @staticmethod
+    def enable_stream_recording(recorder):
+        """启用流式响应录制（StreamRecorder），传入None时关闭"""
+        AIProviderFactory.stream_recorder = recorder
+
+    @staticmethod
+    def enable_replay(replayer):
+        """所有模型改为回放录制的流式响应（StreamReplayer），传入None时恢复真实服务商"""
+        AIProviderFactory.replayer = replayer
+
+    @staticmethod
+    def enable_router(router):
+        """启用自动路由，传入None时关闭"""
+        AIProviderFactory.router = router
     
+    # 模型目录：上下文窗口与预留的最大输出长度（单位：token）
+    MODEL_CATALOG = {
+        "glm-z1-flash": {"context_window": 32768, "max_output_tokens": 8192},
+        "glm-z1-airx": {"context_window": 32768, "max_output_tokens": 8192},
+        "glm-z1-air": {"context_window": 32768, "max_output_tokens": 8192},
+        "glm-4-plus": {"context_window": 128000, "max_output_tokens": 4096},
+        "deepseek-ai/DeepSeek-V3": {"context_window": 65536, "max_output_tokens": 8192},
+        "deepseek-ai/DeepSeek-R1": {"context_window": 65536, "max_output_tokens": 16384},
+        "Qwen/Qwen3-235B-A22B": {"context_window": 131072, "max_output_tokens": 8192},
+    }
+    DEFAULT_MODEL_INFO = {"context_window": 8192, "max_output_tokens": 2048}
+
+    @staticmethod
+    def get_model_info(model: str) -> Dict[str, int]:
+        """获取模型的上下文窗口信息，未知模型使用保守的默认值
+
+        自动路由取模型组中最小的上下文窗口，保证切换到任一模型都不会超出
+        """
+        if model == AIProviderFactory.AUTO_MODEL and AIProviderFactory.router is not None:
+            infos = [AIProviderFactory.get_model_info(m) for m in AIProviderFactory.router.group]
+            if infos:
+                return min(infos, key=lambda info: info["context_window"] - info["max_output_tokens"])
+        return AIProviderFactory.MODEL_CATALOG.get(model, AIProviderFactory.DEFAULT_MODEL_INFO)
+
+    @staticmethod
+    def get_context_budget(model: str) -> int:
+        """获取可用于历史消息的token预算（上下文窗口减去预留输出）"""
+        info = AIProviderFactory.get_model_info(model)
+        return info["context_window"] - info["max_output_tokens"]
+
     @staticmethod
     def get_supported_models() -> Dict[str, List[str]]:
-        """获取支持的模型列表"""
-        return {
+        """获取支持的模型列表（启用时包含本地模拟模型）"""
+        models = {
             "智谱AI": [
                 "glm-z1-flash",
                 "glm-z1-airx",
@@ -157,6 +616,10 @@ class AIProviderFactory:
                 "Qwen/Qwen3-235B-A22B"
             ]
         }
+        if AIProviderFactory.mock_models_listed:
+            from .mock_provider import MOCK_PRESETS
+            models["本地模拟"] = list(MOCK_PRESETS)
+        return models
 
 
 # 为了兼容性，保留原有的类名
@@ -0,0 +1,270 @@
+"""
+异步服务提供商
+基于httpx异步客户端（可用时启用HTTP/2）的流式接口：多个流在同一个事件循环线程上并发，
+中断请求即取消任务。与同步服务商共享限流器、容错策略与回复缓存
+"""
+import asyncio
+import concurrent.futures
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import AsyncIterator, Dict, List, Optional
+
+from .ai_providers import REPLAY_CHUNK_CHARS, SSE_DONE, SiliconFlowProvider, ZhipuAIProvider, parse_sse_line
+from .conversation import to_api_messages
+from .errors import ProviderError, StreamStalledError, StreamTruncatedError, is_retryable, parse_retry_after
+from .rate_limiter import Priority, RateLimiter
+from .resilience import ResiliencePolicy
+from .response_cache import ResponseCache, make_cache_key
+from .single_flight import AsyncSingleFlight, make_flight_key
+from .transport import get_async_client
+from utils.tracing import tracer
+
+# 等待限流许可的线程数上限：排队的请求在专用线程池中阻塞等待，
+# 不占用事件循环的默认线程池（上下文组装与回复缓存读写在那里运行）
+LIMITER_WAIT_THREADS = 64
+
+_limiter_executor: Optional[concurrent.futures.ThreadPoolExecutor] = None
+_limiter_executor_lock = threading.Lock()
+
+
+def _get_limiter_executor() -> concurrent.futures.ThreadPoolExecutor:
+    """获取等待限流许可的共享线程池（首次使用时创建）"""
+    global _limiter_executor
+    if _limiter_executor is None:
+        with _limiter_executor_lock:
+            if _limiter_executor is None:
+                _limiter_executor = concurrent.futures.ThreadPoolExecutor(
+                    LIMITER_WAIT_THREADS, thread_name_prefix="rate-limit-wait")
+    return _limiter_executor
+
+
+class AsyncAIProvider(ABC):
+    """异步AI服务提供商抽象基类"""
+
+    def __init__(self, api_key: str):
+        self.api_key = api_key
+        self.connect_timeout: Optional[float] = None
+        self.read_timeout: Optional[float] = None
+        self.idle_timeout: Optional[float] = None
+
+    def configure_timeouts(self, connect_timeout: Optional[float], read_timeout: Optional[float],
+                           idle_timeout: Optional[float]):
+        """设置连接超时、非流式读取超时与流式空闲超时"""
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.idle_timeout = idle_timeout
+
+    @abstractmethod
+    def chat_stream(self, messages: List[Dict[str, str]], model: str) -> AsyncIterator[str]:
+        """发送流式聊天请求，逐段返回回复文本（异步生成器）"""
+        pass
+
+    async def chat(self, messages: List[Dict[str, str]], model: str) -> str:
+        """发送聊天请求，返回完整回复"""
+        return ''.join([chunk async for chunk in self.chat_stream(messages, model)])
+
+
+class AsyncOpenAICompatibleProvider(AsyncAIProvider):
+    """OpenAI兼容接口的异步服务提供商"""
+    name = ""
+    url = ""
+    error_label = "API"
+
+    def build_messages(self, messages: List[Dict[str, str]], model: str) -> List[Dict[str, str]]:
+        return to_api_messages(messages)
+
+    async def chat_stream(self, messages: List[Dict[str, str]], model: str) -> AsyncIterator[str]:
+        import httpx
+        payload = {"model": model, "stream": True, "messages": self.build_messages(messages, model)}
+        headers = {"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"}
+        # 流式请求的读取超时即相邻数据的最大间隔，由下面的空闲检测负责
+        timeout = httpx.Timeout(None, connect=self.connect_timeout)
+        connect_started = time.perf_counter_ns()
+        try:
+            async with get_async_client().stream('POST', self.url, json=payload, headers=headers,
+                                                 timeout=timeout) as response:
+                tracer.complete('provider.connect', connect_started, provider=self.name, model=model)
+                if response.status_code >= 400:
+                    body = (await response.aread()).decode('utf-8', errors='replace')
+                    raise ProviderError(
+                        f"{self.error_label}请求错误\n响应状态码: {response.status_code}\n响应内容: {body[:500]}",
+                        response.status_code, retry_after=parse_retry_after(response.headers.get('retry-after'))
+                    )
+                lines = response.aiter_lines()
+                first_line = True
+                while True:
+                    line = await self._next_line(lines)
+                    if first_line:
+                        first_line = False
+                        tracer.instant('provider.first_byte', provider=self.name, model=model)
+                    text = parse_sse_line(line)
+                    if text is SSE_DONE:
+                        return
+                    if text:
+                        yield text
+        except ProviderError:
+            raise
+        except httpx.HTTPError as e:
+            raise ProviderError(f"{self.error_label}流式请求中断: {e!r}", retryable=is_retryable(e))
+
+
+    async def _next_line(self, lines) -> str:
+        """读取下一行，超过空闲时限时抛出 StreamStalledError
+
+        不用 asyncio.wait_for：Python 3.12 之前，任务取消与下一行（常已在缓冲区中）同时完成时
+        wait_for 返回结果而吞掉取消，被取消的流会一直读到服务端的下一次停顿之后
+        """
+        read = asyncio.ensure_future(lines.__anext__())
+        try:
+            done, _ = await asyncio.wait({read}, timeout=self.idle_timeout)
+        finally:
+            if not read.done():
+                read.cancel()
+        if not done:
+            raise StreamStalledError(self.idle_timeout)
+        try:
+            return read.result()
+        except StopAsyncIteration:
+            raise StreamTruncatedError() from None
+
+
+class AsyncZhipuAIProvider(AsyncOpenAICompatibleProvider):
+    """智谱AI异步服务提供商（OpenAI兼容接口，API密钥直接作为Bearer令牌）"""
+    name = "zhipu"
+    url = ZhipuAIProvider.url
+    error_label = "GLM API"
+
+
+class AsyncSiliconFlowProvider(AsyncOpenAICompatibleProvider):
+    """硅基流动异步服务提供商"""
+    name = "siliconflow"
+    url = SiliconFlowProvider.url
+    error_label = "SiliconFlow API"
+
+    def build_messages(self, messages: List[Dict[str, str]], model: str) -> List[Dict[str, str]]:
+        return SiliconFlowProvider.build_messages(messages, model)
+
+
+class AsyncWrappedProvider(AsyncAIProvider):
+    """异步包装基类：超时设置传递给内层服务提供商"""
+
+    def __init__(self, provider: AsyncAIProvider):
+        super().__init__(provider.api_key)
+        self.provider = provider
+
+    def configure_timeouts(self, connect_timeout, read_timeout, idle_timeout):
+        super().configure_timeouts(connect_timeout, read_timeout, idle_timeout)
+        self.provider.configure_timeouts(connect_timeout, read_timeout, idle_timeout)
+
+
+class AsyncLimitedProvider(AsyncWrappedProvider):
+    """经过限流的异步服务提供商：排队在专用线程池中等待，不阻塞事件循环"""
+
+    def __init__(self, provider: AsyncAIProvider, limiter: RateLimiter, priority: int = Priority.INTERACTIVE):
+        super().__init__(provider)
+        self.limiter = limiter
+        self.priority = priority
+
+    async def chat_stream(self, messages: List[Dict[str, str]], model: str) -> AsyncIterator[str]:
+        loop = asyncio.get_running_loop()
+        # 等待期间任务被取消时，拿到的许可要立即归还
+        acquiring = loop.run_in_executor(_get_limiter_executor(), self.limiter.acquire, self.priority)
+        try:
+            await asyncio.shield(acquiring)
+        except asyncio.CancelledError:
+            acquiring.add_done_callback(lambda _: self.limiter.release(succeeded=False))
+            raise
+        error = None
+        try:
+            async for chunk in self.provider.chat_stream(messages, model):
+                yield chunk
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            if isinstance(error, ProviderError) and error.status_code == 429:
+                self.limiter.throttle(error.retry_after)
+            self.limiter.release(succeeded=error is None)
+
+
+class AsyncResilientProvider(AsyncWrappedProvider):
+    """带重试的异步服务提供商：与 ResilientProvider 相同，只在首字到达前重试"""
+
+    def __init__(self, provider: AsyncAIProvider, policy: ResiliencePolicy):
+        super().__init__(provider)
+        self.policy = policy
+        self.retries = 0
+        provider.configure_timeouts(policy.connect_timeout, policy.read_timeout, policy.idle_timeout)
+
+    async def chat_stream(self, messages: List[Dict[str, str]], model: str) -> AsyncIterator[str]:
+        attempt = 0
+        while True:
+            stream = self.provider.chat_stream(messages, model)
+            try:
+                first_chunk = await stream.__anext__()
+            except StopAsyncIteration:
+                return
+            except Exception as e:
+                await stream.aclose()
+                if attempt >= self.policy.max_retries or not is_retryable(e):
+                    raise
+                delay = self.policy.backoff(attempt, getattr(e, 'retry_after', None))
+                print(f"请求失败，{delay:.1f} 秒后重试（第 {attempt + 1} 次）: {e}")
+                self.retries += 1
+                attempt += 1
+                await asyncio.sleep(delay)
+                continue
+            break
+
+        try:
+            yield first_chunk
+            async for chunk in stream:
+                yield chunk
+        finally:
+            await stream.aclose()
+
+
+class AsyncSingleFlightProvider(AsyncWrappedProvider):
+    """合并相同并发请求的异步服务提供商：重复请求订阅同一个上游流"""
+
+    def __init__(self, provider: AsyncAIProvider, group: AsyncSingleFlight):
+        super().__init__(provider)
+        self.group = group
+
+    async def chat_stream(self, messages: List[Dict[str, str]], model: str) -> AsyncIterator[str]:
+        key = make_flight_key(self.api_key, model, messages)
+        chunks = self.group.stream(key, lambda: self.provider.chat_stream(messages, model))
+        try:
+            async for chunk in chunks:
+                yield chunk
+        finally:
+            await chunks.aclose()
+
+
+class AsyncCachedProvider(AsyncWrappedProvider):
+    """带回复缓存的异步服务提供商：命中时按片段回放，只缓存完整结束的回复"""
+
+    def __init__(self, provider: AsyncAIProvider, cache: ResponseCache):
+        super().__init__(provider)
+        self.cache = cache
+        self.cache_hit = False  # 最近一次回复是否来自缓存
+
+    async def chat_stream(self, messages: List[Dict[str, str]], model: str) -> AsyncIterator[str]:
+        loop = asyncio.get_running_loop()
+        key = make_cache_key(model, messages)
+        # 磁盘层是SQLite，放到线程池中读写
+        content = await loop.run_in_executor(None, self.cache.get, key)
+        self.cache_hit = content is not None
+        if content is not None:
+            for start in range(0, len(content), REPLAY_CHUNK_CHARS):
+                yield content[start:start + REPLAY_CHUNK_CHARS]
+            return
+
+        parts = []
+        async for chunk in self.provider.chat_stream(messages, model):
+            parts.append(chunk)
+            yield chunk
+        # 在结束标记之前断开的流抛出 StreamTruncatedError，不会执行到这里
+        if parts:
+            await loop.run_in_executor(None, self.cache.put, key, ''.join(parts))
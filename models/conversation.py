@@ -0,0 +1,141 @@
+"""
+会话消息存储
+当前打开会话的内存消息列表（唯一数据源），写入时同步到数据库
+"""
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+
+class MessageRecord:
+    """单条消息记录（只读）
+
+    model 为生成回复的模型，reply_to 为多模型对比时所回复的用户消息ID，
+    ttft 与 total_seconds 为多模型对比时该回复的首字延迟与总耗时（秒）
+    """
+    __slots__ = ('id', 'role', 'content', 'model', 'reply_to', 'ttft', 'total_seconds', '_api_message')
+
+    def __init__(self, message_id: Optional[int], role: str, content: str,
+                 model: Optional[str] = None, reply_to: Optional[int] = None,
+                 ttft: Optional[float] = None, total_seconds: Optional[float] = None):
+        self.id = message_id
+        self.role = role
+        self.content = content
+        self.model = model
+        self.reply_to = reply_to
+        self.ttft = ttft
+        self.total_seconds = total_seconds
+        self._api_message = None
+
+    def to_api(self) -> Dict[str, str]:
+        """转换为API请求格式（结果缓存，每条消息只构建一次）"""
+        if self._api_message is None:
+            self._api_message = {"role": self.role, "content": self.content}
+        return self._api_message
+
+    def __repr__(self):
+        return f"MessageRecord(id={self.id!r}, role={self.role!r}, content={self.content[:20]!r})"
+
+
+class ConversationSummary:
+    """会话摘要：概括了ID不大于 covers_until 的所有消息"""
+    __slots__ = ('content', 'covers_until')
+
+    def __init__(self, content: str, covers_until: int):
+        self.content = content
+        self.covers_until = covers_until
+
+    def to_api(self) -> Dict[str, str]:
+        """转换为放在上下文开头的系统消息"""
+        return {"role": "system", "content": f"以下是此前对话的摘要，请结合摘要继续对话：\n{self.content}"}
+
+
+def select_replies(messages: Sequence[Union[MessageRecord, Dict[str, str]]],
+                   model: Optional[str] = None) -> list:
+    """多模型对比的同一轮有多条回复时只保留一条：优先当前模型的回复，否则保留最后一条"""
+    groups: Dict[int, list] = {}
+    for message in messages:
+        reply_to = message.reply_to if isinstance(message, MessageRecord) else message.get('reply_to')
+        if reply_to is not None:
+            groups.setdefault(reply_to, []).append(message)
+    if not any(len(group) > 1 for group in groups.values()):
+        return list(messages)
+
+    dropped = set()
+    for group in groups.values():
+        if len(group) < 2:
+            continue
+        models = [m.model if isinstance(m, MessageRecord) else m.get('model') for m in group]
+        keep = models.index(model) if model in models else len(group) - 1
+        dropped.update(id(message) for index, message in enumerate(group) if index != keep)
+    return [message for message in messages if id(message) not in dropped]
+
+
+def to_api_messages(messages: Iterable[Union[MessageRecord, Dict[str, str]]]) -> List[Dict[str, str]]:
+    """将消息记录或字典序列转换为API请求使用的消息列表"""
+    return [message.to_api() if isinstance(message, MessageRecord) else message for message in messages]
+
+
+class ConversationStore:
+    """单个会话的内存消息存储
+
+    消息保存在不可变元组中，追加/删除时替换整个元组，
+    因此 snapshot() 可以直接交给工作线程使用而无需复制。
+    """
+
+    def __init__(self, db, conversation_id: str, max_messages: int = 50):
+        self.db = db
+        self.conversation_id = conversation_id
+        self.max_messages = max_messages
+        self._records: Tuple[MessageRecord, ...] = ()
+        self.summary: Optional[ConversationSummary] = None
+
+    @classmethod
+    def load(cls, db, conversation_id: str, max_messages: int = 50) -> "ConversationStore":
+        """从数据库加载会话（只在打开会话时读取一次）"""
+        store = cls(db, conversation_id, max_messages)
+        store._records = tuple(
+            MessageRecord(message['id'], message['role'], message['content'],
+                          message.get('model'), message.get('reply_to'),
+                          message.get('ttft'), message.get('total_seconds'))
+            for message in db.get_conversation_history(conversation_id, max_messages)
+        )
+        summary = db.get_summary(conversation_id)
+        if summary:
+            store.summary = ConversationSummary(*summary)
+        return store
+
+    def snapshot(self) -> Tuple[MessageRecord, ...]:
+        """获取当前消息的不可变快照"""
+        return self._records
+
+    def __len__(self):
+        return len(self._records)
+
+    def append(self, role: str, content: str, model: Optional[str] = None,
+               reply_to: Optional[int] = None, ttft: Optional[float] = None,
+               total_seconds: Optional[float] = None) -> MessageRecord:
+        """追加消息并写入数据库，超出上限时与数据库一致地丢弃最早的消息"""
+        sender = 'ai' if role == 'assistant' else 'user'
+        message_id = self.db.save_message(content, sender, self.conversation_id, model, reply_to,
+                                          ttft, total_seconds)
+        record = MessageRecord(message_id, role, content, model, reply_to, ttft, total_seconds)
+
+        records = self._records + (record,)
+        if len(records) > self.max_messages:
+            records = records[-self.max_messages:]
+        self._records = records
+        return record
+
+    def remove(self, message_id: int):
+        """删除消息（同时从数据库中删除）"""
+        self.db.delete_message(message_id)
+        self._records = tuple(record for record in self._records if record.id != message_id)
+
+    def set_summary(self, content: str, covers_until: int):
+        """更新会话摘要并写入数据库"""
+        self.db.save_summary(content, self.conversation_id, covers_until)
+        self.summary = ConversationSummary(content, covers_until)
+
+    def reset(self):
+        """清空内存中的消息与摘要（数据库由调用方处理）"""
+        self._records = ()
+        self.summary = None
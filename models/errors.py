@@ -0,0 +1,74 @@
+"""
+服务商请求错误
+统一记录HTTP状态码与是否可以重试，供重试策略判断
+"""
+from typing import Optional
+
+# 可以重试的HTTP状态码：请求超时、限流与服务端错误
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+# 网络层可重试错误的类型名（requests/urllib3/httpx/SDK，避免在此导入这些库）
+RETRYABLE_ERROR_NAMES = {
+    'ConnectionError', 'ConnectTimeout', 'ReadTimeout', 'Timeout', 'ChunkedEncodingError',
+    'ProtocolError', 'RemoteDisconnected', 'ConnectError', 'ReadError', 'RemoteProtocolError',
+    'APIConnectionError', 'APITimeoutError',
+}
+
+
+class ProviderError(Exception):
+    """服务商请求失败
+
+    status_code: HTTP状态码（网络错误时为None）
+    retryable: 是否可以重试
+    retry_after: 服务端要求的重试等待时间（秒）
+    """
+
+    def __init__(self, message: str, status_code: Optional[int] = None, retryable: Optional[bool] = None,
+                 retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retryable = status_code in RETRYABLE_STATUS_CODES if retryable is None else retryable
+        self.retry_after = retry_after
+
+
+class StreamStalledError(ProviderError):
+    """流式响应在空闲时限内没有收到任何数据"""
+
+    def __init__(self, idle_seconds: float):
+        super().__init__(f"流式响应已停滞：{idle_seconds:g} 秒内没有收到数据", retryable=True)
+        self.idle_seconds = idle_seconds
+
+
+class StreamTruncatedError(ProviderError):
+    """流式响应在结束标记（SSE的 [DONE] 或 finish_reason）之前结束：连接被提前关闭，回复不完整"""
+
+    def __init__(self):
+        super().__init__("流式响应未正常结束：连接在回复完成前关闭", retryable=True)
+
+
+class StreamAbortedError(ProviderError):
+    """流式请求被调用方中止（取消或中断），不可重试"""
+
+    def __init__(self):
+        super().__init__("流式请求已中止", retryable=False)
+
+
+def is_retryable(error: BaseException) -> bool:
+    """判断错误是否可以重试"""
+    if isinstance(error, ProviderError):
+        return error.retryable
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    status_code = getattr(error, 'status_code', None)
+    if status_code is None:
+        status_code = getattr(getattr(error, 'response', None), 'status_code', None)
+    if isinstance(status_code, int):
+        return status_code in RETRYABLE_STATUS_CODES
+    return any(cls.__name__ in RETRYABLE_ERROR_NAMES for cls in type(error).__mro__)
+
+
+def parse_retry_after(value) -> Optional[float]:
+    """解析Retry-After响应头（只支持秒数形式）"""
+    try:
+        return max(0.0, float(value)) if value is not None else None
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,220 @@
+"""
+对冲请求
+首字在按历史延迟分位数计算的时限内没有到达时，再发出一个相同的请求（同一模型或等价模型），
+保留先开始输出的流并取消另一个，用于削减首字延迟的长尾
+"""
+import queue
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, Iterator, List, Optional
+
+from .ai_providers import AIProvider
+from .errors import StreamAbortedError
+from .transport import StreamAbort, abort_scope, on_abort
+
+
+class HedgingPolicy:
+    """对冲策略与统计
+
+    percentile: 对冲时限取该模型近期首字延迟的分位数
+    min_delay / max_delay: 时限的上下限（秒），样本不足 min_samples 时使用 default_delay
+    budget_ratio / burst: 对冲预算，对冲次数不超过 请求数 × budget_ratio + burst
+    alternate: 对冲请求发往的模型，返回None时使用同一模型
+    """
+
+    def __init__(self, percentile: float = 0.9, min_delay: float = 0.5, max_delay: float = 8.0,
+                 default_delay: float = 2.0, min_samples: int = 20, window: int = 200,
+                 budget_ratio: float = 0.1, burst: int = 2,
+                 alternate: Optional[Callable[[str], Optional[str]]] = None,
+                 clock: Callable[[], float] = time.monotonic):
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.default_delay = default_delay
+        self.min_samples = min_samples
+        self.window = window
+        self.budget_ratio = budget_ratio
+        self.burst = burst
+        self.alternate = alternate
+        self.clock = clock
+        self._samples: Dict[str, deque] = {}
+        self._lock = threading.Lock()
+        # 统计
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.budget_denied = 0
+
+    def delay_for(self, model: str) -> float:
+        """计算对冲时限"""
+        with self._lock:
+            samples = sorted(self._samples.get(model, ()))
+        if len(samples) < self.min_samples:
+            return self.default_delay
+        index = min(len(samples) - 1, int(len(samples) * self.percentile))
+        return max(self.min_delay, min(self.max_delay, samples[index]))
+
+    def record_ttft(self, model: str, seconds: float):
+        """记录首字延迟样本"""
+        with self._lock:
+            samples = self._samples.get(model)
+            if samples is None:
+                samples = self._samples[model] = deque(maxlen=self.window)
+            samples.append(seconds)
+
+    def record_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def try_acquire_hedge(self) -> bool:
+        """申请一次对冲，超出预算时拒绝"""
+        with self._lock:
+            if self.hedges >= self.requests * self.budget_ratio + self.burst:
+                self.budget_denied += 1
+                return False
+            self.hedges += 1
+            return True
+
+    def record_hedge_win(self):
+        with self._lock:
+            self.hedge_wins += 1
+
+    def stats(self) -> Dict[str, int]:
+        """对冲统计"""
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "hedges": self.hedges,
+                "hedge_wins": self.hedge_wins,
+                "budget_denied": self.budget_denied,
+            }
+
+
+class _Attempt:
+    """一次请求尝试：在后台线程中读取流，片段放入共享队列"""
+
+    def __init__(self, index: int, model: str, provider: AIProvider, messages, events: "queue.Queue",
+                 clock: Callable[[], float]):
+        self.index = index
+        self.model = model
+        self.started_at = clock()
+        self.cancelled = threading.Event()
+        self._abort = StreamAbort()
+        self._provider = provider
+        self._messages = messages
+        self._events = events
+        self._thread = threading.Thread(target=self._run, name=f"hedge-{model}-{index}", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        stream = None
+        try:
+            # 服务商打开响应时登记关闭回调，cancel() 可以打断阻塞中的读取
+            with abort_scope(self._abort):
+                stream = self._provider.stream_chat(messages=self._messages, model=self.model)
+                for chunk in stream:
+                    if self.cancelled.is_set():
+                        return
+                    self._events.put((self.index, 'chunk', chunk))
+                self._events.put((self.index, 'done', None))
+        except Exception as e:
+            if not self.cancelled.is_set():
+                self._events.put((self.index, 'error', e))
+        finally:
+            # 关闭流，释放底层连接与并发名额
+            if hasattr(stream, 'close'):
+                stream.close()
+
+    def cancel(self):
+        """取消：立即关闭已打开的响应（仍在等待首字时同样打断），读取线程随后关闭流"""
+        self.cancelled.set()
+        self._abort.abort()
+
+
+class HedgedProvider(AIProvider):
+    """带对冲的服务提供商包装
+
+    alternate_factory 用于创建对冲到其他模型时的服务提供商
+    """
+
+    def __init__(self, provider: AIProvider, policy: HedgingPolicy,
+                 alternate_factory: Optional[Callable[[str], AIProvider]] = None):
+        super().__init__(provider.api_key)
+        self.provider = provider
+        self.policy = policy
+        self.alternate_factory = alternate_factory
+        self.served_model: Optional[str] = None
+
+    def chat(self, messages: List[Dict[str, str]], model: str, stream: bool = False) -> str:
+        """非流式请求不做对冲"""
+        return self.provider.chat(messages=messages, model=model, stream=stream)
+
+    def _hedge_target(self, model: str):
+        """对冲请求的模型与服务提供商"""
+        alternate = self.policy.alternate(model) if self.policy.alternate else None
+        if alternate and alternate != model and self.alternate_factory is not None:
+            return alternate, self.alternate_factory(alternate)
+        return model, self.provider
+
+    def stream_chat(self, messages: List[Dict[str, str]], model: str) -> Iterator[str]:
+        policy = self.policy
+        policy.record_request()
+        events: "queue.Queue" = queue.Queue()
+        # 各尝试在自己的线程与中止范围内读取；调用方中止时唤醒等待，由 finally 取消所有尝试
+        on_abort(lambda: events.put((-1, 'aborted', None)))
+        attempts = [_Attempt(0, model, self.provider, messages, events, policy.clock)]
+        deadline = attempts[0].started_at + policy.delay_for(model)
+        may_hedge = True
+        winner = None
+        failures = 0
+
+        try:
+            # 等待第一个片段：超过时限仍未到达时发出对冲请求
+            while winner is None:
+                timeout = max(0.0, deadline - policy.clock()) if may_hedge else None
+                try:
+                    index, kind, payload = events.get(timeout=timeout)
+                except queue.Empty:
+                    may_hedge = False
+                    if policy.try_acquire_hedge():
+                        hedge_model, hedge_provider = self._hedge_target(model)
+                        attempts.append(_Attempt(1, hedge_model, hedge_provider, messages, events, policy.clock))
+                    continue
+
+                if kind == 'aborted':
+                    raise StreamAbortedError()
+                if kind == 'error':
+                    failures += 1
+                    # 还有进行中的尝试时继续等待
+                    if failures < len(attempts):
+                        continue
+                    raise payload
+                winner = attempts[index]
+                for attempt in attempts:
+                    if attempt is not winner:
+                        attempt.cancel()
+                policy.record_ttft(winner.model, policy.clock() - winner.started_at)
+                self.served_model = winner.model
+                if winner.index > 0:
+                    policy.record_hedge_win()
+                if kind == 'done':
+                    return
+                yield payload
+
+            # 只转发胜出的流
+            while True:
+                index, kind, payload = events.get()
+                if kind == 'aborted':
+                    raise StreamAbortedError()
+                if index != winner.index:
+                    continue
+                if kind == 'chunk':
+                    yield payload
+                elif kind == 'done':
+                    return
+                else:
+                    raise payload
+        finally:
+            for attempt in attempts:
+                attempt.cancel()
@@ -0,0 +1,216 @@
+"""
+本地模拟服务提供商
+不需要API密钥与网络，按场景（首字延迟、输出速率、思考过程、错误与停滞）生成可复现的流式回复，
+用于离线测试与基准。选择以 mock 开头的模型即使用模拟服务商：
+
+    mock                      默认场景
+    mock/fast                 无延迟，尽快输出
+    mock/reasoning            先输出思考过程（<think>...</think>）
+    mock?ttft=0.1&tps=200     用查询参数覆盖场景参数（见 MockScenario.PARAM_ALIASES）
+
+utils/mock_server.py 按同样的场景提供硅基流动与智谱格式的本地SSE服务
+"""
+import asyncio
+import random
+import threading
+import time
+from typing import AsyncIterator, Callable, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import parse_qsl
+
+from .ai_providers import AIProvider
+from .async_providers import AsyncAIProvider
+from .conversation import to_api_messages
+from .errors import ProviderError, StreamStalledError
+
+MOCK_MODEL_PREFIX = "mock"
+
+# 回复语料：按段落组织（每段是一组片段），包含标题、列表、加粗与代码块，覆盖渲染器的主要路径
+_REPLY_PARAGRAPHS = [
+    ["## ", "模拟", "回复", "\n\n"],
+    ["这是", "一段", "由本地", "模拟", "服务商", "生成的", "回复，", "用于", "离线", "测试", "与", "基准", "。",
+     "它", "按照", "配置的", "速率", "逐段", "输出", "。\n\n"],
+    ["- ", "**首字", "延迟**", "：", "可配置", "\n", "- ", "**输出", "速率**", "：", "按", " token ", "计", "\n",
+     "- ", "**错误", "与", "停滞**", "：", "可", "注入", "\n\n"],
+    ["```", "python", "\n", "def ", "hello", "(name):", "\n", "    return ", "f\"你好，", "{name}\"", "\n", "```",
+     "\n\n"],
+    ["Streaming ", "responses ", "are ", "split ", "into ", "small ", "deltas ", "so ", "that ", "the ",
+     "renderer ", "sees ", "realistic ", "traffic", ".\n\n"],
+]
+_REASONING_TOKENS = ["让我", "想想", "这个", "问题", "。", "首先", "，", "需要", "理解", "用户", "的", "意图", "；",
+                     "然后", "组织", "回答", "的", "结构", "。"]
+
+
+class MockScenario:
+    """模拟场景
+
+    ttft: 首个片段前的延迟（秒）
+    tokens_per_second: 输出速率（片段/秒），0表示不限速
+    reply_tokens: 回复片段数（按段落取整，略多于该值）
+    reasoning_tokens: 思考过程片段数，0表示没有思考过程
+    error_status: 请求失败时返回的HTTP状态码；error_rate 为失败的概率（设置了状态码且概率为0时总是失败）
+    retry_after: 状态码为429时 Retry-After 的秒数
+    stall_after / stall_seconds: 输出 stall_after 个片段后停顿 stall_seconds 秒
+    seed: 随机种子（决定哪些请求失败），便于复现
+    """
+
+    # 模型名查询参数 -> 属性名
+    PARAM_ALIASES = {
+        "ttft": "ttft", "tps": "tokens_per_second", "tokens": "reply_tokens", "reasoning": "reasoning_tokens",
+        "error": "error_status", "error_rate": "error_rate", "retry_after": "retry_after",
+        "stall_after": "stall_after", "stall": "stall_seconds", "seed": "seed",
+    }
+
+    def __init__(self, ttft: float = 0.3, tokens_per_second: float = 40.0, reply_tokens: int = 120,
+                 reasoning_tokens: int = 0, error_status: Optional[int] = None, error_rate: float = 0.0,
+                 retry_after: float = 1.0, stall_after: Optional[int] = None, stall_seconds: float = 0.0,
+                 seed: Optional[int] = None):
+        self.ttft = ttft
+        self.tokens_per_second = tokens_per_second
+        self.reply_tokens = reply_tokens
+        self.reasoning_tokens = reasoning_tokens
+        self.error_status = error_status
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.stall_after = stall_after
+        self.stall_seconds = stall_seconds
+        self.seed = seed
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def copy(self, **overrides) -> "MockScenario":
+        values = {name: getattr(self, name) for name in self.PARAM_ALIASES.values()}
+        values.update(overrides)
+        return MockScenario(**values)
+
+    @staticmethod
+    def for_model(model: str) -> "MockScenario":
+        """按模型名选择预设场景，并应用查询参数"""
+        name, _, query = model.partition('?')
+        scenario = MOCK_PRESETS.get(name, MOCK_PRESETS[MOCK_MODEL_PREFIX])
+        overrides = {}
+        for key, value in parse_qsl(query):
+            attribute = MockScenario.PARAM_ALIASES.get(key)
+            if attribute is None:
+                raise ValueError(f"未知的模拟参数: {key}")
+            if attribute in ('reply_tokens', 'reasoning_tokens', 'error_status', 'stall_after', 'seed'):
+                overrides[attribute] = int(value)
+            else:
+                overrides[attribute] = float(value)
+        return scenario.copy(**overrides) if overrides else scenario
+
+    def pick_error(self) -> Optional[int]:
+        """决定本次请求是否失败，返回状态码（成功时为None）"""
+        if self.error_status is None:
+            return None
+        if self.error_rate <= 0:
+            return self.error_status
+        with self._lock:
+            return self.error_status if self._random.random() < self.error_rate else None
+
+    def reply(self, messages: List[Dict[str, str]]) -> List[str]:
+        """生成回复片段：先复述最后一条用户消息，再按段落循环语料"""
+        prompt = next((m['content'] for m in reversed(to_api_messages(messages)) if m['role'] == 'user'), '')
+        tokens = ["收到", "：", prompt[:40].replace('\n', ' '), "\n\n"]
+        index = 0
+        while len(tokens) < self.reply_tokens:
+            tokens.extend(_REPLY_PARAGRAPHS[index % len(_REPLY_PARAGRAPHS)])
+            index += 1
+        return tokens
+
+    def reasoning(self) -> List[str]:
+        return [_REASONING_TOKENS[i % len(_REASONING_TOKENS)] for i in range(self.reasoning_tokens)]
+
+    def timeline(self, messages: List[Dict[str, str]]) -> Iterator[Tuple[float, str, bool]]:
+        """逐个返回 (发送前的等待秒数, 片段, 是否为思考过程)"""
+        interval = 1.0 / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+        tokens = [(text, True) for text in self.reasoning()] + [(text, False) for text in self.reply(messages)]
+        for index, (text, is_reasoning) in enumerate(tokens):
+            delay = self.ttft if index == 0 else interval
+            if index == self.stall_after:
+                delay += self.stall_seconds
+            yield delay, text, is_reasoning
+
+
+# 预设场景（模型名 -> 场景）
+MOCK_PRESETS = {
+    "mock": MockScenario(),
+    "mock/fast": MockScenario(ttft=0.0, tokens_per_second=0.0, reply_tokens=200),
+    "mock/slow": MockScenario(ttft=2.0, tokens_per_second=8.0),
+    "mock/reasoning": MockScenario(reasoning_tokens=80),
+    "mock/flaky": MockScenario(error_status=503, error_rate=0.3),
+    "mock/stall": MockScenario(stall_after=20, stall_seconds=90.0),
+}
+
+
+def is_mock_model(model: str) -> bool:
+    return model == MOCK_MODEL_PREFIX or model.startswith(MOCK_MODEL_PREFIX + "/") or \
+        model.startswith(MOCK_MODEL_PREFIX + "?")
+
+
+def mock_error(status: int, scenario: MockScenario) -> ProviderError:
+    retry_after = scenario.retry_after if status == 429 else None
+    return ProviderError(f"模拟服务商请求错误\n响应状态码: {status}", status, retry_after=retry_after)
+
+
+def _inline_reasoning(timeline: Iterator[Tuple[float, str, bool]]) -> Iterator[Tuple[float, str]]:
+    """把思考过程包在 <think>...</think> 中（与GLM-Z1的输出方式相同）"""
+    thinking = False
+    for delay, text, is_reasoning in timeline:
+        if is_reasoning and not thinking:
+            thinking = True
+            text = "<think>" + text
+        elif not is_reasoning and thinking:
+            thinking = False
+            text = "</think>" + text
+        yield delay, text
+
+
+class MockProvider(AIProvider):
+    """模拟服务提供商：空闲超时短于停顿时与真实服务商一样抛出 StreamStalledError"""
+    name = "mock"
+
+    def __init__(self, api_key: str = "", scenario: Optional[MockScenario] = None,
+                 sleep: Callable[[float], None] = time.sleep):
+        super().__init__(api_key)
+        self.scenario = scenario
+        self.sleep = sleep
+
+    def chat(self, messages: List[Dict[str, str]], model: str = MOCK_MODEL_PREFIX, stream: bool = False) -> str:
+        if stream:
+            return self.stream_chat(messages, model)
+        return ''.join(self.stream_chat(messages, model))
+
+    def stream_chat(self, messages: List[Dict[str, str]], model: str = MOCK_MODEL_PREFIX) -> Iterator[str]:
+        scenario = self.scenario or MockScenario.for_model(model)
+        status = scenario.pick_error()
+        if status is not None:
+            raise mock_error(status, scenario)
+        for delay, text in _inline_reasoning(scenario.timeline(messages)):
+            if self.idle_timeout and delay > self.idle_timeout:
+                self.sleep(self.idle_timeout)
+                raise StreamStalledError(self.idle_timeout)
+            if delay:
+                self.sleep(delay)
+            yield text
+
+
+class AsyncMockProvider(AsyncAIProvider):
+    """异步模拟服务提供商"""
+    name = "mock"
+
+    def __init__(self, api_key: str = "", scenario: Optional[MockScenario] = None):
+        super().__init__(api_key)
+        self.scenario = scenario
+
+    async def chat_stream(self, messages: List[Dict[str, str]], model: str) -> AsyncIterator[str]:
+        scenario = self.scenario or MockScenario.for_model(model)
+        status = scenario.pick_error()
+        if status is not None:
+            raise mock_error(status, scenario)
+        for delay, text in _inline_reasoning(scenario.timeline(messages)):
+            if self.idle_timeout and delay > self.idle_timeout:
+                await asyncio.sleep(self.idle_timeout)
+                raise StreamStalledError(self.idle_timeout)
+            if delay:
+                await asyncio.sleep(delay)
+            yield text
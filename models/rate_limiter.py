@@ -0,0 +1,194 @@
+"""
+请求限流
+按 服务商 + API密钥 的令牌桶限速与并发上限，交互请求优先于后台任务，
+并根据429响应的Retry-After自动降低速率、暂停发送
+"""
+import threading
+import time
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from .ai_providers import AIProvider
+from .errors import ProviderError
+
+
+class Priority:
+    """请求优先级（数值越小越优先）"""
+    INTERACTIVE = 0  # 用户正在等待的对话
+    BACKGROUND = 1  # 会话摘要等后台任务
+
+
+class RateLimiter:
+    """令牌桶 + 并发上限
+
+    rate: 每秒允许发出的请求数；burst: 令牌桶容量
+    max_concurrency: 同时进行的请求上限；background_reserve: 为交互请求保留的并发名额
+    min_rate: 收到429后速率下降的下限；recovery: 每次成功后速率回升的比例
+    """
+
+    def __init__(self, rate: float = 2.0, burst: int = 4, max_concurrency: int = 4, background_reserve: int = 1,
+                 min_rate: float = 0.1, recovery: float = 0.05, clock: Callable[[], float] = time.monotonic):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.max_concurrency = max_concurrency
+        self.background_reserve = min(background_reserve, max_concurrency - 1)
+        self.min_rate = min_rate
+        self.recovery = recovery
+        self.clock = clock
+        self._tokens = float(burst)
+        self._updated_at = clock()
+        self._paused_until = 0.0
+        self._in_flight = 0
+        self._waiting = {Priority.INTERACTIVE: 0, Priority.BACKGROUND: 0}
+        self._condition = threading.Condition()
+        # 统计
+        self.throttled = 0  # 收到429的次数
+        self.waits = 0  # 需要排队的请求数
+        self.wait_seconds = 0.0
+
+    def _refill(self, now: float):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def _blocked_for(self, priority: int, now: float) -> Optional[float]:
+        """还需等待的秒数，None表示只能等待其他请求释放名额"""
+        if any(count for level, count in self._waiting.items() if level < priority):
+            return None  # 有更高优先级的请求在排队
+        limit = self.max_concurrency - (self.background_reserve if priority > Priority.INTERACTIVE else 0)
+        if self._in_flight >= limit:
+            return None
+        if now < self._paused_until:
+            return self._paused_until - now
+        if self._tokens < 1:
+            return (1 - self._tokens) / self.rate
+        return 0.0
+
+    def acquire(self, priority: int = Priority.INTERACTIVE, timeout: Optional[float] = None) -> bool:
+        """获取发送许可，超时返回False；成功后必须调用 release()"""
+        started_at = self.clock()
+        with self._condition:
+            self._waiting[priority] += 1
+            waited = False
+            try:
+                while True:
+                    now = self.clock()
+                    self._refill(now)
+                    delay = self._blocked_for(priority, now)
+                    if delay == 0.0:
+                        break
+                    waited = True
+                    if timeout is not None:
+                        remaining = timeout - (now - started_at)
+                        if remaining <= 0:
+                            return False
+                        delay = remaining if delay is None else min(delay, remaining)
+                    self._condition.wait(delay)
+            finally:
+                self._waiting[priority] -= 1
+                if waited:
+                    self.waits += 1
+                    self.wait_seconds += self.clock() - started_at
+                # 排队状态变化，其他优先级的请求可能可以继续
+                self._condition.notify_all()
+            self._tokens -= 1
+            self._in_flight += 1
+            return True
+
+    def release(self, succeeded: bool = True):
+        """释放并发名额；成功的请求让降低过的速率逐步回升"""
+        with self._condition:
+            self._in_flight -= 1
+            if succeeded and self.rate < self.max_rate:
+                self.rate = min(self.max_rate, self.rate * (1 + self.recovery))
+            self._condition.notify_all()
+
+    def throttle(self, retry_after: Optional[float] = None):
+        """收到429：速率减半，并在Retry-After期间暂停发送"""
+        with self._condition:
+            self.throttled += 1
+            self.rate = max(self.min_rate, self.rate / 2)
+            now = self.clock()
+            self._refill(now)
+            self._tokens = min(self._tokens, 0.0)
+            if retry_after:
+                self._paused_until = max(self._paused_until, now + retry_after)
+            self._condition.notify_all()
+
+    def stats(self) -> Dict[str, float]:
+        with self._condition:
+            return {
+                "rate": self.rate,
+                "in_flight": self._in_flight,
+                "throttled": self.throttled,
+                "waits": self.waits,
+                "wait_seconds": self.wait_seconds,
+            }
+
+
+class RateLimiterRegistry:
+    """按 (服务商, API密钥) 共享限流器：同一账户的所有请求受同一限额约束"""
+
+    def __init__(self, settings: Optional[Dict[str, dict]] = None):
+        self.settings = settings or {}  # 服务商名称 -> RateLimiter参数，'' 为默认值
+        self._limiters: Dict[Tuple[str, str], RateLimiter] = {}
+        self._lock = threading.Lock()
+
+    def get(self, provider_name: str, api_key: str) -> RateLimiter:
+        key = (provider_name, api_key)
+        with self._lock:
+            limiter = self._limiters.get(key)
+            if limiter is None:
+                options = dict(self.settings.get('', {}))
+                options.update(self.settings.get(provider_name, {}))
+                limiter = self._limiters[key] = RateLimiter(**options)
+            return limiter
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return {provider_name: limiter.stats() for (provider_name, _), limiter in self._limiters.items()}
+
+
+class LimitedProvider(AIProvider):
+    """经过限流的服务提供商包装：流式请求在整个输出期间占用一个并发名额"""
+
+    def __init__(self, provider: AIProvider, limiter: RateLimiter, priority: int = Priority.INTERACTIVE):
+        super().__init__(provider.api_key)
+        self.provider = provider
+        self.limiter = limiter
+        self.priority = priority
+
+    def configure_timeouts(self, connect_timeout, read_timeout, idle_timeout):
+        super().configure_timeouts(connect_timeout, read_timeout, idle_timeout)
+        self.provider.configure_timeouts(connect_timeout, read_timeout, idle_timeout)
+
+    def _finish(self, error: Optional[BaseException]):
+        if isinstance(error, ProviderError) and error.status_code == 429:
+            self.limiter.throttle(error.retry_after)
+        self.limiter.release(succeeded=error is None)
+
+    def chat(self, messages: List[Dict[str, str]], model: str, stream: bool = False) -> str:
+        if stream:
+            # 原始流式响应对象的生命周期不受控制，只限速不占用并发名额
+            self.limiter.acquire(self.priority)
+            self.limiter.release()
+            return self.provider.chat(messages=messages, model=model, stream=True)
+        self.limiter.acquire(self.priority)
+        error = None
+        try:
+            return self.provider.chat(messages=messages, model=model)
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self._finish(error)
+
+    def stream_chat(self, messages: List[Dict[str, str]], model: str) -> Iterator[str]:
+        self.limiter.acquire(self.priority)
+        error = None
+        try:
+            yield from self.provider.stream_chat(messages=messages, model=model)
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self._finish(error)
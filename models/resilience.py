@@ -0,0 +1,120 @@
+"""
+请求容错策略
+连接/读取超时、流式响应空闲看门狗，以及首字到达前对限流、服务端错误和连接错误的指数退避重试（带抖动）
+"""
+import random
+import time
+from typing import Callable, Dict, Iterator, List, Optional
+
+from .ai_providers import AIProvider
+from .errors import is_retryable
+from .transport import stream_aborted
+
+
+class ResiliencePolicy:
+    """单个模型的容错策略（时间单位：秒）
+
+    connect_timeout: 建立连接的超时
+    read_timeout: 非流式请求等待响应的超时
+    idle_timeout: 流式响应相邻数据的最大间隔，超过即视为停滞
+    max_retries: 首字到达前的最大重试次数
+    backoff_base / backoff_max: 指数退避的初始值与上限
+    """
+
+    def __init__(self, connect_timeout: float = 10.0, read_timeout: float = 120.0, idle_timeout: float = 60.0,
+                 max_retries: int = 2, backoff_base: float = 0.5, backoff_max: float = 8.0):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.idle_timeout = idle_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+    def backoff(self, attempt: int, retry_after: Optional[float] = None,
+                rng: Callable[[], float] = random.random) -> float:
+        """第 attempt 次重试前的等待时间：上限的一半加上随机抖动；服务端给出Retry-After时不少于该值"""
+        cap = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        delay = cap / 2 + rng() * cap / 2
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.backoff_max))
+        return delay
+
+    def copy(self, **overrides) -> "ResiliencePolicy":
+        values = dict(self.__dict__)
+        values.update(overrides)
+        return ResiliencePolicy(**values)
+
+
+class ResilienceSettings:
+    """按模型区分的容错策略：未单独配置的模型使用默认策略"""
+
+    def __init__(self, default: Optional[ResiliencePolicy] = None,
+                 overrides: Optional[Dict[str, ResiliencePolicy]] = None):
+        self.default = default or ResiliencePolicy()
+        self.overrides = overrides or {}
+
+    def policy_for(self, model: str) -> ResiliencePolicy:
+        return self.overrides.get(model, self.default)
+
+
+class ResilientProvider(AIProvider):
+    """带超时与重试的服务提供商包装
+
+    只在首字到达前重试：已经输出部分回复后的错误直接抛出，避免重复内容
+    """
+
+    def __init__(self, provider: AIProvider, policy: ResiliencePolicy,
+                 sleep: Callable[[float], None] = time.sleep):
+        super().__init__(provider.api_key)
+        self.provider = provider
+        self.policy = policy
+        self.sleep = sleep
+        self.retries = 0  # 本实例累计重试次数
+        provider.configure_timeouts(policy.connect_timeout, policy.read_timeout, policy.idle_timeout)
+
+    @property
+    def served_model(self) -> Optional[str]:
+        return getattr(self.provider, 'served_model', None)
+
+    def _should_retry(self, error: Exception, attempt: int) -> bool:
+        # 被中止的流（如对冲中落败的一方）读取出错是预期的，不重试
+        if attempt >= self.policy.max_retries or not is_retryable(error) or stream_aborted():
+            return False
+        delay = self.policy.backoff(attempt, getattr(error, 'retry_after', None))
+        print(f"请求失败，{delay:.1f} 秒后重试（第 {attempt + 1} 次）: {error}")
+        self.retries += 1
+        self.sleep(delay)
+        return True
+
+    def chat(self, messages: List[Dict[str, str]], model: str, stream: bool = False) -> str:
+        """发送聊天请求，失败时按策略重试（原始流式响应对象直接透传）"""
+        if stream:
+            return self.provider.chat(messages=messages, model=model, stream=True)
+        attempt = 0
+        while True:
+            try:
+                return self.provider.chat(messages=messages, model=model)
+            except Exception as e:
+                if not self._should_retry(e, attempt):
+                    raise
+                attempt += 1
+
+    def stream_chat(self, messages: List[Dict[str, str]], model: str) -> Iterator[str]:
+        """发送流式聊天请求，首字到达前失败时重试"""
+        attempt = 0
+        while True:
+            stream = self.provider.stream_chat(messages=messages, model=model)
+            try:
+                first_chunk = next(stream)
+            except StopIteration:
+                return
+            except Exception as e:
+                stream.close()
+                if not self._should_retry(e, attempt):
+                    raise
+                attempt += 1
+                continue
+            break
+
+        yield first_chunk
+        yield from stream
@@ -0,0 +1,194 @@
+"""
+AI回复缓存
+按 (模型, 规范化后的消息, 请求参数) 的哈希精确匹配，内存LRU + SQLite持久层，
+支持过期时间与容量淘汰
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional
+
+from .conversation import to_api_messages
+
+
+def normalize_messages(messages: Iterable) -> list:
+    """规范化消息：只保留角色与内容，统一换行符并去除首尾空白"""
+    normalized = []
+    for message in to_api_messages(messages):
+        content = message.get('content') or ''
+        normalized.append({
+            "role": message['role'].strip().lower(),
+            "content": content.replace('\r\n', '\n').replace('\r', '\n').strip()
+        })
+    return normalized
+
+
+def make_cache_key(model: str, messages: Iterable, params: Optional[Dict[str, Any]] = None) -> str:
+    """生成缓存键"""
+    payload = json.dumps(
+        {"model": model, "messages": normalize_messages(messages), "params": params or {}},
+        ensure_ascii=False, sort_keys=True, separators=(',', ':')
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """回复缓存
+
+    会被多个请求线程同时访问，内存层与磁盘层分别加锁；磁盘层每次操作使用独立连接。
+    ttl_seconds 为0时不过期。
+    """
+
+    def __init__(self, max_entries: int = 256, max_bytes: int = 8 * 1024 * 1024,
+                 ttl_seconds: int = 7 * 24 * 3600, disk_path: Optional[str] = None,
+                 max_disk_entries: int = 2000):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.max_disk_entries = max_disk_entries
+        self._memory = OrderedDict()  # 缓存键 -> (创建时间, 回复内容)
+        self._memory_bytes = 0
+        self._memory_lock = threading.Lock()
+        self._disk_path = None
+        self._disk_lock = threading.Lock()
+        self._disk_writes = 0
+        # 命中统计
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if disk_path:
+            self.enable_disk_cache(disk_path)
+
+    def _expired(self, created_at: float) -> bool:
+        return self.ttl_seconds > 0 and time.time() - created_at > self.ttl_seconds
+
+    def get(self, key: str) -> Optional[str]:
+        """查询缓存：先查内存，再查磁盘（磁盘命中后回填内存）"""
+        with self._memory_lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if self._expired(entry[0]):
+                    self._pop_memory(key)
+                else:
+                    self._memory.move_to_end(key)
+                    self.memory_hits += 1
+                    return entry[1]
+
+        entry = self._load_from_disk(key)
+        with self._memory_lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._put_memory(key, *entry)
+        return entry[1]
+
+    def put(self, key: str, content: str):
+        """写入缓存（内存与磁盘）"""
+        created_at = time.time()
+        with self._memory_lock:
+            self._put_memory(key, created_at, content)
+        self._save_to_disk(key, created_at, content)
+
+    def stats(self) -> Dict[str, int]:
+        """命中统计"""
+        with self._memory_lock:
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "memory_entries": len(self._memory),
+            }
+
+    def clear(self):
+        """清空缓存"""
+        with self._memory_lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+        if self._disk_path:
+            with self._disk_lock:
+                conn = sqlite3.connect(self._disk_path)
+                conn.execute('DELETE FROM response_cache')
+                conn.commit()
+                conn.close()
+
+    # ---- 内存层（调用方持有 _memory_lock） ----
+
+    def _put_memory(self, key: str, created_at: float, content: str):
+        self._pop_memory(key)
+        self._memory[key] = (created_at, content)
+        self._memory_bytes += len(content)
+        while self._memory and (len(self._memory) > self.max_entries or self._memory_bytes > self.max_bytes):
+            _, (_, evicted) = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+
+    def _pop_memory(self, key: str):
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_bytes -= len(old[1])
+
+    # ---- 磁盘层 ----
+
+    def enable_disk_cache(self, disk_path: str):
+        """启用磁盘缓存"""
+        os.makedirs(os.path.dirname(os.path.abspath(disk_path)), exist_ok=True)
+        with self._disk_lock:
+            conn = sqlite3.connect(disk_path)
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS response_cache (
+                    cache_key TEXT PRIMARY KEY,
+                    content TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+            ''')
+            conn.commit()
+            conn.close()
+        self._disk_path = disk_path
+
+    def _load_from_disk(self, key: str):
+        """从磁盘读取未过期的条目，返回 (创建时间, 回复内容)"""
+        if not self._disk_path:
+            return None
+        with self._disk_lock:
+            conn = sqlite3.connect(self._disk_path)
+            row = conn.execute(
+                'SELECT created_at, content FROM response_cache WHERE cache_key = ?', (key,)
+            ).fetchone()
+            if row and self._expired(row[0]):
+                conn.execute('DELETE FROM response_cache WHERE cache_key = ?', (key,))
+                row = None
+            elif row:
+                conn.execute('UPDATE response_cache SET accessed_at = ? WHERE cache_key = ?', (time.time(), key))
+            conn.commit()
+            conn.close()
+        return row
+
+    def _save_to_disk(self, key: str, created_at: float, content: str):
+        """写入磁盘，定期清理过期与超出容量的条目"""
+        if not self._disk_path:
+            return
+        with self._disk_lock:
+            conn = sqlite3.connect(self._disk_path)
+            conn.execute(
+                'INSERT OR REPLACE INTO response_cache (cache_key, content, created_at, accessed_at) '
+                'VALUES (?, ?, ?, ?)',
+                (key, content, created_at, created_at)
+            )
+            self._disk_writes += 1
+            if self._disk_writes % 50 == 0:
+                if self.ttl_seconds > 0:
+                    conn.execute('DELETE FROM response_cache WHERE created_at < ?', (time.time() - self.ttl_seconds,))
+                conn.execute('''
+                    DELETE FROM response_cache WHERE cache_key IN (
+                        SELECT cache_key FROM response_cache
+                        ORDER BY accessed_at DESC
+                        LIMIT -1 OFFSET ?
+                    )
+                ''', (self.max_disk_entries,))
+            conn.commit()
+            conn.close()
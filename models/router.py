@@ -0,0 +1,188 @@
+"""
+模型路由
+为每个模型维护首字延迟、生成速度与错误率的指数滑动平均（EWMA），
+"auto" 请求路由到等价模型组中最快的健康模型，连接失败时自动切换到下一个模型
+"""
+import threading
+import time
+from typing import Callable, Dict, Iterator, List, Optional, Sequence
+
+from .ai_providers import AIProvider
+
+
+class ModelStats:
+    """单个模型的滚动统计"""
+    __slots__ = ('ttft', 'tokens_per_second', 'error_rate', 'samples', 'last_failure_at')
+
+    def __init__(self):
+        self.ttft: Optional[float] = None  # 首字延迟（秒）
+        self.tokens_per_second: Optional[float] = None
+        self.error_rate = 0.0
+        self.samples = 0
+        self.last_failure_at: Optional[float] = None
+
+    def as_dict(self) -> Dict[str, Optional[float]]:
+        return {
+            "ttft": self.ttft,
+            "tokens_per_second": self.tokens_per_second,
+            "error_rate": self.error_rate,
+            "samples": self.samples,
+        }
+
+
+def _ewma(previous: Optional[float], value: float, alpha: float) -> float:
+    return value if previous is None else alpha * value + (1 - alpha) * previous
+
+
+class ModelRouter:
+    """延迟感知的模型路由器
+
+    group: 等价模型组，auto 请求只在组内选择
+    api_key_lookup: 按模型获取API密钥，返回空值的模型不参与路由
+    provider_factory: 创建服务提供商（测试时可替换为本地替身）
+    clock: 单调时钟（测试时可替换为可控时钟）
+    """
+    # 估算"最快"时假定的回复长度（token），用于综合首字延迟与生成速度
+    TYPICAL_REPLY_TOKENS = 200
+
+    def __init__(self, group: Sequence[str], api_key_lookup: Callable[[str], str],
+                 provider_factory: Optional[Callable[[str, str], AIProvider]] = None,
+                 alpha: float = 0.3, error_threshold: float = 0.5, cooldown_seconds: float = 30.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.group = list(group)
+        self.api_key_lookup = api_key_lookup
+        self.provider_factory = provider_factory
+        self.alpha = alpha
+        self.error_threshold = error_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self.clock = clock
+        self._stats: Dict[str, ModelStats] = {}
+        self._lock = threading.Lock()
+
+    def _get_stats(self, model: str) -> ModelStats:
+        stats = self._stats.get(model)
+        if stats is None:
+            stats = self._stats[model] = ModelStats()
+        return stats
+
+    # ---- 统计 ----
+
+    def record_success(self, model: str, ttft: float, total_seconds: float, tokens: int):
+        """记录一次成功的流式请求"""
+        with self._lock:
+            stats = self._get_stats(model)
+            stats.ttft = _ewma(stats.ttft, ttft, self.alpha)
+            generation_seconds = total_seconds - ttft
+            if tokens > 1 and generation_seconds > 0:
+                stats.tokens_per_second = _ewma(stats.tokens_per_second, tokens / generation_seconds, self.alpha)
+            stats.error_rate = _ewma(stats.error_rate, 0.0, self.alpha)
+            stats.samples += 1
+
+    def record_failure(self, model: str):
+        """记录一次失败的请求"""
+        with self._lock:
+            stats = self._get_stats(model)
+            stats.error_rate = _ewma(stats.error_rate, 1.0, self.alpha) if stats.samples else 1.0
+            stats.samples += 1
+            stats.last_failure_at = self.clock()
+
+    def stats(self) -> Dict[str, Dict[str, Optional[float]]]:
+        """所有模型的统计快照"""
+        with self._lock:
+            return {model: stats.as_dict() for model, stats in self._stats.items()}
+
+    # ---- 路由 ----
+
+    def is_healthy(self, model: str) -> bool:
+        """错误率低于阈值，或距上次失败已超过冷却时间（允许重新试探）"""
+        with self._lock:
+            stats = self._stats.get(model)
+            if stats is None or stats.error_rate < self.error_threshold:
+                return True
+            return self.clock() - stats.last_failure_at >= self.cooldown_seconds
+
+    def _expected_seconds(self, model: str) -> float:
+        """预计完成一次典型回复的耗时，没有统计的模型优先试探"""
+        with self._lock:
+            stats = self._stats.get(model)
+            if stats is None or stats.ttft is None:
+                return 0.0
+            seconds = stats.ttft
+            if stats.tokens_per_second:
+                seconds += self.TYPICAL_REPLY_TOKENS / stats.tokens_per_second
+            return seconds
+
+    def rank(self) -> List[str]:
+        """按路由优先级排序组内模型：健康的模型按预计耗时排序，不健康的排在最后作为兜底"""
+        candidates = [model for model in self.group if self.api_key_lookup(model)]
+        healthy = [model for model in candidates if self.is_healthy(model)]
+        unhealthy = [model for model in candidates if model not in healthy]
+        healthy.sort(key=self._expected_seconds)  # 稳定排序，相同耗时保持组内顺序
+        return healthy + unhealthy
+
+    def _create_provider(self, model: str) -> AIProvider:
+        api_key = self.api_key_lookup(model)
+        if self.provider_factory is not None:
+            return self.provider_factory(model, api_key)
+        from .ai_providers import AIProviderFactory
+        return AIProviderFactory.create_model_provider(model, api_key)
+
+
+class RoutedProvider(AIProvider):
+    """auto 模型的服务提供商：按路由顺序尝试，首个片段到达前失败时切换到下一个模型
+
+    served_model 记录最近一次实际提供回复的模型，cache_hit 记录这次回复是否来自回复缓存
+    """
+
+    def __init__(self, router: ModelRouter):
+        super().__init__("")
+        self.router = router
+        self.served_model: Optional[str] = None
+        self.cache_hit = False
+
+    def chat(self, messages, model: str = "auto", stream: bool = False) -> str:
+        """非流式请求同样按路由顺序尝试"""
+        return ''.join(self.stream_chat(messages, model))
+
+    def stream_chat(self, messages, model: str = "auto") -> Iterator[str]:
+        router = self.router
+        candidates = router.rank()
+        if not candidates:
+            raise Exception("自动路由没有可用的模型，请检查模型组与API Key设置")
+
+        errors = []
+        for candidate in candidates:
+            started_at = router.clock()
+            first_chunk_at = None
+            tokens = 0
+            provider = router._create_provider(candidate)
+            try:
+                for chunk in provider.stream_chat(messages=messages, model=candidate):
+                    if first_chunk_at is None:
+                        first_chunk_at = router.clock()
+                        self.served_model = candidate
+                    tokens += 1  # 每个流式片段约为一个token
+                    yield chunk
+            except GeneratorExit:
+                raise
+            except Exception as e:
+                router.record_failure(candidate)
+                if first_chunk_at is not None:
+                    # 已经输出了部分回复，无法无缝切换
+                    raise
+                errors.append(f"{candidate}: {e}")
+                continue
+
+            finished_at = router.clock()
+            if first_chunk_at is None:
+                # 空回复视为失败，尝试下一个模型
+                router.record_failure(candidate)
+                errors.append(f"{candidate}: 空回复")
+                continue
+            self.cache_hit = getattr(provider, 'cache_hit', False)
+            if not self.cache_hit:
+                # 缓存回放的耗时不反映模型的实际延迟
+                router.record_success(candidate, first_chunk_at - started_at, finished_at - started_at, tokens)
+            return
+
+        raise Exception("自动路由的所有模型均请求失败：\n" + '\n'.join(errors))
@@ -0,0 +1,252 @@
+"""
+相同请求合并（single-flight）
+同时进行的相同请求（同一API密钥、模型与消息）只向上游发出一次：上游流由后台读取到回放缓冲区，
+每个请求都是缓冲区的订阅者，先回放已收到的片段，再接收后续片段。
+所有订阅者都离开（或被调用方中止）后立即中止上游流（停滞或仍在等待首字时同样打断读取）；流结束后从登记表中移除，之后的相同请求重新发出（由回复缓存负责复用）
+"""
+import asyncio
+import threading
+from typing import AsyncIterator, Callable, Dict, Iterator, List, Optional, Tuple
+
+from .ai_providers import AIProvider
+from .errors import StreamAbortedError
+from .response_cache import make_cache_key
+from .transport import StreamAbort, abort_scope, on_abort
+
+
+def make_flight_key(api_key: str, model: str, messages, stream: bool = True) -> str:
+    """合并键：API密钥不同的请求不合并（各自计费与限流）"""
+    return make_cache_key(model, messages, {"api_key": api_key, "stream": stream})
+
+
+class _Flight:
+    """一次上游请求：回放缓冲区与订阅者计数（在 cond 下访问）"""
+
+    def __init__(self, provider):
+        self.provider = provider
+        self.chunks: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.abort = StreamAbort()  # 同步请求：读取线程中打开的响应登记到这里
+        self.task = None  # 异步请求：读取上游流的任务
+
+
+class SingleFlight:
+    """同步请求的合并登记表，可被多个请求线程同时使用"""
+
+    def __init__(self):
+        self._flights: Dict[str, _Flight] = {}
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        # 统计
+        self.flights = 0
+        self.coalesced = 0
+
+    def stream(self, key: str, provider, open_stream: Callable[[], Iterator[str]]) -> Tuple[Iterator[str], _Flight]:
+        """订阅 key 对应的上游流，没有进行中的相同请求时用 open_stream 发出
+
+        provider 为发出请求的服务提供商（用于读取 served_model 等属性），返回 (片段迭代器, 所订阅的请求)
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is None:
+                flight = self._flights[key] = _Flight(provider)
+                self.flights += 1
+                leader = True
+            else:
+                self.coalesced += 1
+                leader = False
+            flight.subscribers += 1
+        if leader:
+            threading.Thread(target=self._pump, args=(key, flight, open_stream),
+                             name="single-flight", daemon=True).start()
+        return self._follow(key, flight), flight
+
+    def _pump(self, key: str, flight: _Flight, open_stream: Callable[[], Iterator[str]]):
+        """读取上游流写入缓冲区，没有订阅者后停止（最后一个订阅者离开时中止阻塞中的读取）"""
+        stream = None
+        error = None
+        try:
+            with abort_scope(flight.abort):
+                stream = open_stream()
+                for chunk in stream:
+                    with self._cond:
+                        if flight.subscribers == 0:
+                            break
+                        flight.chunks.append(chunk)
+                        self._cond.notify_all()
+        except Exception as e:
+            error = e
+        finally:
+            if hasattr(stream, 'close'):
+                stream.close()
+            with self._cond:
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+                flight.error = error
+                flight.done = True
+                self._cond.notify_all()
+
+    def _follow(self, key: str, flight: _Flight) -> Iterator[str]:
+        """订阅者：先回放缓冲区中的片段，再等待新片段
+
+        读取线程不在调用方的中止范围内，调用方中止时由这里唤醒等待并离开
+        """
+        index = 0
+        left = threading.Event()
+
+        def leave():
+            with self._cond:
+                left.set()
+                self._cond.notify_all()
+
+        on_abort(leave)
+        try:
+            while True:
+                with self._cond:
+                    while index >= len(flight.chunks) and not flight.done and not left.is_set():
+                        self._cond.wait()
+                    if left.is_set():
+                        # 不能正常结束：外层的回复缓存会把不完整的回复当作完整回复保存
+                        raise StreamAbortedError()
+                    pending = flight.chunks[index:]
+                    finished = flight.done
+                index += len(pending)
+                for chunk in pending:
+                    yield chunk
+                if finished:
+                    if flight.error is not None:
+                        raise flight.error
+                    return
+        finally:
+            with self._cond:
+                flight.subscribers -= 1
+                abandoned = flight.subscribers == 0 and not flight.done
+                # 最后一个订阅者离开：新的相同请求不再加入这个即将关闭的流
+                if abandoned and self._flights.get(key) is flight:
+                    del self._flights[key]
+            if abandoned:
+                # 不等上游的下一个片段：立即关闭响应，释放连接与并发名额
+                flight.abort.abort()
+
+    def stats(self) -> Dict[str, int]:
+        """合并统计：flights 为实际发出的上游请求数，coalesced 为合并掉的重复请求数"""
+        with self._lock:
+            return {"flights": self.flights, "coalesced": self.coalesced, "in_flight": len(self._flights)}
+
+
+class SingleFlightProvider(AIProvider):
+    """合并相同并发请求的服务提供商包装（位于回复缓存之内、对冲之外）"""
+
+    def __init__(self, provider: AIProvider, group: SingleFlight):
+        super().__init__(provider.api_key)
+        self.provider = provider
+        self.group = group
+        self._flight: Optional[_Flight] = None
+
+    @property
+    def served_model(self) -> Optional[str]:
+        """实际提供回复的模型（合并时为发出请求的服务提供商的模型）"""
+        provider = self._flight.provider if self._flight is not None else self.provider
+        return getattr(provider, 'served_model', None)
+
+    def chat(self, messages: List[Dict[str, str]], model: str, stream: bool = False) -> str:
+        """发送聊天请求（原始流式响应对象无法共享，直接透传）"""
+        if stream:
+            return self.provider.chat(messages=messages, model=model, stream=True)
+        key = make_flight_key(self.api_key, model, messages, stream=False)
+        chunks, self._flight = self.group.stream(
+            key, self.provider, lambda: iter([self.provider.chat(messages=messages, model=model)])
+        )
+        return ''.join(chunks)
+
+    def stream_chat(self, messages: List[Dict[str, str]], model: str) -> Iterator[str]:
+        key = make_flight_key(self.api_key, model, messages)
+        chunks, self._flight = self.group.stream(
+            key, self.provider, lambda: self.provider.stream_chat(messages=messages, model=model)
+        )
+        try:
+            yield from chunks
+        finally:
+            chunks.close()
+
+
+class AsyncSingleFlight:
+    """异步请求的合并登记表：上游流由事件循环中的任务读取，每个事件循环各自登记"""
+
+    def __init__(self):
+        # 事件循环ID -> (合并键 -> _Flight, 条件变量)
+        self._loops: Dict[int, tuple] = {}
+        # 统计
+        self.flights = 0
+        self.coalesced = 0
+
+    def _state(self):
+        loop_id = id(asyncio.get_running_loop())
+        state = self._loops.get(loop_id)
+        if state is None:
+            state = self._loops[loop_id] = ({}, asyncio.Condition())
+        return state
+
+    async def stream(self, key: str, open_stream: Callable[[], AsyncIterator[str]]) -> AsyncIterator[str]:
+        """订阅 key 对应的上游流，没有进行中的相同请求时用 open_stream 发出"""
+        flights, cond = self._state()
+        flight = flights.get(key)
+        if flight is None:
+            flight = flights[key] = _Flight(None)
+            self.flights += 1
+            flight.task = asyncio.get_running_loop().create_task(self._pump(key, flight, open_stream))
+        else:
+            self.coalesced += 1
+        flight.subscribers += 1
+
+        index = 0
+        try:
+            while True:
+                async with cond:
+                    await cond.wait_for(lambda: index < len(flight.chunks) or flight.done)
+                pending = flight.chunks[index:]
+                finished = flight.done
+                index += len(pending)
+                for chunk in pending:
+                    yield chunk
+                if finished:
+                    if flight.error is not None:
+                        raise flight.error
+                    return
+        finally:
+            flight.subscribers -= 1
+            if flight.subscribers == 0 and not flight.done:
+                if flights.get(key) is flight:
+                    del flights[key]
+                # 取消读取任务，不等上游的下一个片段
+                flight.task.cancel()
+
+    async def _pump(self, key: str, flight: _Flight, open_stream: Callable[[], AsyncIterator[str]]):
+        """读取上游流写入缓冲区，没有订阅者后停止（最后一个订阅者离开时任务被取消）"""
+        flights, cond = self._state()
+        stream = open_stream()
+        error = None
+        try:
+            async for chunk in stream:
+                if flight.subscribers == 0:
+                    break
+                flight.chunks.append(chunk)
+                async with cond:
+                    cond.notify_all()
+        except Exception as e:
+            error = e
+        finally:
+            await stream.aclose()
+            if flights.get(key) is flight:
+                del flights[key]
+            flight.error = error
+            flight.done = True
+            async with cond:
+                cond.notify_all()
+
+    def stats(self) -> Dict[str, int]:
+        """合并统计（所有事件循环合计）"""
+        return {"flights": self.flights, "coalesced": self.coalesced,
+                "in_flight": sum(len(flights) for flights, _ in self._loops.values())}
@@ -0,0 +1,283 @@
+"""
+流式响应的录制与回放
+录制：启用后记录硅基流动与智谱（直连）流式响应的原始SSE字节块及其到达间隔，追加保存到一个紧凑的文件中；
+回放：ReplayProvider 按原速、加速或不限速把录制的字节块重新经过SSE解析交给调用方，
+便于用真实的片段形态对 AIStreamThread、思考标签解析与 MessageWidget 渲染做可复现的基准。
+
+文件格式：每段录制是一个独立的gzip成员（可直接追加），解压后为
+    MAGIC | 头部长度(u32) | 头部JSON | 若干个 [间隔微秒(u32) | 长度(u32) | 字节块]
+头部记录服务商、模型、录制时间、片段数与是否完整结束。录制内容包含模型的原始回复，不包含请求与API密钥。
+"""
+import asyncio
+import gzip
+import json
+import struct
+import threading
+import time
+from typing import AsyncIterator, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .ai_providers import AIProvider, iter_sse_deltas
+from .async_providers import AsyncAIProvider
+from .errors import StreamStalledError, StreamTruncatedError
+
+MAGIC = b"NFSR\x01"
+# 与 requests 的 iter_lines 相同的读取块大小（分块传输时按服务端发送的块返回）
+ITER_CHUNK_SIZE = 512
+_CHUNK_HEADER = struct.Struct('<II')
+_LENGTH = struct.Struct('<I')
+
+
+class LineBuffer:
+    """把字节块切分为行（与 requests.Response.iter_lines 的行为一致）"""
+
+    def __init__(self):
+        self.pending: Optional[bytes] = None
+
+    def feed(self, chunk: bytes) -> List[bytes]:
+        if self.pending is not None:
+            chunk = self.pending + chunk
+        lines = chunk.splitlines()
+        if lines and lines[-1] and chunk and lines[-1][-1] == chunk[-1]:
+            self.pending = lines.pop()
+        else:
+            self.pending = None
+        return lines
+
+    def flush(self) -> List[bytes]:
+        pending, self.pending = self.pending, None
+        return [pending] if pending is not None else []
+
+
+def split_lines(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    buffer = LineBuffer()
+    for chunk in chunks:
+        yield from buffer.feed(chunk)
+    yield from buffer.flush()
+
+
+class StreamRecording:
+    """一段录制的流式响应：chunks 为 (距上一个字节块的秒数, 字节块) 列表，第一个间隔从发出请求算起"""
+
+    def __init__(self, provider: str, model: str, chunks: List[Tuple[float, bytes]], complete: bool = True,
+                 recorded_at: Optional[float] = None):
+        self.provider = provider
+        self.model = model
+        self.chunks = chunks
+        self.complete = complete
+        self.recorded_at = recorded_at if recorded_at is not None else time.time()
+
+    @property
+    def duration(self) -> float:
+        return sum(delay for delay, _ in self.chunks)
+
+    @property
+    def size(self) -> int:
+        return sum(len(data) for _, data in self.chunks)
+
+    def lines(self) -> Iterator[bytes]:
+        return split_lines(data for _, data in self.chunks)
+
+    def text(self) -> str:
+        """回复全文（与服务商客户端解析的结果相同）"""
+        return ''.join(iter_sse_deltas(self.lines()))
+
+    def to_bytes(self) -> bytes:
+        header = json.dumps({
+            "provider": self.provider, "model": self.model, "recorded_at": self.recorded_at,
+            "complete": self.complete, "chunks": len(self.chunks),
+        }, ensure_ascii=False).encode('utf-8')
+        parts = [MAGIC, _LENGTH.pack(len(header)), header]
+        for delay, data in self.chunks:
+            parts.append(_CHUNK_HEADER.pack(min(int(delay * 1e6), 0xFFFFFFFF), len(data)))
+            parts.append(data)
+        return b''.join(parts)
+
+
+def load_recordings(path: str) -> List[StreamRecording]:
+    """读取录制文件中的所有录制（末尾写了一半的录制会被忽略）"""
+    with gzip.open(path, 'rb') as f:
+        try:
+            data = f.read()
+        except EOFError:
+            # 录制过程中进程退出，最后一个gzip成员不完整：只保留完整的部分
+            data = _read_complete_members(path)
+    recordings = []
+    offset = 0
+    while offset < len(data):
+        if data[offset:offset + len(MAGIC)] != MAGIC:
+            raise ValueError(f"不是有效的流录制文件: {path}")
+        offset += len(MAGIC)
+        (header_length,) = _LENGTH.unpack_from(data, offset)
+        offset += _LENGTH.size
+        header = json.loads(data[offset:offset + header_length].decode('utf-8'))
+        offset += header_length
+        chunks = []
+        for _ in range(header['chunks']):
+            delay_us, length = _CHUNK_HEADER.unpack_from(data, offset)
+            offset += _CHUNK_HEADER.size
+            chunks.append((delay_us / 1e6, data[offset:offset + length]))
+            offset += length
+        recordings.append(StreamRecording(header['provider'], header['model'], chunks, header['complete'],
+                                          header['recorded_at']))
+    return recordings
+
+
+def _read_complete_members(path: str) -> bytes:
+    import zlib
+    with open(path, 'rb') as f:
+        raw = f.read()
+    data = []
+    while raw:
+        decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+        try:
+            member = decompressor.decompress(raw)
+        except zlib.error:
+            break
+        if not decompressor.eof:
+            break
+        data.append(member)
+        raw = decompressor.unused_data
+    return b''.join(data)
+
+
+class StreamRecorder:
+    """流式响应录制器（线程安全）：每段录制在流结束（或中断）时作为一个gzip成员追加到文件"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.recorded = 0
+        self._lock = threading.Lock()
+
+    def iter_lines(self, response, provider: str, model: str, started_at: Optional[float] = None) -> Iterator[bytes]:
+        """代替 response.iter_lines()：逐行返回响应，同时记录原始字节块与到达间隔
+
+        started_at: 发出请求时的 time.perf_counter()，第一个间隔由此算起（包含连接与首字延迟）
+        """
+        chunks: List[Tuple[float, bytes]] = []
+        last = started_at if started_at is not None else time.perf_counter()
+
+        def timed_chunks():
+            nonlocal last
+            for data in response.iter_content(chunk_size=ITER_CHUNK_SIZE):
+                now = time.perf_counter()
+                chunks.append((now - last, data))
+                last = now
+                yield data
+
+        complete = False
+        try:
+            for line in split_lines(timed_chunks()):
+                # 解析方读到结束标记后即停止读取，此时流已完整
+                if line.startswith(b'data: [DONE]'):
+                    complete = True
+                yield line
+            complete = True
+        finally:
+            if chunks:
+                self.save(StreamRecording(provider, model, chunks, complete))
+
+    def save(self, recording: StreamRecording):
+        data = gzip.compress(recording.to_bytes())
+        with self._lock:
+            with open(self.path, 'ab') as f:
+                f.write(data)
+            self.recorded += 1
+
+
+class StreamReplayer:
+    """回放来源：按模型轮流选择录制（没有该模型的录制时轮流使用全部录制）
+
+    speed: 1为原速，大于1为加速，0为不等待（尽快输出）
+    """
+
+    def __init__(self, recordings: List[StreamRecording], speed: float = 1.0):
+        if not recordings:
+            raise ValueError("没有可回放的录制")
+        self.recordings = recordings
+        self.speed = speed
+        self.path: Optional[str] = None  # 录制文件路径（从文件加载时）
+        self._cursors: Dict[Optional[str], int] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def load(path: str, speed: float = 1.0) -> "StreamReplayer":
+        replayer = StreamReplayer(load_recordings(path), speed)
+        replayer.path = path
+        return replayer
+
+    def next_recording(self, model: Optional[str] = None) -> StreamRecording:
+        candidates = [r for r in self.recordings if r.model == model] or self.recordings
+        key = model if candidates is not self.recordings else None
+        with self._lock:
+            index = self._cursors.get(key, 0)
+            self._cursors[key] = index + 1
+        return candidates[index % len(candidates)]
+
+    def scaled(self, delay: float) -> float:
+        return delay / self.speed if self.speed > 0 else 0.0
+
+
+class ReplayProvider(AIProvider):
+    """回放录制的流式响应：字节块按录制的间隔（按回放速度缩放）经过与真实服务商相同的SSE解析
+
+    缩放后的间隔超过空闲超时时与真实服务商一样抛出 StreamStalledError
+    """
+    name = "replay"
+
+    def __init__(self, replayer: StreamReplayer, api_key: str = "", sleep=time.sleep):
+        super().__init__(api_key)
+        self.replayer = replayer
+        self.sleep = sleep
+
+    def chat(self, messages: List[Dict[str, str]], model: str, stream: bool = False) -> str:
+        if stream:
+            return self.stream_chat(messages, model)
+        return ''.join(self.stream_chat(messages, model))
+
+    def stream_chat(self, messages: List[Dict[str, str]], model: str) -> Iterator[str]:
+        recording = self.replayer.next_recording(model)
+        yield from iter_sse_deltas(split_lines(self._timed_chunks(recording)))
+
+    def _timed_chunks(self, recording: StreamRecording) -> Iterator[bytes]:
+        for delay, data in recording.chunks:
+            delay = self.replayer.scaled(delay)
+            if self.idle_timeout and delay > self.idle_timeout:
+                self.sleep(self.idle_timeout)
+                raise StreamStalledError(self.idle_timeout)
+            if delay:
+                self.sleep(delay)
+            yield data
+
+
+class AsyncReplayProvider(AsyncAIProvider):
+    """异步回放录制的流式响应"""
+    name = "replay"
+
+    def __init__(self, replayer: StreamReplayer, api_key: str = ""):
+        super().__init__(api_key)
+        self.replayer = replayer
+
+    async def chat_stream(self, messages: List[Dict[str, str]], model: str) -> AsyncIterator[str]:
+        from .ai_providers import SSE_DONE, parse_sse_line
+        recording = self.replayer.next_recording(model)
+        buffer = LineBuffer()
+        for delay, data in recording.chunks:
+            delay = self.replayer.scaled(delay)
+            if self.idle_timeout and delay > self.idle_timeout:
+                await asyncio.sleep(self.idle_timeout)
+                raise StreamStalledError(self.idle_timeout)
+            if delay:
+                await asyncio.sleep(delay)
+            for line in buffer.feed(data):
+                text = parse_sse_line(line)
+                if text is SSE_DONE:
+                    return
+                if text:
+                    yield text
+        for line in buffer.flush():
+            text = parse_sse_line(line)
+            if text is SSE_DONE:
+                return
+            if text:
+                yield text
+        raise StreamTruncatedError()
@@ -0,0 +1,218 @@
+"""
+HTTP传输层
+进程内共享的连接池：同一服务商的请求复用TCP/TLS连接，多个模型并发请求时也不必各自握手；
+以及流式响应的空闲看门狗与跨线程中止
+"""
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, Optional
+
+from .errors import StreamStalledError
+
+# 每个主机保留的连接数（并发对比多个模型时同一主机会有多个请求）
+POOL_CONNECTIONS = 8
+POOL_MAXSIZE = 16
+
+_lock = threading.Lock()
+_session = None
+_zhipu_clients: Dict[str, object] = {}
+_async_clients: Dict[int, object] = {}  # 事件循环id -> httpx.AsyncClient
+
+
+def get_session():
+    """获取共享的requests会话（线程安全，首次使用时创建）"""
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                _session = session
+    return _session
+
+
+def get_zhipu_client(api_key: str):
+    """获取智谱AI客户端（按API密钥复用，SDK内部维护连接池）"""
+    client = _zhipu_clients.get(api_key)
+    if client is None:
+        with _lock:
+            client = _zhipu_clients.get(api_key)
+            if client is None:
+                import zhipuai
+                # 重试由 resilience 模块统一处理，关闭SDK自带的重试
+                client = _zhipu_clients[api_key] = zhipuai.ZhipuAI(api_key=api_key, max_retries=0)
+    return client
+
+
+def get_async_client():
+    """获取当前事件循环共享的异步HTTP客户端（安装了h2时启用HTTP/2，多个流复用同一连接）"""
+    import asyncio
+    loop_id = id(asyncio.get_running_loop())
+    client = _async_clients.get(loop_id)
+    if client is None:
+        import httpx
+        try:
+            import h2  # noqa: F401
+            http2 = True
+        except ImportError:
+            http2 = False
+        limits = httpx.Limits(max_connections=POOL_MAXSIZE * 4, max_keepalive_connections=POOL_MAXSIZE)
+        client = _async_clients[loop_id] = httpx.AsyncClient(http2=http2, limits=limits)
+    return client
+
+
+async def close_async_client():
+    """关闭当前事件循环的异步HTTP客户端（在该循环中调用）"""
+    import asyncio
+    client = _async_clients.pop(id(asyncio.get_running_loop()), None)
+    if client is not None:
+        await client.aclose()
+
+
+def close_all():
+    """关闭所有连接（退出时调用）"""
+    global _session
+    with _lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+        _zhipu_clients.clear()
+
+
+def close_response(response):
+    """关闭流式HTTP响应（可在其他线程中调用）：先关闭套接字的读取端，
+    阻塞在读取中的线程立即返回——仅 close() 不会唤醒阻塞的 recv，要等到下一份数据或读取超时
+    """
+    shutdown = getattr(getattr(response, 'raw', None), 'shutdown', None)
+    if shutdown is not None:
+        try:
+            shutdown()
+        except Exception:
+            pass  # 连接已归还连接池或已关闭
+    response.close()
+
+
+class StreamWatchdog:
+    """空闲流看门狗：超过 idle_timeout 秒没有收到数据时调用 on_stall（通常是关闭响应以打断阻塞的读取）"""
+
+    def __init__(self, idle_timeout: float, on_stall: Optional[Callable[[], None]] = None):
+        self.idle_timeout = idle_timeout
+        self.on_stall = on_stall
+        self.stalled = False
+        self._last_activity = time.monotonic()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._watch, name="stream-watchdog", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def feed(self):
+        """收到数据"""
+        self._last_activity = time.monotonic()
+
+    def stop(self):
+        self._stopped.set()
+
+    def _watch(self):
+        interval = max(0.05, self.idle_timeout / 4)
+        while not self._stopped.wait(interval):
+            if time.monotonic() - self._last_activity >= self.idle_timeout:
+                self.stalled = True
+                if self.on_stall is not None:
+                    try:
+                        self.on_stall()
+                    except Exception:
+                        pass
+                return
+
+
+class StreamAbort:
+    """跨线程中止流：读取流的线程登记关闭回调（通常是关闭HTTP响应），
+    其他线程调用 abort() 立即打断阻塞的读取（如对冲请求中落败、仍在等待首字的一方）
+    """
+
+    def __init__(self):
+        self.aborted = False
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    def add(self, callback: Callable[[], None]):
+        with self._lock:
+            if not self.aborted:
+                self._callbacks.append(callback)
+                return
+        _call_quietly(callback)
+
+    def abort(self):
+        with self._lock:
+            self.aborted = True
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            _call_quietly(callback)
+
+
+def _call_quietly(callback: Callable[[], None]):
+    try:
+        callback()
+    except Exception:
+        pass
+
+
+_abort_scope = threading.local()
+
+
+@contextmanager
+def abort_scope(handle: StreamAbort):
+    """在当前线程中读取的流登记到 handle"""
+    previous = getattr(_abort_scope, 'handle', None)
+    _abort_scope.handle = handle
+    try:
+        yield handle
+    finally:
+        _abort_scope.handle = previous
+
+
+def on_abort(callback: Callable[[], None]):
+    """服务商打开流式响应后调用：当前线程的流被中止时执行 callback（没有中止范围时忽略）"""
+    handle = getattr(_abort_scope, 'handle', None)
+    if handle is not None:
+        handle.add(callback)
+
+
+def stream_aborted() -> bool:
+    """当前线程的流是否已被中止（中止导致的读取错误不应重试）"""
+    handle = getattr(_abort_scope, 'handle', None)
+    return handle is not None and handle.aborted
+
+
+def watch_stream(stream: Iterable, idle_timeout: Optional[float],
+                 on_stall: Optional[Callable[[], None]] = None) -> Iterator:
+    """逐项读取原始流（SSE行或SDK数据块），相邻数据间隔超过 idle_timeout 时抛出 StreamStalledError"""
+    if not idle_timeout:
+        yield from stream
+        return
+
+    watchdog = StreamWatchdog(idle_timeout, on_stall)
+    watchdog.start()
+    try:
+        for item in stream:
+            if watchdog.stalled:
+                raise StreamStalledError(idle_timeout)
+            watchdog.feed()
+            yield item
+    except StreamStalledError:
+        raise
+    except Exception as e:
+        # 看门狗关闭响应导致的读取错误
+        if watchdog.stalled:
+            raise StreamStalledError(idle_timeout) from e
+        raise
+    finally:
+        watchdog.stop()
+    if watchdog.stalled:
+        raise StreamStalledError(idle_timeout)
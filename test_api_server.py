@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+测试本地API服务：OpenAI兼容的流式与非流式接口、并发请求、聊天记录保存与访问令牌
+"""
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import httpx
+
+from chat_db import ChatDatabase
+from core.api_server import ChatCompletionServer
+from models import AIProviderFactory, AsyncSiliconFlowProvider, RateLimiterRegistry, SiliconFlowProvider
+from models.transport import close_async_client
+from testutils import FaultServer
+
+MODEL = "deepseek-ai/DeepSeek-V3"
+MESSAGES = [{"role": "user", "content": "你好"}]
+
+
+def run_against(script, check, token=None, db=None):
+    """启动替身上游与本地API服务，在事件循环中执行 check(server, client)，返回替身上游（已关闭）"""
+    upstream = FaultServer(script)
+    original_url, original_limits = AsyncSiliconFlowProvider.url, AIProviderFactory.rate_limits
+    AsyncSiliconFlowProvider.url = upstream.url
+    # 默认限流（每秒2个请求）会让并发测试排队
+    AIProviderFactory.set_rate_limits(RateLimiterRegistry({'': {'rate': 1000, 'burst': 100, 'max_concurrency': 100}}))
+
+    async def main():
+        server = ChatCompletionServer(db, lambda model: "test-key", MODEL, port=0, token=token)
+        await server.start()
+        try:
+            async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{server.port}", timeout=10) as client:
+                return await check(server, client)
+        finally:
+            await server.close()
+            await close_async_client()
+
+    try:
+        asyncio.run(main())
+    finally:
+        AsyncSiliconFlowProvider.url = original_url
+        AIProviderFactory.rate_limits = original_limits
+        upstream.close()
+    return upstream
+
+
+async def read_stream(client, **extra):
+    """发起流式请求，返回 (回复文本, 会话ID, 是否以[DONE]结束)"""
+    parts, done = [], False
+    payload = {"model": MODEL, "messages": MESSAGES, "stream": True, **extra}
+    async with client.stream('POST', '/v1/chat/completions', json=payload) as response:
+        assert response.status_code == 200
+        assert response.headers['content-type'].startswith('text/event-stream')
+        async for line in response.aiter_lines():
+            if not line.startswith('data: '):
+                continue
+            if line == 'data: [DONE]':
+                done = True
+                continue
+            chunk = json.loads(line[len('data: '):])
+            assert chunk['object'] == 'chat.completion.chunk'
+            parts.append(chunk['choices'][0]['delta'].get('content', ''))
+        return ''.join(parts), response.headers['x-conversation-id'], done
+
+
+def test_streaming_completion():
+    async def check(server, client):
+        text, conversation_id, done = await read_stream(client)
+        assert text == "你好，世界" and done
+        assert conversation_id.startswith(ChatDatabase.API_CONVERSATION_PREFIX)
+    run_against([('stream', ['你好', '，', '世界'])], check)
+
+
+def test_non_streaming_completion():
+    async def check(server, client):
+        response = await client.post('/v1/chat/completions', json={"model": MODEL, "messages": MESSAGES})
+        assert response.status_code == 200
+        data = response.json()
+        assert data['object'] == 'chat.completion'
+        assert data['choices'][0]['message'] == {"role": "assistant", "content": "一二三"}
+        # 非流式请求的连接可以复用
+        response = await client.get('/v1/models')
+        assert MODEL in [model['id'] for model in response.json()['data']]
+    run_against([('stream', ['一', '二', '三'])], check)
+
+
+def test_concurrent_streams():
+    # 每个上游流中途停顿0.3秒：并发转发时所有上游流同时处于进行中（串行时同一时刻只有一个）
+    async def check(server, client):
+        results = await asyncio.gather(*(read_stream(client) for _ in range(20)))
+        assert [text for text, _, _ in results] == ["前半后半"] * 20
+        assert len({conversation_id for _, conversation_id, _ in results}) == 20
+    upstream = run_against([('stream', ['前半', '后半'], 1, 0.3)] * 20, check)
+    assert upstream.peak_streams == 20
+
+
+def test_persists_to_database():
+    with tempfile.TemporaryDirectory() as folder:
+        db = ChatDatabase(os.path.join(folder, 'chat.db'))
+
+        async def check(server, client):
+            headers = {'X-Conversation-Id': 'api-test'}
+            payload = {"model": MODEL, "messages": MESSAGES}
+            response = await client.post('/v1/chat/completions', json=payload, headers=headers)
+            assert response.headers['x-conversation-id'] == 'api-test'
+
+        run_against([('stream', ['收到'])], check, db=db)
+        history = db.get_conversation_history('api-test')
+        assert [(message['role'], message['content']) for message in history] == [('user', '你好'), ('assistant', '收到')]
+
+
+def test_requires_token():
+    async def check(server, client):
+        payload = {"model": MODEL, "messages": MESSAGES}
+        response = await client.post('/v1/chat/completions', json=payload)
+        assert response.status_code == 401
+        assert response.json()['error']['type'] == 'authentication_error'
+        response = await client.post('/v1/chat/completions', json=payload, headers={'Authorization': 'Bearer secret'})
+        assert response.status_code == 200
+    run_against([('stream', ['ok'])], check, token='secret')
+
+
+def test_errors():
+    async def check(server, client):
+        assert (await client.get('/v1/unknown')).status_code == 404
+        assert (await client.post('/v1/chat/completions', content=b'not json')).status_code == 400
+        response = await client.post('/v1/chat/completions', json={"model": MODEL, "messages": MESSAGES})
+        assert response.status_code == 502
+    run_against([('status', 400)], check)
+
+
+def test_closing_sync_stream_aborts_stalled_upstream():
+    """同步服务商（自动路由/对冲）在线程池中读取：客户端离开时立即关闭停滞的上游响应，释放工作线程"""
+    closed = threading.Event()
+
+    class Recorded(SiliconFlowProvider):
+        def stream_chat(self, messages, model):
+            try:
+                yield from super().stream_chat(messages, model)
+            finally:
+                closed.set()
+
+    async def main(provider):
+        server = ChatCompletionServer(None, lambda model: "test-key", MODEL, port=0)
+        stream = server._iter_sync_stream(provider, MESSAGES, MODEL)
+        try:
+            await asyncio.wait_for(stream.__anext__(), 0.5)
+            raise AssertionError("上游停滞时不应收到片段")
+        except asyncio.TimeoutError:
+            pass
+        started = time.monotonic()
+        await stream.aclose()
+        assert await asyncio.get_running_loop().run_in_executor(None, closed.wait, 4.0)
+        assert time.monotonic() - started < 4.0
+        await server.close()
+
+    with FaultServer([('stream', ['迟到'], 0, 5.0)]) as upstream:
+        provider = Recorded("test-key")
+        provider.url = upstream.url
+        asyncio.run(main(provider))
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+测试异步服务提供商：同一事件循环线程上的大量并发流、错误分类、取消（包括紧接在片段之后的取消），以及限流排队不占用默认线程池
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from models import ProviderError, RateLimiter, ResponseCache, StreamStalledError, StreamTruncatedError
+from models.async_providers import AsyncCachedProvider, AsyncLimitedProvider, AsyncResilientProvider
+from models.mock_provider import AsyncMockProvider
+from models.resilience import ResiliencePolicy
+from models.transport import close_async_client
+from testutils import FaultServer, make_async_provider
+
+MESSAGES = [{"role": "user", "content": "你好"}]
+
+
+def run(coro):
+    async def main():
+        try:
+            return await coro
+        finally:
+            await close_async_client()
+    return asyncio.run(main())
+
+
+def test_concurrent_streams_share_one_thread():
+    # 每个流在中途停顿0.3秒：并发时所有流同时处于进行中（串行时同一时刻只有一个）
+    server = FaultServer([('stream', ['第一段', '第二段'], 1, 0.3)] * 30)
+    try:
+        threads = set()
+
+        async def one(provider):
+            chunks = []
+            async for chunk in provider.chat_stream(MESSAGES, "deepseek-ai/DeepSeek-V3"):
+                threads.add(threading.get_ident())
+                chunks.append(chunk)
+            return ''.join(chunks)
+
+        async def fan_out():
+            return await asyncio.gather(*(one(make_async_provider(server.url)) for _ in range(30)))
+
+        results = run(fan_out())
+        assert results == ["第一段第二段"] * 30
+        assert server.peak_streams == 30
+        assert len(threads) == 1
+    finally:
+        server.close()
+
+
+def test_http_error_is_classified():
+    server = FaultServer([('status', 429, {'Retry-After': '2'})])
+    try:
+        try:
+            run(make_async_provider(server.url).chat(MESSAGES, "deepseek-ai/DeepSeek-V3"))
+            raise AssertionError("应当抛出429")
+        except ProviderError as e:
+            assert e.status_code == 429 and e.retryable and e.retry_after == 2.0
+    finally:
+        server.close()
+
+
+def test_idle_stream_raises_stalled():
+    server = FaultServer([('stream', ['第一段', '第二段'], 1, 2.0)])
+    try:
+        try:
+            run(make_async_provider(server.url, idle_timeout=0.3).chat(MESSAGES, "deepseek-ai/DeepSeek-V3"))
+            raise AssertionError("停滞应当抛出")
+        except StreamStalledError:
+            pass
+    finally:
+        server.close()
+
+
+def test_retry_before_first_token():
+    server = FaultServer([('status', 503), ('stream', ['恢复'])])
+    try:
+        policy = ResiliencePolicy(connect_timeout=1.0, idle_timeout=2.0, max_retries=2, backoff_base=0.01)
+        provider = AsyncResilientProvider(make_async_provider(server.url), policy)
+        assert run(provider.chat(MESSAGES, "deepseek-ai/DeepSeek-V3")) == "恢复"
+        assert provider.retries == 1 and server.requests == 2
+    finally:
+        server.close()
+
+
+def test_truncated_stream_is_not_cached():
+    server = FaultServer([('truncated', ['半句']), ('stream', ['完整'])])
+    try:
+        provider = AsyncCachedProvider(make_async_provider(server.url), ResponseCache())
+
+        async def twice():
+            try:
+                await provider.chat(MESSAGES, "deepseek-ai/DeepSeek-V3")
+                raise AssertionError("提前断开应当抛出")
+            except StreamTruncatedError:
+                pass
+            return [await provider.chat(MESSAGES, "deepseek-ai/DeepSeek-V3") for _ in range(2)]
+
+        # 不完整的回复没有被缓存：第二次请求到达服务器，第三次命中缓存
+        assert run(twice()) == ["完整", "完整"]
+        assert server.requests == 2
+    finally:
+        server.close()
+
+
+def test_cancellation_stops_stream():
+    server = FaultServer([('stream', ['第一段', '第二段'], 1, 5.0)])
+    try:
+        received = []
+
+        async def consume():
+            async for chunk in make_async_provider(server.url, idle_timeout=10.0).chat_stream(
+                    MESSAGES, "deepseek-ai/DeepSeek-V3"):
+                received.append(chunk)
+
+        async def cancel_soon():
+            task = asyncio.create_task(consume())
+            await asyncio.sleep(0.3)
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                return True
+            return False
+
+        started = time.monotonic()
+        assert run(cancel_soon())
+        # 取消后立即结束，不会等到服务端的停顿（5秒）结束
+        assert received == ['第一段']
+        assert time.monotonic() - started < 4.0
+    finally:
+        server.close()
+
+
+def test_cancellation_right_after_a_chunk_is_not_lost():
+    """片段后的空行已在缓冲区中：紧接着取消时不能被读取结果吞掉（Python 3.12 之前 wait_for 的问题）"""
+    with FaultServer([('stream', ['第一段', '第二段'], 1, 5.0)]) as server:
+        async def cancel_on_first_chunk():
+            received = asyncio.Event()
+
+            async def consume():
+                async for _ in make_async_provider(server.url, idle_timeout=10.0).chat_stream(
+                        MESSAGES, "deepseek-ai/DeepSeek-V3"):
+                    received.set()
+
+            task = asyncio.create_task(consume())
+            await received.wait()
+            task.cancel()
+            await asyncio.wait({task}, timeout=4.0)
+            return task.cancelled()
+
+        assert run(cancel_on_first_chunk())
+
+
+def test_rate_limit_waiters_do_not_starve_default_executor():
+    """大量请求排队等待限流许可时，事件循环的默认线程池（上下文组装、缓存读写）仍然可用"""
+    limiter = RateLimiter(rate=1000.0, burst=100, max_concurrency=1, background_reserve=0)
+    provider = AsyncLimitedProvider(AsyncMockProvider("test-key"), limiter)
+
+    async def one():
+        return [chunk async for chunk in provider.chat_stream(MESSAGES, "mock?ttft=0&tps=0&tokens=3")]
+
+    async def check():
+        assert limiter.acquire()  # 占住唯一的名额，之后的请求全部排队
+        loop = asyncio.get_running_loop()
+        waiters = [asyncio.create_task(one()) for _ in range(40)]
+        await asyncio.sleep(0.2)
+        try:
+            assert await asyncio.wait_for(loop.run_in_executor(None, lambda: 'ok'), 2.0) == 'ok'
+        finally:
+            limiter.release()
+        results = await asyncio.wait_for(asyncio.gather(*waiters), 20.0)
+        assert all(results)
+
+    run(check())
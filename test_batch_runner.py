@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+测试批量提示运行器：JSONL/CSV输入、并发运行、失败记录与断点续跑
+"""
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from core.batch_runner import BatchInputError, BatchRunner, load_checkpoint, load_prompts
+from models import AIProviderFactory, RateLimiterRegistry, SiliconFlowProvider
+from testutils import FaultServer
+
+MODEL = "deepseek-ai/DeepSeek-V3"
+
+
+def write_lines(path, records):
+    with open(path, 'w', encoding='utf-8') as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+
+def read_results(path):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+
+def run_batch(script, items, output_path, concurrency=4, progress=None):
+    """指向替身上游运行一批条目（放宽限流），返回 (汇总, 替身上游)"""
+    server = FaultServer(script)
+    original_url, original_limits = SiliconFlowProvider.url, AIProviderFactory.rate_limits
+    SiliconFlowProvider.url = server.url
+    AIProviderFactory.set_rate_limits(RateLimiterRegistry({'': {'rate': 1000, 'burst': 100, 'max_concurrency': 100}}))
+    try:
+        runner = BatchRunner(MODEL, lambda model: "test-key", output_path, concurrency, progress)
+        return runner.run(items), server
+    finally:
+        SiliconFlowProvider.url = original_url
+        AIProviderFactory.rate_limits = original_limits
+        server.close()
+
+
+def test_load_jsonl_and_csv():
+    with tempfile.TemporaryDirectory() as folder:
+        jsonl = os.path.join(folder, 'prompts.jsonl')
+        write_lines(jsonl, [
+            {"id": "a", "prompt": "你好", "system": "简短回答"},
+            {"messages": [{"role": "user", "content": "第二条"}], "model": "glm-4-plus"},
+        ])
+        items = load_prompts(jsonl)
+        assert items[0]['id'] == 'a' and items[0]['messages'][0] == {"role": "system", "content": "简短回答"}
+        assert items[1]['id'] == '2' and items[1]['model'] == 'glm-4-plus'
+
+        csv_path = os.path.join(folder, 'prompts.csv')
+        with open(csv_path, 'w', encoding='utf-8', newline='') as f:
+            f.write('id,prompt\nx,"包含,逗号"\ny,第二条\n')
+        items = load_prompts(csv_path)
+        assert [item['id'] for item in items] == ['x', 'y']
+        assert items[0]['messages'] == [{"role": "user", "content": "包含,逗号"}]
+
+        write_lines(jsonl, [{"id": "a", "prompt": "一"}, {"id": "a", "prompt": "二"}])
+        try:
+            load_prompts(jsonl)
+            raise AssertionError("重复ID应当报错")
+        except BatchInputError:
+            pass
+
+
+def test_runs_items_concurrently_with_stats():
+    with tempfile.TemporaryDirectory() as folder:
+        output = os.path.join(folder, 'results.jsonl')
+        items = [{"id": str(i), "index": i, "messages": [{"role": "user", "content": f"第{i}条"}], "model": None}
+                 for i in range(8)]
+        # 每个回复在首段后停顿0.3秒：并发4时同时进行中的请求达到4个且不超过4个
+        summary, upstream = run_batch([('stream', ['回复', '内容'], 1, 0.3)] * 8, items, output, concurrency=4)
+        assert upstream.peak_streams == 4
+        assert summary['succeeded'] == 8 and summary['failed'] == 0 and upstream.requests == 8
+        results = read_results(output)
+        assert sorted(result['id'] for result in results) == [str(i) for i in range(8)]
+        for result in results:
+            assert result['status'] == 'ok' and result['response'] == '回复内容'
+            assert result['latency_s'] >= result['ttft_s'] and result['completion_tokens'] > 0 and result['chunks'] == 2
+
+
+def test_resume_skips_completed_and_retries_failures():
+    with tempfile.TemporaryDirectory() as folder:
+        output = os.path.join(folder, 'results.jsonl')
+        items = [{"id": str(i), "index": i, "messages": [{"role": "user", "content": f"第{i}条"}], "model": None}
+                 for i in range(3)]
+        # 第一次运行：一个条目失败（400不重试），模拟中断时写了一半的最后一行
+        summary, _ = run_batch([('stream', ['好']), ('status', 400), ('stream', ['好'])], items, output, concurrency=1)
+        assert summary['succeeded'] == 2 and summary['failed'] == 1
+        with open(output, 'a', encoding='utf-8') as f:
+            f.write('{"id": "2", "status": "o')
+        assert load_checkpoint(output) == {'0', '2'}
+
+        summary, upstream = run_batch([('stream', ['补上'])], items, output)
+        assert summary['succeeded'] == 1 and summary['skipped'] == 2 and upstream.requests == 1
+        ok = {result['id']: result['response'] for result in read_results_tolerant(output) if result['status'] == 'ok'}
+        assert ok == {'0': '好', '1': '补上', '2': '好'}
+
+        # 输出文件中其他输入的结果不计入跳过数
+        summary, upstream = run_batch([('stream', ['新的'])], items[:1] + [dict(items[0], id='new')], output)
+        assert summary['succeeded'] == 1 and summary['skipped'] == 1 and upstream.requests == 1
+
+
+def read_results_tolerant(path):
+    results = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                results.append(json.loads(line))
+            except json.JSONDecodeError:
+                pass
+    return results
+
+
+def test_interrupt_aborts_stalled_items():
+    """Ctrl+C时进行中的条目立即中止（不等停滞的上游），不记为失败，重新运行时再执行"""
+    def interrupt(result):
+        raise KeyboardInterrupt
+
+    with tempfile.TemporaryDirectory() as folder:
+        output = os.path.join(folder, 'results.jsonl')
+        items = [{"id": str(i), "index": i, "messages": [{"role": "user", "content": f"第{i}条"}], "model": None}
+                 for i in range(4)]
+        # 最先到达的请求立即完成（进度回调中模拟Ctrl+C），其余请求在首字前停滞5秒
+        script = [('stream', ['好'])] + [('stream', ['迟到'], 0, 5.0)] * 3
+        started = time.monotonic()
+        try:
+            run_batch(script, items, output, concurrency=4, progress=interrupt)
+            raise AssertionError("应当重新抛出KeyboardInterrupt")
+        except KeyboardInterrupt:
+            pass
+        assert time.monotonic() - started < 4.0
+        results = read_results(output)
+        assert [result['status'] for result in results] == ['ok']
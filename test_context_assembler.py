@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+测试上下文组装器：历史回复去除思考过程、按消息ID与内容缓存、删除与编辑消息时的缓存清除，以及缓存条目上限
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from core.context_assembler import ContextAssembler
+from models import MessageRecord
+
+MODEL = 'glm-4-flash'
+
+
+def conversation(*contents):
+    roles = ('user', 'assistant')
+    return tuple(MessageRecord(index + 1, roles[index % 2], content) for index, content in enumerate(contents))
+
+
+def test_history_replies_drop_thinking_and_are_cached():
+    assembler = ContextAssembler()
+    messages = conversation("问题", "<think>推理过程</think>回答", "追问")
+    context = assembler.assemble(messages, MODEL)
+    assert [m['content'] for m in context.messages] == ["问题", "回答", "追问"]
+    assert context.trimmed_tokens > 0 and context.dropped_messages == 0
+    # 当前用户消息不缓存，历史消息按ID缓存
+    assert list(assembler._cache) == [2, 1]
+    assert assembler.assemble(messages, MODEL).messages == context.messages
+
+
+def test_forget_evicts_deleted_message():
+    assembler = ContextAssembler()
+    assembler.assemble(conversation("问题", "回答", "追问"), MODEL)
+    assembler.forget(2)
+    assert 2 not in assembler._cache and 1 in assembler._cache
+    assembler.forget(99)  # 未缓存的消息
+    assert list(assembler._cache) == [1]
+
+
+def test_edited_content_replaces_cached_entry():
+    assembler = ContextAssembler()
+    assembler.assemble(conversation("问题", "旧回答", "追问"), MODEL)
+    context = assembler.assemble(conversation("问题", "新回答", "追问"), MODEL)
+    assert context.messages[1]['content'] == "新回答"
+    # 同一ID只保留一个条目
+    assert len(assembler._cache) == 2 and assembler._cache[2][0] == "新回答"
+
+
+def test_cache_is_bounded_by_entries():
+    assembler = ContextAssembler(max_cache_entries=3)
+    messages = conversation(*[f"消息{index}" for index in range(8)])
+    assembler.assemble(messages, MODEL)
+    # 从最新的消息开始准备，超出上限时丢弃最久未使用的（最早加入的）条目
+    assert list(assembler._cache) == [3, 2, 1]
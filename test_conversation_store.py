@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+测试会话内存存储：追加与删除、按上限裁剪、快照不可变，以及与聊天记录数据库的一致性
+"""
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from chat_db import ChatDatabase
+from models import ConversationStore
+
+
+def make_store(max_messages=50):
+    db = ChatDatabase(db_path=os.path.join(tempfile.mkdtemp(), 'chat_history.db'))
+    return ConversationStore(db, 'conv-1', max_messages)
+
+
+def test_append_and_remove_write_through():
+    store = make_store()
+    question = store.append('user', "问题")
+    reply = store.append('assistant', "回答", model='glm-4-flash', reply_to=question.id, ttft=0.5, total_seconds=2.0)
+    assert question.id is not None and reply.id != question.id
+    assert [(r.role, r.content) for r in store.snapshot()] == [('user', "问题"), ('assistant', "回答")]
+
+    # 重新加载得到与内存一致的记录
+    loaded = ConversationStore.load(store.db, 'conv-1').snapshot()
+    assert [(r.id, r.role, r.content, r.model, r.reply_to, r.ttft, r.total_seconds) for r in loaded] == \
+        [(question.id, 'user', "问题", None, None, None, None),
+         (reply.id, 'assistant', "回答", 'glm-4-flash', question.id, 0.5, 2.0)]
+
+    store.remove(question.id)
+    assert [r.id for r in store.snapshot()] == [reply.id]
+    assert [r.id for r in ConversationStore.load(store.db, 'conv-1').snapshot()] == [reply.id]
+
+
+def test_trims_to_max_messages_like_the_database():
+    store = make_store(max_messages=3)
+    for index in range(5):
+        store.append('user' if index % 2 == 0 else 'assistant', f"消息{index}")
+    assert len(store) == 3
+    assert [r.content for r in store.snapshot()] == ["消息2", "消息3", "消息4"]
+    # 数据库保留全部消息，加载时取最近的 max_messages 条，与内存中一致
+    loaded = ConversationStore.load(store.db, 'conv-1', max_messages=3).snapshot()
+    assert [r.id for r in loaded] == [r.id for r in store.snapshot()]
+
+
+def test_snapshot_is_unaffected_by_later_changes():
+    store = make_store()
+    first = store.append('user', "一")
+    snapshot = store.snapshot()
+    store.append('assistant', "二")
+    store.remove(first.id)
+    assert isinstance(snapshot, tuple) and [r.content for r in snapshot] == ["一"]
+    assert [r.content for r in store.snapshot()] == ["二"]
+
+
+def test_summary_write_through_and_reset():
+    store = make_store()
+    record = store.append('user', "一")
+    store.set_summary("之前的摘要", record.id)
+    loaded = ConversationStore.load(store.db, 'conv-1')
+    assert (loaded.summary.content, loaded.summary.covers_until) == ("之前的摘要", record.id)
+    store.reset()
+    assert store.snapshot() == () and store.summary is None
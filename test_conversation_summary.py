@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+测试会话滚动摘要：摘要范围划分、增量摘要、上下文组装与数据库持久化
+"""
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from chat_db import ChatDatabase
+from core.context_assembler import ContextAssembler
+from core.summarizer import ConversationSummarizer
+from models import ConversationStore
+
+
+class FakeProvider:
+    """记录请求并返回固定摘要的服务商"""
+
+    def __init__(self, reply="<think>整理中</think>用户在学习Python，已讨论列表与字典。"):
+        self.reply = reply
+        self.requests = []
+
+    def chat(self, messages, model):
+        self.requests.append((messages, model))
+        return self.reply
+
+
+def make_store(turns=10, chars=200):
+    db_path = os.path.join(tempfile.mkdtemp(), 'chat_history.db')
+    store = ConversationStore(ChatDatabase(db_path=db_path), 'conv-1')
+    for index in range(turns):
+        store.append('user', f"问题{index} " + 'a' * chars)
+        store.append('assistant', f"<think>思考{index}</think>回答{index} " + 'b' * chars)
+    return store
+
+
+def test_plan_keeps_recent_turns():
+    store = make_store()
+    summarizer = ConversationSummarizer(threshold_tokens=200, keep_recent_tokens=150)
+    records = store.snapshot()
+    assert summarizer.needs_summary(records, None)
+
+    to_summarize, covers_until = summarizer.plan(records, None)
+    kept = [record for record in records if record.id > covers_until]
+    assert to_summarize and kept
+    # 保留部分从用户消息开始，被摘要的部分以助手回复结束
+    assert kept[0].role == 'user'
+    assert to_summarize[-1].role == 'assistant'
+
+
+def test_incremental_summary_and_persistence():
+    store = make_store()
+    summarizer = ConversationSummarizer(threshold_tokens=200, keep_recent_tokens=150, summary_model='glm-z1-flash')
+    provider = FakeProvider()
+
+    summary = summarizer.summarize(provider, store.snapshot(), None)
+    assert summary.content == "用户在学习Python，已讨论列表与字典。"
+    messages, model = provider.requests[0]
+    assert model == 'glm-z1-flash'
+    assert '<think>' not in messages[1]['content']
+    store.set_summary(summary.content, summary.covers_until)
+
+    # 再次摘要时只发送已有摘要与新增的对话
+    for index in range(10, 14):
+        store.append('user', f"问题{index} " + 'a' * 200)
+        store.append('assistant', f"回答{index} " + 'b' * 200)
+    summarizer.summarize(provider, store.snapshot(), store.summary)
+    prompt = provider.requests[1][0][1]['content']
+    assert "已有摘要" in prompt and "问题0 " not in prompt
+
+    reloaded = ConversationStore.load(store.db, 'conv-1')
+    assert reloaded.summary.covers_until == summary.covers_until
+    # 摘要不出现在历史消息中
+    assert all(record.role in ('user', 'assistant') for record in reloaded.snapshot())
+
+
+def test_assemble_replaces_covered_messages():
+    store = make_store()
+    records = store.snapshot()
+    store.set_summary("早先的对话摘要", records[9].id)
+
+    context = ContextAssembler().assemble(records, 'glm-4-flash', store.summary)
+    assert context.messages[0]['role'] == 'system'
+    assert "早先的对话摘要" in context.messages[0]['content']
+    assert len(context.messages) == 1 + len(records) - 10
+    assert context.messages[1]['content'].startswith("问题5 ")
+
+
+def test_cache_does_not_reuse_messages_with_recycled_ids():
+    """清空历史后消息ID从1重新开始，缓存不能把旧会话的内容发送出去"""
+    from models import MessageRecord
+    assembler = ContextAssembler()
+    old = (MessageRecord(1, 'user', "旧问题"), MessageRecord(2, 'assistant', "旧回答"), MessageRecord(3, 'user', "再问"))
+    assembler.assemble(old, 'glm-4-flash')
+    new = (MessageRecord(1, 'user', "新问题"), MessageRecord(2, 'assistant', "新回答"), MessageRecord(3, 'user', "继续"))
+    contents = [m['content'] for m in assembler.assemble(new, 'glm-4-flash').messages]
+    assert contents == ["新问题", "新回答", "继续"]
+
+    assembler.clear()
+    assert not assembler._cache
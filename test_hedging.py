@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+测试对冲请求：按分位数计算的时限与预热前的默认值、对冲预算、胜出流的转发与落败流的立即关闭、
+对冲胜出统计，以及单个请求失败与两个请求都失败时的处理
+"""
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from models import MockScenario, ProviderError, SiliconFlowProvider
+from models.ai_providers import AIProvider
+from models.hedging import HedgedProvider, HedgingPolicy
+from models.transport import on_abort
+from utils.mock_server import MockStreamServer
+
+MESSAGES = [{"role": "user", "content": "你好"}]
+BLOCK = None  # 一直等到被中止
+
+
+class StandInProvider(AIProvider):
+    """按脚本逐次响应的本地替身：每次请求等待 wait 秒（BLOCK 为等到被中止）后输出片段或抛出错误
+
+    等待期间被中止时与真实服务商一样以读取错误结束
+    """
+    name = "standin"
+
+    def __init__(self, *scripts):
+        super().__init__("test-key")
+        self.scripts = list(scripts)
+        self.calls = []  # 每次请求的中止事件
+        self._lock = threading.Lock()
+
+    def chat(self, messages, model, stream=False):
+        return ''.join(self.stream_chat(messages, model))
+
+    def stream_chat(self, messages, model):
+        with self._lock:
+            wait, chunks, error = self.scripts[len(self.calls)]
+            aborted = threading.Event()
+            self.calls.append((model, aborted))
+        on_abort(aborted.set)
+        if aborted.wait(wait if wait is not BLOCK else 10):
+            raise ProviderError("连接已关闭")
+        if error is not None:
+            raise error
+        yield from chunks
+
+
+def make_policy(**overrides):
+    settings = dict(default_delay=0.05, min_delay=0.01, max_delay=1.0, min_samples=3, budget_ratio=0.0, burst=5)
+    settings.update(overrides)
+    return HedgingPolicy(**settings)
+
+
+def test_delay_uses_percentile_after_warm_up():
+    policy = HedgingPolicy(percentile=0.9, default_delay=2.0, min_delay=0.5, max_delay=8.0, min_samples=5)
+    for seconds in (1.0, 1.2, 1.4):
+        policy.record_ttft('m', seconds)
+    assert policy.delay_for('m') == 2.0  # 样本不足
+    for seconds in (1.6, 3.0, 1.1, 1.3, 1.5, 1.7, 2.5):
+        policy.record_ttft('m', seconds)
+    assert policy.delay_for('m') == 3.0  # 10个样本的p90
+    assert policy.delay_for('other') == 2.0
+    for _ in range(10):
+        policy.record_ttft('fast', 0.01)
+        policy.record_ttft('slow', 30.0)
+    assert policy.delay_for('fast') == 0.5 and policy.delay_for('slow') == 8.0
+
+
+def test_hedge_wins_and_loser_is_closed_immediately():
+    primary = StandInProvider((BLOCK, ["慢"], None))
+    backup = StandInProvider((0, ["快1", "快2"], None))
+    policy = make_policy(alternate=lambda model: 'backup')
+    provider = HedgedProvider(primary, policy, lambda model: backup)
+    stream = provider.stream_chat(MESSAGES, 'm')
+
+    assert next(stream) == "快1"
+    # 选出胜者时落败的一方立即被中止，而不是等到它的下一个片段
+    assert primary.calls[0][1].is_set()
+    assert list(stream) == ["快2"]
+    assert provider.served_model == 'backup' and backup.calls[0][0] == 'backup'
+    assert policy.stats() == {"requests": 1, "hedges": 1, "hedge_wins": 1, "budget_denied": 0}
+
+
+def test_loser_blocked_on_http_read_is_interrupted():
+    """真实HTTP流：落败一方阻塞在等待首字的读取中，中止时关闭套接字立即打断，不必等服务端发出数据"""
+    backup = StandInProvider((0, ["快"], None))
+    policy = make_policy(alternate=lambda model: 'backup')
+    with MockStreamServer(MockScenario(ttft=5.0, reply_tokens=3)) as server:
+        server.point_providers()
+        primary = SiliconFlowProvider("test-key")
+        provider = HedgedProvider(primary, policy, lambda model: backup)
+        started = time.perf_counter()
+        assert list(provider.stream_chat(MESSAGES, 'deepseek-ai/DeepSeek-V3')) == ["快"]
+        for reader in threading.enumerate():
+            if reader.name == 'hedge-deepseek-ai/DeepSeek-V3-0':
+                reader.join(3.0)
+                assert not reader.is_alive()
+        assert time.perf_counter() - started < 4.0
+    assert policy.stats()['hedge_wins'] == 1
+
+
+def test_primary_wins_after_hedge_started():
+    primary = StandInProvider((0.15, ["主1", "主2"], None))
+    hedge = StandInProvider((BLOCK, ["对冲"], None))
+    policy = make_policy(alternate=lambda model: 'backup')
+    provider = HedgedProvider(primary, policy, lambda model: hedge)
+
+    assert list(provider.stream_chat(MESSAGES, 'm')) == ["主1", "主2"]
+    assert len(hedge.calls) == 1 and hedge.calls[0][1].is_set()
+    assert provider.served_model == 'm'
+    assert policy.stats()['hedges'] == 1 and policy.stats()['hedge_wins'] == 0
+
+
+def test_fast_primary_does_not_hedge_and_records_ttft():
+    primary = StandInProvider(*[(0, ["好"], None)] * 3)
+    policy = make_policy(default_delay=5.0, min_samples=3)
+    provider = HedgedProvider(primary, policy)
+    for _ in range(3):
+        assert list(provider.stream_chat(MESSAGES, 'm')) == ["好"]
+    assert policy.stats()['hedges'] == 0
+    # 预热后时限来自实测首字延迟（限制在下限）
+    assert policy.delay_for('m') == policy.min_delay
+
+
+def test_budget_caps_hedges():
+    primary = StandInProvider(*[(0.12, ["主"], None)] * 3)
+    hedge = StandInProvider(*[(BLOCK, ["对冲"], None)] * 3)
+    policy = make_policy(budget_ratio=0.0, burst=1)
+    provider = HedgedProvider(primary, policy, lambda model: hedge)
+    policy.alternate = lambda model: 'backup'
+    for _ in range(3):
+        assert list(provider.stream_chat(MESSAGES, 'm')) == ["主"]
+    assert len(hedge.calls) == 1
+    assert policy.stats() == {"requests": 3, "hedges": 1, "hedge_wins": 0, "budget_denied": 2}
+
+
+def test_primary_error_before_deadline_is_raised_without_hedge():
+    primary = StandInProvider((0, [], ProviderError("请求错误", 400)))
+    policy = make_policy(default_delay=5.0)
+    provider = HedgedProvider(primary, policy)
+    try:
+        list(provider.stream_chat(MESSAGES, 'm'))
+    except ProviderError as e:
+        assert e.status_code == 400
+    else:
+        raise AssertionError("应当抛出错误")
+    assert policy.stats()['hedges'] == 0
+
+
+def test_primary_error_while_hedge_in_flight_uses_hedge():
+    primary = StandInProvider((0.1, [], ProviderError("主请求失败", 500)))
+    hedge = StandInProvider((0.2, ["对冲回复"], None))
+    policy = make_policy(alternate=lambda model: 'backup')
+    provider = HedgedProvider(primary, policy, lambda model: hedge)
+    assert list(provider.stream_chat(MESSAGES, 'm')) == ["对冲回复"]
+    assert provider.served_model == 'backup'
+    assert policy.stats()['hedge_wins'] == 1
+
+
+def test_both_failing_raises_last_error():
+    primary = StandInProvider((0.1, [], ProviderError("主请求失败", 500)))
+    hedge = StandInProvider((0.2, [], ProviderError("对冲也失败", 503)))
+    policy = make_policy(alternate=lambda model: 'backup')
+    provider = HedgedProvider(primary, policy, lambda model: hedge)
+    try:
+        list(provider.stream_chat(MESSAGES, 'm'))
+    except ProviderError as e:
+        assert e.status_code == 503
+    else:
+        raise AssertionError("应当抛出错误")
+    assert policy.stats()['hedge_wins'] == 0
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+测试界面卡顿监测：心跳延迟统计、卡顿时采样调用栈并归结为处理函数与热点、报告与导出，以及Qt侧的心跳与帧重绘计时
+"""
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from utils.lag_monitor import NO_SAMPLE, LagMonitor, lag_monitor
+from utils.tracing import tracer
+
+
+def _query_db():
+    time.sleep(0.15)
+
+
+def slow_handler():
+    _query_db()
+
+
+def test_disabled_monitor_is_noop():
+    monitor = LagMonitor()
+    monitor.start()
+    monitor.tick()
+    monitor.tick()
+    monitor.record_frame(3.0, True)
+    assert monitor._sampler is None and not monitor.drifts and not monitor.frames
+
+
+def test_stall_sampling_and_report():
+    monitor = LagMonitor(interval_ms=10, threshold_ms=50, sample_ms=2)
+    monitor.enable()
+    tracer.enable()
+    tracer.clear()
+    monitor.start()
+    try:
+        monitor.tick()
+        for _ in range(5):
+            time.sleep(0.01)
+            monitor.tick()
+        slow_handler()
+        monitor.tick()
+        # 没有采样到调用栈的卡顿（心跳本身迟到）
+        monitor._last_tick_ns -= 80_000_000
+        monitor._samples = []
+        monitor.tick()
+    finally:
+        monitor.stop()
+        tracer.disable()
+
+    assert len(monitor.drifts) == 7 and min(monitor.drifts) < 50
+    stalls = list(monitor.stalls)
+    assert len(stalls) == 2
+    stall = stalls[0]
+    assert stall.handler == 'test_lag_monitor.slow_handler'
+    assert stall.hot_spot == 'test_lag_monitor._query_db'
+    assert 130 <= stall.duration_ms and len(stall.samples) > 5
+    assert stall.samples[0].stack[-2:] == ('test_lag_monitor.slow_handler', 'test_lag_monitor._query_db')
+    assert stalls[1].handler == NO_SAMPLE and stalls[1].duration_ms >= 70
+
+    offenders = dict(monitor.offenders())
+    assert offenders['test_lag_monitor.slow_handler']['stalls'] == 1
+    report = monitor.report()
+    assert 'test_lag_monitor.slow_handler' in report and '卡顿' in report
+    event = next(e for e in tracer.events() if e.name == 'ui.stall')
+    assert event.tags['handler'] == 'test_lag_monitor.slow_handler' and event.duration_ns >= 130_000_000
+    tracer.clear()
+
+    with tempfile.TemporaryDirectory() as folder:
+        monitor.save(folder)
+        files = os.listdir(folder)
+        assert len(files) == 1
+        with open(os.path.join(folder, files[0]), encoding='utf-8') as f:
+            data = json.load(f)
+        assert data['summary']['stalls'] == 2 and data['stalls'][0]['stacks']
+
+
+def test_qt_watchdog():
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    from PyQt6.QtCore import QEventLoop, QTimer
+    from PyQt6.QtWidgets import QApplication, QLabel, QScrollArea, QVBoxLayout, QWidget
+    from ui.frame_monitor import LagWatchdog
+
+    app = QApplication.instance() or QApplication(sys.argv)
+    window = QWidget()
+    layout = QVBoxLayout(window)
+    scroll_area = QScrollArea()
+    label = QLabel("消息")
+    scroll_area.setWidget(label)
+    scroll_area.setWidgetResizable(True)
+    layout.addWidget(scroll_area)
+    window.resize(400, 300)
+    window.show()
+
+    lag_monitor.enable()
+    lag_monitor.clear()
+    watchdog = LagWatchdog(window, scroll_area.viewport())
+    watchdog.start()
+    try:
+        loop = QEventLoop()
+        ticks = [0]
+
+        def update_label():
+            ticks[0] += 1
+            label.setText(f"消息 {ticks[0]}")
+
+        timer = QTimer()
+        timer.timeout.connect(update_label)
+        timer.start(20)
+        QTimer.singleShot(150, slow_handler)
+        QTimer.singleShot(500, loop.quit)
+        loop.exec()
+        timer.stop()
+    finally:
+        watchdog.stop()
+        lag_monitor.enabled = False
+        window.close()
+
+    summary = lag_monitor.summary()
+    assert summary['ticks'] > 10 and summary['chat_frames'] > 0
+    handlers = [stall.handler for stall in lag_monitor.stalls]
+    assert 'test_lag_monitor.slow_handler' in handlers
+    lag_monitor.clear()
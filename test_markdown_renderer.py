@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+测试Markdown渲染：行内元素与链接地址的转义、各类块级元素、代码块高亮与后台渲染管线
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from utils.markdown_renderer import highlight_code, render_inline, render_markdown
+
+
+def test_link_href_is_escaped_once():
+    html = render_inline('见 [文档](https://example.com/?a=1&b="2") & <b>')
+    assert '<a href="https://example.com/?a=1&amp;b=&quot;2&quot;">文档</a>' in html
+    assert '&amp;amp;' not in html and html.endswith('&amp; &lt;b&gt;')
+
+
+def test_inline_styles_and_code_spans():
+    html = render_inline("**粗** *斜* ~~删~~ `a**b**<c>`")
+    assert html.startswith("<b>粗</b> <i>斜</i> <s>删</s> <code")
+    # 行内代码的内容只转义，不做其他替换
+    assert "a**b**&lt;c&gt;</code>" in html
+    # 单词内部的下划线不是斜体
+    assert render_inline("snake_case_name") == "snake_case_name"
+
+
+def test_block_elements():
+    text = "\n".join([
+        "# 标题 #",
+        "第一行",
+        "第二行",
+        "",
+        "- 项目一",
+        "  续行",
+        "- 项目二",
+        "1. 有序",
+        "> 引用 **重点**",
+        "---",
+        "| 列A | 列B |",
+        "| --- | --- |",
+        "| 1 |",
+    ])
+    html = render_markdown(text)
+    assert html.startswith("<h1>标题</h1><p>第一行<br>第二行</p>")
+    assert "<ul><li>项目一<br>续行</li><li>项目二</li></ul><ol><li>有序</li></ol>" in html
+    assert '<blockquote style="color:#57606a;"><p>引用 <b>重点</b></p></blockquote><hr>' in html
+    # 缺少的单元格补为空
+    assert "<th bgcolor=\"#f6f8fa\">列A</th>" in html and "<tr><td>1</td><td></td></tr></table>" in html
+
+
+def test_fenced_code_uses_code_renderer():
+    calls = []
+
+    def code_renderer(code, language):
+        calls.append((code, language))
+        return "[代码]"
+
+    html = render_markdown("前\n```python\nx = 1\n\n# 不是标题\n```\n后", code_renderer)
+    assert calls == [("x = 1\n\n# 不是标题", "python")]
+    assert html == "<p>前</p>[代码]<p>后</p>"
+    # 未闭合的代码块延续到结尾（流式输出结束前的常见情况）
+    render_markdown("~~~\n未闭合", code_renderer)
+    assert calls[-1] == ("未闭合", "")
+
+
+def test_highlight_code_falls_back_to_escaping():
+    assert highlight_code("<a> & b") == "&lt;a&gt; &amp; b"
+    assert highlight_code("<a>", "no-such-language") == "&lt;a&gt;"
+    highlighted = highlight_code("def f(): pass", "python")
+    assert "def" in highlighted and "style=" in highlighted
+
+
+def test_render_pipeline_renders_once_and_caches():
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    from PyQt6.QtCore import QCoreApplication
+    from ui.render_pipeline import RenderPipeline
+
+    app = QCoreApplication.instance() or QCoreApplication(sys.argv)
+    pipeline = RenderPipeline(max_threads=1)
+    content = "**完成**"
+    key = pipeline.make_key(content, 7)
+    results = []
+    # 相同键的并发请求只提交一个渲染任务
+    pipeline.request(key, content, lambda k, html: results.append(('a', html)))
+    pipeline.request(key, content, lambda k, html: results.append(('b', html)))
+    assert list(pipeline._pending) == [key] and len(pipeline._pending[key]) == 2
+    deadline = time.monotonic() + 5
+    while len(results) < 2 and time.monotonic() < deadline:
+        app.processEvents()
+        time.sleep(0.01)
+    assert results == [('a', '<p><b>完成</b></p>'), ('b', '<p><b>完成</b></p>')]
+    # 内存缓存命中时同步回调
+    pipeline.request(key, content, lambda k, html: results.append(('c', html)))
+    assert results[-1] == ('c', '<p><b>完成</b></p>') and not pipeline._pending
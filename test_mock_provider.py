@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+测试本地模拟服务商与模拟SSE服务：场景参数、思考过程、错误与停滞注入，以及真实客户端解析两种格式
+"""
+import asyncio
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from models import (AIProviderFactory, MockProvider, MockScenario, ProviderError, SiliconFlowProvider,
+                    StreamStalledError, ZhipuAIProvider)
+from models.async_providers import AsyncSiliconFlowProvider
+from models.mock_provider import AsyncMockProvider
+from models.transport import close_async_client, get_session
+from utils.mock_server import MockStreamServer
+
+MESSAGES = [{"role": "user", "content": "介绍一下自己"}]
+
+
+def test_scenario_from_model_name():
+    scenario = MockScenario.for_model("mock/reasoning?ttft=0.05&tokens=10")
+    assert scenario.reasoning_tokens == 80 and scenario.ttft == 0.05 and scenario.reply_tokens == 10
+    assert MockScenario.for_model("mock").ttft == 0.3
+    try:
+        MockScenario.for_model("mock?unknown=1")
+        raise AssertionError("未知参数应当报错")
+    except ValueError:
+        pass
+
+
+def test_pacing_and_reasoning():
+    sleeps = []
+    scenario = MockScenario(ttft=0.5, tokens_per_second=10, reply_tokens=5, reasoning_tokens=3)
+    provider = MockProvider("", scenario, sleep=sleeps.append)
+    text = ''.join(provider.stream_chat(MESSAGES, "mock"))
+    assert text.startswith("<think>让我想想这个</think>收到：介绍一下自己")
+    assert sleeps[0] == 0.5 and all(abs(delay - 0.1) < 1e-9 for delay in sleeps[1:])
+
+
+def test_injected_errors_and_stalls():
+    provider = MockProvider("", MockScenario(error_status=429, retry_after=2))
+    try:
+        list(provider.stream_chat(MESSAGES, "mock"))
+        raise AssertionError("应当抛出429")
+    except ProviderError as e:
+        assert e.status_code == 429 and e.retryable and e.retry_after == 2
+
+    # 约一半的请求失败，按种子可复现
+    flaky = MockScenario(ttft=0, tokens_per_second=0, error_status=503, error_rate=0.5, seed=7)
+    outcomes = []
+    for _ in range(20):
+        try:
+            list(MockProvider("", flaky).stream_chat(MESSAGES, "mock"))
+            outcomes.append(True)
+        except ProviderError:
+            outcomes.append(False)
+    assert 0 < outcomes.count(False) < 20
+
+    sleeps = []
+    provider = MockProvider("", MockScenario(ttft=0, tokens_per_second=0, stall_after=3, stall_seconds=30),
+                            sleep=sleeps.append)
+    provider.configure_timeouts(1.0, 2.0, 0.5)
+    chunks = []
+    try:
+        for chunk in provider.stream_chat(MESSAGES, "mock"):
+            chunks.append(chunk)
+        raise AssertionError("应当检测到停滞")
+    except StreamStalledError:
+        assert len(chunks) == 3 and sleeps == [0.5]
+
+
+def test_factory_creates_mock_providers():
+    provider = AIProviderFactory.create_provider("mock/fast", "mock")
+    assert ''.join(provider.stream_chat(MESSAGES, "mock/fast")).startswith("收到：介绍一下自己")
+
+    async def run():
+        async_provider = AIProviderFactory.create_async_provider("mock/fast", "mock")
+        assert isinstance(async_provider.provider.provider, AsyncMockProvider)
+        return ''.join([chunk async for chunk in async_provider.chat_stream(MESSAGES, "mock/fast")])
+
+    assert asyncio.run(run()).startswith("收到：")
+
+
+def test_server_speaks_siliconflow_and_zhipu_formats():
+    scenario = MockScenario(ttft=0, tokens_per_second=0, reply_tokens=6, reasoning_tokens=2)
+    with MockStreamServer(scenario) as server:
+        server.point_providers()
+        expected = ''.join(scenario.reply(MESSAGES))
+        # 硅基流动：思考过程在 reasoning_content 中，客户端只取正文
+        assert ''.join(SiliconFlowProvider("key").stream_chat(MESSAGES, "deepseek-ai/DeepSeek-R1")) == expected
+        response = get_session().post(server.siliconflow_url, stream=True, json={
+            "model": "deepseek-ai/DeepSeek-R1", "stream": True, "messages": MESSAGES})
+        deltas = [json.loads(line[6:])['choices'][0]['delta'] for line in response.iter_lines(decode_unicode=True)
+                  if line.startswith('data: {')]
+        response.close()
+        assert deltas[0] == {"reasoning_content": "让我"}
+        # 智谱：思考过程内嵌在正文中
+        text = ''.join(ZhipuAIProvider("key").stream_chat(MESSAGES, "glm-z1-flash"))
+        assert text == "<think>让我想想</think>" + expected
+        assert server.last_request['path'].startswith('/api/paas/v4') and server.requests == 3
+
+        async def run():
+            try:
+                provider = AsyncSiliconFlowProvider("key")
+                return ''.join([chunk async for chunk in provider.chat_stream(MESSAGES, "deepseek-ai/DeepSeek-V3")])
+            finally:
+                await close_async_client()
+
+        assert asyncio.run(run()) == expected
+    assert SiliconFlowProvider.url.startswith("https://")
+
+
+def test_server_injects_errors_by_model_name():
+    with MockStreamServer() as server:
+        provider = SiliconFlowProvider("key")
+        provider.url = server.siliconflow_url
+        try:
+            list(provider.stream_chat(MESSAGES, "mock?error=429&retry_after=3"))
+            raise AssertionError("应当抛出429")
+        except ProviderError as e:
+            assert e.status_code == 429 and e.retry_after == 3.0
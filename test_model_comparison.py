@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+测试多模型对比：收到首个片段时即发出首字延迟、对比面板的实时耗时显示，以及各模型回复的耗时随回复一起保存
+"""
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from chat_db import ChatDatabase
+from models import ConversationStore, MessageRecord
+
+
+def test_first_token_is_emitted_before_the_reply_finishes():
+    from PyQt6.QtCore import Qt
+    from core.ai_client import AIStreamThread
+
+    events = []
+    thread = AIStreamThread("你好", "mock", (MessageRecord(1, 'user', "你好"),), "mock?ttft=0.05&tps=0&tokens=20")
+    # 在当前线程中直接运行线程主体
+    thread.first_token.connect(lambda seconds: events.append(('first', seconds)), Qt.ConnectionType.DirectConnection)
+    thread.chunk_received.connect(lambda chunk: events.append(('chunk', chunk)), Qt.ConnectionType.DirectConnection)
+    thread.timing_ready.connect(lambda ttft, total, cached: events.append(('timing', ttft)),
+                                Qt.ConnectionType.DirectConnection)
+    thread.run()
+
+    kinds = [kind for kind, _ in events]
+    assert kinds[0] == 'first' and kinds.count('first') == 1
+    assert kinds.count('chunk') > 1 and kinds[-1] == 'timing'
+    # 实时发出的首字延迟与回复结束后的计时一致
+    assert events[0][1] == events[-1][1]
+
+
+def test_comparison_widget_shows_first_token_live():
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    from PyQt6.QtWidgets import QApplication
+    from ui.widgets import ComparisonWidget
+
+    app = QApplication.instance() or QApplication(sys.argv)
+    widget = ComparisonWidget(['glm-4-flash', 'deepseek-ai/DeepSeek-V3'])
+    widget.set_first_token('glm-4-flash', 0.42)
+    assert widget._stats_labels['glm-4-flash'].text() == "首字 0.42 秒 · 生成中..."
+    assert widget._stats_labels['deepseek-ai/DeepSeek-V3'].text() == "等待首字..."
+    widget.set_timing('glm-4-flash', 0.4, 2.5)
+    assert widget._stats_labels['glm-4-flash'].text() == "首字 0.40 秒 · 总耗时 2.50 秒"
+    widget.close()
+
+
+def test_comparison_timings_are_saved_with_replies():
+    db = ChatDatabase(db_path=os.path.join(tempfile.mkdtemp(), 'chat_history.db'))
+    store = ConversationStore(db, 'conv-1')
+    question = store.append('user', "你好")
+    store.append('assistant', "回答一", model='glm-4-flash', reply_to=question.id, ttft=0.4, total_seconds=2.5)
+    store.append('assistant', "回答二", model='deepseek-ai/DeepSeek-V3', reply_to=question.id)
+
+    user, first, second = ConversationStore.load(db, 'conv-1').snapshot()
+    assert user.ttft is None and user.total_seconds is None
+    assert (first.model, first.reply_to, first.ttft, first.total_seconds) == ('glm-4-flash', question.id, 0.4, 2.5)
+    assert second.ttft is None and second.total_seconds is None
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+测试自动模型路由：使用本地替身服务商注入延迟与错误，时钟可控，结果确定
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from models import AIProvider, CachedProvider, ModelRouter, ResponseCache, RoutedProvider
+
+
+class FakeClock:
+    """可控时钟：替身服务商通过推进时钟模拟延迟"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+
+class StandInProvider(AIProvider):
+    """本地替身服务商
+
+    ttft: 首字延迟；token_interval: 每个片段的间隔；
+    fail_connect: 连接失败；fail_after: 输出若干片段后中断
+    """
+
+    def __init__(self, clock, name, ttft=0.5, tokens=10, token_interval=0.05,
+                 fail_connect=False, fail_after=None):
+        super().__init__("test-key")
+        self.clock = clock
+        self.name = name
+        self.ttft = ttft
+        self.tokens = tokens
+        self.token_interval = token_interval
+        self.fail_connect = fail_connect
+        self.fail_after = fail_after
+        self.calls = 0
+
+    def chat(self, messages, model, stream=False):
+        return ''.join(self.stream_chat(messages, model))
+
+    def stream_chat(self, messages, model):
+        self.calls += 1
+        self.clock.advance(self.ttft)
+        if self.fail_connect:
+            raise ConnectionError(f"{self.name} 连接失败")
+        for index in range(self.tokens):
+            if index:
+                self.clock.advance(self.token_interval)
+            if self.fail_after is not None and index == self.fail_after:
+                raise ConnectionError(f"{self.name} 连接中断")
+            yield f"{self.name}{index} "
+
+
+def make_router(providers, clock, **kwargs):
+    return ModelRouter(
+        list(providers),
+        api_key_lookup=lambda model: "test-key",
+        provider_factory=lambda model, api_key: providers[model],
+        clock=clock,
+        **kwargs
+    )
+
+
+def ask(router):
+    provider = RoutedProvider(router)
+    text = ''.join(provider.stream_chat([{"role": "user", "content": "你好"}], "auto"))
+    return provider.served_model, text
+
+
+def test_routes_to_fastest_model():
+    clock = FakeClock()
+    providers = {
+        "slow": StandInProvider(clock, "slow", ttft=2.0),
+        "fast": StandInProvider(clock, "fast", ttft=0.3),
+        "medium": StandInProvider(clock, "medium", ttft=1.0),
+    }
+    router = make_router(providers, clock)
+
+    # 没有统计的模型优先试探，按组内顺序
+    assert [ask(router)[0] for _ in range(3)] == ["slow", "fast", "medium"]
+    assert router.rank() == ["fast", "medium", "slow"]
+    for _ in range(5):
+        assert ask(router)[0] == "fast"
+    assert abs(router.stats()["fast"]["ttft"] - 0.3) < 1e-9
+    assert router.stats()["fast"]["tokens_per_second"] > 0
+
+
+def test_generation_speed_counts():
+    clock = FakeClock()
+    providers = {
+        # 首字稍快但生成很慢
+        "quick-start": StandInProvider(clock, "quick-start", ttft=0.2, tokens=20, token_interval=0.5),
+        "quick-finish": StandInProvider(clock, "quick-finish", ttft=0.4, tokens=20, token_interval=0.01),
+    }
+    router = make_router(providers, clock)
+    ask(router)
+    ask(router)
+    assert router.rank() == ["quick-finish", "quick-start"]
+
+
+def test_failover_when_connect_fails():
+    clock = FakeClock()
+    providers = {
+        "primary": StandInProvider(clock, "primary", ttft=0.1),
+        "backup": StandInProvider(clock, "backup", ttft=0.8),
+    }
+    router = make_router(providers, clock, cooldown_seconds=60)
+    ask(router)
+    ask(router)
+    assert router.rank()[0] == "primary"
+
+    providers["primary"].fail_connect = True
+    served, text = ask(router)
+    assert served == "backup" and text.startswith("backup0")
+    assert router.stats()["primary"]["error_rate"] > 0
+
+    # 一次失败不会被剔除；连续失败使错误率超过阈值后排到最后
+    assert router.is_healthy("primary")
+    ask(router)
+    assert not router.is_healthy("primary")
+    assert router.rank() == ["backup", "primary"]
+
+    # 冷却时间过后重新试探，恢复后再次成为首选
+    providers["primary"].fail_connect = False
+    clock.advance(61)
+    assert ask(router)[0] == "primary"
+
+
+def test_unhealthy_model_ranked_last():
+    clock = FakeClock()
+    providers = {
+        "flaky": StandInProvider(clock, "flaky", ttft=0.1, fail_connect=True),
+        "steady": StandInProvider(clock, "steady", ttft=1.0),
+    }
+    router = make_router(providers, clock, cooldown_seconds=30)
+    assert ask(router)[0] == "steady"
+    assert not router.is_healthy("flaky")
+    assert router.rank() == ["steady", "flaky"]
+    clock.advance(31)
+    assert router.rank()[0] == "flaky"
+
+
+def test_no_failover_after_partial_output():
+    clock = FakeClock()
+    providers = {
+        "broken": StandInProvider(clock, "broken", ttft=0.1, fail_after=3),
+        "backup": StandInProvider(clock, "backup", ttft=0.5),
+    }
+    router = make_router(providers, clock)
+    provider = RoutedProvider(router)
+    received = []
+    try:
+        for chunk in provider.stream_chat([{"role": "user", "content": "你好"}], "auto"):
+            received.append(chunk)
+        raise AssertionError("部分输出后的错误应当抛出")
+    except ConnectionError:
+        pass
+    assert len(received) == 3
+    assert providers["backup"].calls == 0
+
+
+def test_all_models_failing():
+    clock = FakeClock()
+    providers = {
+        "a": StandInProvider(clock, "a", fail_connect=True),
+        "b": StandInProvider(clock, "b", fail_connect=True),
+    }
+    router = make_router(providers, clock)
+    try:
+        ask(router)
+        raise AssertionError("所有模型失败时应当抛出")
+    except Exception as e:
+        assert "a: a 连接失败" in str(e) and "b: b 连接失败" in str(e)
+
+
+def test_cache_hits_not_recorded():
+    """回复缓存的回放耗时接近0，计入统计会让命中过缓存的模型显得极快"""
+    clock = FakeClock()
+    stand_in = StandInProvider(clock, "fast", ttft=0.3)
+    providers = {"fast": CachedProvider(stand_in, ResponseCache())}
+    router = make_router(providers, clock)
+    ask(router)
+    recorded = router.stats()["fast"]
+
+    provider = RoutedProvider(router)
+    ''.join(provider.stream_chat([{"role": "user", "content": "你好"}], "auto"))
+    assert provider.cache_hit and provider.served_model == "fast" and stand_in.calls == 1
+    assert router.stats()["fast"] == recorded
+
+
+def test_stream_thread_skips_cache_hits():
+    """直接指定模型的流式请求同样只把实际请求计入路由统计"""
+    from PyQt6.QtCore import Qt
+    from core.ai_client import AIStreamThread
+    from models import AIProviderFactory, MessageRecord
+
+    model = "mock?ttft=0&tps=0&tokens=20"
+    previous_cache, previous_router = AIProviderFactory.response_cache, AIProviderFactory.router
+    router = ModelRouter([model], api_key_lookup=lambda model: "mock")
+    AIProviderFactory.enable_response_cache(ResponseCache())
+    AIProviderFactory.enable_router(router)
+    cached = []
+    try:
+        for _ in range(2):
+            thread = AIStreamThread("你好", "mock", (MessageRecord(1, 'user', "你好"),), model)
+            finished = []
+            # 测试中没有事件循环，槽在工作线程中直接调用
+            thread.timing_ready.connect(lambda ttft, total, hit: cached.append(hit), Qt.ConnectionType.DirectConnection)
+            thread.stream_finished.connect(finished.append, Qt.ConnectionType.DirectConnection)
+            thread.start()
+            assert thread.wait(5000) and finished
+        assert router.stats()[model]["samples"] == 1
+        # 界面据此不把缓存回放计入性能统计
+        assert cached == [False, True]
+    finally:
+        AIProviderFactory.enable_response_cache(previous_cache)
+        AIProviderFactory.enable_router(previous_router)
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+测试性能统计：对数-线性直方图的分位数精度与合并、按日期增量写入SQLite、错误率与掉帧计数、统计面板与命令行报告
+"""
+import os
+import random
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from core.perf_stats import Histogram, PerfStats, main
+
+DAY = 86400
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1_700_000_000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_histogram_percentiles_and_merge():
+    rng = random.Random(7)
+    values = [rng.lognormvariate(6, 1) for _ in range(20000)]
+    histogram = Histogram()
+    for value in values:
+        histogram.record(value)
+    ordered = sorted(values)
+    for fraction in (0.5, 0.95, 0.99):
+        exact = ordered[int(len(ordered) * fraction) - 1]
+        assert abs(histogram.percentile(fraction) - exact) / exact < 0.03
+    assert histogram.count == len(values) and histogram.maximum == max(values)
+    assert len(histogram.buckets) < 400
+
+    # 小于子桶数的值按整数分桶，分位数不超出实际范围
+    small = Histogram()
+    for value in (0.2, 3, 3, 7):
+        small.record(value)
+    assert small.percentile(0.5) == 3.5 and small.percentile(1.0) == 7
+
+    # 分两半记录再合并与一次记录结果相同，序列化往返不变
+    first, second = Histogram(), Histogram()
+    for index, value in enumerate(values):
+        (first if index % 2 else second).record(value)
+    first.merge(second)
+    assert first.buckets == histogram.buckets and first.count == histogram.count
+    restored = Histogram.from_row(first.buckets_json(), first.count, first.total, first.minimum, first.maximum)
+    assert restored.percentile(0.95) == histogram.percentile(0.95)
+
+
+def test_incremental_persistence_by_day():
+    clock = FakeClock()
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, 'perf_stats.db')
+        stats = PerfStats(path, flush_interval=3600, clock=clock)
+        for index in range(50):
+            stats.record_request('glm-4-plus', 0.2 + index / 1000, 2.0, tokens=360)
+        stats.record_error('glm-4-plus')
+        stats.record_frame_drops('glm-4-plus', 4)
+        stats.record_frame_drops('glm-4-plus', 0)
+        stats.flush()
+
+        # 同一天的第二批合并到已有行，第二天另起一行
+        for _ in range(50):
+            stats.record_request('glm-4-plus', 0.3, 3.0, tokens=360)
+        clock.now += DAY
+        stats.record_request('glm-4-plus', 1.0, 5.0, tokens=400)
+        stats.record_request('deepseek-ai/DeepSeek-V3', 0.5, 1.5, tokens=100)
+        stats.flush()
+
+        # 新实例只读数据库
+        reopened = PerfStats(path, clock=clock)
+        summary = reopened.summary()
+        glm = summary['glm-4-plus']
+        assert list(summary) == ['deepseek-ai/DeepSeek-V3', 'glm-4-plus']
+        assert glm['requests'] == 102 and glm['errors'] == 1 and glm['frame_drops'] == 4
+        assert abs(glm['error_rate'] - 1 / 102) < 1e-9
+        assert glm['ttft_ms']['count'] == 101
+        assert 200 <= glm['ttft_ms']['p50'] <= 310 and glm['ttft_ms']['p99'] == 300
+        # 前50次约200 tokens/s，后50次约133 tokens/s
+        assert abs(glm['tokens_per_s']['p50'] - 360 / 2.7) / (360 / 2.7) < 0.03
+        assert abs(glm['tokens_per_s']['p99'] - 200) / 200 < 0.03
+        assert summary['deepseek-ai/DeepSeek-V3']['tokens_per_s']['p50'] == 100
+
+        # 只统计今天
+        today = reopened.summary(days=1)['glm-4-plus']
+        assert today['requests'] == 1 and today['errors'] == 0 and today['ttft_ms']['p50'] == 1000
+
+        daily = reopened.daily('glm-4-plus')
+        assert [stats['requests'] for _, stats in daily] == [101, 1]
+        assert daily[0][1]['frame_drops'] == 4 and daily[0][0] < daily[1][0]
+
+
+def test_reports():
+    clock = FakeClock()
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, 'perf_stats.db')
+        stats = PerfStats(path, clock=clock)
+        stats.record_request('glm-4-plus', 0.25, 2.5, tokens=450)
+        stats.record_error('glm-4-flash')
+        report = stats.report(model='glm-4-plus')
+        assert 'glm-4-plus' in report and '250/250/250' in report and '按日期' in report
+        assert 'glm-4-flash' not in report
+        assert '100.0%' in stats.report()
+
+        os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+        from PyQt6.QtWidgets import QApplication
+        from ui.dialogs import PerfStatsDialog
+        app = QApplication.instance() or QApplication(sys.argv)
+        dialog = PerfStatsDialog(stats)
+        assert dialog.table.rowCount() == 2
+        assert dialog.table.item(0, 0).text() == 'glm-4-flash' and dialog.table.item(0, 3).text() == '-'
+        assert dialog.table.item(1, 3).text() == '250'
+        assert dialog.daily_table.rowCount() == 1
+        dialog.close()
+
+        main(['--db', path, '--days', '7'])
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+测试服务商子进程：帧编码、流式输出、取消、服务商错误的报告，以及子进程崩溃后的隔离与重启
+"""
+import functools
+import json
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from core.provider_process import (FRAME_DELTA, ProviderProcess, StreamHandler, decode_frame,
+                                   encode_frame)
+from models import MessageRecord
+from models.resilience import ResiliencePolicy, ResilienceSettings
+from testutils import FaultServer
+
+MODEL = "deepseek-ai/DeepSeek-V3"
+HISTORY = (MessageRecord(1, 'user', "你好"),)
+
+
+def point_to(url):
+    """子进程初始化：把硅基流动请求指向本地服务器"""
+    from models import SiliconFlowProvider
+    SiliconFlowProvider.url = url
+
+
+def fail_streams(error):
+    """子进程初始化：模拟服务商抛出的错误"""
+    from models.mock_provider import MockProvider
+
+    def stream_chat(self, messages, model=''):
+        raise error
+        yield
+
+    MockProvider.stream_chat = stream_chat
+
+
+class Collector(StreamHandler):
+    def __init__(self):
+        self.chunks = []
+        self.context = None
+        self.done = None
+        self.error = None
+        self.finished = threading.Event()
+
+    def on_context(self, total_tokens, trimmed_tokens):
+        self.context = (total_tokens, trimmed_tokens)
+
+    def on_delta(self, text):
+        self.chunks.append(text)
+
+    def on_done(self, ttft, total, served_model, cached):
+        self.done = (ttft, total, served_model, cached)
+        self.finished.set()
+
+    def on_error(self, message):
+        self.error = message
+        self.finished.set()
+
+
+def make_process(server, read_timeout=2.0, **settings):
+    policy = ResiliencePolicy(connect_timeout=1.0, read_timeout=read_timeout, idle_timeout=5.0, max_retries=0)
+    return ProviderProcess({
+        'resilience': ResilienceSettings(policy),
+        'initializer': functools.partial(point_to, server.url),
+        **settings,
+    })
+
+
+def test_frame_round_trip():
+    frame = encode_frame(FRAME_DELTA, 7, "片段".encode('utf-8'))
+    assert len(frame) == 5 + len("片段".encode('utf-8'))
+    assert decode_frame(frame) == (FRAME_DELTA, 7, "片段".encode('utf-8'))
+
+
+def test_stream_through_child_process():
+    server = FaultServer([('stream', ['你好', '，', '世界'])])
+    process = make_process(server)
+    try:
+        handler = Collector()
+        process.submit(handler, MODEL, "test-key", HISTORY)
+        assert handler.finished.wait(20)
+        assert handler.error is None
+        assert ''.join(handler.chunks) == "你好，世界"
+        assert handler.context[0] > 0
+        assert handler.done[2] == MODEL and handler.done[0] <= handler.done[1] and not handler.done[3]
+    finally:
+        process.shutdown()
+        server.close()
+
+
+def test_provider_errors_are_reported():
+    """服务商抛出 ValueError/OSError 的子类（JSON解析、网络错误）时同样发回错误，而不是当作管道关闭忽略"""
+    for error in (json.JSONDecodeError("响应格式错误", "{", 1), ConnectionResetError("连接被重置")):
+        process = ProviderProcess({'initializer': functools.partial(fail_streams, error)})
+        try:
+            handler = Collector()
+            process.submit(handler, "mock/fast", "mock", HISTORY)
+            assert handler.finished.wait(20)
+            assert handler.done is None and error.args[0] in handler.error
+        finally:
+            process.shutdown()
+
+
+def test_crash_is_isolated_and_restarted():
+    server = FaultServer([('stream', ['第一段', '第二段'], 1, 3.0), ('stream', ['恢复'])])
+    process = make_process(server)
+    try:
+        handler = Collector()
+        process.submit(handler, MODEL, "test-key", HISTORY)
+        deadline = time.monotonic() + 20
+        while not handler.chunks and time.monotonic() < deadline:
+            time.sleep(0.02)
+        process.kill()
+        assert handler.finished.wait(5)
+        assert handler.error and handler.chunks == ['第一段']
+
+        retry = Collector()
+        process.submit(retry, MODEL, "test-key", HISTORY)
+        assert retry.finished.wait(20)
+        assert ''.join(retry.chunks) == "恢复" and process.restarts == 1
+    finally:
+        process.shutdown()
+        server.close()
+
+
+def test_cancel_stops_delivery():
+    server = FaultServer([('stream', ['第一段', '第二段'], 1, 1.0), ('stream', ['之后'])])
+    process = make_process(server)
+    try:
+        handler = Collector()
+        request_id = process.submit(handler, MODEL, "test-key", HISTORY)
+        deadline = time.monotonic() + 20
+        while not handler.chunks and time.monotonic() < deadline:
+            time.sleep(0.02)
+        process.cancel(request_id)
+        time.sleep(1.5)
+        assert handler.chunks == ['第一段'] and not handler.finished.is_set()
+        # 子进程仍可继续处理新的请求
+        after = Collector()
+        process.submit(after, MODEL, "test-key", HISTORY)
+        assert after.finished.wait(20) and ''.join(after.chunks) == "之后"
+    finally:
+        process.shutdown()
+        server.close()
+
+
+def test_cancel_interrupts_stream_stalled_before_first_token():
+    """取消时立即关闭停滞的响应：并发名额马上释放，下一个请求不必等上游的首字"""
+    server = FaultServer([('stream', ['迟到'], 0, 8.0), ('stream', ['之后'])])
+    limits = {'': {'rate': 1000.0, 'burst': 100, 'max_concurrency': 1, 'background_reserve': 0}}
+    process = make_process(server, read_timeout=30.0, rate_limits=limits)
+    try:
+        handler = Collector()
+        request_id = process.submit(handler, MODEL, "test-key", HISTORY)
+        deadline = time.monotonic() + 20
+        while not server.peak_streams and time.monotonic() < deadline:
+            time.sleep(0.02)
+        started = time.monotonic()
+        process.cancel(request_id)
+        after = Collector()
+        process.submit(after, MODEL, "test-key", HISTORY)
+        assert after.finished.wait(20) and ''.join(after.chunks) == "之后"
+        assert time.monotonic() - started < 4.0
+        assert not handler.chunks and handler.error is None and not handler.finished.is_set()
+    finally:
+        process.shutdown()
+        server.close()
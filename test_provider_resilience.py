@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+测试请求容错策略：本地HTTP服务器按脚本注入错误状态码、限流、首字前停滞、中途停滞与提前断开
+"""
+import os
+import socket
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from models import (CachedProvider, ProviderError, ResiliencePolicy, ResilienceSettings, ResponseCache,
+                    StreamStalledError, StreamTruncatedError, make_cache_key)
+from testutils import POLICY, make_provider, run_with_server
+
+
+def stream_text(provider):
+    return ''.join(provider.stream_chat([{"role": "user", "content": "你好"}], "deepseek-ai/DeepSeek-V3"))
+
+
+def test_retries_server_errors_before_first_token():
+    def check(server):
+        provider, sleeps = make_provider(server.url)
+        assert stream_text(provider) == "你好呀"
+        assert server.requests == 3
+        assert len(sleeps) == 2 and sleeps[0] <= sleeps[1] * 2
+    run_with_server([('status', 503), ('status', 502), ('stream', ['你好', '呀'])], check)
+
+
+def test_honours_retry_after():
+    def check(server):
+        provider, sleeps = make_provider(server.url)
+        assert stream_text(provider) == "ok"
+        assert sleeps[0] >= 0.3
+    run_with_server([('status', 429, {'Retry-After': '0.3'}), ('stream', ['ok'])], check)
+
+
+def test_gives_up_after_max_retries():
+    def check(server):
+        provider, sleeps = make_provider(server.url)
+        try:
+            stream_text(provider)
+            raise AssertionError("重试耗尽后应当抛出")
+        except ProviderError as e:
+            assert e.status_code == 503
+        assert server.requests == 3 and len(sleeps) == 2
+    run_with_server([('status', 503)] * 3, check)
+
+
+def test_client_error_not_retried():
+    def check(server):
+        provider, sleeps = make_provider(server.url)
+        try:
+            stream_text(provider)
+            raise AssertionError("400错误应当直接抛出")
+        except ProviderError as e:
+            assert e.status_code == 400 and not e.retryable
+        assert server.requests == 1 and not sleeps
+    run_with_server([('status', 400)], check)
+
+
+def test_non_stream_chat_retried():
+    def check(server):
+        provider, sleeps = make_provider(server.url)
+        try:
+            provider.chat([{"role": "user", "content": "你好"}], "deepseek-ai/DeepSeek-V3")
+        except ProviderError:
+            pass
+        assert server.requests == 3
+    run_with_server([('status', 500)] * 3, check)
+
+
+def test_stall_before_first_token_is_retried():
+    def check(server):
+        provider, sleeps = make_provider(server.url)
+        started = time.monotonic()
+        assert stream_text(provider) == "恢复"
+        # 空闲时限（0.5秒）后放弃并重试，不会等到服务端恢复
+        assert server.requests == 2 and len(sleeps) == 1
+        assert time.monotonic() - started < 4.0
+    run_with_server([('stream', ['停滞'], 0, 5.0), ('stream', ['恢复'])], check)
+
+
+def test_idle_watchdog_mid_stream():
+    def check(server):
+        provider, sleeps = make_provider(server.url)
+        received = []
+        started = time.monotonic()
+        try:
+            for chunk in provider.stream_chat([{"role": "user", "content": "你好"}], "deepseek-ai/DeepSeek-V3"):
+                received.append(chunk)
+            raise AssertionError("中途停滞应当抛出")
+        except StreamStalledError:
+            pass
+        # 已经输出部分回复，不再重试；停滞在空闲时限附近被发现，不会一直挂起
+        assert received == ['第一段', '第二段']
+        assert server.requests == 1 and not sleeps
+        assert time.monotonic() - started < 4.0
+    run_with_server([('stream', ['第一段', '第二段', '第三段'], 2, 5.0)], check)
+
+
+def test_truncated_stream_is_not_cached():
+    def check(server):
+        provider, sleeps = make_provider(server.url)
+        cached = CachedProvider(provider, ResponseCache())
+        # 首字前断开时重试
+        assert stream_text(cached) == "完整"
+        assert server.requests == 2 and len(sleeps) == 1
+        # 输出部分回复后在 [DONE] 之前断开：抛出错误，不完整的回复不写入缓存
+        received = []
+        try:
+            for chunk in cached.stream_chat([{"role": "user", "content": "再说一遍"}], "deepseek-ai/DeepSeek-V3"):
+                received.append(chunk)
+            raise AssertionError("提前断开应当抛出")
+        except StreamTruncatedError:
+            pass
+        assert received == ['半句']
+        assert stream_text(cached) == "完整" and server.requests == 3
+        assert cached.cache.get(make_cache_key("deepseek-ai/DeepSeek-V3",
+                                               [{"role": "user", "content": "再说一遍"}])) is None
+    run_with_server([('truncated', []), ('stream', ['完整']), ('truncated', ['半句'])], check)
+
+
+def test_connection_refused_is_retried():
+    probe = socket.socket()
+    probe.bind(('127.0.0.1', 0))
+    port = probe.getsockname()[1]
+    probe.close()
+    provider, sleeps = make_provider(f"http://127.0.0.1:{port}/v1/chat/completions")
+    try:
+        stream_text(provider)
+        raise AssertionError("连接被拒绝时应当抛出")
+    except ProviderError as e:
+        assert e.retryable
+    assert len(sleeps) == POLICY.max_retries
+
+
+def test_backoff_with_jitter():
+    policy = ResiliencePolicy(backoff_base=1.0, backoff_max=8.0)
+    assert policy.backoff(0, rng=lambda: 0.0) == 0.5
+    assert policy.backoff(0, rng=lambda: 1.0) == 1.0
+    assert policy.backoff(2, rng=lambda: 1.0) == 4.0
+    assert policy.backoff(10, rng=lambda: 1.0) == 8.0
+    assert policy.backoff(0, retry_after=3.0, rng=lambda: 0.0) == 3.0
+
+
+def test_per_model_policy():
+    slow = POLICY.copy(idle_timeout=5.0)
+    settings = ResilienceSettings(POLICY, {"deepseek-ai/DeepSeek-R1": slow})
+    assert settings.policy_for("deepseek-ai/DeepSeek-R1").idle_timeout == 5.0
+    assert settings.policy_for("deepseek-ai/DeepSeek-V3").idle_timeout == 0.5
+    provider, _ = make_provider("http://127.0.0.1:1/", settings.policy_for("deepseek-ai/DeepSeek-R1"))
+    assert provider.provider.idle_timeout == 5.0 and provider.provider.connect_timeout == 1.0
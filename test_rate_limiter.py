@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+测试请求限流：令牌桶速率、并发上限、交互请求优先与429退让
+"""
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from models import LimitedProvider, Priority, ProviderError, RateLimiter, RateLimiterRegistry
+from models.ai_providers import AIProvider
+
+
+class StandInProvider(AIProvider):
+    """按脚本输出或抛出错误的本地替身"""
+    name = "standin"
+
+    def __init__(self, error=None, delay=0.0):
+        super().__init__("test-key")
+        self.error = error
+        self.delay = delay
+
+    def chat(self, messages, model, stream=False):
+        return ''.join(self.stream_chat(messages, model))
+
+    def stream_chat(self, messages, model):
+        time.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        yield "ok"
+
+
+def test_token_bucket_limits_rate():
+    limiter = RateLimiter(rate=20.0, burst=2, max_concurrency=10)
+    started = time.monotonic()
+    for _ in range(6):
+        assert limiter.acquire()
+        limiter.release()
+    # 突发2个，其余4个按每秒20个发放
+    assert time.monotonic() - started >= 0.18
+    assert limiter.stats()['waits'] >= 4
+
+
+def test_concurrency_cap():
+    limiter = RateLimiter(rate=1000.0, burst=100, max_concurrency=2)
+    assert limiter.acquire() and limiter.acquire()
+    assert not limiter.acquire(timeout=0.05)
+    limiter.release()
+    assert limiter.acquire(timeout=0.05)
+
+
+def test_background_reserve_keeps_slot_for_interactive():
+    limiter = RateLimiter(rate=1000.0, burst=100, max_concurrency=2, background_reserve=1)
+    assert limiter.acquire(Priority.BACKGROUND)
+    assert not limiter.acquire(Priority.BACKGROUND, timeout=0.05)
+    assert limiter.acquire(Priority.INTERACTIVE, timeout=0.05)
+
+
+def test_interactive_served_before_background():
+    limiter = RateLimiter(rate=1000.0, burst=100, max_concurrency=1, background_reserve=0)
+    assert limiter.acquire()
+    order = []
+
+    def worker(priority, label):
+        limiter.acquire(priority)
+        order.append(label)
+        limiter.release()
+
+    background = threading.Thread(target=worker, args=(Priority.BACKGROUND, 'background'))
+    background.start()
+    time.sleep(0.05)
+    interactive = threading.Thread(target=worker, args=(Priority.INTERACTIVE, 'interactive'))
+    interactive.start()
+    time.sleep(0.05)
+    limiter.release()
+    background.join(1)
+    interactive.join(1)
+    assert order == ['interactive', 'background']
+
+
+def test_429_pauses_and_lowers_rate():
+    limiter = RateLimiter(rate=100.0, burst=5, max_concurrency=4)
+    provider = LimitedProvider(StandInProvider(ProviderError("限流", 429, retry_after=0.2)), limiter)
+    try:
+        list(provider.stream_chat([], "m"))
+        raise AssertionError("应当抛出429")
+    except ProviderError:
+        pass
+    assert limiter.stats()['throttled'] == 1 and limiter.rate == 50.0
+    assert limiter.stats()['in_flight'] == 0
+    started = time.monotonic()
+    assert limiter.acquire()
+    assert time.monotonic() - started >= 0.15
+    limiter.release()
+    assert limiter.rate > 50.0
+
+
+def test_stream_holds_slot_until_finished():
+    limiter = RateLimiter(rate=1000.0, burst=100, max_concurrency=1)
+    provider = LimitedProvider(StandInProvider(), limiter)
+    stream = provider.stream_chat([], "m")
+    assert next(stream) == "ok"
+    assert limiter.stats()['in_flight'] == 1
+    stream.close()
+    assert limiter.stats()['in_flight'] == 0
+
+
+def test_registry_shares_limiter_per_key():
+    registry = RateLimiterRegistry({'': {'rate': 5.0}, 'siliconflow': {'max_concurrency': 2}})
+    assert registry.get('siliconflow', 'a') is registry.get('siliconflow', 'a')
+    assert registry.get('siliconflow', 'a') is not registry.get('siliconflow', 'b')
+    limiter = registry.get('siliconflow', 'a')
+    assert limiter.rate == 5.0 and limiter.max_concurrency == 2
+    assert registry.get('zhipu', 'a').max_concurrency == 4
+
+
+def test_cancelled_stream_thread_releases_slot():
+    """中断（cancel）的流式线程关闭流：并发名额与请求合并的订阅都被释放，之后的请求不会阻塞"""
+    from PyQt6.QtCore import Qt
+    from core.ai_client import AIStreamThread
+    from models import AIProviderFactory, MessageRecord
+
+    previous_limits, previous_flight = AIProviderFactory.rate_limits, AIProviderFactory.single_flight
+    registry = RateLimiterRegistry({'': {'rate': 1000.0, 'burst': 100, 'max_concurrency': 1, 'background_reserve': 0}})
+    AIProviderFactory.set_rate_limits(registry)
+    AIProviderFactory.enable_single_flight(True)
+    group = AIProviderFactory.single_flight
+    history = (MessageRecord(1, 'user', "你好"),)
+    try:
+        for _ in range(3):
+            thread = AIStreamThread("你好", "mock", history, "mock?ttft=0&tps=50&tokens=500")
+            first_chunk = threading.Event()
+            # 测试中没有事件循环，槽在工作线程中直接调用
+            thread.chunk_received.connect(lambda _: first_chunk.set(), Qt.ConnectionType.DirectConnection)
+            finished = []
+            thread.stream_finished.connect(finished.append, Qt.ConnectionType.DirectConnection)
+            thread.start()
+            assert first_chunk.wait(5)
+            thread.cancel()
+            assert thread.wait(5000)
+            assert not finished
+            # 请求合并的读取线程在下一个片段处发现没有订阅者，随后关闭上游流并释放名额
+            deadline = time.monotonic() + 5
+            while registry.stats()['mock']['in_flight'] and time.monotonic() < deadline:
+                time.sleep(0.01)
+            assert registry.stats()['mock']['in_flight'] == 0
+            assert group.stats()['in_flight'] == 0
+    finally:
+        AIProviderFactory.set_rate_limits(previous_limits)
+        AIProviderFactory.single_flight = previous_flight
+
+
+def test_cancel_interrupts_stream_stalled_before_first_token():
+    """上游在首字前停滞时中断：cancel() 立即关闭响应（经过请求合并与对冲的读取线程），不等下一个片段"""
+    from PyQt6.QtCore import Qt
+    from core.ai_client import AIStreamThread
+    from models import AIProviderFactory, HedgingPolicy, MessageRecord, SiliconFlowProvider
+    from testutils import FaultServer
+
+    previous = (AIProviderFactory.rate_limits, AIProviderFactory.single_flight, AIProviderFactory.hedging,
+                SiliconFlowProvider.url)
+    registry = RateLimiterRegistry({'': {'rate': 1000.0, 'burst': 100, 'max_concurrency': 1, 'background_reserve': 0}})
+    AIProviderFactory.set_rate_limits(registry)
+    AIProviderFactory.enable_single_flight(True)
+    AIProviderFactory.enable_hedging(HedgingPolicy(default_delay=30.0))
+    try:
+        with FaultServer([('stream', ['迟到'], 0, 5.0)]) as upstream:
+            SiliconFlowProvider.url = upstream.url
+            thread = AIStreamThread("你好", "test-key", (MessageRecord(1, 'user', "你好"),), "deepseek-ai/DeepSeek-V3")
+            errors, finished = [], []
+            thread.error_occurred.connect(errors.append, Qt.ConnectionType.DirectConnection)
+            thread.stream_finished.connect(finished.append, Qt.ConnectionType.DirectConnection)
+            thread.start()
+            deadline = time.monotonic() + 5
+            while not upstream.peak_streams and time.monotonic() < deadline:
+                time.sleep(0.01)
+            started = time.monotonic()
+            thread.cancel()
+            assert thread.wait(4000)
+            assert time.monotonic() - started < 4.0
+            assert not errors and not finished
+            deadline = time.monotonic() + 4
+            while registry.stats()['siliconflow']['in_flight'] and time.monotonic() < deadline:
+                time.sleep(0.01)
+            assert registry.stats()['siliconflow']['in_flight'] == 0
+            assert AIProviderFactory.single_flight.stats()['in_flight'] == 0
+    finally:
+        AIProviderFactory.set_rate_limits(previous[0])
+        AIProviderFactory.single_flight = previous[1]
+        AIProviderFactory.hedging = previous[2]
+        SiliconFlowProvider.url = previous[3]
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+测试渲染结果缓存：内存层按条目数与字节数的LRU淘汰、磁盘层读写与清理、渲染器版本失效，以及删除消息时的清除
+"""
+import os
+import sqlite3
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import utils.render_cache as render_cache
+from utils.render_cache import RenderCache, make_render_key
+
+
+def disk_rows(path):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute('SELECT cache_key, message_id, version FROM render_cache ORDER BY cache_key').fetchall()
+    finally:
+        conn.close()
+
+
+def test_render_key_includes_message_id():
+    assert make_render_key("内容", 3).startswith("3:")
+    assert make_render_key("内容").startswith("-:")
+    assert make_render_key("内容", 3) != make_render_key("别的内容", 3)
+
+
+def test_memory_lru_by_entries():
+    cache = RenderCache(max_entries=2)
+    cache.put('a', 'A')
+    cache.put('b', 'B')
+    assert cache.get('a') == 'A'  # a 变为最近使用
+    cache.put('c', 'C')
+    assert cache.get('b') is None and cache.get('a') == 'A' and cache.get('c') == 'C'
+
+
+def test_memory_lru_by_bytes():
+    cache = RenderCache(max_bytes=10)
+    cache.put('a', 'x' * 4)
+    cache.put('b', 'y' * 4)
+    cache.put('a', 'z' * 5)  # 替换时扣除旧值的大小
+    assert cache._memory_bytes == 9
+    cache.put('c', 'w' * 3)
+    assert list(cache._memory) == ['a', 'c'] and cache._memory_bytes == 8
+    # 单个超出上限的条目不会留在缓存中
+    cache.put('big', 'v' * 11)
+    assert cache.get('big') is None and cache._memory_bytes <= 10
+
+
+def test_disk_tier_round_trip_and_discard_message():
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, 'cache', 'render_cache.db')
+        cache = RenderCache(disk_path=path)
+        first, second, unsaved = make_render_key("一", 1), make_render_key("二", 2), make_render_key("三")
+        cache.save_to_disk(first, '<p>一</p>')
+        cache.save_to_disk(second, '<p>二</p>')
+        cache.save_to_disk(unsaved, '<p>三</p>')
+        cache.put(first, '<p>一</p>')
+        cache.put(second, '<p>二</p>')
+
+        # 重新打开的缓存可读取之前的结果
+        reopened = RenderCache(disk_path=path)
+        assert reopened.load_from_disk(first) == '<p>一</p>' and reopened.load_from_disk(unsaved) == '<p>三</p>'
+        assert reopened.load_from_disk('9:missing') is None
+
+        cache.discard_message(1)
+        assert cache.get(first) is None and cache.get(second) == '<p>二</p>'
+        assert cache.load_from_disk(first) is None and cache.load_from_disk(second) == '<p>二</p>'
+        assert sorted(row[1] for row in disk_rows(path) if row[1] is not None) == [2]
+
+
+def test_renderer_version_invalidates_disk_entries():
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, 'render_cache.db')
+        cache = RenderCache(disk_path=path, max_disk_entries=1000)
+        key = make_render_key("旧版本", 1)
+        cache.save_to_disk(key, '<p>旧</p>')
+        original = render_cache.RENDERER_VERSION
+        render_cache.RENDERER_VERSION = original + 1
+        try:
+            assert cache.load_from_disk(key) is None
+            # 定期清理时删除旧版本的条目
+            for index in range(99):
+                cache.save_to_disk(make_render_key(f"新{index}", 2), '<p>新</p>')
+            assert {row[2] for row in disk_rows(path)} == {original + 1}
+            assert len(disk_rows(path)) == 99
+        finally:
+            render_cache.RENDERER_VERSION = original
+
+
+def test_disk_tier_is_pruned_to_max_entries():
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, 'render_cache.db')
+        cache = RenderCache(disk_path=path, max_disk_entries=10)
+        for index in range(100):
+            cache.save_to_disk(make_render_key(f"消息{index}", index), '<p></p>')
+        assert len(disk_rows(path)) == 10
+
+
+def test_without_disk_cache_disk_calls_are_noops():
+    cache = RenderCache()
+    cache.save_to_disk('1:x', '<p></p>')
+    assert cache.load_from_disk('1:x') is None
+    cache.discard_message(1)
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+测试渲染快照：保存与读取、所属会话的判断，以及损坏、截断或旧版本文件的处理
+"""
+import os
+import struct
+import sys
+import tempfile
+import zlib
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import utils.render_snapshot as render_snapshot
+from utils.render_snapshot import (MAX_SNAPSHOT_TEXT, SnapshotEntry, get_snapshot_path, load_snapshot,
+                                   save_snapshot, snapshot_matches)
+
+ENTRIES = [
+    SnapshotEntry(12, True, 40, "用户的问题"),
+    SnapshotEntry(None, False, 120, "还没有保存的回复\n第二行"),
+]
+
+
+def test_round_trip():
+    with tempfile.TemporaryDirectory() as folder:
+        path = get_snapshot_path(os.path.join(folder, 'chat_history.db'))
+        assert path == os.path.join(folder, 'chat_history.snapshot')
+        save_snapshot(path, '会话-1', ENTRIES)
+        assert load_snapshot(path) == ('会话-1', ENTRIES)
+        assert os.listdir(folder) == ['chat_history.snapshot']  # 临时文件已替换
+
+
+def test_long_text_and_height_are_clamped():
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, 'chat.snapshot')
+        save_snapshot(path, 'c', [SnapshotEntry(1, False, 70000, "字" * (MAX_SNAPSHOT_TEXT + 10))])
+        _, [entry] = load_snapshot(path)
+        assert entry.height == 0xFFFF and entry.text == "字" * MAX_SNAPSHOT_TEXT
+
+
+def test_snapshot_matches_conversation():
+    assert snapshot_matches('会话-1', '会话-1')
+    assert not snapshot_matches('会话-1', '会话-2')
+    assert not snapshot_matches(None, '会话-1')
+
+
+def test_corrupt_truncated_and_stale_files_are_ignored():
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, 'chat.snapshot')
+        assert load_snapshot(path) is None  # 不存在
+
+        with open(path, 'wb') as f:
+            f.write(b'not zlib data')
+        assert load_snapshot(path) is None
+
+        save_snapshot(path, '会话-1', ENTRIES)
+        with open(path, 'rb') as f:
+            data = zlib.decompress(f.read())
+        # 截断在完整字符处（最后一个字占3字节）、截断在头部、魔数不符
+        for broken in (data[:-3], data[:3], b'XXXX' + data[4:]):
+            with open(path, 'wb') as f:
+                f.write(zlib.compress(broken))
+            assert load_snapshot(path) is None
+
+        # 格式版本变化后旧文件不再读取
+        save_snapshot(path, '会话-1', ENTRIES)
+        original = render_snapshot.SNAPSHOT_VERSION
+        render_snapshot.SNAPSHOT_VERSION = original + 1
+        try:
+            assert load_snapshot(path) is None
+        finally:
+            render_snapshot.SNAPSHOT_VERSION = original
+
+
+def test_invalid_utf8_is_ignored():
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, 'chat.snapshot')
+        header = struct.pack('<4sBH', b'NFSN', render_snapshot.SNAPSHOT_VERSION, 2) + b'\xff\xfe'
+        with open(path, 'wb') as f:
+            f.write(zlib.compress(header + struct.pack('<H', 0)))
+        assert load_snapshot(path) is None
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+测试回复缓存：缓存键的规范化、过期时间、内存LRU淘汰、SQLite持久化，以及不完整的流式回复不写入缓存
+"""
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from models import AIProvider, CachedProvider, MessageRecord, ResponseCache, StreamTruncatedError, make_cache_key
+
+MODEL = "glm-4-flash"
+MESSAGES = [{"role": "user", "content": "你好"}]
+
+
+def age_entry(cache, key, seconds):
+    """把条目的创建时间提前 seconds 秒（内存与磁盘）"""
+    created_at, content = cache._memory[key]
+    cache._memory[key] = (created_at - seconds, content)
+    if cache._disk_path:
+        conn = sqlite3.connect(cache._disk_path)
+        conn.execute('UPDATE response_cache SET created_at = created_at - ? WHERE cache_key = ?', (seconds, key))
+        conn.commit()
+        conn.close()
+
+
+class ScriptedProvider(AIProvider):
+    """依次输出片段，可在结束前抛出错误"""
+
+    def __init__(self, chunks, error=None):
+        super().__init__("test-key")
+        self.chunks = chunks
+        self.error = error
+        self.calls = 0
+
+    def chat(self, messages, model, stream=False):
+        return ''.join(self.stream_chat(messages, model))
+
+    def stream_chat(self, messages, model):
+        self.calls += 1
+        yield from self.chunks
+        if self.error is not None:
+            raise self.error
+
+
+def test_cache_key_normalizes_messages():
+    key = make_cache_key(MODEL, MESSAGES)
+    assert make_cache_key(MODEL, [{"role": "User", "content": " 你好\r\n"}]) == make_cache_key(
+        MODEL, [{"role": "user", "content": "你好"}])
+    assert make_cache_key(MODEL, (MessageRecord(1, 'user', "你好"),)) == key
+    assert make_cache_key("glm-4-plus", MESSAGES) != key
+    assert make_cache_key(MODEL, MESSAGES, {"temperature": 0.5}) != key
+
+
+def test_ttl_expiry_in_memory_and_on_disk():
+    with tempfile.TemporaryDirectory() as folder:
+        cache = ResponseCache(ttl_seconds=60, disk_path=os.path.join(folder, 'response_cache.db'))
+        cache.put('k', "回复")
+        assert cache.get('k') == "回复"
+        age_entry(cache, 'k', 120)
+        assert cache.get('k') is None
+        # 过期的磁盘条目被删除
+        assert ResponseCache(disk_path=cache._disk_path).get('k') is None
+        assert cache.stats()['misses'] == 1
+
+        forever = ResponseCache(ttl_seconds=0)
+        forever.put('k', "回复")
+        age_entry(forever, 'k', 10 * 365 * 24 * 3600)
+        assert forever.get('k') == "回复"
+
+
+def test_memory_lru_eviction():
+    cache = ResponseCache(max_entries=2)
+    cache.put('a', "A")
+    cache.put('b', "B")
+    assert cache.get('a') == "A"  # a 变为最近使用
+    cache.put('c', "C")
+    assert cache.get('b') is None and cache.get('a') == "A" and cache.get('c') == "C"
+
+    cache = ResponseCache(max_bytes=10)
+    cache.put('a', "x" * 6)
+    cache.put('b', "y" * 6)
+    assert cache.get('a') is None and cache.get('b') == "y" * 6 and cache._memory_bytes == 6
+
+
+def test_sqlite_persistence_across_instances():
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, 'cache', 'response_cache.db')
+        ResponseCache(disk_path=path).put('k', "持久化的回复")
+
+        reopened = ResponseCache(disk_path=path)
+        assert reopened.get('k') == "持久化的回复"
+        assert reopened.get('k') == "持久化的回复"
+        # 第一次从磁盘读取并回填内存，第二次命中内存
+        stats = reopened.stats()
+        assert stats['disk_hits'] == 1 and stats['memory_hits'] == 1 and stats['memory_entries'] == 1
+
+        reopened.clear()
+        assert ResponseCache(disk_path=path).get('k') is None
+
+
+def test_disk_tier_is_pruned_to_max_entries():
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, 'response_cache.db')
+        cache = ResponseCache(disk_path=path, max_disk_entries=5)
+        for index in range(50):
+            cache.put(f'k{index}', "回复")
+            time.sleep(0.001)  # 访问时间各不相同
+        conn = sqlite3.connect(path)
+        keys = {row[0] for row in conn.execute('SELECT cache_key FROM response_cache')}
+        conn.close()
+        # 保留最近访问的条目
+        assert keys == {f'k{index}' for index in range(45, 50)}
+
+
+def test_only_complete_streams_are_cached():
+    cache = ResponseCache()
+    key = make_cache_key(MODEL, MESSAGES)
+
+    # 在结束标记之前断开：抛出错误，不写入缓存
+    truncated = CachedProvider(ScriptedProvider(["半", "句"], StreamTruncatedError()), cache)
+    received = []
+    try:
+        for chunk in truncated.stream_chat(MESSAGES, MODEL):
+            received.append(chunk)
+        raise AssertionError("提前断开应当抛出")
+    except StreamTruncatedError:
+        pass
+    assert received == ["半", "句"] and cache.get(key) is None
+
+    # 调用方中途放弃（关闭生成器）同样不写入
+    abandoned = CachedProvider(ScriptedProvider(["一", "二"]), cache)
+    stream = abandoned.stream_chat(MESSAGES, MODEL)
+    assert next(stream) == "一"
+    stream.close()
+    assert cache.get(key) is None
+
+    # 完整结束的回复写入缓存，之后的相同请求按片段回放
+    upstream = ScriptedProvider(["完", "整"])
+    complete = CachedProvider(upstream, cache)
+    assert ''.join(complete.stream_chat(MESSAGES, MODEL)) == "完整" and not complete.cache_hit
+    assert ''.join(complete.stream_chat(MESSAGES, MODEL)) == "完整" and complete.cache_hit
+    assert upstream.calls == 1
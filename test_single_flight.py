@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+测试相同请求合并：并发的重复请求只发出一次上游请求，后加入的请求从头回放，错误与中途退出互不影响，
+所有订阅者离开后立即中止停滞的上游流
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from models import ProviderError, SiliconFlowProvider, SingleFlight, SingleFlightProvider
+from models.async_providers import AsyncSingleFlightProvider
+from models.single_flight import AsyncSingleFlight
+from models.transport import close_async_client
+from testutils import FaultServer, make_async_provider
+
+MODEL = "deepseek-ai/DeepSeek-V3"
+MESSAGES = [{"role": "user", "content": "你好"}]
+
+
+def make_provider(url, group, api_key="test-key", idle_timeout=2.0):
+    provider = SiliconFlowProvider(api_key)
+    provider.url = url
+    provider.configure_timeouts(1.0, idle_timeout, idle_timeout)
+    return SingleFlightProvider(provider, group)
+
+
+def stream_all(providers, messages=MESSAGES, stagger=0.0):
+    """在多个线程中同时发起流式请求，返回各自收到的文本（出错时为异常对象）"""
+    results = [None] * len(providers)
+
+    def run(index, provider):
+        try:
+            results[index] = ''.join(provider.stream_chat(messages, MODEL))
+        except Exception as e:
+            results[index] = e
+
+    threads = []
+    for index, provider in enumerate(providers):
+        threads.append(threading.Thread(target=run, args=(index, provider)))
+        threads[-1].start()
+        time.sleep(stagger)
+    for thread in threads:
+        thread.join(10)
+    return results
+
+
+def test_duplicates_share_one_upstream_request():
+    # 上游在第一段后停顿：后加入的请求需要先回放已收到的片段
+    server = FaultServer([('stream', ['第一段', '第二段', '第三段'], 1, 0.4)] * 5)
+    try:
+        group = SingleFlight()
+        results = stream_all([make_provider(server.url, group) for _ in range(5)], stagger=0.05)
+        assert results == ["第一段第二段第三段"] * 5
+        assert server.requests == 1
+        assert group.stats() == {"flights": 1, "coalesced": 4, "in_flight": 0}
+    finally:
+        server.close()
+
+
+def test_different_requests_are_not_merged():
+    server = FaultServer([('stream', ['甲'], 0, 0.2), ('stream', ['乙'], 0, 0.2)])
+    try:
+        group = SingleFlight()
+        # API密钥不同的相同消息各自请求
+        results = stream_all([make_provider(server.url, group, "key-a"), make_provider(server.url, group, "key-b")])
+        assert sorted(results) == ["乙", "甲"]
+        assert server.requests == 2
+    finally:
+        server.close()
+
+
+def test_errors_reach_every_subscriber():
+    server = FaultServer([('status', 400)])
+    try:
+        group = SingleFlight()
+        results = stream_all([make_provider(server.url, group) for _ in range(3)])
+        assert all(isinstance(result, ProviderError) and result.status_code == 400 for result in results)
+        assert server.requests <= 3
+    finally:
+        server.close()
+
+
+def test_leaving_subscriber_does_not_cancel_others():
+    server = FaultServer([('stream', ['一', '二', '三'], 1, 0.3)])
+    try:
+        group = SingleFlight()
+        leaving = make_provider(server.url, group).stream_chat(MESSAGES, MODEL)
+        assert next(leaving) == "一"
+        staying = make_provider(server.url, group)
+        result = []
+        thread = threading.Thread(target=lambda: result.append(''.join(staying.stream_chat(MESSAGES, MODEL))))
+        thread.start()
+        time.sleep(0.1)
+        leaving.close()
+        thread.join(5)
+        assert result == ["一二三"] and server.requests == 1
+    finally:
+        server.close()
+
+
+def test_last_subscriber_leaving_aborts_stalled_upstream():
+    """上游在第一段后停滞5秒：最后一个订阅者离开时立即关闭响应，不等下一个片段或空闲时限"""
+    with FaultServer([('stream', ['一', '二'], 1, 5.0)]) as server:
+        provider = make_provider(server.url, SingleFlight(), idle_timeout=10.0)
+        stream = provider.stream_chat(MESSAGES, MODEL)
+        assert next(stream) == "一"
+        started = time.monotonic()
+        stream.close()
+        flight = provider._flight
+        while not flight.done and time.monotonic() - started < 4.0:
+            time.sleep(0.02)
+        assert flight.done and flight.chunks == ["一"]
+
+
+def test_async_last_subscriber_leaving_cancels_pump():
+    with FaultServer([('stream', ['一', '二'], 1, 5.0)]) as server:
+        group = AsyncSingleFlight()
+
+        async def main():
+            try:
+                provider = AsyncSingleFlightProvider(make_async_provider(server.url, idle_timeout=10.0), group)
+                stream = provider.chat_stream(MESSAGES, MODEL)
+                assert await stream.__anext__() == "一"
+                flights, _ = group._state()
+                (flight,) = flights.values()
+                await stream.aclose()
+                # 读取任务被取消，不等上游停滞结束
+                await asyncio.wait({flight.task}, timeout=4.0)
+                return flight.task.done()
+            finally:
+                await close_async_client()
+
+        assert asyncio.run(main())
+        assert group.stats()["in_flight"] == 0
+
+
+def test_completed_flight_is_not_reused():
+    server = FaultServer([('stream', ['第一次']), ('stream', ['第二次'])])
+    try:
+        group = SingleFlight()
+        assert ''.join(make_provider(server.url, group).stream_chat(MESSAGES, MODEL)) == "第一次"
+        assert ''.join(make_provider(server.url, group).stream_chat(MESSAGES, MODEL)) == "第二次"
+    finally:
+        server.close()
+
+
+def test_async_duplicates_share_one_upstream_request():
+    server = FaultServer([('stream', ['前半', '后半'], 1, 0.3)] * 10)
+    try:
+        group = AsyncSingleFlight()
+
+        async def one(delay):
+            await asyncio.sleep(delay)
+            provider = AsyncSingleFlightProvider(make_async_provider(server.url), group)
+            return ''.join([chunk async for chunk in provider.chat_stream(MESSAGES, MODEL)])
+
+        async def main():
+            try:
+                return await asyncio.gather(*(one(index * 0.02) for index in range(10)))
+            finally:
+                await close_async_client()
+
+        assert asyncio.run(main()) == ["前半后半"] * 10
+        assert server.requests == 1
+        assert group.stats()["coalesced"] == 9
+    finally:
+        server.close()
@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+"""
+测试启动路径：core/models 包导入时不加载重量级依赖，窗口在延迟初始化完成前即可关闭
+"""
+import os
+import subprocess
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+# 首次使用时才导入的依赖（SDK、HTTP客户端、语法高亮、配置解密与界面库）
+HEAVY_MODULES = ('zhipuai', 'requests', 'httpx', 'pygments', 'cryptography', 'PyQt6')
+
+
+def test_package_imports_are_lazy():
+    # 在新进程中导入，不受其他测试已加载模块的影响
+    code = ("import sys, core, models, utils.markdown_renderer; "
+            f"print(','.join(name for name in {HEAVY_MODULES!r} if name in sys.modules))")
+    result = subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == ''
+
+
+def test_window_closes_before_deferred_init():
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    from PyQt6.QtWidgets import QApplication
+    from ui.main_window import ChatWindow
+
+    app = QApplication.instance() or QApplication(sys.argv)
+    window = ChatWindow()
+    # 未绘制首帧：配置、数据库与异步流选项都还没有加载
+    assert not window._initialized and window.async_streams is False
+    window.close()
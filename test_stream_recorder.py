@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+测试流式响应的录制与回放：录制真实客户端的原始字节块，回放时按速度缩放间隔并得到相同的片段
+"""
+import asyncio
+import gzip
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from models import (AIProviderFactory, MockScenario, ReplayProvider, SiliconFlowProvider, StreamRecorder,
+                    StreamReplayer, StreamStalledError, ZhipuAIProvider, load_recordings)
+from models.stream_recorder import StreamRecording, split_lines
+from utils.mock_server import MockStreamServer
+
+MESSAGES = [{"role": "user", "content": "介绍一下自己"}]
+
+
+def record_streams(path: str, scenario: MockScenario):
+    """经由模拟服务录制硅基流动与智谱各一段，返回客户端收到的片段"""
+    received = {}
+    AIProviderFactory.enable_stream_recording(StreamRecorder(path))
+    try:
+        with MockStreamServer(scenario) as server:
+            server.point_providers()
+            received['siliconflow'] = list(SiliconFlowProvider("key").stream_chat(MESSAGES, "deepseek-ai/DeepSeek-V3"))
+            received['zhipu'] = list(ZhipuAIProvider("key").stream_chat(MESSAGES, "glm-z1-flash"))
+    finally:
+        AIProviderFactory.enable_stream_recording(None)
+    return received
+
+
+def test_split_lines_matches_requests():
+    chunks = [b"data: {\"a\"", b": 1}\n\nda", b"ta: [DONE]\n", b"\n", b"tail"]
+    assert list(split_lines(chunks)) == [b'data: {"a": 1}', b'', b'data: [DONE]', b'', b'tail']
+
+
+def test_record_and_replay_round_trip():
+    scenario = MockScenario(ttft=0.05, tokens_per_second=100, reply_tokens=20, reasoning_tokens=3)
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, 'streams.nfsr')
+        received = record_streams(path, scenario)
+        recordings = load_recordings(path)
+        assert [r.provider for r in recordings] == ['siliconflow', 'zhipu']
+        assert all(r.complete for r in recordings)
+        siliconflow = recordings[0]
+        assert siliconflow.model == "deepseek-ai/DeepSeek-V3"
+        assert siliconflow.text() == ''.join(received['siliconflow'])
+        # 第一个间隔包含首字延迟，总时长接近场景的时长
+        assert siliconflow.chunks[0][0] >= 0.05 and siliconflow.duration >= 0.05 + 0.2
+        # 压缩后明显小于原始SSE字节
+        assert os.path.getsize(path) < sum(r.size for r in recordings) / 3
+
+        # 不限速回放：按模型选择录制，得到相同的片段
+        replayer = StreamReplayer.load(path, speed=0)
+        assert list(ReplayProvider(replayer).stream_chat(MESSAGES, "glm-z1-flash")) == received['zhipu']
+        assert list(ReplayProvider(replayer).stream_chat(MESSAGES, "deepseek-ai/DeepSeek-V3")) == \
+            received['siliconflow']
+
+        # 加速回放：等待时间按速度缩放
+        sleeps = []
+        list(ReplayProvider(StreamReplayer(recordings, speed=4), sleep=sleeps.append).stream_chat(
+            MESSAGES, "deepseek-ai/DeepSeek-V3"))
+        assert abs(sum(sleeps) - siliconflow.duration / 4) < 1e-3
+
+
+def test_factory_replays_for_sync_and_async():
+    recording = StreamRecording('siliconflow', 'deepseek-ai/DeepSeek-V3', [
+        (0.0, b'data: {"choices": [{"delta": {"content": "\xe4\xbd'),
+        (0.0, b'\xa0\xe5\xa5\xbd"}}]}\n\ndata: [DONE]\n\n'),
+    ])
+    AIProviderFactory.enable_replay(StreamReplayer([recording], speed=0))
+    try:
+        # 没有该模型的录制时使用任意录制；多字节字符被拆在两个字节块中
+        provider = AIProviderFactory.create_provider("glm-4-plus", "key")
+        assert list(provider.stream_chat(MESSAGES, "glm-4-plus")) == ["你好"]
+
+        async def run():
+            async_provider = AIProviderFactory.create_async_provider("glm-4-plus", "key")
+            return [chunk async for chunk in async_provider.chat_stream(MESSAGES, "glm-4-plus")]
+
+        assert asyncio.run(run()) == ["你好"]
+    finally:
+        AIProviderFactory.enable_replay(None)
+
+
+def test_interrupted_stream_and_truncated_file():
+    scenario = MockScenario(ttft=0, tokens_per_second=0, reply_tokens=200)
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, 'streams.nfsr')
+        recorder = StreamRecorder(path)
+        AIProviderFactory.enable_stream_recording(recorder)
+        try:
+            with MockStreamServer(scenario) as server:
+                server.point_providers()
+                stream = SiliconFlowProvider("key").stream_chat(MESSAGES, "deepseek-ai/DeepSeek-V3")
+                next(stream)
+                stream.close()  # 调用方提前结束
+        finally:
+            AIProviderFactory.enable_stream_recording(None)
+        assert recorder.recorded == 1 and not load_recordings(path)[0].complete
+
+        # 写了一半的录制被忽略
+        recorder.save(StreamRecording('zhipu', 'glm-4-plus', [(0.1, b'data: {}\n\n')]))
+        with open(path, 'ab') as f:
+            f.write(gzip.compress(StreamRecording('zhipu', 'x', [(0.1, b'data')]).to_bytes())[:-6])
+        assert [r.model for r in load_recordings(path)] == ['deepseek-ai/DeepSeek-V3', 'glm-4-plus']
+
+
+def test_replay_reports_stalls():
+    recording = StreamRecording('siliconflow', 'm', [
+        (0.0, b'data: {"choices": [{"delta": {"content": "a"}}]}\n\n'),
+        (30.0, b'data: {"choices": [{"delta": {"content": "b"}}]}\n\ndata: [DONE]\n\n'),
+    ])
+    sleeps = []
+    provider = ReplayProvider(StreamReplayer([recording], speed=1), sleep=sleeps.append)
+    provider.configure_timeouts(1.0, 2.0, 5.0)
+    chunks = []
+    try:
+        for chunk in provider.stream_chat(MESSAGES, 'm'):
+            chunks.append(chunk)
+        raise AssertionError("应当检测到停滞")
+    except StreamStalledError:
+        assert chunks == ['a'] and sleeps == [5.0]
+    # 加速后不再超过空闲超时
+    provider = ReplayProvider(StreamReplayer([recording], speed=10), sleep=sleeps.append)
+    provider.configure_timeouts(1.0, 2.0, 5.0)
+    assert list(provider.stream_chat(MESSAGES, 'm')) == ['a', 'b']
+
+
+class ChatOptions:
+    """只提供 [CHAT] 选项的配置替身"""
+
+    def __init__(self, **options):
+        self.options = options
+
+    def get_chat_option(self, name, default=""):
+        return self.options.get(name, default)
+
+
+def test_invalid_replay_settings_leave_replay_disabled():
+    from core.provider_setup import _load_replayer
+
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, 'streams.nfsr')
+        StreamRecorder(path).save(StreamRecording('zhipu', 'glm-4-plus', [(0.0, b'data: [DONE]\n\n')]))
+        with open(os.path.join(folder, 'broken.nfsr'), 'wb') as f:
+            f.write(b'not a recording')
+        open(os.path.join(folder, 'empty.nfsr'), 'wb').close()
+
+        assert _load_replayer(ChatOptions(), folder) is None
+        replayer = _load_replayer(ChatOptions(replay_streams='streams.nfsr', replay_speed='2'), folder)
+        assert replayer.speed == 2.0 and len(replayer.recordings) == 1
+        # 文件不存在、不是录制文件、没有录制，以及回放速度无效时都只打印警告
+        for options in (dict(replay_streams='missing.nfsr'), dict(replay_streams='broken.nfsr'),
+                        dict(replay_streams='empty.nfsr'), dict(replay_streams='streams.nfsr', replay_speed='快')):
+            assert _load_replayer(ChatOptions(**options), folder) is None
@@ -77,6 +77,7 @@ class TestWindow(QMainWindow):
             message_widget.append_content(chunk)
             # 模拟延迟
             QApplication.processEvents()
+        message_widget.finish_streaming()
         
         print("已完成流式thinking测试")
 
@@ -88,7 +89,7 @@ def main():
     print("思考内容处理测试")
     print("测试项目：")
     print("1. 静态thinking内容不应该出现在正常气泡中")
-    print("2. 思考过程完成后不应该自动隐藏")
+    print("2. 思考过程完成后折叠为摘要行，点击可展开")
     
     sys.exit(app.exec())
 
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+测试思考过程面板：摘要行文本、流式时只显示尾部，以及完成后折叠、正文在展开时才创建
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+from ui.widgets import MessageWidget, thinking_summary, thinking_tail
+
+
+def test_summary_text():
+    assert thinking_summary(12, completed=False, expanded=True) == "思考中...（12 字）  ▾ 收起"
+    assert thinking_summary(12, completed=True, duration=3.14) == "思考过程（12 字，用时 3.1 秒）  ▸ 展开"
+    # 从历史记录加载的消息没有用时
+    assert thinking_summary(12, completed=True) == "思考过程（12 字）  ▸ 展开"
+
+
+def test_tail_keeps_last_lines_and_chars():
+    assert thinking_tail("短内容", 600, 8) == "短内容▊"
+    lines = "\n".join(f"第{index}行" for index in range(20))
+    assert thinking_tail(lines, 600, 3) == "…第17行\n第18行\n第19行▊"
+    # 单行超长时按字符数截断
+    assert thinking_tail("字" * 50, 10, 8) == "…" + "字" * 10 + "▊"
+
+
+def test_panel_collapses_when_thinking_completes():
+    from PyQt6.QtWidgets import QApplication
+    app = QApplication.instance() or QApplication(sys.argv)
+
+    widget = MessageWidget("", align_right=False)
+    assert widget.thinking_header is None  # 没有思考内容时不创建
+    widget.append_content("<think>" + "\n".join(f"推理{index}" for index in range(20)))
+    assert widget.thinking_header.text().startswith("思考中...") and widget._thinking_expanded
+    assert widget.thinking_label.text().startswith("…") and widget.thinking_label.text().endswith("推理19▊")
+
+    widget.append_content("</think>回答")
+    assert not widget._thinking_expanded and widget.thinking_header.text().startswith("思考过程（")
+    assert widget.thinking_label.isHidden()
+
+    # 展开后显示完整内容，不再带光标
+    widget._toggle_thinking()
+    assert widget.thinking_label.text().startswith("推理0") and not widget.thinking_label.text().endswith("▊")
+    widget.close()
+
+
+def test_history_message_starts_collapsed_without_body():
+    from PyQt6.QtWidgets import QApplication
+    app = QApplication.instance() or QApplication(sys.argv)
+
+    widget = MessageWidget("<think>历史推理</think>历史回答", align_right=False)
+    assert widget.thinking_header.text() == "思考过程（4 字）  ▸ 展开"
+    assert widget.thinking_label is None  # 折叠时不创建正文
+    widget._toggle_thinking()
+    assert widget.thinking_label.text() == "历史推理"
+    widget.close()
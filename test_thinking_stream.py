@@ -33,7 +33,8 @@ class TestWindow(QMainWindow):
         test_button.clicked.connect(self.start_streaming_test)
         layout.addWidget(test_button)
         
-        self.current_message_widget = None        self.test_content_chunks = [
+        self.current_message_widget = None
+        self.test_content_chunks = [
             "<think>",
             "我需要仔细分析这个问题。",
             "首先，让我理解用户的需求：",
@@ -77,8 +78,10 @@ class TestWindow(QMainWindow):
             
             self.chunk_index += 1
         else:
-            # 测试完成
+            # 测试完成，切换到完整富文本渲染
             self.timer.stop()
+            if self.current_message_widget:
+                self.current_message_widget.finish_streaming()
             print("流式测试完成！")
 
 def main():
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+测试端到端延迟追踪：未启用时为空操作，标签绑定、环形缓冲区、Chrome trace与SQLite导出，以及服务商与流式线程的打点
+"""
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from utils.tracing import _NULL_SPAN, Tracer, tracer
+
+MESSAGES = [{"role": "user", "content": "你好"}]
+
+
+def test_disabled_tracer_is_noop():
+    t = Tracer()
+    with t.span('x', model='m') as span:
+        span.tag(chars=1)
+    t.instant('y')
+    t.end(t.begin('z'))
+    with t.bind(conversation='c'):
+        t.complete('w', time.perf_counter_ns())
+    assert t.events() == []
+    # 未启用时不创建span对象，也不记录任何事件
+    recorded = []
+    t._record = lambda *args: recorded.append(args)
+    assert t.span('ui.flush', chars=1) is _NULL_SPAN and t.begin('chat.turn') is None
+    with t.span('ui.flush', chars=1):
+        t.instant('stream.first_token')
+    t.complete('db.save', time.perf_counter_ns())
+    assert recorded == []
+
+
+def test_spans_tags_and_ring_buffer():
+    t = Tracer(capacity=5)
+    t.enable()
+    with t.bind(model='glm-4-plus', conversation='c1'):
+        with t.span('db.save', role='user'):
+            time.sleep(0.002)
+        t.instant('provider.first_byte')
+    turn = t.begin('chat.turn', model='m2')
+    try:
+        with t.span('ui.flush'):
+            raise ValueError("失败")
+    except ValueError:
+        pass
+    t.end(turn, chunks=3)
+
+    events = {event.name: event for event in t.events()}
+    assert events['db.save'].tags == {'model': 'glm-4-plus', 'conversation': 'c1', 'role': 'user'}
+    assert events['db.save'].duration_ns >= 2_000_000
+    assert events['provider.first_byte'].duration_ns is None
+    assert events['ui.flush'].tags == {'error': 'ValueError'}
+    assert events['chat.turn'].tags == {'model': 'm2', 'chunks': 3}
+
+    # 其他线程中的记录不继承本线程绑定的标签
+    def worker():
+        t.set_tags(conversation='c2')
+        t.instant('stream.first_token')
+
+    with t.bind(model='not-inherited'):
+        thread = threading.Thread(target=worker)
+        thread.start()
+        thread.join()
+    assert t.events()[-1].tags == {'conversation': 'c2'}
+
+    for _ in range(10):
+        t.instant('tick')
+    assert len(t.events()) == 5
+
+
+def test_chrome_trace_and_sqlite_export():
+    t = Tracer()
+    t.enable()
+    with t.span('db.persist', model='m', conversation='c'):
+        pass
+    t.instant('stream.end', model='m', conversation='c')
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, 'trace.json')
+        t.export_chrome_trace(path)
+        with open(path, encoding='utf-8') as f:
+            trace = json.load(f)
+        phases = {event['name']: event for event in trace['traceEvents']}
+        assert phases['db.persist']['ph'] == 'X' and phases['db.persist']['cat'] == 'db'
+        assert phases['stream.end']['ph'] == 'i' and phases['stream.end']['args']['conversation'] == 'c'
+        assert phases['thread_name']['ph'] == 'M'
+
+        db_path = os.path.join(folder, 'trace_metrics.db')
+        assert t.export_sqlite(db_path) == 2
+        t.export_sqlite(db_path)
+        conn = sqlite3.connect(db_path)
+        rows = conn.execute("SELECT name, duration_ms IS NULL, model, conversation FROM trace_spans "
+                            "ORDER BY id").fetchall()
+        conn.close()
+        assert rows[:2] == [('db.persist', 0, 'm', 'c'), ('stream.end', 1, 'm', 'c')] and len(rows) == 4
+
+
+def test_provider_and_stream_thread_spans():
+    from core.ai_client import AIStreamThread
+    from models import (AIProviderFactory, MessageRecord, MockScenario, RateLimiterRegistry, SiliconFlowProvider)
+    from utils.mock_server import MockStreamServer
+
+    tracer.enable()
+    tracer.clear()
+    previous_limits = AIProviderFactory.rate_limits
+    AIProviderFactory.set_rate_limits(RateLimiterRegistry({'': {'rate': 1000.0, 'burst': 1000}}))
+    try:
+        with MockStreamServer(MockScenario(ttft=0.02, tokens_per_second=0, reply_tokens=10)) as server:
+            server.point_providers()
+            with tracer.bind(conversation='conv-1'):
+                assert list(SiliconFlowProvider("key").stream_chat(MESSAGES, "deepseek-ai/DeepSeek-V3"))
+        events = tracer.events()
+        connect = next(e for e in events if e.name == 'provider.connect')
+        first_byte = next(e for e in events if e.name == 'provider.first_byte')
+        assert connect.tags == {'conversation': 'conv-1', 'provider': 'siliconflow', 'model': 'deepseek-ai/DeepSeek-V3'}
+        assert first_byte.start_ns >= connect.start_ns + connect.duration_ns
+
+        # 在当前线程中直接运行流式线程的主体
+        tracer.clear()
+        thread = AIStreamThread("你好", "mock", (MessageRecord(1, 'user', "你好"),), "mock/fast")
+        thread.trace_tags = {'conversation': 'conv-2'}
+        thread.run()
+        names = [e.name for e in tracer.events()]
+        assert names[:2] == ['stream.assemble_context', 'stream.first_token'] and names[-1] == 'stream.request'
+        request = tracer.events()[-1]
+        assert request.tags['conversation'] == 'conv-2' and request.tags['model'] == 'mock/fast'
+        assert request.tags['chunks'] > 0
+    finally:
+        tracer.disable()
+        tracer.clear()
+        AIProviderFactory.set_rate_limits(previous_limits)
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+测试智谱直连流式请求：SSE解析、错误分类与回退到SDK
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from models import ProviderError, ZhipuAIProvider
+from testutils import run_with_server
+
+MESSAGES = [{"role": "user", "content": "你好"}]
+
+
+class SdkStandIn(ZhipuAIProvider):
+    """用替身代替SDK流式请求，记录是否发生回退"""
+
+    def __init__(self, api_key, url):
+        super().__init__(api_key)
+        self.url = url
+        self.sdk_calls = 0
+
+    def _iter_sdk_stream(self, messages, model):
+        self.sdk_calls += 1
+        yield "来自SDK"
+
+
+def test_raw_stream_parses_sse():
+    def check(server):
+        provider = SdkStandIn("raw-key", server.url)
+        assert ''.join(provider.stream_chat(MESSAGES, "glm-4-plus")) == "你好，世界"
+        assert provider.sdk_calls == 0 and provider._client is None
+    run_with_server([('stream', ['你好', '，', '世界'])], check)
+
+
+def test_rejected_raw_request_falls_back_to_sdk():
+    def check(server):
+        provider = SdkStandIn("fallback-key", server.url)
+        assert ''.join(provider.stream_chat(MESSAGES, "glm-4-plus")) == "来自SDK"
+        # 同一API密钥之后直接使用SDK
+        assert ''.join(provider.stream_chat(MESSAGES, "glm-4-plus")) == "来自SDK"
+        assert provider.sdk_calls == 2 and server.requests == 1
+    run_with_server([('status', 401)], check)
+
+
+def test_server_errors_are_not_fallbacks():
+    def check(server):
+        provider = SdkStandIn("error-key", server.url)
+        try:
+            ''.join(provider.stream_chat(MESSAGES, "glm-4-plus"))
+            raise AssertionError("应当抛出429")
+        except ProviderError as e:
+            assert e.status_code == 429 and e.retryable and e.retry_after == 1.0
+        assert provider.sdk_calls == 0
+    run_with_server([('status', 429, {'Retry-After': '1'})], check)
+
+
+def test_sdk_transport_when_disabled():
+    provider = SdkStandIn("sdk-key", "http://127.0.0.1:1/")
+    provider.raw_http = False
+    assert ''.join(provider.stream_chat(MESSAGES, "glm-4-plus")) == "来自SDK"
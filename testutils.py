@@ -0,0 +1,141 @@
+"""
+测试共用的本地服务与服务商构造
+FaultServer 是按脚本响应的本地HTTP服务器：依次返回错误状态码、流式回复（可在中途停滞）或提前断开的流
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from models import AsyncSiliconFlowProvider, ResiliencePolicy, ResilientProvider, SiliconFlowProvider
+
+
+def sse_line(text):
+    return f"data: {json.dumps({'choices': [{'delta': {'content': text}}]})}\n\n".encode('utf-8')
+
+
+class FaultHandler(BaseHTTPRequestHandler):
+    """按服务器上的脚本依次处理请求（流式响应使用分块传输，与真实服务一致）"""
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def write_chunk(self, data: bytes):
+        self.wfile.write(f"{len(data):x}\r\n".encode('ascii') + data + b"\r\n")
+        self.wfile.flush()
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        server = self.server
+        with server.lock:
+            server.requests += 1
+            action = server.script.pop(0) if server.script else ('stream', ['ok'])
+        kind = action[0]
+
+        if kind == 'status':
+            status, headers = action[1], action[2] if len(action) > 2 else {}
+            body = json.dumps({"error": f"injected {status}"}).encode('utf-8')
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
+        # ('stream', 片段列表, 停滞前发送的片段数, 停滞秒数)；('truncated', 片段列表) 发送后不发 [DONE] 直接结束
+        chunks = action[1]
+        stall_after = action[2] if len(action) > 2 else None
+        stall_seconds = action[3] if len(action) > 3 else 0
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        self.wfile.flush()
+        with server.lock:
+            server.open_streams += 1
+            server.peak_streams = max(server.peak_streams, server.open_streams)
+        try:
+            for index, chunk in enumerate(chunks):
+                if index == stall_after:
+                    time.sleep(stall_seconds)
+                self.write_chunk(sse_line(chunk))
+            if stall_after == len(chunks):
+                time.sleep(stall_seconds)
+            if kind != 'truncated':
+                self.write_chunk(b"data: [DONE]\n\n")
+            self.write_chunk(b"")
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+        finally:
+            with server.lock:
+                server.open_streams -= 1
+
+
+class FaultHTTPServer(ThreadingHTTPServer):
+    # 并发测试会同时发起几十个连接，默认的监听队列（5）会导致连接超时
+    request_queue_size = 128
+
+
+class FaultServer:
+    """在后台线程中运行的 FaultHTTPServer；peak_streams 为同时进行中的流式响应数的最大值"""
+
+    def __init__(self, script):
+        self.httpd = FaultHTTPServer(('127.0.0.1', 0), FaultHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.lock = threading.Lock()
+        self.httpd.requests = 0
+        self.httpd.open_streams = 0
+        self.httpd.peak_streams = 0
+        self.httpd.script = list(script)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}/v1/chat/completions"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    @property
+    def requests(self):
+        return self.httpd.requests
+
+    @property
+    def peak_streams(self):
+        return self.httpd.peak_streams
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+POLICY = ResiliencePolicy(connect_timeout=1.0, read_timeout=2.0, idle_timeout=0.5,
+                          max_retries=2, backoff_base=0.01, backoff_max=0.5)
+
+
+def make_provider(url, policy=POLICY):
+    """指向 url 的硅基流动服务商（带容错策略），返回 (服务商, 重试等待记录)"""
+    sleeps = []
+    provider = SiliconFlowProvider("test-key")
+    provider.url = url
+    return ResilientProvider(provider, policy, sleep=sleeps.append), sleeps
+
+
+def make_async_provider(url, idle_timeout=2.0):
+    """指向 url 的异步硅基流动服务商"""
+    provider = AsyncSiliconFlowProvider("test-key")
+    provider.url = url
+    provider.configure_timeouts(1.0, 2.0, idle_timeout)
+    return provider
+
+
+def run_with_server(script, check):
+    """启动按 script 响应的服务器，调用 check(server) 后关闭"""
+    server = FaultServer(script)
+    try:
+        check(server)
+    finally:
+        server.close()
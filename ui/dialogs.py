@@ -2,7 +2,8 @@
 对话框组件
 """
 from PyQt6.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QLabel, QPushButton, 
-                             QTextEdit, QFormLayout, QWidget)
+                             QTextEdit, QFormLayout, QWidget, QCheckBox, QComboBox, QTableWidget,
+                             QTableWidgetItem, QHeaderView, QAbstractItemView)
 from PyQt6.QtCore import Qt
 from PyQt6.QtGui import QIcon
 from utils.resources import resource_path
@@ -15,7 +16,7 @@ class ModelSelectionDialog(QDialog):
         super().__init__(parent)
         self.config_manager = config_manager
         self.setWindowTitle("选择模型")
-        self.setFixedSize(400, 580)
+        self.setFixedSize(400, 640)
         self.setWindowFlags(self.windowFlags() & ~Qt.WindowType.WindowMaximizeButtonHint)
         self.setup_ui()
         
@@ -146,6 +147,29 @@ class ModelSelectionDialog(QDialog):
             self.model_buttons.append((radio, model))
             layout.addWidget(radio)
 
+        # 自动路由：在等价模型组中选择最快的可用模型
+        auto_button = QPushButton("auto - 自动选择最快的可用模型")
+        auto_button.setCheckable(True)
+        auto_button.setAutoExclusive(True)
+        auto_button.setFixedHeight(40)
+        auto_button.setStyleSheet(radio.styleSheet())
+        if not self.config_manager.get_api_key_for_model("auto"):
+            auto_button.setDisabled(True)
+            auto_button.setToolTip("请先设置API Key")
+        self.model_buttons.append((auto_button, "auto"))
+        layout.addWidget(auto_button)
+
+        # 本地模拟模型（[CHAT] mock_models = true 时列出，不需要API Key）
+        from models import AIProviderFactory
+        for model in AIProviderFactory.get_supported_models().get("本地模拟", []):
+            mock_button = QPushButton(f"{model} - 本地模拟（离线测试）")
+            mock_button.setCheckable(True)
+            mock_button.setAutoExclusive(True)
+            mock_button.setFixedHeight(40)
+            mock_button.setStyleSheet(radio.styleSheet())
+            self.model_buttons.append((mock_button, model))
+            layout.addWidget(mock_button)
+
         # 底部按钮区域
         button_layout = QHBoxLayout()
         
@@ -202,7 +226,11 @@ class ModelSelectionDialog(QDialog):
         siliconflow_key = self.config_manager.get_api_key("deepseek")
         
         for button, model in self.model_buttons:
-            if model.startswith("glm-"):
+            if model == "auto":
+                button.setEnabled(bool(self.config_manager.get_api_key_for_model("auto")))
+            elif model.startswith("mock"):
+                continue
+            elif model.startswith("glm-"):
                 button.setEnabled(bool(glm_key.strip()))
             else:
                 button.setEnabled(bool(siliconflow_key.strip()))
@@ -215,6 +243,159 @@ class ModelSelectionDialog(QDialog):
         return None
 
 
+class ModelComparisonDialog(QDialog):
+    """多模型对比对话框：选择同时提问的模型"""
+    
+    def __init__(self, config_manager, selected_models=None, parent=None):
+        super().__init__(parent)
+        self.config_manager = config_manager
+        self.setWindowTitle("多模型对比")
+        self.setFixedWidth(400)
+        self.setWindowFlags(self.windowFlags() & ~Qt.WindowType.WindowMaximizeButtonHint)
+        self.setup_ui(selected_models or [])
+        
+    def setup_ui(self, selected_models):
+        layout = QVBoxLayout(self)
+        layout.setSpacing(12)
+        layout.setContentsMargins(20, 20, 20, 20)
+        
+        title = QLabel("选择要同时对比的模型（至少两个）")
+        title.setStyleSheet("QLabel { font-size: 14px; font-weight: bold; color: #333; }")
+        layout.addWidget(title)
+        
+        from models import AIProviderFactory
+        self.model_checkboxes = []
+        for models in AIProviderFactory.get_supported_models().values():
+            for model in models:
+                checkbox = QCheckBox(model)
+                checkbox.setChecked(model in selected_models)
+                if not self.config_manager.get_api_key_for_model(model):
+                    checkbox.setDisabled(True)
+                    checkbox.setChecked(False)
+                    checkbox.setToolTip("请先设置对应的API Key")
+                self.model_checkboxes.append((checkbox, model))
+                layout.addWidget(checkbox)
+        
+        button_layout = QHBoxLayout()
+        cancel_button = QPushButton("关闭对比")
+        cancel_button.setFixedSize(100, 35)
+        cancel_button.setStyleSheet(StyleManager.get_model_button_style())
+        cancel_button.clicked.connect(self.reject)
+        confirm_button = QPushButton("开始对比")
+        confirm_button.setFixedSize(100, 35)
+        confirm_button.setStyleSheet(StyleManager.get_primary_button_style())
+        confirm_button.clicked.connect(self.accept)
+        button_layout.addWidget(cancel_button)
+        button_layout.addStretch()
+        button_layout.addWidget(confirm_button)
+        layout.addLayout(button_layout)
+
+    def get_selected_models(self):
+        """获取选择的模型列表"""
+        return [model for checkbox, model in self.model_checkboxes if checkbox.isChecked()]
+
+
+class PerfStatsDialog(QDialog):
+    """性能统计面板：按模型的首字延迟、总耗时、生成速度分位数、错误率与掉帧次数，选中模型后显示按日期的变化"""
+    PERIODS = (("今天", 1), ("最近7天", 7), ("最近30天", 30), ("全部", None))
+    COLUMNS = ("模型", "请求", "错误率", "首字p50", "首字p95", "首字p99", "总耗时p50", "总耗时p95", "总耗时p99",
+               "tokens/s p50", "tokens/s p95", "tokens/s p99", "掉帧")
+    DAILY_COLUMNS = ("日期", "请求", "错误率", "首字p50", "首字p95", "总耗时p50", "tokens/s p50", "掉帧")
+
+    def __init__(self, perf_stats, parent=None):
+        super().__init__(parent)
+        self.perf_stats = perf_stats
+        self.setWindowTitle("性能统计")
+        self.resize(980, 560)
+        self.setStyleSheet(StyleManager.get_dialog_style())
+        self.setup_ui()
+        self._refresh()
+
+    def setup_ui(self):
+        layout = QVBoxLayout(self)
+        layout.setSpacing(10)
+        layout.setContentsMargins(16, 16, 16, 16)
+
+        header = QHBoxLayout()
+        title = QLabel("按模型的实测性能（首字与总耗时单位为毫秒/秒）")
+        title.setStyleSheet("QLabel { font-size: 14px; font-weight: bold; color: #333; }")
+        header.addWidget(title)
+        header.addStretch()
+        self.period_combo = QComboBox()
+        for label, _ in self.PERIODS:
+            self.period_combo.addItem(label)
+        self.period_combo.setCurrentIndex(1)
+        self.period_combo.currentIndexChanged.connect(self._refresh)
+        header.addWidget(self.period_combo)
+        layout.addLayout(header)
+
+        self.table = self._create_table(self.COLUMNS)
+        self.table.itemSelectionChanged.connect(self._refresh_daily)
+        layout.addWidget(self.table, 3)
+
+        self.daily_label = QLabel("选中模型查看按日期的变化")
+        self.daily_label.setStyleSheet("QLabel { color: #666; }")
+        layout.addWidget(self.daily_label)
+        self.daily_table = self._create_table(self.DAILY_COLUMNS)
+        layout.addWidget(self.daily_table, 2)
+
+    @staticmethod
+    def _create_table(columns) -> QTableWidget:
+        table = QTableWidget(0, len(columns))
+        table.setHorizontalHeaderLabels(columns)
+        table.verticalHeader().setVisible(False)
+        table.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        table.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        table.setSelectionMode(QAbstractItemView.SelectionMode.SingleSelection)
+        table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.ResizeToContents)
+        table.horizontalHeader().setStretchLastSection(True)
+        return table
+
+    @staticmethod
+    def _cell(value, scale: float = 1.0, digits: int = 0, suffix: str = "") -> QTableWidgetItem:
+        text = '-' if value is None else f"{value * scale:.{digits}f}{suffix}"
+        item = QTableWidgetItem(text)
+        item.setTextAlignment(Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter)
+        return item
+
+    def _days(self):
+        return self.PERIODS[self.period_combo.currentIndex()][1]
+
+    def _refresh(self):
+        summary = self.perf_stats.summary(self._days())
+        self.table.setRowCount(len(summary))
+        for row, (model, stats) in enumerate(summary.items()):
+            self.table.setItem(row, 0, QTableWidgetItem(model))
+            cells = [self._cell(stats['requests']), self._cell(stats['error_rate'], 100, 1, '%')]
+            cells += [self._cell(stats['ttft_ms'][p]) for p in ('p50', 'p95', 'p99')]
+            cells += [self._cell(stats['total_ms'][p], 0.001, 2) for p in ('p50', 'p95', 'p99')]
+            cells += [self._cell(stats['tokens_per_s'][p], 1, 1) for p in ('p50', 'p95', 'p99')]
+            cells.append(self._cell(stats['frame_drops']))
+            for column, item in enumerate(cells, start=1):
+                self.table.setItem(row, column, item)
+        if summary:
+            self.table.selectRow(0)
+        else:
+            self.daily_table.setRowCount(0)
+
+    def _refresh_daily(self):
+        items = self.table.selectedItems()
+        if not items:
+            return
+        model = self.table.item(items[0].row(), 0).text()
+        self.daily_label.setText(f"{model} 按日期")
+        daily = self.perf_stats.daily(model, self._days())
+        self.daily_table.setRowCount(len(daily))
+        for row, (day, stats) in enumerate(reversed(daily)):
+            self.daily_table.setItem(row, 0, QTableWidgetItem(day))
+            cells = [self._cell(stats['requests']), self._cell(stats['error_rate'], 100, 1, '%'),
+                     self._cell(stats['ttft_ms']['p50']), self._cell(stats['ttft_ms']['p95']),
+                     self._cell(stats['total_ms']['p50'], 0.001, 2), self._cell(stats['tokens_per_s']['p50'], 1, 1),
+                     self._cell(stats['frame_drops'])]
+            for column, item in enumerate(cells, start=1):
+                self.daily_table.setItem(row, column, item)
+
+
 class APIKeyDialog(QDialog):
     """API密钥设置对话框"""
     
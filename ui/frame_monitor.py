@@ -0,0 +1,90 @@
+"""
+界面掉帧统计
+流式输出期间用精确定时器按帧间隔触发，实际间隔超过一帧半时按超出的帧数计为掉帧（界面线程被阻塞）
+
+LagWatchdog（--lag-monitor）在整个运行期间驱动卡顿监测的心跳，并记录每帧的重绘耗时，见 utils/lag_monitor.py
+"""
+import time
+
+from PyQt6.QtCore import QEvent, QObject, Qt, QTimer
+from PyQt6.QtWidgets import QApplication
+
+from utils.lag_monitor import lag_monitor
+
+
+class FrameDropCounter(QObject):
+    """掉帧计数器：start() 开始计数，stop() 停止并返回期间丢掉的帧数"""
+    FRAME_MS = 16
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.dropped = 0
+        self._last_tick = None
+        self._timer = QTimer(self)
+        self._timer.setTimerType(Qt.TimerType.PreciseTimer)
+        self._timer.setInterval(self.FRAME_MS)
+        self._timer.timeout.connect(self._tick)
+
+    def start(self):
+        self.dropped = 0
+        self._last_tick = time.perf_counter()
+        self._timer.start()
+
+    def stop(self) -> int:
+        if self._timer.isActive():
+            self._tick()
+            self._timer.stop()
+        return self.dropped
+
+    def _tick(self):
+        now = time.perf_counter()
+        frames = (now - self._last_tick) * 1000 / self.FRAME_MS
+        if frames >= 1.5:
+            self.dropped += int(frames + 0.5) - 1
+        self._last_tick = now
+
+
+class LagWatchdog(QObject):
+    """卡顿监测的界面侧：心跳定时器，窗口重绘（UpdateRequest）耗时与是否重绘了聊天区，
+    以及正在分发的Qt事件（卡在Qt内部、没有Python帧时用于定位）
+    """
+
+    def __init__(self, window, chat_viewport, parent=None):
+        super().__init__(parent or window)
+        self.window = window
+        self.chat_viewport = chat_viewport
+        self._chat_painted = False
+        self._timer = QTimer(self)
+        self._timer.setTimerType(Qt.TimerType.PreciseTimer)
+        self._timer.setInterval(int(lag_monitor.interval_ms))
+        self._timer.timeout.connect(lag_monitor.tick)
+        lag_monitor.ignore_code(LagWatchdog.eventFilter.__code__)
+
+    def start(self):
+        QApplication.instance().installEventFilter(self)
+        lag_monitor.start()
+        self._timer.start()
+
+    def stop(self):
+        self._timer.stop()
+        QApplication.instance().removeEventFilter(self)
+        lag_monitor.stop()
+
+    def eventFilter(self, watched, event):
+        kind = event.type()
+        lag_monitor.current_event = (kind, type(watched).__name__)
+        if kind == QEvent.Type.Paint and not self._chat_painted and (
+                watched is self.chat_viewport or self.chat_viewport.isAncestorOf(watched)):
+            self._chat_painted = True
+        elif kind == QEvent.Type.UpdateRequest and watched is self.window and not lag_monitor.painting:
+            # 由过滤器直接处理整窗重绘，计时包含其中所有组件的绘制
+            self._chat_painted = False
+            lag_monitor.painting = True
+            started = time.perf_counter()
+            try:
+                handled = watched.event(event)
+            finally:
+                lag_monitor.painting = False
+            lag_monitor.record_frame((time.perf_counter() - started) * 1000, self._chat_painted)
+            return handled
+        return False
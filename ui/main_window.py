@@ -6,35 +6,54 @@ import os
 import sqlite3
 import uuid
 import math
+import time
 from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QPushButton, 
                              QScrollArea, QApplication, QSizePolicy, QDialog, QLabel)
-from PyQt6.QtCore import Qt, QTimer, QPropertyAnimation, QEasingCurve, QSize
-from PyQt6.QtGui import QFont, QIcon, QPixmap, QPainter, QColor
-from PyQt6.QtSvg import QSvgRenderer
+from PyQt6.QtCore import Qt, QThread, QTimer, QPropertyAnimation, QEasingCurve, QSize
+from PyQt6.QtGui import QFont, QIcon, QColor
 
 from utils.resources import resource_path, get_config_paths, get_icon_path
-from core.config_manager import ConfigManager
-from core.ai_client import AIChatThread, AIStreamThread
+from utils.startup_profiler import profiler
+from utils.tracing import tracer
+from utils.lag_monitor import lag_monitor
+from utils.render_snapshot import SnapshotEntry, get_snapshot_path, load_snapshot, save_snapshot, snapshot_matches
+from core.ai_client import AIChatThread, AIStreamThread, AsyncStreamTask, ConversationSummaryThread, ProcessStreamTask
+from core.context_assembler import context_assembler, estimate_tokens
+from core.perf_stats import PerfStats
+from core.provider_setup import configure_providers
 from .styles import StyleManager
-from .widgets import CustomTextEdit, MessageWidget, ToastWidget
-from .dialogs import APIKeyDialog, ModelSelectionDialog, ConfirmDialog
+from .widgets import ComparisonWidget, CustomTextEdit, MessageWidget, SnapshotMessageWidget, ToastWidget
+from .render_pipeline import RenderPipeline
+from .frame_monitor import FrameDropCounter, LagWatchdog
+from models import AIProviderFactory
+from models.conversation import ConversationStore
 from chat_db import ChatDatabase
 
 
 class ChatWindow(QWidget):
     """主聊天窗口"""
     
+    # 每个事件循环周期加载的历史消息数量
+    HISTORY_BATCH_SIZE = 8
+
     def __init__(self):
         super().__init__()
         
-        # 初始化配置管理器
-        config_paths = get_config_paths()
-        self.config_manager = ConfigManager(config_paths)
+        # 配置管理器（解密配置）与数据库在首帧绘制后再初始化，见 _deferred_init
+        self._config_manager = None
+        self.db = None
+        self.store = None  # 当前会话的内存消息存储
+        self.current_model = None
+        self.conversation_id = None
+        self._init_scheduled = False
+        self._initialized = False
         
-        # 初始化数据库
-        self.db = ChatDatabase()
-          # 初始化状态
+        # 初始化状态
         self.ai_thread = None
+        self.summary_thread = None
+        self.summarizer = None  # 会话摘要器，启用压缩模式时创建
+        self.provider_process = None  # 服务商子进程，启用时创建
+        self.async_streams = False  # 异步流式请求，配置加载后确定（初始化完成前关闭窗口时同样可读）
         self.typing_animation = None
         self.timer = QTimer(self)
         self.dot_count = 0
@@ -43,23 +62,124 @@ class ChatWindow(QWidget):
         # 流式输出相关状态
         self.current_ai_message_widget = None  # 当前AI消息组件引用
         self.full_ai_response = ""  # 存储完整的AI响应文本
+        self.served_model = None  # 实际提供回复的模型
+        self._trace_turn = None  # 延迟追踪：当前一轮对话（发送到保存完毕）的span
+        self.perf_stats = None  # 按模型的性能统计，数据库打开时创建
+        self._last_timing = None  # 当前回复的 (首字延迟, 总耗时, 是否为缓存回放)
+        self.frame_drops = FrameDropCounter(self)
+        
+        # 多模型对比状态
+        self.compare_models = []  # 对比模式下同时提问的模型，为空时为普通模式
+        self.compare_threads = {}  # 模型 -> 进行中的流式线程
+        self.comparison_widget = None
+        self._cancelled_streams = set()  # 已取消、尚未结束的流式线程
+        self._compare_model_choices = []  # 上次选择的对比模型
+        self._comparison_started_at = 0.0
+        self._comparison_timings = {}  # 模型 -> (首字延迟, 总耗时)，随回复一起保存
+        
+        # 设置窗口（只构建窗口外壳）
+        self._setup_window()
+        self.setup_ui()
         
-        # 获取当前模型和会话
+        # 初始化完成前禁用输入
+        self.input_box.setEnabled(False)
+        self.send_button.setEnabled(False)
+        profiler.mark("窗口外壳构建")
+        
+        # 可选的卡顿监测（--lag-monitor）：事件循环延迟、帧重绘耗时与卡顿时的调用栈
+        self.lag_watchdog = None
+        if lag_monitor.enabled:
+            self.lag_watchdog = LagWatchdog(self, self.scroll_area.viewport())
+            self.lag_watchdog.start()
+        
+        # 先绘制上次退出时保存的快照，数据库加载完成后再替换
+        self._snapshot_widgets = []
+        self._snapshot_conversation_id = None  # 快照所属的会话
+        self._pending_history_widgets = []
+        self._paint_snapshot()
+
+    @property
+    def config_manager(self):
+        """配置管理器（首次访问时创建）"""
+        if self._config_manager is None:
+            from core.config_manager import ConfigManager
+            self._config_manager = ConfigManager(get_config_paths())
+        return self._config_manager
+
+    def paintEvent(self, event):
+        """首帧绘制后再初始化各子系统"""
+        super().paintEvent(event)
+        if not self._init_scheduled:
+            self._init_scheduled = True
+            profiler.mark("首帧绘制")
+            QTimer.singleShot(0, self._deferred_init)
+
+    def _deferred_init(self):
+        """延迟初始化：加载配置、打开数据库，然后分批加载历史消息"""
+        # 获取当前模型
         self.current_model = self.config_manager.get_current_model()
+        self._update_model_label()
+        saved_compare_models = self.config_manager.get_chat_option('compare_models')
+        self._compare_model_choices = [m for m in saved_compare_models.split(',') if m]
+        # 异步流式请求：所有流共享一个事件循环线程
+        self.async_streams = self.config_manager.get_chat_option('async_streams', 'false').lower() in ('1', 'true', 'yes', 'on')
+        compaction = self.config_manager.get_compaction_settings()
+        if compaction:
+            from core.summarizer import ConversationSummarizer
+            self.summarizer = ConversationSummarizer(**compaction)
+        profiler.mark("配置加载")
+        
+        # 容错、限流、自动路由、对冲请求与回复缓存
+        cache_settings = configure_providers(self.config_manager, os.path.dirname(ChatDatabase.get_default_db_path()))
+        
+        # 初始化数据库与会话
+        self.db = ChatDatabase()
+        self.perf_stats = PerfStats(os.path.join(os.path.dirname(self.db.db_path), 'perf_stats.db'))
         self.conversation_id = self._get_or_create_conversation()
-        
-        # 设置窗口
-        self._setup_window()
-        self.setup_ui()
+        self.store = ConversationStore.load(self.db, self.conversation_id)
+        if self._snapshot_widgets and not snapshot_matches(self._snapshot_conversation_id, self.conversation_id):
+            # 其他会话的快照不能作为本会话的首帧
+            self._replace_snapshot()
+        
+        # 渲染结果缓存到数据库旁，重新打开会话时无需再次渲染
+        RenderPipeline.instance().enable_disk_cache(
+            os.path.join(os.path.dirname(self.db.db_path), 'render_cache.db')
+        )
+        # 可选的服务商子进程：网络请求与响应解析不占用界面进程（首次请求时启动）
+        if self.config_manager.get_chat_option('provider_process', 'false').lower() in ('1', 'true', 'yes', 'on'):
+            from core.provider_process import ProviderProcess
+            recorder, replayer = AIProviderFactory.stream_recorder, AIProviderFactory.replayer
+            self.provider_process = ProviderProcess({
+                'resilience': AIProviderFactory.resilience,
+                'rate_limits': self.config_manager.get_rate_limit_settings(),
+                'zhipu_raw_http': AIProviderFactory.zhipu_raw_http,
+                'single_flight': AIProviderFactory.single_flight is not None,
+                'response_cache': cache_settings,
+                'record_streams': recorder.path if recorder is not None else None,
+                'replay': {'path': replayer.path, 'speed': replayer.speed} if replayer is not None else None,
+            })
+        profiler.mark("数据库打开")
+        
+        self._initialized = True
+        # 根据模型状态设置输入框和发送按钮的可用性
+        self._update_ui_state()
         
         # 加载历史消息
         self._load_history_messages()
-          # 根据模型状态设置输入框和发送按钮的可用性
-        self._update_ui_state()
     
     def _update_model_label(self):
         """更新模型名称标签"""
-        if self.current_model:
+        if not self._initialized:
+            self.model_label.setText("加载中...")
+            self.model_label.setVisible(True)
+        elif self.compare_models:
+            self.model_label.setText(f"对比 {len(self.compare_models)} 个模型")
+            self.model_label.setToolTip("、".join(self.compare_models))
+            self.model_label.setVisible(True)
+        elif self.current_model == AIProviderFactory.AUTO_MODEL:
+            self.model_label.setText("自动路由")
+            self.model_label.setVisible(True)
+        elif self.current_model:
             self.model_label.setText(self.current_model)
             self.model_label.setVisible(True)
         else:
@@ -81,28 +201,107 @@ class ChatWindow(QWidget):
             print(f"图标文件 {icon_path} 不存在。")
     
     def _get_or_create_conversation(self):
-        """获取或创建会话ID"""
+        """获取或创建会话ID（不包括通过本地API服务产生的会话）"""
         conn = sqlite3.connect(self.db.db_path)
         cursor = conn.cursor()
-        cursor.execute('SELECT DISTINCT conversation_id FROM messages ORDER BY timestamp DESC LIMIT 1')
+        cursor.execute('SELECT DISTINCT conversation_id FROM messages WHERE conversation_id NOT LIKE ? '
+                       'ORDER BY timestamp DESC LIMIT 1', (ChatDatabase.API_CONVERSATION_PREFIX + '%',))
         result = cursor.fetchone()
         conn.close()
         
         return result[0] if result else str(uuid.uuid4())
     
+    def _paint_snapshot(self):
+        """读取渲染快照并立即创建占位消息"""
+        snapshot = load_snapshot(get_snapshot_path(ChatDatabase.get_default_db_path()))
+        if not snapshot:
+            return
+        self._snapshot_conversation_id, entries = snapshot
+        for entry in entries:
+            placeholder = SnapshotMessageWidget(entry, self)
+            self.message_layout.insertWidget(self.message_layout.count() - 1, placeholder)
+            self._snapshot_widgets.append(placeholder)
+        profiler.mark("快照绘制")
+
+    def _replace_snapshot(self):
+        """用数据库中加载的真实消息一次性替换快照占位消息"""
+        for placeholder in self._snapshot_widgets:
+            self.message_layout.removeWidget(placeholder)
+            placeholder.deleteLater()
+        self._snapshot_widgets = []
+        
+        for message_widget in self._pending_history_widgets:
+            message_widget.setVisible(True)
+        self._pending_history_widgets = []
+
+    def _save_snapshot(self):
+        """保存当前可见视口中的消息快照"""
+        if not self._initialized or not self.conversation_id:
+            return
+        viewport_top = self.scroll_area.verticalScrollBar().value()
+        viewport_bottom = viewport_top + self.scroll_area.viewport().height()
+        
+        entries = []
+        for i in range(self.message_layout.count()):
+            widget = self.message_layout.itemAt(i).widget()
+            if not isinstance(widget, MessageWidget) or not widget.isVisible():
+                continue
+            geometry = widget.geometry()
+            if geometry.bottom() < viewport_top or geometry.top() > viewport_bottom:
+                continue
+            entries.append(SnapshotEntry(widget.message_id, widget.align_right, geometry.height(), widget.snapshot_text()))
+        
+        try:
+            save_snapshot(get_snapshot_path(self.db.db_path), self.conversation_id, entries)
+        except OSError as e:
+            print(f"保存渲染快照失败: {e}")
+
+    def closeEvent(self, event):
+        """退出时保存渲染快照与性能统计，并停止异步事件循环与服务商子进程"""
+        self._save_snapshot()
+        if self.perf_stats is not None:
+            self.perf_stats.flush()
+        if self.lag_watchdog is not None:
+            self.lag_watchdog.stop()
+        if self.provider_process is not None:
+            self.provider_process.shutdown()
+        if self.async_streams:
+            from core.event_loop import shutdown_loop_thread
+            shutdown_loop_thread()
+        super().closeEvent(event)
+
     def _load_history_messages(self):
-        """加载历史消息"""
-        history_messages = self.db.get_conversation_history(self.conversation_id)
-        for message in history_messages:
-            self.add_message(
-                message['content'], 
-                align_right=(message['role'] == 'user'), 
-                message_id=message['id']
+        """加载历史消息（分批创建消息组件，避免长时间阻塞事件循环）"""
+        self._load_history_batch(self.store.snapshot(), 0)
+
+    def _load_history_batch(self, history_messages: tuple, start: int):
+        """加载一批历史消息，剩余部分在下一个事件循环周期继续"""
+        batch = history_messages[start:start + self.HISTORY_BATCH_SIZE]
+        for message in batch:
+            message_widget = MessageWidget(
+                message.content, 
+                align_right=(message.role == 'user'), 
+                message_id=message.id,
+                parent=self
             )
+            if self._snapshot_widgets:
+                # 快照仍在显示时先隐藏，全部加载完后一次性替换
+                message_widget.setVisible(False)
+                self._pending_history_widgets.append(message_widget)
+            self.message_layout.insertWidget(self.message_layout.count() - 1, message_widget)
+        
+        next_start = start + self.HISTORY_BATCH_SIZE
+        if next_start < len(history_messages):
+            QTimer.singleShot(0, lambda: self._load_history_batch(history_messages, next_start))
+        else:
+            self._replace_snapshot()
+            QTimer.singleShot(100, self.scroll_to_bottom)
+            profiler.mark("历史消息加载")
+            profiler.finish()
     
     def _update_ui_state(self):
         """更新UI状态"""
-        has_model = self.current_model is not None
+        has_model = self._initialized and (self.current_model is not None or bool(self.compare_models))
         self.input_box.setEnabled(has_model)
         self.send_button.setEnabled(has_model)
         if has_model:
@@ -157,6 +356,23 @@ class ChatWindow(QWidget):
         right_layout = QHBoxLayout()
         right_layout.addStretch()
         
+        # 多模型对比按钮
+        self.compare_button = QPushButton("对比")
+        self.compare_button.setCheckable(True)
+        self.compare_button.setFixedSize(40, 40)
+        self.compare_button.setToolTip("多模型对比")
+        self.compare_button.setStyleSheet(StyleManager.get_button_style())
+        self.compare_button.clicked.connect(self.show_comparison_dialog)
+        right_layout.addWidget(self.compare_button)
+        
+        # 性能统计按钮
+        self.stats_button = QPushButton("统计")
+        self.stats_button.setFixedSize(40, 40)
+        self.stats_button.setToolTip("按模型的性能统计")
+        self.stats_button.setStyleSheet(StyleManager.get_button_style())
+        self.stats_button.clicked.connect(self.show_perf_stats_dialog)
+        right_layout.addWidget(self.stats_button)
+        
         # API按钮
         self.api_button = self._create_icon_button('icon/key.svg', 40, self.show_api_key_dialog)
         right_layout.addWidget(self.api_button)
@@ -173,13 +389,8 @@ class ChatWindow(QWidget):
         """创建图标按钮"""
         button = QPushButton()
         try:
-            svg_renderer = QSvgRenderer(resource_path(icon_path))
-            pixmap = QPixmap(size, size)
-            pixmap.fill(Qt.GlobalColor.transparent)
-            painter = QPainter(pixmap)
-            svg_renderer.render(painter)
-            painter.end()
-            button.setIcon(QIcon(pixmap))
+            # SVG由Qt图标引擎按需渲染，无需在启动时加载QtSvg
+            button.setIcon(QIcon(resource_path(icon_path)))
             button.setIconSize(QSize(size, size))
         except Exception as e:
             print(f"图标加载失败 {icon_path}: {e}")
@@ -247,15 +458,8 @@ class ChatWindow(QWidget):
         try:
             self.send_icon = QIcon(resource_path('icon/send.svg'))
             self.stop_icon = QIcon(resource_path('icon/stop.svg'))
-              # 创建发送图标
-            send_pixmap = QPixmap(32, 32)
-            send_pixmap.fill(Qt.GlobalColor.transparent)
-            painter = QPainter(send_pixmap)
-            svg_renderer = QSvgRenderer(resource_path('icon/send.svg'))
-            svg_renderer.render(painter)
-            painter.end()
             
-            self.send_button.setIcon(QIcon(send_pixmap))
+            self.send_button.setIcon(self.send_icon)
             self.send_button.setIconSize(QSize(32, 32))
         except Exception as e:
             print(f"发送/停止图标加载失败: {e}")
@@ -266,10 +470,12 @@ class ChatWindow(QWidget):
 
     def show_api_key_dialog(self):
         """显示API密钥对话框"""
+        from .dialogs import APIKeyDialog
         dialog = APIKeyDialog(self.config_manager, self)
         dialog.exec()
     def show_settings_dialog(self):
         """显示设置对话框"""
+        from .dialogs import ModelSelectionDialog
         dialog = ModelSelectionDialog(self.config_manager, self)
         if dialog.exec():
             selected_model = dialog.get_selected_model()
@@ -285,6 +491,37 @@ class ChatWindow(QWidget):
                 # 更新模型标签
                 self._update_model_label()
 
+    def show_comparison_dialog(self):
+        """选择多模型对比的模型，取消时回到单模型模式"""
+        if not self._initialized:
+            self.compare_button.setChecked(False)
+            return
+        from .dialogs import ModelComparisonDialog
+        dialog = ModelComparisonDialog(self.config_manager, self.compare_models or self._compare_model_choices, self)
+        if dialog.exec():
+            models = dialog.get_selected_models()
+            if len(models) < 2:
+                ToastWidget("至少选择两个模型", self).show()
+                models = []
+            else:
+                self._compare_model_choices = models
+                self.config_manager.save_chat_option('compare_models', ','.join(models))
+        else:
+            models = []
+        
+        self.compare_models = models
+        self.compare_button.setChecked(bool(models))
+        self.model_label.setToolTip("")
+        self._update_model_label()
+        self._update_ui_state()
+
+    def show_perf_stats_dialog(self):
+        """显示按模型的性能统计"""
+        if self.perf_stats is None:
+            return
+        from .dialogs import PerfStatsDialog
+        PerfStatsDialog(self.perf_stats, self).exec()
+
     def add_message(self, content: str, align_right: bool = False, message_id: int = None):
         """添加消息到界面"""
         message_widget = MessageWidget(content, align_right, message_id, self)
@@ -319,9 +556,8 @@ class ChatWindow(QWidget):
             self._interrupt_ai_response()
             return
 
-        # 检查API密钥
-        api_key = self.config_manager.get_api_key_for_model(self.current_model)
-        if not api_key:
+        # 检查API密钥（对比模式下在选择模型时已检查）
+        if not self.compare_models and not self.config_manager.get_api_key_for_model(self.current_model):
             ToastWidget("无API Key", self).show()
             return
 
@@ -330,22 +566,57 @@ class ChatWindow(QWidget):
             ToastWidget("消息不能为空！", self).show()
             return
             
-        # 保存用户消息到数据库
-        message_id = self.db.save_message(text, 'user', self.conversation_id)
-        self.add_message(text, align_right=True, message_id=message_id)
-          # 设置等待状态
-        self._set_waiting_state(True)
-        self.get_ai_response(text)
+        model = ','.join(self.compare_models) if self.compare_models else self.current_model
+        self._trace_turn = tracer.begin('chat.turn', model=model, conversation=self.conversation_id)
+        with tracer.span('ui.send_message', model=model, conversation=self.conversation_id):
+            # 保存用户消息到数据库
+            with tracer.span('db.save', model=model, conversation=self.conversation_id):
+                record = self.store.append('user', text)
+            self.add_message(text, align_right=True, message_id=record.id)
+            # 设置等待状态
+            self._set_waiting_state(True)
+            if self.compare_models:
+                self.start_comparison(text, record.id)
+            else:
+                self.get_ai_response(text)
     
     def _interrupt_ai_response(self):
         """中断AI响应"""
-        if self.ai_thread and self.ai_thread.isRunning():
-            self.ai_thread.terminate()
-            self.ai_thread.wait()
+        if self.compare_threads:
+            for model, thread in list(self.compare_threads.items()):
+                self._cancel_stream(thread)
+                self.comparison_widget.message_widgets[model].finish_streaming()
+            self.compare_threads.clear()
+            self.comparison_widget = None
             self.timer.stop()
             self._set_waiting_state(False)
+            self.frame_drops.stop()
+            self._end_trace_turn(interrupted=True)
+            ToastWidget("已中断", self).show()
+        elif self.ai_thread and self.ai_thread.isRunning():
+            self._cancel_stream(self.ai_thread)
+            self.timer.stop()
+            if self.current_ai_message_widget:
+                self.current_ai_message_widget.finish_streaming()
+            self._set_waiting_state(False)
+            self.frame_drops.stop()
+            self._end_trace_turn(interrupted=True)
             ToastWidget("已中断", self).show()
     
+    def _cancel_stream(self, task):
+        """取消流式请求：断开信号后协作式取消，线程在下一个片段处关闭流并自行结束（释放限流名额）"""
+        for signal in (task.chunk_received, task.context_assembled, task.first_token, task.timing_ready,
+                       task.model_served, task.stream_finished, task.error_occurred):
+            try:
+                signal.disconnect()
+            except TypeError:
+                pass  # 没有连接
+        task.cancel()
+        if isinstance(task, QThread):
+            # 线程结束前保留引用，避免运行中的QThread被销毁
+            self._cancelled_streams.add(task)
+            task.finished.connect(lambda t=task: self._cancelled_streams.discard(t))
+
     def _set_waiting_state(self, waiting: bool):
         """设置等待状态"""
         self.input_box.setDisabled(waiting)
@@ -365,23 +636,75 @@ class ChatWindow(QWidget):
     def get_ai_response(self, text: str):
         """获取AI响应（使用流式输出）"""
         api_key = self.config_manager.get_api_key_for_model(self.current_model)
-        history_messages = self.db.get_conversation_history(self.conversation_id)
+        history_messages = self.store.snapshot()
 
         # 重置流式输出状态
         self.current_ai_message_widget = None
         self.full_ai_response = ""
+        self.served_model = self.current_model
+        self._last_timing = None
 
         # 创建并启动AI流式线程
-        self.ai_thread = AIStreamThread(text, api_key, history_messages, self.current_model)
+        self.ai_thread = self._create_stream_task(text, api_key, history_messages, self.current_model)
+        self.ai_thread.trace_tags = {'conversation': self.conversation_id}
         self.ai_thread.chunk_received.connect(self.handle_ai_chunk)
+        self.ai_thread.context_assembled.connect(self.handle_context_assembled)
+        self.ai_thread.model_served.connect(self.handle_model_served)
+        self.ai_thread.timing_ready.connect(self.handle_timing)
         self.ai_thread.stream_finished.connect(self.handle_ai_stream_finished)
         self.ai_thread.error_occurred.connect(self.handle_error)
         self.ai_thread.start()
+        self.frame_drops.start()
+    def _create_stream_task(self, text: str, api_key: str, history_messages, model: str):
+        """创建流式请求：可运行在服务商子进程或共享事件循环上（自动路由仍使用线程）"""
+        if self.provider_process is not None and model != AIProviderFactory.AUTO_MODEL:
+            return ProcessStreamTask(self.provider_process, text, api_key, history_messages, model, self.store.summary)
+        if self.async_streams and model != AIProviderFactory.AUTO_MODEL:
+            return AsyncStreamTask(text, api_key, history_messages, model, self.store.summary)
+        return AIStreamThread(text, api_key, history_messages, model, self.store.summary)
+
+    def handle_context_assembled(self, total_tokens: int, trimmed_tokens: int):
+        """显示本次请求的上下文大小"""
+        tooltip = f"本次上下文约 {total_tokens} tokens"
+        if trimmed_tokens:
+            tooltip += f"，已裁剪 {trimmed_tokens} tokens"
+            print(f"上下文组装: 发送约 {total_tokens} tokens，裁剪 {trimmed_tokens} tokens")
+        cache = AIProviderFactory.response_cache
+        if cache is not None:
+            stats = cache.stats()
+            tooltip += (f"\n回复缓存：命中 {stats['memory_hits'] + stats['disk_hits']} 次"
+                        f"（磁盘 {stats['disk_hits']}），未命中 {stats['misses']} 次")
+        if AIProviderFactory.hedging is not None:
+            stats = AIProviderFactory.hedging.stats()
+            tooltip += (f"\n对冲请求：{stats['hedges']}/{stats['requests']} 次，"
+                        f"对冲胜出 {stats['hedge_wins']} 次，超出预算 {stats['budget_denied']} 次")
+        if AIProviderFactory.single_flight is not None:
+            stats = AIProviderFactory.single_flight.stats()
+            if stats['coalesced']:
+                tooltip += f"\n请求合并：上游请求 {stats['flights']} 次，合并重复请求 {stats['coalesced']} 次"
+        if AIProviderFactory.rate_limits is not None:
+            for provider_name, stats in AIProviderFactory.rate_limits.stats().items():
+                if stats['waits'] or stats['throttled']:
+                    tooltip += (f"\n限流（{provider_name}）：排队 {stats['waits']} 次共 {stats['wait_seconds']:.1f} 秒，"
+                                f"收到429 {stats['throttled']} 次，当前 {stats['rate']:.2f} 次/秒")
+        self.model_label.setToolTip(tooltip)
+
+    def handle_model_served(self, model: str):
+        """记录实际提供回复的模型（自动路由时显示在提示中）"""
+        self.served_model = model
+        if model != self.current_model:
+            self.model_label.setToolTip(f"自动路由: {model}\n{self.model_label.toolTip()}")
+
+    def handle_timing(self, first_token_seconds: float, total_seconds: float, cached: bool):
+        """记录本次回复的首字延迟与总耗时（在 stream_finished 之前到达）"""
+        self._last_timing = (first_token_seconds, total_seconds, cached)
+
     def handle_ai_chunk(self, chunk: str):
         """处理AI流式响应片段"""
         self.full_ai_response += chunk
         
         if self.current_ai_message_widget is None:
+            tracer.instant('ui.first_token', model=self.served_model, conversation=self.conversation_id)
             # 创建新的AI消息组件
             self.current_ai_message_widget = MessageWidget("", align_right=False, parent=self)
             self.message_layout.insertWidget(self.message_layout.count() - 1, self.current_ai_message_widget)
@@ -389,35 +712,148 @@ class ChatWindow(QWidget):
             QTimer.singleShot(10, self.scroll_to_bottom)
         
         # 更新消息内容
-        self.current_ai_message_widget.update_content(self.full_ai_response)
+        with tracer.span('ui.flush', model=self.served_model, conversation=self.conversation_id,
+                         chars=len(self.full_ai_response)):
+            self.current_ai_message_widget.update_content(self.full_ai_response)
         
         # 确保滚动到底部，但使用更短的延迟
         QTimer.singleShot(20, self.scroll_to_bottom)
     
     def handle_ai_stream_finished(self, full_text: str):
         """处理AI流式响应完成"""
+        tracer.instant('stream.end', model=self.served_model, conversation=self.conversation_id)
         self.timer.stop()
+        self._record_perf_stats(self.served_model, full_text)
         self._set_waiting_state(False)
         
         # 清理AI响应文本
         cleaned_text = full_text.strip()
         
-        # 保存AI响应到数据库
-        conn = sqlite3.connect(self.db.db_path)
-        cursor = conn.cursor()
-        cursor.execute('INSERT INTO messages (content, sender, conversation_id) VALUES (?, ?, ?)',
-                      (cleaned_text, "ai", self.conversation_id))
-        message_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
+        # 保存AI响应（写入内存会话并同步到数据库）
+        with tracer.span('db.persist', model=self.served_model, conversation=self.conversation_id):
+            message_id = self.store.append('assistant', cleaned_text, model=self.served_model).id
         
-        # 更新消息组件的message_id
+        # 更新消息组件的message_id，并切换到完整富文本渲染
         if self.current_ai_message_widget:
             self.current_ai_message_widget.message_id = message_id
+            with tracer.span('ui.finish_streaming', model=self.served_model, conversation=self.conversation_id):
+                self.current_ai_message_widget.finish_streaming()
         
         # 重置状态
         self.current_ai_message_widget = None
         self.full_ai_response = ""
+        self._end_trace_turn(served_model=self.served_model)
+        
+        self._maybe_start_summary()
+
+    def _record_perf_stats(self, model: str, full_text: str):
+        """把本次回复的耗时、生成速度与界面掉帧计入性能统计"""
+        dropped = self.frame_drops.stop()
+        if self.perf_stats is None:
+            return
+        if self._last_timing is not None:
+            first_token_seconds, total_seconds, cached = self._last_timing
+            # 缓存回放的耗时接近0，不反映模型的实际延迟
+            if not cached:
+                self.perf_stats.record_request(model, first_token_seconds, total_seconds, estimate_tokens(full_text))
+        self.perf_stats.record_frame_drops(model, dropped)
+
+    def _end_trace_turn(self, **tags):
+        """结束当前一轮对话的追踪span"""
+        tracer.end(self._trace_turn, **tags)
+        self._trace_turn = None
+
+    def start_comparison(self, text: str, user_message_id: int):
+        """把同一问题同时发送给多个模型，回复并排流式显示（总耗时取决于最慢的模型）"""
+        history_messages = self.store.snapshot()
+        widget = ComparisonWidget(self.compare_models, self)
+        self.comparison_widget = widget
+        self.message_layout.insertWidget(self.message_layout.count() - 1, widget)
+        QTimer.singleShot(10, self.scroll_to_bottom)
+        
+        self._comparison_started_at = time.perf_counter()
+        self._comparison_timings = {}
+        for model in self.compare_models:
+            api_key = self.config_manager.get_api_key_for_model(model)
+            thread = self._create_stream_task(text, api_key, history_messages, model)
+            thread.trace_tags = {'conversation': self.conversation_id}
+            thread.chunk_received.connect(lambda chunk, m=model: widget.append_chunk(m, chunk))
+            thread.first_token.connect(lambda first, m=model: widget.set_first_token(m, first))
+            thread.timing_ready.connect(
+                lambda first, total, cached, m=model: self._handle_comparison_timing(widget, m, first, total, cached)
+            )
+            thread.stream_finished.connect(
+                lambda full_text, m=model: self._handle_comparison_finished(widget, m, full_text, user_message_id)
+            )
+            thread.error_occurred.connect(lambda message, m=model: self._handle_comparison_error(widget, m, message))
+            self.compare_threads[model] = thread
+        # 全部创建后再启动，避免先启动的模型占用首个连接
+        for thread in self.compare_threads.values():
+            thread.start()
+
+    def _handle_comparison_timing(self, widget, model: str, first_token_seconds: float, total_seconds: float,
+                                  cached: bool):
+        """显示某个模型的耗时并计入性能统计（对比模式下界面掉帧无法归属到单个模型，不计入；缓存回放不计入）"""
+        widget.set_timing(model, first_token_seconds, total_seconds, cached)
+        self._comparison_timings[model] = (first_token_seconds, total_seconds)
+        if self.perf_stats is not None and not cached:
+            self.perf_stats.record_request(model, first_token_seconds, total_seconds,
+                                           estimate_tokens(widget.contents[model]))
+
+    def _handle_comparison_finished(self, widget, model: str, full_text: str, user_message_id: int):
+        """某个模型回复完成：连同耗时一起保存并关联到同一条用户消息"""
+        ttft, total_seconds = self._comparison_timings.pop(model, (None, None))
+        with tracer.span('db.persist', model=model, conversation=self.conversation_id):
+            record = self.store.append('assistant', full_text.strip(), model=model, reply_to=user_message_id,
+                                       ttft=ttft, total_seconds=total_seconds)
+        widget.finish_model(model, record.id)
+        self._comparison_model_done(model)
+
+    def _handle_comparison_error(self, widget, model: str, message: str):
+        """某个模型请求失败，不影响其他模型"""
+        widget.set_error(model, message)
+        if self.perf_stats is not None:
+            self.perf_stats.record_error(model)
+        self._comparison_model_done(model)
+
+    def _comparison_model_done(self, model: str):
+        """所有模型都结束后恢复输入"""
+        self.compare_threads.pop(model, None)
+        if self.compare_threads:
+            return
+        wall_seconds = time.perf_counter() - self._comparison_started_at
+        print(f"多模型对比完成: 总耗时 {wall_seconds:.2f} 秒")
+        self.timer.stop()
+        self._set_waiting_state(False)
+        self._end_trace_turn()
+        self.comparison_widget = None
+        self._maybe_start_summary()
+
+    def _maybe_start_summary(self):
+        """历史超过阈值时在后台增量生成会话摘要"""
+        if not self.summarizer or (self.summary_thread and self.summary_thread.isRunning()):
+            return
+        records = self.store.snapshot()
+        if not self.summarizer.needs_summary(records, self.store.summary):
+            return
+        api_key = self.config_manager.get_api_key_for_model(self.summarizer.summary_model)
+        if not api_key:
+            return
+        
+        conversation_id = self.conversation_id
+        self.summary_thread = ConversationSummaryThread(self.summarizer, api_key, records, self.store.summary)
+        self.summary_thread.summary_ready.connect(
+            lambda content, covers_until: self._handle_summary_ready(conversation_id, content, covers_until)
+        )
+        self.summary_thread.error_occurred.connect(print)
+        self.summary_thread.start()
+
+    def _handle_summary_ready(self, conversation_id: str, content: str, covers_until: int):
+        """保存新生成的会话摘要"""
+        if conversation_id != self.conversation_id or self.store is None:
+            return
+        self.store.set_summary(content, covers_until)
+
     def handle_ai_response(self, text: str):
         """处理AI响应"""
         self.timer.stop()
@@ -427,13 +863,7 @@ class ChatWindow(QWidget):
         cleaned_text = text.strip()
         
         # 保存AI响应（保存原始响应）
-        conn = sqlite3.connect(self.db.db_path)
-        cursor = conn.cursor()
-        cursor.execute('INSERT INTO messages (content, sender, conversation_id) VALUES (?, ?, ?)',
-                      (cleaned_text, "ai", self.conversation_id))
-        message_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
+        message_id = self.store.append('assistant', cleaned_text).id
         
         self.add_message(cleaned_text, align_right=False, message_id=message_id)
 
@@ -441,6 +871,10 @@ class ChatWindow(QWidget):
         """处理错误"""
         self.timer.stop()
         self._set_waiting_state(False)
+        self.frame_drops.stop()
+        if self.perf_stats is not None and self.served_model:
+            self.perf_stats.record_error(self.served_model)
+        self._end_trace_turn(error=message[:200])
         self.add_message(f"错误: {message}", align_right=False)
 
     def update_dot_animation(self):
@@ -459,7 +893,9 @@ class ChatWindow(QWidget):
         """删除消息"""
         # 如果消息有ID，从数据库中删除
         if hasattr(message_widget, 'message_id') and message_widget.message_id is not None:
-            self.db.delete_message(message_widget.message_id)
+            self.store.remove(message_widget.message_id)
+            context_assembler.forget(message_widget.message_id)
+            RenderPipeline.instance().discard_message(message_widget.message_id)
         
         # 从UI中移除
         self.message_layout.removeWidget(message_widget)
@@ -467,18 +903,35 @@ class ChatWindow(QWidget):
 
     def clear_history(self):
         """清除历史记录"""
+        if not self._initialized:
+            return
+        from .dialogs import ConfirmDialog
         dialog = ConfirmDialog("确定要清除所有聊天记录吗？\n此操作不可恢复。", "确认清除", self)
         
         if dialog.exec() == QDialog.DialogCode.Accepted:
+            # 正在生成的摘要基于被清除的历史，断开信号后让线程自行结束，不能写入重建的数据库
+            # （仍保留 summary_thread 引用，避免运行中的QThread被销毁）
+            if self.summary_thread and self.summary_thread.isRunning():
+                try:
+                    self.summary_thread.summary_ready.disconnect()
+                except TypeError:
+                    pass  # 没有连接
+
             # 清除数据库
             if hasattr(self.db, '_conn') and self.db._conn:
                 self.db._conn.close()
             
             if os.path.exists(self.db.db_path):
                 os.remove(self.db.db_path)
+            snapshot_path = get_snapshot_path(self.db.db_path)
+            if os.path.exists(snapshot_path):
+                os.remove(snapshot_path)
             
             # 重新初始化数据库
             self.db.init_database()
+            self.store.reset()
+            # 新数据库的消息ID从1重新开始
+            context_assembler.clear()
             
             # 清除UI消息
             while self.message_layout.count() > 1:
@@ -498,6 +951,7 @@ def main():
         QApplication.setAttribute(Qt.ApplicationAttribute.AA_UseHighDpiPixmaps, True)
 
     app = QApplication(sys.argv)
+    profiler.mark("QApplication创建")
 
     # 设置全局字体
     if sys.platform == 'darwin':  # macOS
@@ -508,6 +962,7 @@ def main():
 
     window = ChatWindow()
     window.show()
+    profiler.mark("窗口显示")
     sys.exit(app.exec())
 
 
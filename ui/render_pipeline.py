@@ -0,0 +1,103 @@
+"""
+富文本渲染管线
+在后台线程中完成Markdown解析与代码高亮，结果经缓存后通过信号回到GUI线程
+"""
+from typing import Callable, Dict, List, Optional
+
+from PyQt6.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+
+from utils.markdown_renderer import render_markdown
+from utils.render_cache import RenderCache, make_render_key
+
+
+class _RenderSignals(QObject):
+    """渲染任务信号（QRunnable本身不能发射信号）"""
+    finished = pyqtSignal(str, str)  # 渲染键, HTML
+
+
+class _RenderTask(QRunnable):
+    """单个Markdown渲染任务：先查磁盘缓存，未命中再渲染并写回"""
+
+    def __init__(self, key: str, content: str, cache: RenderCache, signals: _RenderSignals):
+        super().__init__()
+        self.key = key
+        self.content = content
+        self.cache = cache
+        self.signals = signals
+
+    def run(self):
+        rich_text = self.cache.load_from_disk(self.key)
+        if rich_text is None:
+            try:
+                rich_text = render_markdown(self.content)
+                self.cache.save_to_disk(self.key, rich_text)
+            except Exception as e:
+                print(f"Markdown渲染失败: {e}")
+                rich_text = ""
+        self.signals.finished.emit(self.key, rich_text)
+
+
+class RenderPipeline(QObject):
+    """后台渲染管线（全局单例）"""
+
+    _instance = None
+
+    @classmethod
+    def instance(cls) -> "RenderPipeline":
+        """获取全局渲染管线"""
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    @staticmethod
+    def make_key(content: str, message_id: Optional[int] = None) -> str:
+        """生成渲染键（消息ID + 内容哈希）"""
+        return make_render_key(content, message_id)
+
+    def __init__(self, max_threads: int = 2):
+        super().__init__()
+        self.cache = RenderCache()
+        self._pool = QThreadPool(self)
+        self._pool.setMaxThreadCount(max_threads)
+        self._signals = _RenderSignals(self)
+        self._signals.finished.connect(self._on_task_finished)
+        self._pending: Dict[str, List[Callable[[str, str], None]]] = {}
+
+    def enable_disk_cache(self, disk_path: str):
+        """启用磁盘缓存，重新打开会话时可直接复用之前的渲染结果"""
+        try:
+            self.cache.enable_disk_cache(disk_path)
+        except Exception as e:
+            print(f"渲染磁盘缓存启用失败: {e}")
+
+    def request(self, key: str, content: str, callback: Callable[[str, str], None]):
+        """提交渲染请求，在GUI线程中调用 callback(key, rich_text)
+
+        内存缓存命中时立即同步回调；相同键的并发请求只渲染一次。
+        """
+        rich_text = self.cache.get(key)
+        if rich_text is not None:
+            callback(key, rich_text)
+            return
+
+        if key in self._pending:
+            self._pending[key].append(callback)
+            return
+
+        self._pending[key] = [callback]
+        self._pool.start(_RenderTask(key, content, self.cache, self._signals))
+
+    def discard_message(self, message_id: int):
+        """丢弃已删除消息的渲染缓存"""
+        self.cache.discard_message(message_id)
+
+    def _on_task_finished(self, key: str, rich_text: str):
+        """写入内存缓存并分发渲染结果"""
+        if rich_text:
+            self.cache.put(key, rich_text)
+        for callback in self._pending.pop(key, []):
+            try:
+                callback(key, rich_text)
+            except RuntimeError:
+                # 消息组件已被删除
+                pass
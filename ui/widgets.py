@@ -7,7 +7,29 @@ from PyQt6.QtGui import QIcon, QFontMetrics
 from PyQt6 import QtGui
 from utils.resources import resource_path
 from .styles import StyleManager
+from .render_pipeline import RenderPipeline
 import re
+import time
+
+
+def thinking_summary(length: int, completed: bool, duration=None, expanded: bool = False) -> str:
+    """思考过程摘要行文本：字数、用时（流式输出时才有）与展开/收起提示"""
+    if completed:
+        summary = f"思考过程（{length} 字"
+        if duration is not None:
+            summary += f"，用时 {duration:.1f} 秒"
+        summary += "）"
+    else:
+        summary = f"思考中...（{length} 字）"
+    return summary + ("  ▾ 收起" if expanded else "  ▸ 展开")
+
+
+def thinking_tail(text: str, max_chars: int, max_lines: int) -> str:
+    """流式思考时展开显示的尾部：最多 max_chars 个字符中的最后 max_lines 行，截断时以省略号开头"""
+    tail = '\n'.join(text[-max_chars:].split('\n')[-max_lines:])
+    if len(tail) < len(text):
+        tail = "…" + tail
+    return tail + "▊"
 
 
 class CustomTextEdit(QTextEdit):
@@ -30,7 +52,13 @@ class CustomTextEdit(QTextEdit):
 
 
 class MessageWidget(QWidget):
-    """消息组件"""    
+    """消息组件"""
+    # 占位提示文本，不参与富文本渲染
+    PLACEHOLDER_TEXTS = ("✨ 思考完成", "✨ AI正在回复...", "正在思考...")
+    # 流式思考时只显示尾部内容
+    THINKING_TAIL_CHARS = 600
+    THINKING_TAIL_LINES = 8
+
     def __init__(self, content: str, align_right: bool = False, message_id: int = None, parent=None):
         super().__init__(parent)
         self.parent = parent
@@ -39,7 +67,8 @@ class MessageWidget(QWidget):
         self.content = content.strip() if content else ""
         self.align_right = align_right
         self.message_label = None  # 存储标签引用以便动态更新
-        self.thinking_label = None  # 存储思考过程标签引用
+        self.thinking_header = None  # 思考过程摘要行（点击展开/收起）
+        self.thinking_label = None  # 思考过程正文标签，仅在展开时创建
         
         # 流式处理状态变量
         self.is_in_thinking_mode = False  # 是否正在思考模式
@@ -47,10 +76,24 @@ class MessageWidget(QWidget):
         self.current_normal_content = ""  # 当前正常内容缓存
         self.content_buffer = ""  # 内容缓冲区
         
+        # 两阶段渲染状态：流式期间显示纯文本，结束后在后台渲染富文本
+        self.is_streaming = False
+        self._display_text = ""  # 当前正常消息框中显示的文本
+        self._render_key = None  # 最近一次富文本渲染请求的键
+        
+        # 思考过程面板状态
+        self._thinking_text = ""  # 完整思考内容
+        self._thinking_shown_text = ""  # 正文标签当前显示的文本
+        self._thinking_completed = False
+        self._thinking_expanded = True  # 流式过程中展开，完成后折叠
+        self._thinking_started_at = None
+        self._thinking_duration = None
+        
         self._setup_ui()    
         
     def update_content(self, new_content: str):
         """动态更新消息内容"""
+        self.is_streaming = True
         self.content = new_content.strip() if new_content else ""
         self._process_streaming_content()
         # 强制更新布局和重绘
@@ -58,10 +101,37 @@ class MessageWidget(QWidget):
     
     def append_content(self, additional_content: str):
         """追加内容到现有消息（流式更新）"""
+        self.is_streaming = True
         self.content += additional_content
         self._process_streaming_content()
         # 强制更新布局和重绘
         self._force_layout_update()
+
+    def finish_streaming(self, final_content: str = None):
+        """结束流式输出，在后台线程中对最终内容做一次完整的富文本渲染"""
+        if final_content is not None:
+            self.content = final_content.strip()
+            self._process_streaming_content()
+        self.is_streaming = False
+        self._request_rich_render()
+
+    def _request_rich_render(self):
+        """提交富文本渲染请求（仅AI消息）"""
+        if self.align_right or not self._display_text or self._display_text in self.PLACEHOLDER_TEXTS:
+            return
+        pipeline = RenderPipeline.instance()
+        self._render_key = pipeline.make_key(self._display_text, self.message_id)
+        pipeline.request(self._render_key, self._display_text, self._apply_rich_text)
+
+    def _apply_rich_text(self, key: str, rich_text: str):
+        """在GUI线程中一次性替换为渲染好的富文本"""
+        # 渲染期间内容又发生了变化，丢弃过期结果
+        if self.is_streaming or key != self._render_key or not rich_text or not self.message_label:
+            return
+        self.message_label.setTextFormat(Qt.TextFormat.RichText)
+        self.message_label.setText(rich_text)
+        self._force_layout_update()
+
     def _process_streaming_content(self):
         """处理流式内容，实时检测thinking标签"""
         if self.align_right:  # 用户消息不需要处理thinking
@@ -133,54 +203,122 @@ class MessageWidget(QWidget):
                 self._update_normal_content(content)
     
     def _create_thinking_widget(self):
-        """动态创建思考过程组件"""
-        if self.thinking_label or self.align_right:
+        """按需创建思考过程区域：摘要行 + 可折叠正文（正文在展开时才创建）"""
+        if self.thinking_header or self.align_right:
             return
             
-        # 在现有布局中插入thinking widget
-        main_layout = self.layout()
-        if main_layout and main_layout.count() > 0:
-            # 创建思考过程区域
-            thinking_widget = QWidget()
-            thinking_layout = QHBoxLayout(thinking_widget)
-            thinking_layout.setContentsMargins(0, 0, 0, 0)
-            
-            # 创建思考过程标签
-            self.thinking_label = QLabel()
-            self.thinking_label.setWordWrap(True)            
-            self.thinking_label.setStyleSheet("""
-                QLabel {
-                    background-color: #f0f8ff;
-                    border: 1px dashed #87ceeb;
-                    border-radius: 10px;
-                    padding: 8px;
-                    font-size: 12px;
-                    color: #4682b4;
-                    max-width: 960px;
-                }
-            """)
-            self.thinking_label.setVisible(False)
-            
-            thinking_layout.addWidget(self.thinking_label)
-            thinking_layout.addStretch()
-              # 插入到消息内容之前
-            main_layout.insertWidget(0, thinking_widget)
+        thinking_widget = QWidget()
+        thinking_layout = QVBoxLayout(thinking_widget)
+        thinking_layout.setContentsMargins(0, 0, 0, 0)
+        thinking_layout.setSpacing(2)
+        
+        # 摘要行，点击展开/收起
+        self.thinking_header = QPushButton()
+        self.thinking_header.setFlat(True)
+        self.thinking_header.setCursor(Qt.CursorShape.PointingHandCursor)
+        self.thinking_header.setStyleSheet("""
+            QPushButton {
+                background-color: #f0f8ff;
+                border: 1px dashed #87ceeb;
+                border-radius: 10px;
+                padding: 4px 10px;
+                font-size: 12px;
+                color: #4682b4;
+                text-align: left;
+            }
+            QPushButton:hover {
+                background-color: #e3f1fd;
+            }
+        """)
+        self.thinking_header.clicked.connect(self._toggle_thinking)
+        
+        header_row = QHBoxLayout()
+        header_row.setContentsMargins(0, 0, 0, 0)
+        header_row.addWidget(self.thinking_header)
+        header_row.addStretch()
+        thinking_layout.addLayout(header_row)
+        
+        # 插入到消息内容之前
+        self.layout().insertWidget(0, thinking_widget)
+        self._thinking_layout = thinking_layout
+
+    def _create_thinking_label(self):
+        """创建思考过程正文标签"""
+        self.thinking_label = QLabel()
+        self.thinking_label.setWordWrap(True)
+        self.thinking_label.setTextFormat(Qt.TextFormat.PlainText)
+        # 设置与正常消息框相同的最大宽度和约束
+        self.thinking_label.setMaximumWidth(960)
+        self.thinking_label.setSizePolicy(QSizePolicy.Policy.Preferred, QSizePolicy.Policy.Minimum)
+        self.thinking_label.setStyleSheet("""
+            QLabel {
+                background-color: #f0f8ff;
+                border: 1px dashed #87ceeb;
+                border-radius: 10px;
+                padding: 8px;
+                font-size: 12px;
+                color: #4682b4;
+            }
+        """)
+        
+        body_row = QHBoxLayout()
+        body_row.setContentsMargins(0, 0, 0, 0)
+        body_row.addWidget(self.thinking_label)
+        body_row.addStretch()
+        self._thinking_layout.addLayout(body_row)
+
     def _update_thinking_content(self, content: str, completed: bool = False):
-        """更新思考过程内容"""
-        if not self.thinking_label:
+        """更新思考过程内容（折叠时只更新摘要行，不对全文排版）"""
+        if self.align_right:
             return
+        self._create_thinking_widget()
             
         # 清理内容，确保不显示</think>标签
-        clean_content = content.replace('</think>', '').strip()
+        self._thinking_text = content.replace('</think>', '').strip()
         
         if completed:
-            # 思考完成，显示完整内容（保持可见，不自动隐藏）
-            self.thinking_label.setText(f"思考过程：\n{clean_content}")
-            self.thinking_label.setVisible(True)
+            if not self._thinking_completed:
+                self._thinking_completed = True
+                if self._thinking_started_at is not None:
+                    self._thinking_duration = time.monotonic() - self._thinking_started_at
+                # 思考完成后默认折叠为摘要行
+                self._thinking_expanded = False
+        elif self.is_streaming and self._thinking_started_at is None:
+            self._thinking_started_at = time.monotonic()
+        
+        self._refresh_thinking_panel()
+
+    def _refresh_thinking_panel(self):
+        """刷新摘要行与正文"""
+        summary = thinking_summary(len(self._thinking_text), self._thinking_completed,
+                                   self._thinking_duration, self._thinking_expanded)
+        if self.thinking_header.text() != summary:
+            self.thinking_header.setText(summary)
+        
+        if not self._thinking_expanded:
+            if self.thinking_label:
+                self.thinking_label.setVisible(False)
+            return
+        
+        if not self.thinking_label:
+            self._create_thinking_label()
+        
+        if self._thinking_completed:
+            text = self._thinking_text
         else:
-            # 思考进行中，显示当前内容 + 光标动画
-            self.thinking_label.setText(f"思考中...\n{clean_content}▊")
-            self.thinking_label.setVisible(True)
+            # 流式过程中只排版可见的尾部
+            text = thinking_tail(self._thinking_text, self.THINKING_TAIL_CHARS, self.THINKING_TAIL_LINES)
+        
+        if text != self._thinking_shown_text:
+            self._thinking_shown_text = text
+            self.thinking_label.setText(text)
+        self.thinking_label.setVisible(True)
+
+    def _toggle_thinking(self):
+        """展开/收起思考过程"""
+        self._thinking_expanded = not self._thinking_expanded
+        self._refresh_thinking_panel()
+        self._force_layout_update()
     
     def _update_normal_content(self, content: str):
         """更新正常消息内容"""
@@ -191,10 +329,15 @@ class MessageWidget(QWidget):
         cleaned_content = content.strip()
         
         if cleaned_content:
-            self._format_message_text(self.message_label, cleaned_content)
+            self._display_text = cleaned_content
+            if self.is_streaming:
+                self._set_plain_text(self.message_label, cleaned_content)
+            else:
+                self._format_message_text(self.message_label, cleaned_content)
             # 确保正常消息可见（特别是在思考模式结束后）
             self.message_label.setVisible(True)
         else:
+            self._display_text = ""
             # 如果没有正常内容，显示默认提示
             if not self.is_in_thinking_mode:
                 self._format_message_text(self.message_label, "✨ AI正在回复...")
@@ -229,16 +372,22 @@ class MessageWidget(QWidget):
                 # 合并并显示正常内容
                 normal_content = (before_think + after_think).strip()
                 if normal_content:
+                    self._display_text = normal_content
                     self._format_message_text(self.message_label, normal_content)
                 else:
                     # 如果没有正常内容，显示默认消息
                     self._format_message_text(self.message_label, "✨ 思考完成")
             else:
                 # thinking标签不完整，按正常内容处理
+                self._display_text = self.content
                 self._format_message_text(self.message_label, self.content)
         else:
             # 没有thinking标签，按正常内容处理
+            self._display_text = self.content
             self._format_message_text(self.message_label, self.content)
+        
+        # 静态加载的AI消息同样在后台渲染富文本
+        self._request_rich_render()
 
     def _parse_content(self):
         """解析消息内容，分离思考过程和实际回复（兼容旧版本）"""
@@ -287,6 +436,7 @@ class MessageWidget(QWidget):
         
         # 设置处理后的文本
         formatted_text = '\n'.join(formatted_lines)
+        message_label.setTextFormat(Qt.TextFormat.PlainText)
         message_label.setText(formatted_text)
         
         # 动态计算气泡框的合适宽度
@@ -294,8 +444,27 @@ class MessageWidget(QWidget):
         bubble_width = min(max_width, text_width + 24)  # 加上内边距
         
         # 设置大小策略和约束
-        message_label.setMaximumWidth(max_width)
         message_label.setMinimumWidth(min(bubble_width, max_width))
+        self._apply_bubble_style(message_label)
+
+    def _set_plain_text(self, message_label: QLabel, content: str):
+        """流式快速路径：直接设置纯文本，不做逐行测量与换行计算"""
+        if message_label.textFormat() != Qt.TextFormat.PlainText:
+            message_label.setTextFormat(Qt.TextFormat.PlainText)
+        message_label.setText(content)
+        
+        # 只测量最后一行，气泡宽度随内容单调增长
+        last_line = content[content.rfind('\n') + 1:]
+        bubble_width = QFontMetrics(message_label.font()).horizontalAdvance(last_line) + 24
+        if bubble_width > message_label.minimumWidth():
+            message_label.setMinimumWidth(min(bubble_width, 960))
+        if not message_label.styleSheet():
+            self._apply_bubble_style(message_label)
+
+    def _apply_bubble_style(self, message_label: QLabel):
+        """设置气泡框的大小策略与样式"""
+        max_width = 960
+        message_label.setMaximumWidth(max_width)
         message_label.setSizePolicy(QSizePolicy.Policy.Preferred, QSizePolicy.Policy.Minimum)
         message_label.setStyleSheet(f"""
             QLabel {{
@@ -344,32 +513,7 @@ class MessageWidget(QWidget):
         message_layout = QVBoxLayout(self)
         message_layout.setContentsMargins(0, 0, 0, 0)
         message_layout.setSpacing(5)
-          # 为AI消息预创建思考过程区域（初始隐藏）
-        if not self.align_right:
-            thinking_widget = QWidget()
-            thinking_layout = QHBoxLayout(thinking_widget)
-            thinking_layout.setContentsMargins(0, 0, 0, 0)
-            
-            # 创建思考过程标签
-            self.thinking_label = QLabel()
-            self.thinking_label.setWordWrap(True)            # 设置与正常消息框相同的最大宽度和约束
-            self.thinking_label.setMaximumWidth(960)
-            self.thinking_label.setSizePolicy(QSizePolicy.Policy.Preferred, QSizePolicy.Policy.Minimum)
-            self.thinking_label.setStyleSheet("""
-                QLabel {
-                    background-color: #f0f8ff;
-                    border: 1px dashed #87ceeb;
-                    border-radius: 10px;
-                    padding: 8px;
-                    font-size: 12px;
-                    color: #4682b4;
-                }
-            """)
-            self.thinking_label.setVisible(False)  # 初始隐藏
-            
-            thinking_layout.addWidget(self.thinking_label)
-            thinking_layout.addStretch()
-            message_layout.addWidget(thinking_widget)
+        # 思考过程区域在出现思考内容时才创建
         
         # 创建消息内容区域
         content_widget = QWidget()
@@ -436,6 +580,10 @@ class MessageWidget(QWidget):
         
         message_layout.addWidget(button_widget)
     
+    def snapshot_text(self) -> str:
+        """用于渲染快照的纯文本（正常消息框中显示的内容）"""
+        return self._display_text or self.content
+
     def _copy_message(self):
         """复制消息内容"""
         if self.parent and hasattr(self.parent, 'copy_message_content'):
@@ -447,6 +595,100 @@ class MessageWidget(QWidget):
             self.parent.delete_message(self)
 
 
+class SnapshotMessageWidget(QWidget):
+    """快照占位消息：按保存的高度和纯文本立即绘制，数据库加载完成后被真实消息替换"""
+
+    def __init__(self, entry, parent=None):
+        super().__init__(parent)
+        self.message_id = entry.message_id
+        self.align_right = entry.align_right
+        self.setFixedHeight(entry.height)
+        
+        layout = QHBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        
+        label = QLabel()
+        label.setTextFormat(Qt.TextFormat.PlainText)
+        label.setWordWrap(True)
+        label.setText(entry.text)
+        label.setMaximumWidth(960)
+        label.setAlignment(Qt.AlignmentFlag.AlignLeft | Qt.AlignmentFlag.AlignTop)
+        label.setStyleSheet(f"""
+            QLabel {{
+                background-color: {'#a0e6a0' if entry.align_right else 'white'};
+                border-radius: 15px;
+                padding: 12px;
+                font-size: 14px;
+            }}
+        """)
+        
+        if entry.align_right:
+            layout.addStretch()
+        layout.addWidget(label, alignment=Qt.AlignmentFlag.AlignTop)
+        if not entry.align_right:
+            layout.addStretch()
+
+
+class ComparisonWidget(QWidget):
+    """多模型对比：同一问题的各模型回复并排显示，每列显示首字延迟与总耗时"""
+
+    def __init__(self, models: list, parent=None):
+        super().__init__(parent)
+        self.parent = parent
+        self.message_widgets = {}  # 模型 -> MessageWidget
+        self.contents = {}  # 模型 -> 已接收的回复内容
+        self._stats_labels = {}
+        
+        layout = QHBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.setSpacing(10)
+        for model in models:
+            column = QVBoxLayout()
+            column.setSpacing(4)
+            
+            header = QLabel(model)
+            header.setStyleSheet("QLabel { color: #2d3748; font-size: 13px; font-weight: bold; }")
+            column.addWidget(header)
+            
+            message_widget = MessageWidget("", align_right=False, parent=parent)
+            column.addWidget(message_widget)
+            
+            stats_label = QLabel("等待首字...")
+            stats_label.setStyleSheet("QLabel { color: #718096; font-size: 12px; }")
+            column.addWidget(stats_label)
+            column.addStretch()
+            
+            layout.addLayout(column, 1)
+            self.message_widgets[model] = message_widget
+            self.contents[model] = ""
+            self._stats_labels[model] = stats_label
+
+    def append_chunk(self, model: str, chunk: str):
+        """追加某个模型的回复片段"""
+        self.contents[model] += chunk
+        self.message_widgets[model].update_content(self.contents[model])
+
+    def finish_model(self, model: str, message_id: int = None):
+        """某个模型回复完成"""
+        message_widget = self.message_widgets[model]
+        message_widget.message_id = message_id
+        message_widget.finish_streaming()
+
+    def set_first_token(self, model: str, first_token_seconds: float):
+        """收到首个片段时立即显示首字延迟（总耗时在回复结束后由 set_timing 补全）"""
+        self._stats_labels[model].setText(f"首字 {first_token_seconds:.2f} 秒 · 生成中...")
+
+    def set_timing(self, model: str, first_token_seconds: float, total_seconds: float, cached: bool = False):
+        """显示首字延迟与总耗时（cached 表示回复来自缓存）"""
+        text = f"首字 {first_token_seconds:.2f} 秒 · 总耗时 {total_seconds:.2f} 秒"
+        self._stats_labels[model].setText(text + " · 缓存" if cached else text)
+
+    def set_error(self, model: str, message: str):
+        """显示某个模型的错误"""
+        self.message_widgets[model].finish_streaming(f"错误: {message}")
+        self._stats_labels[model].setText("请求失败")
+
+
 class ToastWidget(QDialog):
     """提示信息组件"""
     
@@ -0,0 +1,257 @@
+"""
+界面卡顿监测
+通过 --lag-monitor 启用：界面线程中的定时器按固定间隔调用 tick()，实际间隔超出预期的部分即事件循环延迟；
+辅助线程定期检查心跳，界面线程超过阈值没有响应时采样它的调用栈，记录卡顿期间正在运行的处理函数
+（handle_ai_chunk、_force_layout_update、scroll_to_bottom、数据库调用等）。
+界面侧还会记录每帧的重绘耗时（见 ui/frame_monitor.py 的 LagWatchdog）。
+
+退出时打印报告：事件循环延迟分位数、帧重绘耗时，以及按卡顿总时长排序的处理函数与热点。
+启用延迟追踪（--trace）时，每次卡顿同时记录为 ui.stall span。
+"""
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque, namedtuple
+from typing import Dict, List, Optional, Tuple
+
+from utils.tracing import tracer
+
+# handler 为事件循环调用的最外层处理函数，hot_spot 为最内层的项目代码（或第三方库）函数
+StackSample = namedtuple('StackSample', 'handler hot_spot stack')
+Stall = namedtuple('Stall', 'started_at duration_ms handler hot_spot samples')
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+NO_SAMPLE = "（未采样）"
+EVENT_LOOP = "Qt事件循环（无Python代码）"
+PAINTING = "窗口重绘"
+
+
+def _percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class LagMonitor:
+    """事件循环延迟与卡顿采样（未启用时所有方法均为空操作）
+
+    interval_ms: 心跳间隔（界面线程定时器的周期）
+    threshold_ms: 心跳迟到超过该值计为一次卡顿
+    sample_ms: 辅助线程检查心跳与采样调用栈的间隔
+    """
+
+    def __init__(self, interval_ms: float = 16, threshold_ms: float = 50, sample_ms: float = 5,
+                 capacity: int = 10000):
+        self.enabled = False
+        self.interval_ms = interval_ms
+        self.threshold_ms = threshold_ms
+        self.sample_ms = sample_ms
+        self.drifts = deque(maxlen=capacity)  # 每次心跳的延迟（毫秒）
+        self.frames = deque(maxlen=capacity)  # (重绘耗时毫秒, 是否包含聊天区)
+        self.stalls = deque(maxlen=capacity)
+        self._samples: List[StackSample] = []
+        # 由界面侧更新：正在分发的Qt事件 (类型, 接收者类名)，以及是否正在重绘窗口
+        self.current_event = None
+        self.painting = False
+        self._own_codes = frozenset()
+        self._lock = threading.Lock()
+        self._last_tick_ns: Optional[int] = None
+        self._entry_codes = frozenset()
+        self._gui_thread_id = None
+        self._sampler = None
+        self._stopped = threading.Event()
+
+    def enable(self, interval_ms: Optional[float] = None, threshold_ms: Optional[float] = None,
+               sample_ms: Optional[float] = None):
+        if interval_ms is not None:
+            self.interval_ms = interval_ms
+        if threshold_ms is not None:
+            self.threshold_ms = threshold_ms
+        if sample_ms is not None:
+            self.sample_ms = sample_ms
+        self.enabled = True
+
+    def clear(self):
+        with self._lock:
+            self.drifts.clear()
+            self.frames.clear()
+            self.stalls.clear()
+            self._samples = []
+
+    def start(self):
+        """在界面线程中调用：开始心跳并启动采样线程"""
+        if not self.enabled or self._sampler is not None:
+            return
+        self._gui_thread_id = threading.get_ident()
+        self._last_tick_ns = None
+        self._stopped.clear()
+        self._sampler = threading.Thread(target=self._sample_loop, name="lag-monitor", daemon=True)
+        self._sampler.start()
+
+    def stop(self):
+        if self._sampler is None:
+            return
+        self._stopped.set()
+        self._sampler.join()
+        self._sampler = None
+
+    def tick(self):
+        """界面线程的心跳（由定时器按 interval_ms 调用）：记录延迟，迟到超过阈值时结束一次卡顿"""
+        if not self.enabled:
+            return
+        now_ns = time.perf_counter_ns()
+        last_ns = self._last_tick_ns
+        if last_ns is None:
+            # 首次心跳时的调用栈（事件循环及其外层）不属于任何处理函数
+            self._entry_codes = frozenset(self._stack_codes(sys._getframe(1)))
+            self._last_tick_ns = now_ns
+            return
+        drift = max(0.0, (now_ns - last_ns) / 1e6 - self.interval_ms)
+        self.drifts.append(drift)
+        with self._lock:
+            samples, self._samples = self._samples, []
+            # 心跳记录放在锁内，采样线程不会把下一段的采样计入本次卡顿
+            self._last_tick_ns = now_ns
+        if drift >= self.threshold_ms:
+            self._record_stall(last_ns + int(self.interval_ms * 1e6), drift, samples)
+
+    def ignore_code(self, code):
+        """采样时忽略监测自身的帧（如界面侧的事件过滤器）"""
+        self._own_codes = self._own_codes | {code}
+
+    def record_frame(self, paint_ms: float, chat_area: bool):
+        """记录一帧的重绘耗时（chat_area 表示这一帧重绘了聊天区）"""
+        if self.enabled:
+            self.frames.append((paint_ms, chat_area))
+
+    def _record_stall(self, started_ns: int, duration_ms: float, samples: List[StackSample]):
+        if samples:
+            handlers = Counter(sample.handler for sample in samples)
+            handler = handlers.most_common(1)[0][0]
+            hot_spot = Counter(sample.hot_spot for sample in samples if sample.handler == handler).most_common(1)[0][0]
+        else:
+            handler = hot_spot = NO_SAMPLE
+        self.stalls.append(Stall(time.time() - duration_ms / 1000, duration_ms, handler, hot_spot, samples))
+        tracer.complete('ui.stall', started_ns, handler=handler, hot_spot=hot_spot, samples=len(samples))
+
+    def _sample_loop(self):
+        # 提前到阈值的一半开始采样，刚超过阈值的卡顿也有调用栈（未达到阈值的采样在下次心跳时丢弃）
+        late_ns = (self.interval_ms + self.threshold_ms / 2) * 1e6
+        while not self._stopped.wait(self.sample_ms / 1000):
+            last_ns = self._last_tick_ns
+            if last_ns is None or time.perf_counter_ns() - last_ns < late_ns:
+                continue
+            frame = sys._current_frames().get(self._gui_thread_id)
+            if frame is None:
+                continue
+            sample = self._describe(frame, self.painting, self.current_event)
+            del frame
+            with self._lock:
+                # 采样期间心跳已恢复则丢弃
+                if self._last_tick_ns == last_ns:
+                    self._samples.append(sample)
+
+    @staticmethod
+    def _stack_codes(frame):
+        while frame is not None:
+            yield frame.f_code
+            frame = frame.f_back
+
+    @staticmethod
+    def _frame_name(frame) -> str:
+        code = frame.f_code
+        name = getattr(code, 'co_qualname', code.co_name)
+        path = code.co_filename
+        if path.startswith(PROJECT_ROOT):
+            module = os.path.splitext(os.path.relpath(path, PROJECT_ROOT))[0].replace(os.sep, '.')
+        else:
+            module = os.path.splitext(os.path.basename(path))[0]
+        return f"{module}.{name}"
+
+    def _describe(self, frame, painting: bool = False, current_event=None) -> StackSample:
+        """把界面线程的调用栈归结为处理函数与热点（去掉事件循环外层与监测自身的帧）
+
+        没有Python帧时卡在Qt内部（如布局计算），用正在分发的事件作为热点
+        """
+        stack = []
+        while frame is not None:
+            if frame.f_code not in self._entry_codes and frame.f_code not in self._own_codes:
+                stack.append(frame)
+            frame = frame.f_back
+        event = f"{current_event[0].name} → {current_event[1]}" if current_event else "未知事件"
+        if not stack:
+            return StackSample(PAINTING if painting else EVENT_LOOP, event, ())
+        stack.reverse()  # 由外到内
+        names = tuple(self._frame_name(f) for f in stack)
+        project = [name for f, name in zip(stack, names) if f.f_code.co_filename.startswith(PROJECT_ROOT)]
+        hot_spot = project[-1] if project else names[-1]
+        if names[-1] != hot_spot:
+            # 卡在第三方库（如Markdown渲染）时一并显示
+            hot_spot = f"{hot_spot} → {names[-1]}"
+        return StackSample(PAINTING if painting else names[0], hot_spot, names[-12:])
+
+    def offenders(self) -> List[Tuple[str, Dict]]:
+        """按卡顿总时长排序的处理函数：次数、总时长、最长一次与各热点的卡顿次数"""
+        result: Dict[str, Dict] = {}
+        for stall in list(self.stalls):
+            stats = result.setdefault(stall.handler, {"stalls": 0, "total_ms": 0.0, "max_ms": 0.0,
+                                                      "hot_spots": Counter()})
+            stats["stalls"] += 1
+            stats["total_ms"] += stall.duration_ms
+            stats["max_ms"] = max(stats["max_ms"], stall.duration_ms)
+            stats["hot_spots"][stall.hot_spot] += 1
+        return sorted(result.items(), key=lambda item: item[1]["total_ms"], reverse=True)
+
+    def summary(self) -> Dict:
+        drifts = list(self.drifts)
+        frames = list(self.frames)
+        chat_frames = [paint_ms for paint_ms, chat_area in frames if chat_area]
+        result = {"ticks": len(drifts), "stalls": len(self.stalls), "frames": len(frames),
+                  "chat_frames": len(chat_frames),
+                  "slow_frames": sum(1 for paint_ms, _ in frames if paint_ms > self.interval_ms)}
+        if drifts:
+            result["drift_ms"] = {"p50": _percentile(drifts, 0.5), "p95": _percentile(drifts, 0.95),
+                                  "p99": _percentile(drifts, 0.99), "max": max(drifts)}
+        if chat_frames:
+            result["chat_paint_ms"] = {"p50": _percentile(chat_frames, 0.5), "p95": _percentile(chat_frames, 0.95),
+                                       "max": max(chat_frames)}
+        return result
+
+    def report(self, top: int = 10) -> str:
+        summary = self.summary()
+        lines = ["==== 界面卡顿 ===="]
+        if "drift_ms" in summary:
+            drift = summary["drift_ms"]
+            lines.append(f"  事件循环延迟: {summary['ticks']} 次心跳  p50 {drift['p50']:.1f} ms  p95 {drift['p95']:.1f} ms  "
+                         f"p99 {drift['p99']:.1f} ms  最大 {drift['max']:.1f} ms")
+        if "chat_paint_ms" in summary:
+            paint = summary["chat_paint_ms"]
+            lines.append(f"  聊天区重绘: {summary['chat_frames']} 帧  p50 {paint['p50']:.2f} ms  p95 {paint['p95']:.2f} ms  "
+                         f"最大 {paint['max']:.2f} ms（全部 {summary['frames']} 帧中超过一帧时长的 {summary['slow_frames']} 帧）")
+        lines.append(f"  卡顿（心跳迟到超过 {self.threshold_ms:g} ms）: {summary['stalls']} 次")
+        for handler, stats in self.offenders()[:top]:
+            lines.append(f"  {handler}: {stats['stalls']} 次，共 {stats['total_ms']:.0f} ms，最长 {stats['max_ms']:.0f} ms")
+            for hot_spot, count in stats["hot_spots"].most_common(3):
+                lines.append(f"      {count:>4} 次  {hot_spot}")
+        return '\n'.join(lines)
+
+    def save(self, folder: str):
+        """退出时调用：停止采样，导出卡顿记录（含调用栈）到 folder 并打印报告"""
+        if not self.enabled:
+            return
+        self.stop()
+        if not self.drifts:
+            return
+        path = os.path.join(folder, time.strftime('lag-%Y%m%d-%H%M%S.json'))
+        stalls = [{"started_at": stall.started_at, "duration_ms": stall.duration_ms, "handler": stall.handler,
+                   "hot_spot": stall.hot_spot, "stacks": [list(sample.stack) for sample in stall.samples]}
+                  for stall in list(self.stalls)]
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({"summary": self.summary(), "stalls": stalls}, f, ensure_ascii=False, indent=1)
+        print(self.report())
+        print(f"卡顿记录已保存: {path}")
+
+
+# 全局卡顿监测器
+lag_monitor = LagMonitor()
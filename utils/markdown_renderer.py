@@ -0,0 +1,233 @@
+"""
+Markdown渲染工具
+将模型回复中的Markdown转换为Qt富文本（HTML子集），纯Python实现，可在工作线程中调用
+"""
+import html
+import re
+from typing import List
+
+# 渲染器版本，输出格式变化时递增以使磁盘缓存失效
+RENDERER_VERSION = 3
+
+# 代码块外框样式（Qt富文本对table背景支持最稳定）
+CODE_BLOCK_TEMPLATE = (
+    '<table width="100%" cellpadding="8" cellspacing="0" bgcolor="#f6f8fa" '
+    'style="margin-top:4px; margin-bottom:4px;"><tr><td>'
+    '<pre style="font-family:Consolas,Menlo,monospace; font-size:13px;">{code}</pre>'
+    '</td></tr></table>'
+)
+INLINE_CODE_TEMPLATE = (
+    '<code style="font-family:Consolas,Menlo,monospace; background-color:#f0f0f0;">{code}</code>'
+)
+
+_FENCE_PATTERN = re.compile(r'^\s*(```|~~~)\s*([\w+#.-]*)\s*$')
+_HEADING_PATTERN = re.compile(r'^(#{1,6})\s+(.*?)\s*#*\s*$')
+_BULLET_PATTERN = re.compile(r'^(\s*)[-*+]\s+(.*)$')
+_ORDERED_PATTERN = re.compile(r'^(\s*)\d+[.)]\s+(.*)$')
+_HR_PATTERN = re.compile(r'^\s*([-*_])(\s*\1){2,}\s*$')
+_TABLE_SEPARATOR_PATTERN = re.compile(r'^\s*\|?\s*:?-{3,}:?\s*(\|\s*:?-{3,}:?\s*)*\|?\s*$')
+
+_INLINE_CODE_PATTERN = re.compile(r'`([^`\n]+)`')
+_BOLD_PATTERN = re.compile(r'\*\*(.+?)\*\*|__(.+?)__')
+_ITALIC_PATTERN = re.compile(r'(?<![\w*])\*(?!\s)(.+?)(?<!\s)\*(?!\*)|(?<![\w_])_(?!\s)(.+?)(?<!\s)_(?![\w_])')
+_STRIKE_PATTERN = re.compile(r'~~(.+?)~~')
+_LINK_PATTERN = re.compile(r'\[([^\]]+)\]\((https?://[^\s)]+)\)')
+
+
+_pygments = None  # Pygments在首次高亮时才导入，未安装时为False
+
+
+def _load_pygments():
+    """按需导入Pygments"""
+    global _pygments
+    if _pygments is None:
+        try:
+            from pygments import highlight
+            from pygments.formatters import HtmlFormatter
+            from pygments.lexers import get_lexer_by_name
+            from pygments.util import ClassNotFound
+            _pygments = (highlight, HtmlFormatter(noclasses=True, nowrap=True, style='default'),
+                         get_lexer_by_name, ClassNotFound)
+        except ImportError:  # 未安装Pygments时退化为无高亮的代码块
+            _pygments = False
+    return _pygments
+
+
+def highlight_code(code: str, language: str = "") -> str:
+    """对代码做语法高亮，返回内联样式的HTML；无法识别语言时仅做转义"""
+    pygments = _load_pygments() if language else False
+    if pygments:
+        highlight, formatter, get_lexer_by_name, class_not_found = pygments
+        try:
+            lexer = get_lexer_by_name(language.lower(), stripnl=False)
+            return highlight(code, lexer, formatter).rstrip('\n')
+        except class_not_found:
+            pass
+    return html.escape(code)
+
+
+def render_code_block(code: str, language: str = "") -> str:
+    """渲染代码块（带语法高亮）"""
+    return CODE_BLOCK_TEMPLATE.format(code=highlight_code(code, language))
+
+
+def _escape_quotes(text: str) -> str:
+    return text.replace('"', '&quot;').replace("'", '&#x27;')
+
+
+def render_inline(text: str) -> str:
+    """渲染行内元素（行内代码、粗体、斜体、删除线、链接）"""
+    # 先把行内代码替换为占位符，避免其内容被其他规则处理
+    code_spans = []
+
+    def _stash_code(match):
+        code_spans.append(INLINE_CODE_TEMPLATE.format(code=html.escape(match.group(1))))
+        return f"\x00{len(code_spans) - 1}\x00"
+
+    text = _INLINE_CODE_PATTERN.sub(_stash_code, text)
+    text = html.escape(text, quote=False)
+
+    # 整段文本已转义过 & < >，链接地址只需再转义引号，否则 & 会变成 &amp;amp;
+    text = _LINK_PATTERN.sub(lambda m: f'<a href="{_escape_quotes(m.group(2))}">{m.group(1)}</a>', text)
+    text = _BOLD_PATTERN.sub(lambda m: f"<b>{m.group(1) or m.group(2)}</b>", text)
+    text = _ITALIC_PATTERN.sub(lambda m: f"<i>{m.group(1) or m.group(2)}</i>", text)
+    text = _STRIKE_PATTERN.sub(r"<s>\1</s>", text)
+
+    return re.sub(r"\x00(\d+)\x00", lambda m: code_spans[int(m.group(1))], text)
+
+
+def _split_table_row(line: str) -> List[str]:
+    """拆分表格行"""
+    line = line.strip()
+    if line.startswith('|'):
+        line = line[1:]
+    if line.endswith('|'):
+        line = line[:-1]
+    return [cell.strip() for cell in line.split('|')]
+
+
+def _render_table(rows: List[str]) -> str:
+    """渲染表格（第一行为表头，第二行为分隔行）"""
+    header = _split_table_row(rows[0])
+    parts = ['<table border="1" cellspacing="0" cellpadding="4" style="border-color:#d0d7de;">']
+    parts.append('<tr>' + ''.join(f'<th bgcolor="#f6f8fa">{render_inline(cell)}</th>' for cell in header) + '</tr>')
+    for row in rows[2:]:
+        cells = _split_table_row(row)
+        cells += [''] * (len(header) - len(cells))
+        parts.append('<tr>' + ''.join(f'<td>{render_inline(cell)}</td>' for cell in cells[:len(header)]) + '</tr>')
+    parts.append('</table>')
+    return ''.join(parts)
+
+
+def render_markdown(text: str, code_renderer=render_code_block) -> str:
+    """将Markdown文本转换为Qt富文本HTML
+
+    code_renderer 用于渲染围栏代码块，签名为 (code, language) -> html
+    """
+    lines = text.split('\n')
+    blocks = []
+    paragraph = []
+    list_tag = None
+    list_items = []
+
+    def flush_paragraph():
+        if paragraph:
+            blocks.append('<p>' + '<br>'.join(render_inline(line) for line in paragraph) + '</p>')
+            paragraph.clear()
+
+    def flush_list():
+        nonlocal list_tag
+        if list_tag:
+            blocks.append(f'<{list_tag}>' + ''.join(f'<li>{item}</li>' for item in list_items) + f'</{list_tag}>')
+            list_items.clear()
+            list_tag = None
+
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        stripped = line.strip()
+
+        # 围栏代码块
+        fence = _FENCE_PATTERN.match(line)
+        if fence:
+            flush_paragraph()
+            flush_list()
+            marker, language = fence.group(1), fence.group(2)
+            code_lines = []
+            i += 1
+            while i < len(lines) and lines[i].strip() != marker:
+                code_lines.append(lines[i])
+                i += 1
+            blocks.append(code_renderer('\n'.join(code_lines), language))
+            i += 1
+            continue
+
+        if not stripped:
+            flush_paragraph()
+            flush_list()
+            i += 1
+            continue
+
+        # 表格：当前行含'|'且下一行为分隔行
+        if '|' in stripped and i + 1 < len(lines) and _TABLE_SEPARATOR_PATTERN.match(lines[i + 1]):
+            flush_paragraph()
+            flush_list()
+            table_rows = [line, lines[i + 1]]
+            i += 2
+            while i < len(lines) and '|' in lines[i] and lines[i].strip():
+                table_rows.append(lines[i])
+                i += 1
+            blocks.append(_render_table(table_rows))
+            continue
+
+        heading = _HEADING_PATTERN.match(stripped)
+        if heading:
+            flush_paragraph()
+            flush_list()
+            level = len(heading.group(1))
+            blocks.append(f'<h{level}>{render_inline(heading.group(2))}</h{level}>')
+            i += 1
+            continue
+
+        if _HR_PATTERN.match(stripped):
+            flush_paragraph()
+            flush_list()
+            blocks.append('<hr>')
+            i += 1
+            continue
+
+        if stripped.startswith('>'):
+            flush_paragraph()
+            flush_list()
+            quote_lines = []
+            while i < len(lines) and lines[i].strip().startswith('>'):
+                quote_lines.append(lines[i].strip()[1:].lstrip())
+                i += 1
+            blocks.append('<blockquote style="color:#57606a;">' + render_markdown('\n'.join(quote_lines), code_renderer) + '</blockquote>')
+            continue
+
+        bullet = _BULLET_PATTERN.match(line)
+        ordered = None if bullet else _ORDERED_PATTERN.match(line)
+        if bullet or ordered:
+            flush_paragraph()
+            tag = 'ul' if bullet else 'ol'
+            if list_tag != tag:
+                flush_list()
+                list_tag = tag
+            list_items.append(render_inline((bullet or ordered).group(2)))
+            i += 1
+            continue
+
+        if list_tag and line.startswith((' ', '\t')):
+            # 列表项的续行
+            list_items[-1] += '<br>' + render_inline(stripped)
+            i += 1
+            continue
+
+        flush_list()
+        paragraph.append(stripped)
+        i += 1
+
+    flush_paragraph()
+    flush_list()
+    return ''.join(blocks)
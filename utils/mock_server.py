@@ -0,0 +1,238 @@
+"""
+本地模拟SSE服务
+按 MockScenario 输出与硅基流动、智谱相同格式的流式响应，真实服务商客户端指向它即可离线运行：
+
+    POST /v1/chat/completions            硅基流动格式（思考过程在 delta.reasoning_content 中）
+    POST /api/paas/v4/chat/completions   智谱格式（思考过程以 <think>...</think> 内嵌在 content 中）
+
+请求的模型以 mock 开头时按模型名选择场景，否则使用服务器的默认场景。
+
+用法: python -m utils.mock_server [--port 8766] [--ttft 0.3] [--tps 40] [--tokens 120] [--reasoning 0]
+"""
+import json
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Optional
+
+from models.mock_provider import MockScenario, is_mock_model
+
+SILICONFLOW_PATH = '/v1/chat/completions'
+ZHIPU_PATH = '/api/paas/v4/chat/completions'
+
+
+class MockStreamHandler(BaseHTTPRequestHandler):
+    """按场景输出SSE流（分块传输，与真实服务一致）"""
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, status: int, data, headers: Optional[Dict[str, str]] = None):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _write_chunk(self, data: bytes):
+        self.wfile.write(f"{len(data):x}\r\n".encode('ascii') + data + b"\r\n")
+        self.wfile.flush()
+
+    def do_POST(self):
+        path = self.path.split('?', 1)[0]
+        if path not in (SILICONFLOW_PATH, ZHIPU_PATH):
+            self._send_json(404, {"error": {"message": f"未知的路径: {path}"}})
+            return
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        except json.JSONDecodeError:
+            self._send_json(400, {"error": {"message": "请求体不是有效的JSON"}})
+            return
+        server: MockStreamServer = self.server.owner
+        model = request.get('model') or 'mock'
+        scenario = MockScenario.for_model(model) if is_mock_model(model) else server.scenario
+        server.record_request(path, request)
+
+        status = scenario.pick_error()
+        if status is not None:
+            headers = {'Retry-After': f"{scenario.retry_after:g}"} if status == 429 else None
+            self._send_json(status, {"error": {"message": f"模拟错误 {status}", "code": status}}, headers)
+            return
+
+        zhipu = path == ZHIPU_PATH
+        messages = request.get('messages') or []
+        timeline = scenario.timeline(messages)
+        if not request.get('stream'):
+            content = self._full_reply(timeline, zhipu, server.sleep)
+            self._send_json(200, {
+                "id": f"mock-{uuid.uuid4().hex}", "object": "chat.completion", "created": int(time.time()),
+                "model": model, "choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                                             "finish_reason": "stop"}],
+            })
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream; charset=utf-8')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        completion_id = f"mock-{uuid.uuid4().hex}"
+        created = int(time.time())
+        thinking = False
+        tokens = 0
+        try:
+            for delay, text, is_reasoning in timeline:
+                if delay:
+                    server.sleep(delay)
+                delta = {}
+                if zhipu:
+                    # 智谱：思考过程内嵌在正文中
+                    if is_reasoning and not thinking:
+                        text, thinking = "<think>" + text, True
+                    elif not is_reasoning and thinking:
+                        text, thinking = "</think>" + text, False
+                    delta["content"] = text
+                elif is_reasoning:
+                    delta["reasoning_content"] = text
+                else:
+                    delta["content"] = text
+                tokens += 1
+                self._write_chunk(self._event(completion_id, created, model, delta))
+            usage = {"prompt_tokens": sum(len(m.get('content') or '') for m in messages),
+                     "completion_tokens": tokens, "total_tokens": tokens}
+            self._write_chunk(self._event(completion_id, created, model, {}, "stop", usage))
+            self._write_chunk(b"data: [DONE]\n\n")
+            self._write_chunk(b"")
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+
+    @staticmethod
+    def _event(completion_id: str, created: int, model: str, delta: Dict, finish_reason: Optional[str] = None,
+               usage: Optional[Dict] = None) -> bytes:
+        data = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+        if usage is not None:
+            data["usage"] = usage
+        return f"data: {json.dumps(data, ensure_ascii=False)}\n\n".encode('utf-8')
+
+    @staticmethod
+    def _full_reply(timeline, zhipu: bool, sleep: Callable[[float], None]) -> str:
+        parts = []
+        reasoning = []
+        for delay, text, is_reasoning in timeline:
+            if delay:
+                sleep(delay)
+            (reasoning if is_reasoning else parts).append(text)
+        if zhipu and reasoning:
+            return f"<think>{''.join(reasoning)}</think>{''.join(parts)}"
+        return ''.join(parts)
+
+
+class _HTTPServer(ThreadingHTTPServer):
+    # 基准会同时发起大量连接
+    request_queue_size = 128
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # 客户端提前断开（如中断的流）属于正常情况
+        if not isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            super().handle_error(request, client_address)
+
+
+class MockStreamServer:
+    """本地模拟SSE服务（在后台线程中运行）"""
+
+    def __init__(self, scenario: Optional[MockScenario] = None, host: str = '127.0.0.1', port: int = 0,
+                 sleep: Callable[[float], None] = time.sleep):
+        self.scenario = scenario or MockScenario()
+        self.sleep = sleep
+        self.httpd = _HTTPServer((host, port), MockStreamHandler)
+        self.httpd.owner = self
+        self.requests = 0
+        self.last_request: Optional[Dict] = None
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._restore = []
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def siliconflow_url(self) -> str:
+        return self.base_url + SILICONFLOW_PATH
+
+    @property
+    def zhipu_url(self) -> str:
+        return self.base_url + ZHIPU_PATH
+
+    def record_request(self, path: str, request: Dict):
+        with self._lock:
+            self.requests += 1
+            self.last_request = dict(request, path=path)
+
+    def start(self) -> "MockStreamServer":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="mock-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def point_providers(self):
+        """把硅基流动与智谱（同步与异步）服务商的请求地址指向本服务，close() 时恢复"""
+        from models import SiliconFlowProvider, ZhipuAIProvider
+        from models.async_providers import AsyncSiliconFlowProvider, AsyncZhipuAIProvider
+        for cls, url in ((SiliconFlowProvider, self.siliconflow_url), (AsyncSiliconFlowProvider, self.siliconflow_url),
+                         (ZhipuAIProvider, self.zhipu_url), (AsyncZhipuAIProvider, self.zhipu_url)):
+            self._restore.append((cls, cls.__dict__['url']))
+            cls.url = url
+
+    def close(self):
+        for cls, url in reversed(self._restore):
+            cls.url = url
+        self._restore.clear()
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="本地模拟SSE服务（硅基流动与智谱格式）")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8766)
+    parser.add_argument('--ttft', type=float, default=0.3, help="首字延迟（秒）")
+    parser.add_argument('--tps', type=float, default=40.0, help="输出速率（片段/秒），0为不限速")
+    parser.add_argument('--tokens', type=int, default=120, help="回复片段数")
+    parser.add_argument('--reasoning', type=int, default=0, help="思考过程片段数")
+    parser.add_argument('--error', type=int, help="注入的错误状态码")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="注入错误的概率")
+    parser.add_argument('--stall-after', type=int, help="输出多少个片段后停顿")
+    parser.add_argument('--stall', type=float, default=0.0, help="停顿秒数")
+    args = parser.parse_args(argv)
+
+    scenario = MockScenario(ttft=args.ttft, tokens_per_second=args.tps, reply_tokens=args.tokens,
+                            reasoning_tokens=args.reasoning, error_status=args.error, error_rate=args.error_rate,
+                            stall_after=args.stall_after, stall_seconds=args.stall)
+    server = MockStreamServer(scenario, args.host, args.port)
+    print(f"模拟服务已启动:\n  硅基流动 {server.siliconflow_url}\n  智谱     {server.zhipu_url}", flush=True)
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+"""
+富文本渲染结果缓存
+内存LRU + 可选的SQLite磁盘缓存，键为 消息ID + 内容哈希
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from .markdown_renderer import RENDERER_VERSION
+
+
+def make_render_key(content: str, message_id: Optional[int] = None) -> str:
+    """生成渲染缓存键"""
+    digest = hashlib.sha1(content.encode('utf-8')).hexdigest()
+    return f"{message_id if message_id is not None else '-'}:{digest}"
+
+
+class RenderCache:
+    """渲染结果缓存
+
+    内存层只在GUI线程中访问；磁盘层会被渲染工作线程访问，每次操作使用独立连接并加锁。
+    """
+
+    def __init__(self, max_entries: int = 512, max_bytes: int = 32 * 1024 * 1024,
+                 disk_path: Optional[str] = None, max_disk_entries: int = 5000):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_disk_entries = max_disk_entries
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._disk_path = None
+        self._disk_lock = threading.Lock()
+        self._disk_writes = 0
+        if disk_path:
+            self.enable_disk_cache(disk_path)
+
+    # ---- 内存层 ----
+
+    def get(self, key: str) -> Optional[str]:
+        """查询内存缓存"""
+        rich_text = self._memory.get(key)
+        if rich_text is not None:
+            self._memory.move_to_end(key)
+        return rich_text
+
+    def put(self, key: str, rich_text: str):
+        """写入内存缓存，超出容量时淘汰最久未使用的条目"""
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_bytes -= len(old)
+        self._memory[key] = rich_text
+        self._memory_bytes += len(rich_text)
+
+        while self._memory and (len(self._memory) > self.max_entries or self._memory_bytes > self.max_bytes):
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+
+    def discard_message(self, message_id: int):
+        """删除某条消息的所有缓存"""
+        prefix = f"{message_id}:"
+        for key in [k for k in self._memory if k.startswith(prefix)]:
+            self._memory_bytes -= len(self._memory.pop(key))
+
+        if self._disk_path:
+            with self._disk_lock:
+                conn = sqlite3.connect(self._disk_path)
+                conn.execute('DELETE FROM render_cache WHERE message_id = ?', (message_id,))
+                conn.commit()
+                conn.close()
+
+    # ---- 磁盘层 ----
+
+    def enable_disk_cache(self, disk_path: str):
+        """启用磁盘缓存"""
+        os.makedirs(os.path.dirname(os.path.abspath(disk_path)), exist_ok=True)
+        with self._disk_lock:
+            conn = sqlite3.connect(disk_path)
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS render_cache (
+                    cache_key TEXT PRIMARY KEY,
+                    message_id INTEGER,
+                    version INTEGER NOT NULL,
+                    rich_text TEXT NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_render_cache_message ON render_cache (message_id)')
+            conn.commit()
+            conn.close()
+        self._disk_path = disk_path
+
+    def load_from_disk(self, key: str) -> Optional[str]:
+        """从磁盘缓存读取（可在工作线程中调用）"""
+        if not self._disk_path:
+            return None
+        with self._disk_lock:
+            conn = sqlite3.connect(self._disk_path)
+            row = conn.execute(
+                'SELECT rich_text FROM render_cache WHERE cache_key = ? AND version = ?',
+                (key, RENDERER_VERSION)
+            ).fetchone()
+            if row:
+                conn.execute('UPDATE render_cache SET accessed_at = ? WHERE cache_key = ?', (time.time(), key))
+                conn.commit()
+            conn.close()
+        return row[0] if row else None
+
+    def save_to_disk(self, key: str, rich_text: str):
+        """写入磁盘缓存（可在工作线程中调用），定期清理最久未访问的条目"""
+        if not self._disk_path:
+            return
+        message_id = key.split(':', 1)[0]
+        with self._disk_lock:
+            conn = sqlite3.connect(self._disk_path)
+            conn.execute(
+                'INSERT OR REPLACE INTO render_cache (cache_key, message_id, version, rich_text, accessed_at) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (key, int(message_id) if message_id.isdigit() else None, RENDERER_VERSION, rich_text, time.time())
+            )
+            self._disk_writes += 1
+            if self._disk_writes % 100 == 0:
+                conn.execute('DELETE FROM render_cache WHERE version != ?', (RENDERER_VERSION,))
+                conn.execute('''
+                    DELETE FROM render_cache WHERE cache_key IN (
+                        SELECT cache_key FROM render_cache
+                        ORDER BY accessed_at DESC
+                        LIMIT -1 OFFSET ?
+                    )
+                ''', (self.max_disk_entries,))
+            conn.commit()
+            conn.close()
@@ -0,0 +1,93 @@
+"""
+渲染快照
+退出时把最后可见视口中的消息（ID、气泡高度、纯文本）保存为紧凑的二进制文件，
+下次启动时在读取数据库之前直接绘制
+"""
+import os
+import struct
+import zlib
+from typing import List, NamedTuple, Optional, Tuple
+
+SNAPSHOT_MAGIC = b'NFSN'
+SNAPSHOT_VERSION = 1
+# 单条消息保存的最大字符数，快照只用于首帧展示
+MAX_SNAPSHOT_TEXT = 4000
+
+_HEADER = struct.Struct('<4sBH')  # 魔数, 版本, 会话ID长度
+_ENTRY = struct.Struct('<qBHI')  # 消息ID, 标志位, 高度, 文本长度
+_FLAG_ALIGN_RIGHT = 0x01
+
+
+class SnapshotEntry(NamedTuple):
+    """快照中的一条消息"""
+    message_id: Optional[int]
+    align_right: bool
+    height: int
+    text: str
+
+
+def get_snapshot_path(db_path: str) -> str:
+    """快照文件与数据库文件放在同一目录"""
+    return os.path.splitext(db_path)[0] + '.snapshot'
+
+
+def snapshot_matches(snapshot_conversation_id: Optional[str], conversation_id: Optional[str]) -> bool:
+    """快照是否属于正在打开的会话；属于其他会话（如数据库被替换或最近的会话已变化）时不能作为首帧"""
+    return snapshot_conversation_id is not None and snapshot_conversation_id == conversation_id
+
+
+def save_snapshot(path: str, conversation_id: str, entries: List[SnapshotEntry]):
+    """保存快照（先写临时文件再替换，避免半截文件）"""
+    conversation_bytes = conversation_id.encode('utf-8')
+    parts = [_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, len(conversation_bytes)), conversation_bytes]
+    parts.append(struct.pack('<H', len(entries)))
+    for entry in entries:
+        text_bytes = entry.text[:MAX_SNAPSHOT_TEXT].encode('utf-8')
+        parts.append(_ENTRY.pack(
+            entry.message_id if entry.message_id is not None else -1,
+            _FLAG_ALIGN_RIGHT if entry.align_right else 0,
+            max(0, min(entry.height, 0xFFFF)),
+            len(text_bytes)
+        ))
+        parts.append(text_bytes)
+
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as f:
+        f.write(zlib.compress(b''.join(parts), 1))
+    os.replace(temp_path, path)
+
+
+def load_snapshot(path: str) -> Optional[Tuple[str, List[SnapshotEntry]]]:
+    """读取快照，文件不存在或格式不符时返回None"""
+    try:
+        with open(path, 'rb') as f:
+            data = zlib.decompress(f.read())
+
+        magic, version, conversation_length = _HEADER.unpack_from(data, 0)
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+            return None
+        offset = _HEADER.size
+        if offset + conversation_length > len(data):
+            return None  # 文件被截断
+        conversation_id = data[offset:offset + conversation_length].decode('utf-8')
+        offset += conversation_length
+        (count,) = struct.unpack_from('<H', data, offset)
+        offset += 2
+
+        entries = []
+        for _ in range(count):
+            message_id, flags, height, text_length = _ENTRY.unpack_from(data, offset)
+            offset += _ENTRY.size
+            if offset + text_length > len(data):
+                return None  # 文件被截断
+            text = data[offset:offset + text_length].decode('utf-8')
+            offset += text_length
+            entries.append(SnapshotEntry(
+                message_id if message_id >= 0 else None,
+                bool(flags & _FLAG_ALIGN_RIGHT),
+                height,
+                text
+            ))
+        return conversation_id, entries
+    except (OSError, zlib.error, struct.error, UnicodeDecodeError):
+        return None
@@ -0,0 +1,102 @@
+"""
+启动耗时分析工具
+通过 --profile-startup 启用，统计各顶层模块的导入耗时与初始化阶段耗时
+"""
+import builtins
+import sys
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+
+class StartupProfiler:
+    """启动耗时分析器（未启用时所有方法均为空操作）"""
+
+    def __init__(self):
+        self.enabled = False
+        self._start = time.perf_counter()
+        self._last = self._start
+        self._marks = []
+        self._import_times = defaultdict(float)
+        self._local = threading.local()
+        self._original_import = None
+        self._reported = False
+
+    def enable(self):
+        """启用分析并开始统计导入耗时"""
+        if self.enabled:
+            return
+        self.enabled = True
+        self._original_import = builtins.__import__
+        builtins.__import__ = self._timed_import
+
+    def _timed_import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        """记录导入耗时（扣除嵌套导入的时间），按顶层包归类"""
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        frame = [time.perf_counter(), 0.0]
+        stack.append(frame)
+        try:
+            return self._original_import(name, globals, locals, fromlist, level)
+        finally:
+            stack.pop()
+            elapsed = time.perf_counter() - frame[0]
+            if stack:
+                stack[-1][1] += elapsed
+            if level == 0:
+                package = name.split('.')[0]
+            else:
+                package = ((globals or {}).get('__package__') or '?').split('.')[0]
+            self._import_times[package] += elapsed - frame[1]
+
+    def mark(self, name: str):
+        """记录一个初始化阶段的完成时间"""
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        self._marks.append((name, now - self._last, now - self._start))
+        self._last = now
+
+    @contextmanager
+    def span(self, name: str):
+        """统计一段代码的耗时"""
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            now = time.perf_counter()
+            self._marks.append((name, now - start, now - self._start))
+            self._last = now
+
+    def report(self) -> str:
+        """生成耗时报告"""
+        lines = ["==== 启动耗时分析 ====", "[模块导入]"]
+        for package, elapsed in sorted(self._import_times.items(), key=lambda item: -item[1]):
+            if elapsed < 0.0005:
+                continue
+            lines.append(f"  {package:<24}{elapsed * 1000:9.1f} ms")
+        lines.append("[初始化阶段]            耗时        累计")
+        for name, elapsed, total in self._marks:
+            lines.append(f"  {name:<20}{elapsed * 1000:9.1f} ms {total * 1000:9.1f} ms")
+
+        heavy = [module for module in ('requests', 'zhipuai', 'cryptography', 'PyQt6.QtSvg') if module in sys.modules]
+        lines.append(f"[启动完成时已加载的重量级模块] {', '.join(heavy) if heavy else '无'}")
+        return '\n'.join(lines)
+
+    def finish(self):
+        """启动完成：打印报告并停止统计导入"""
+        if not self.enabled or self._reported:
+            return
+        self._reported = True
+        if self._original_import is not None:
+            builtins.__import__ = self._original_import
+        print(self.report())
+
+
+# 全局分析器
+profiler = StartupProfiler()
@@ -0,0 +1,249 @@
+"""
+端到端延迟追踪
+通过 --trace 启用，用单调时钟记录一次对话的各个阶段：发送消息、数据库保存、服务商连接、首字节、首个片段、
+每次界面刷新、流结束与最终保存，便于判断慢在网络、解析、Qt布局还是SQLite。
+
+记录按模型与会话标记（bind() 绑定到当前线程或异步任务），保存在环形缓冲区中，
+可导出为Chrome trace JSON（chrome://tracing 或 ui.perfetto.dev 打开）与本地SQLite指标表。
+未启用时 span() 返回共享的空对象、instant() 直接返回，开销接近于零。
+"""
+import contextvars
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import deque, namedtuple
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+# duration_ns 为None表示瞬时事件（如首字节）
+TraceEvent = namedtuple('TraceEvent', 'name start_ns duration_ns thread_id thread_name tags')
+
+# 当前线程或异步任务绑定的标签（模型、会话等）
+_bound_tags: contextvars.ContextVar = contextvars.ContextVar('trace_tags', default=None)
+
+
+class _NullSpan:
+    """未启用追踪时的空span"""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def tag(self, **tags):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ('tracer', 'name', 'tags', 'start_ns')
+
+    def __init__(self, tracer: "Tracer", name: str, tags: Dict):
+        self.tracer = tracer
+        self.name = name
+        self.tags = tags
+        self.start_ns = time.perf_counter_ns()
+
+    def __enter__(self):
+        self.start_ns = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.tags['error'] = exc_type.__name__
+        self.tracer._record(self.name, self.start_ns, time.perf_counter_ns() - self.start_ns, self.tags)
+        return False
+
+    def tag(self, **tags):
+        """补充标签（如结束时才知道的片段数）"""
+        self.tags.update(tags)
+
+
+class Tracer:
+    """延迟追踪器（未启用时所有方法均为空操作）"""
+
+    def __init__(self, capacity: int = 50000):
+        self.enabled = False
+        self._events = deque(maxlen=capacity)
+        self._origin_ns = time.perf_counter_ns()
+        self._wall_origin = time.time()
+
+    def enable(self, capacity: Optional[int] = None):
+        if capacity is not None and capacity != self._events.maxlen:
+            self._events = deque(self._events, maxlen=capacity)
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def clear(self):
+        self._events.clear()
+
+    def events(self) -> List[TraceEvent]:
+        return list(self._events)
+
+    def _tags(self, tags: Dict) -> Dict:
+        bound = _bound_tags.get()
+        return {**bound, **tags} if bound else tags
+
+    def _record(self, name: str, start_ns: int, duration_ns: Optional[int], tags: Dict):
+        thread = threading.current_thread()
+        # deque.append 是线程安全的，满了自动丢弃最早的记录
+        self._events.append(TraceEvent(name, start_ns, duration_ns, thread.ident, thread.name, tags))
+
+    def span(self, name: str, **tags):
+        """统计一段代码的耗时：with tracer.span('db.save', model=...) as span: ..."""
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, self._tags(tags))
+
+    def begin(self, name: str, **tags):
+        """开始一个跨回调的span（如一整轮对话），返回值传给 end()；未启用时返回None"""
+        if not self.enabled:
+            return None
+        return _Span(self, name, self._tags(tags))
+
+    def end(self, span, **tags):
+        if span is None:
+            return
+        span.tags.update(tags)
+        self._record(span.name, span.start_ns, time.perf_counter_ns() - span.start_ns, span.tags)
+
+    def complete(self, name: str, start_ns: int, **tags):
+        """记录从 start_ns（time.perf_counter_ns()）到现在的span（不便使用with的地方）"""
+        if not self.enabled:
+            return
+        self._record(name, start_ns, time.perf_counter_ns() - start_ns, self._tags(tags))
+
+    def instant(self, name: str, **tags):
+        """记录瞬时事件（首字节、首个片段、流结束等）"""
+        if not self.enabled:
+            return
+        self._record(name, time.perf_counter_ns(), None, self._tags(tags))
+
+    def set_tags(self, **tags):
+        """为当前线程或异步任务之后的记录附加标签（用于工作线程或任务的入口，随线程或任务结束失效）"""
+        if self.enabled:
+            _bound_tags.set({**(_bound_tags.get() or {}), **tags})
+
+    @contextmanager
+    def bind(self, **tags):
+        """为当前线程或异步任务中的记录附加标签"""
+        if not self.enabled:
+            yield
+            return
+        token = _bound_tags.set({**(_bound_tags.get() or {}), **tags})
+        try:
+            yield
+        finally:
+            _bound_tags.reset(token)
+
+    def to_chrome_trace(self) -> Dict:
+        """转换为Chrome trace格式（时间单位为微秒）"""
+        pid = os.getpid()
+        trace_events = []
+        threads = {}
+        for event in self.events():
+            threads[event.thread_id] = event.thread_name
+            item = {
+                "name": event.name, "cat": event.name.split('.', 1)[0], "pid": pid, "tid": event.thread_id,
+                "ts": (event.start_ns - self._origin_ns) / 1000, "args": event.tags,
+            }
+            if event.duration_ns is None:
+                item.update(ph="i", s="t")
+            else:
+                item.update(ph="X", dur=event.duration_ns / 1000)
+            trace_events.append(item)
+        for thread_id, thread_name in threads.items():
+            trace_events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": thread_id,
+                                 "args": {"name": thread_name}})
+        return {"traceEvents": trace_events, "displayTimeUnit": "ms",
+                "otherData": {"started_at": self._wall_origin}}
+
+    def export_chrome_trace(self, path: str):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_chrome_trace(), f, ensure_ascii=False)
+
+    def export_sqlite(self, path: str) -> int:
+        """追加到SQLite指标表 trace_spans，返回写入的记录数
+
+        每次导出是一个会话（session 为导出时间），start_ms 从追踪器创建时算起，瞬时事件的 duration_ms 为NULL
+        """
+        events = self.events()
+        session = time.strftime('%Y-%m-%dT%H:%M:%S')
+        rows = [(session, event.name, event.name.split('.', 1)[0],
+                 (event.start_ns - self._origin_ns) / 1e6,
+                 event.duration_ns / 1e6 if event.duration_ns is not None else None,
+                 self._wall_origin + (event.start_ns - self._origin_ns) / 1e9, event.thread_name,
+                 event.tags.get('model'), event.tags.get('conversation'),
+                 json.dumps(event.tags, ensure_ascii=False, default=str))
+                for event in events]
+        conn = sqlite3.connect(path)
+        try:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS trace_spans (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    session TEXT NOT NULL,
+                    name TEXT NOT NULL,
+                    category TEXT NOT NULL,
+                    start_ms REAL NOT NULL,
+                    duration_ms REAL,
+                    wall_time REAL NOT NULL,
+                    thread TEXT,
+                    model TEXT,
+                    conversation TEXT,
+                    tags TEXT
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_trace_spans_name ON trace_spans (name, session)')
+            conn.executemany('''
+                INSERT INTO trace_spans (session, name, category, start_ms, duration_ms, wall_time, thread, model,
+                                         conversation, tags)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', rows)
+            conn.commit()
+        finally:
+            conn.close()
+        return len(rows)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """按名称汇总span耗时（毫秒）：次数、p50、p95、最大值"""
+        durations: Dict[str, List[float]] = {}
+        for event in self.events():
+            if event.duration_ns is not None:
+                durations.setdefault(event.name, []).append(event.duration_ns / 1e6)
+        result = {}
+        for name, values in durations.items():
+            values.sort()
+            result[name] = {
+                "count": len(values), "p50": values[len(values) // 2],
+                "p95": values[min(len(values) - 1, int(len(values) * 0.95))], "max": values[-1],
+            }
+        return result
+
+    def report(self) -> str:
+        lines = ["==== 延迟追踪 ====", f"  {'阶段':<24}{'次数':>6}{'p50':>12}{'p95':>12}{'最大':>12}"]
+        for name, stats in sorted(self.summary().items()):
+            lines.append(f"  {name:<24}{stats['count']:>6}{stats['p50']:>9.2f} ms{stats['p95']:>9.2f} ms"
+                         f"{stats['max']:>9.2f} ms")
+        return '\n'.join(lines)
+
+    def save(self, folder: str):
+        """退出时调用：导出Chrome trace与SQLite指标表到 folder 并打印汇总"""
+        if not self.enabled or not self._events:
+            return
+        trace_path = os.path.join(folder, time.strftime('trace-%Y%m%d-%H%M%S.json'))
+        self.export_chrome_trace(trace_path)
+        self.export_sqlite(os.path.join(folder, 'trace_metrics.db'))
+        print(self.report())
+        print(f"追踪已保存: {trace_path}（SQLite指标表: trace_metrics.db）")
+
+
+# 全局追踪器
+tracer = Tracer()